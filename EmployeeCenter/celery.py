@@ -3,20 +3,49 @@ from __future__ import absolute_import
 import os
 
 from celery import Celery
+from celery.schedules import crontab
 
 # set the default Django settings module for the 'celery' program.
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proj.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EmployeeCenter.settings')
 
 from django.conf import settings  # noqa
 
-app = Celery('proj')
+app = Celery('EmployeeCenter')
 
 # Using a string here means the worker will not have to
 # pickle the object when using Windows.
 app.config_from_object('django.conf:settings')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
+# Periodic tasks run by celery beat
+app.conf.update(CELERYBEAT_SCHEDULE={
+    'refresh-supply-consumption': {
+        'task': 'supplies.tasks.refresh_consumption',
+        'schedule': crontab(hour=0, minute=15),
+    },
+    'low-stock-digest': {
+        'task': 'supplies.tasks.send_low_stock_digest',
+        'schedule': crontab(hour='8,13,17', minute=0),
+    },
+    'drain-trcloud-outbox': {
+        'task': 'trcloud.tasks.drain_outbox',
+        'schedule': crontab(minute='*'),
+    },
+    'sync-calendar-events': {
+        'task': 'administrator.tasks.sync_calendar_events',
+        'schedule': crontab(minute='*'),
+    },
+    'rebuild-status-summaries': {
+        'task': 'administrator.tasks.rebuild_status_summaries',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'prune-render-cache': {
+        'task': 'media.tasks.prune_render_cache',
+        'schedule': crontab(hour=3, minute=0, day_of_week='sunday'),
+    },
+})
+
 
 @app.task(bind=True)
 def debug_task(self):
-    print('Request: {0!r}'.format(self.request))
\ No newline at end of file
+    print('Request: {0!r}'.format(self.request))
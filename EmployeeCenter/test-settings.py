@@ -17,6 +17,23 @@ DATABASES = {
     }
 }
 
+# Run background tasks in process during tests
+CELERY_ALWAYS_EAGER = True
+CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
+
+# Keep uploaded files on the local disk during tests
+MEDIA_STORAGE = {
+    'BACKEND': 'media.storage.LocalStorage',
+    'OPTIONS': {'location': os.path.join(os.path.dirname(__file__), 'test-storage')}
+}
+
+IMAGE_CACHE = {
+    'LOCATION': os.path.join(os.path.dirname(__file__), 'test-image-cache')
+}
+
+# Send calendar events to an in memory calendar during tests
+GOOGLE_CALENDAR_FAKE = True
+
 PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.MD5PasswordHasher',
 )
@@ -49,7 +66,7 @@ INSTALLED_APPS = (
     'equipment',
     'estimates',
     'deals',
-    #'trcloud',
+    'trcloud',
     'rest_framework',
     'ivr',
     #'twilio',
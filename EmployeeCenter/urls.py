@@ -27,7 +27,7 @@ from contacts.views import CustomerList, CustomerDetail, SupplierList, SupplierD
 from supplies.views import SupplyList, SupplyDetail, supply_type_list
 from supplies.views import FabricList, FabricDetail
 from supplies.views import LogList, LogDetail
-from supplies.views import supply_image, sticker as SupplySticker, fabric_sticker
+from supplies.views import supply_image, sticker as SupplySticker, fabric_sticker, stickers as SupplyStickers, fabric_stickers
 from products.views import ConfigurationViewSet
 from products.views import ModelList, ModelDetail
 from products.views import UpholsteryList, UpholsteryDetail, UpholsteryViewSet
@@ -53,9 +53,9 @@ from administrator.views import UserList, UserDetail
 from administrator.views import LabelList, LabelDetail
 from administrator.views import GroupList, GroupDetail
 from administrator.views import PermissionList, PermissionDetail, LogList as ALogList, public_email
-from equipment.views import EquipmentList, EquipmentDetail, sticker as EquipmentSticker
+from equipment.views import EquipmentList, EquipmentDetail, sticker as EquipmentSticker, stickers as EquipmentStickers
 from hr.views import PayrollList
-from hr.views import employee_stats, employee_image, upload_attendance
+from hr.views import employee_stats, employee_image, upload_attendance, attendance_upload
 from deals.views import DealList, DealDetail
 from ivr.views import voice, get_token, test, route_call, recording_callback, call_status_update_callback
 from accounting.views import AccountList, AccountDetail
@@ -183,6 +183,7 @@ urlpatterns += [
     url(r'^api/v1/payroll/$', PayrollList.as_view()),
 
     url(r'^api/v1/administrator/log/$', ALogList.as_view()),
+    url(r'^api/v1/administrator/metrics/$', administrator.views.metrics),
     # Accounting Views
     url(r'^api/v1/account/$', AccountList.as_view()),
     url(r'^api/v1/account/(?P<pk>[0-9]+)/$', AccountDetail.as_view()),
@@ -200,6 +201,7 @@ urlpatterns += [
     #url(r'^acknowledgement$', 'acknowledgement'),
     url(r'^api/v1/acknowledgement/(?P<ack_id>\d+)/file/$', acknowledgements.views.acknowledgement_file),
     url(r'^api/v1/acknowledgement/(?P<ack_id>\d+)/item/image/$', acknowledgements.views.acknowledgement_item_image),
+    url(r'^api/v1/acknowledgement/(?P<ack_id>\d+)/documents/$', acknowledgements.views.acknowledgement_documents),
 
     #url(r'^acknowledgement/(?P<ack_id>\d+)/pdf$', 'pdf'),
     #url(r'^acknowledgement/(?P<ack_id>\d+)/log$', 'log'),
@@ -286,6 +288,8 @@ urlpatterns += [
     url(r'api/v1/supply/(?P<pk>\d+)/sticker/$', SupplySticker),
     url(r'api/v1/fabric/(?P<pk>\d+)/sticker$', fabric_sticker),
     url(r'api/v1/fabric/(?P<pk>\d+)/sticker/$', fabric_sticker),
+    url(r'^api/v1/supply/sticker/$', SupplyStickers),
+    url(r'^api/v1/fabric/sticker/$', fabric_stickers),
 
     # Supply Log api
     url(r'^api/v1/supply/log/$', LogList.as_view()),
@@ -294,6 +298,7 @@ urlpatterns += [
 urlpatterns += [
     url(r'api/v1/equipment/(?P<pk>\d+)/sticker$', EquipmentSticker),
     url(r'api/v1/equipment/(?P<pk>\d+)/sticker/$', EquipmentSticker),
+    url(r'^api/v1/equipment/sticker/$', EquipmentStickers),
 ]
 
 urlpatterns += [
@@ -316,7 +321,8 @@ urlpatterns += [
 urlpatterns += [
     url(r'^api/v1/employee/stats/$', employee_stats),
     url(r'^api/v1/employee/image/$', employee_image),
-    url(r'^api/v1/employee/attendance/$', upload_attendance)
+    url(r'^api/v1/employee/attendance/$', upload_attendance),
+    url(r'^api/v1/employee/attendance/upload/(?P<upload_id>\d+)/$', attendance_upload)
 ]
 
 
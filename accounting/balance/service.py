@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Running account balances
+
+The debits and credits of every account are kept as monthly totals in
+AccountBalance, which are added to in the same database transaction as
+the journal entry that is posted. The balance of an account is then the
+sum of a row per month instead of a sum over all of its transactions.
+
+Every parent account also holds the totals of all of its sub accounts,
+so that the balance sheet is read from the top level accounts alone.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import Sum, Case, When, F, DecimalField
+from django.db.models.functions import TruncMonth
+
+from accounting.models import Account, AccountBalance, Transaction
+
+
+logger = logging.getLogger(__name__)
+
+batch_size = 500
+
+
+def get_period(day):
+    """
+    Returns the first day of the month of the date
+    """
+    if hasattr(day, 'date'):
+        day = day.date()
+
+    return day.replace(day=1)
+
+
+def post(transactions):
+    """
+    Adds the debits and credits of the transactions to the balances of
+    their accounts and of the parents of those accounts
+    """
+    totals = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+
+    for trx in transactions:
+        period = get_period(trx.journal_entry.date)
+        row = totals[(trx.account_id, period)]
+        row[0] += trx.debit or Decimal('0')
+        row[1] += trx.credit or Decimal('0')
+
+    if not totals:
+        return
+
+    with transaction.atomic():
+        _apply(_rollup(totals))
+
+
+def rebuild(company=None):
+    """
+    Recalculates the balances of the accounts of the company, or of all
+    companies, from their transactions
+    """
+    accounts = Account.objects.filter(company=company) if company else Account.objects.all()
+    account_ids = list(accounts.values_list('id', flat=True))
+
+    rows = Transaction.objects.filter(account_id__in=account_ids) \
+                              .annotate(period=TruncMonth('journal_entry__date')) \
+                              .values('account_id', 'period') \
+                              .annotate(debit=Sum('debit'), credit=Sum('credit')) \
+                              .order_by()
+
+    totals = {(row['account_id'], get_period(row['period'])): [row['debit'] or Decimal('0'),
+                                                              row['credit'] or Decimal('0')]
+              for row in rows}
+
+    rows = _rollup(totals)
+
+    with transaction.atomic():
+        AccountBalance.objects.filter(account_id__in=account_ids).delete()
+        AccountBalance.objects.bulk_create([AccountBalance(account_id=account_id,
+                                                           period=period,
+                                                           debit=row[0],
+                                                           credit=row[1],
+                                                           total_debit=row[2],
+                                                           total_credit=row[3])
+                                            for (account_id, period), row in rows.items()],
+                                           batch_size=batch_size)
+
+    return len(rows)
+
+
+def annotate(queryset, end=None, include_sub_accounts=True):
+    """
+    Annotates the accounts with 'debit_sum' and 'credit_sum' from their
+    monthly balances up to and including the month of 'end'
+    """
+    debit, credit = ('total_debit', 'total_credit') if include_sub_accounts else ('debit', 'credit')
+
+    if end is None:
+        return queryset.annotate(debit_sum=Sum('balances__' + debit),
+                                 credit_sum=Sum('balances__' + credit))
+
+    period = get_period(end)
+    return queryset.annotate(debit_sum=Sum(Case(When(balances__period__lte=period, then=F('balances__' + debit)),
+                                                output_field=DecimalField())),
+                             credit_sum=Sum(Case(When(balances__period__lte=period, then=F('balances__' + credit)),
+                                                 output_field=DecimalField())))
+
+
+def trial_balance(company, end=None):
+    """
+    Returns the accounts of the company with the totals of their own
+    transactions up to the month of 'end'
+    """
+    queryset = Account.objects.filter(company=company).order_by('account_code', 'id')
+
+    return annotate(queryset, end=end, include_sub_accounts=False)
+
+
+def _parents(account_ids):
+    """
+    Returns the parent of each account and of each of their ancestors
+    """
+    parents = {}
+    pending = set(account_ids)
+
+    while pending:
+        rows = Account.objects.filter(pk__in=pending).values_list('id', 'parent_id')
+        pending = set()
+
+        for account_id, parent_id in rows:
+            parents[account_id] = parent_id
+            if parent_id and parent_id not in parents:
+                pending.add(parent_id)
+
+    return parents
+
+
+def _rollup(totals):
+    """
+    Returns the own and the rolled up totals of the accounts and their
+    ancestors as [debit, credit, total_debit, total_credit]
+    """
+    parents = _parents(set(account_id for account_id, period in totals))
+    rows = defaultdict(lambda: [Decimal('0'), Decimal('0'), Decimal('0'), Decimal('0')])
+
+    for (account_id, period), (debit, credit) in totals.items():
+        rows[(account_id, period)][0] += debit
+        rows[(account_id, period)][1] += credit
+
+        seen = set()
+        current = account_id
+        while current and current not in seen:
+            seen.add(current)
+            rows[(current, period)][2] += debit
+            rows[(current, period)][3] += credit
+            current = parents.get(current)
+
+    return rows
+
+
+def _apply(rows):
+    """
+    Adds the totals to the balance rows. The rows are updated in order
+    so that concurrent postings lock them in the same order
+    """
+    for account_id, period in sorted(rows):
+        debit, credit, total_debit, total_credit = rows[(account_id, period)]
+        changes = {'debit': F('debit') + debit,
+                   'credit': F('credit') + credit,
+                   'total_debit': F('total_debit') + total_debit,
+                   'total_credit': F('total_credit') + total_credit}
+
+        updated = AccountBalance.objects.filter(account_id=account_id, period=period).update(**changes)
+
+        if not updated:
+            try:
+                with transaction.atomic():
+                    AccountBalance.objects.create(account_id=account_id, period=period, debit=debit, credit=credit,
+                                                  total_debit=total_debit, total_credit=total_credit)
+            except IntegrityError:
+                AccountBalance.objects.filter(account_id=account_id, period=period).update(**changes)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Recalculates the running account balances from the transactions, e.g.
+when the balances are first set up
+
+    python manage.py rebuild_account_balances
+    python manage.py rebuild_account_balances --company 1
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from accounting.balance import service as balance_service
+from administrator.models import Company
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the monthly account balances from the transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, dest='company', default=None,
+                            help="Only rebuild the accounts of this company")
+
+    def handle(self, *args, **options):
+        company = Company.objects.get(pk=options['company']) if options['company'] else None
+
+        count = balance_service.rebuild(company)
+
+        self.stdout.write(u"Rebuilt {0} account balances".format(count))
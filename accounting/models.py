@@ -8,6 +8,7 @@ from datetime import datetime, date
 from django.db import models
 from django.db.models import Sum
 from administrator.models import User, Company
+from utilities import search
 
 
 logger = logging.getLogger(__name__)
@@ -42,16 +43,33 @@ class Account(models.Model):
     type_detail = models.TextField(null=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="chart_of_accounts")
     parent = models.ForeignKey('self', related_name='sub_accounts', null=True)
+    search_document = models.TextField(null=True, blank=True, editable=False)
 
     @property
     def balance(self):
-        #qs = self.transactions.all()
-        #totals = qs.aggregate(Sum('debit'), Sum('credit'))
-        #return abs((totals['debit__sum'] or 0) - (totals['credit__sum'] or 0)) 
+        """
+        Balance of the account including its sub accounts. Querysets
+        annotated by accounting.balance.service.annotate() do not need
+        any further queries
+        """
         try:
             return abs((self.debit_sum or 0) - (self.credit_sum or 0))
-        except Exception as e:
-            return 0
+        except AttributeError:
+            totals = self.balances.aggregate(debit=Sum('total_debit'), credit=Sum('total_credit'))
+            return abs((totals['debit'] or 0) - (totals['credit'] or 0))
+
+    def get_search_values(self):
+        return [self.id, self.account_code, self.name, self.name_th, self.type]
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        self.search_document = search.document(self.get_search_values())
+
+        super(Account, self).save(*args, **kwargs)
+
+        if created:
+            self.search_document = search.document(self.get_search_values())
+            Account.objects.filter(pk=self.pk).update(search_document=self.search_document)
 
 class Transaction(models.Model):
     account = models.ForeignKey(Account, related_name='transactions')
@@ -75,6 +93,26 @@ class Transaction(models.Model):
         self.transaction_date = value
 
 
+class AccountBalance(models.Model):
+    """
+    Running debit and credit totals of an account for a month
+
+    'debit' and 'credit' are the totals of the account's own
+    transactions. 'total_debit' and 'total_credit' also include the
+    transactions of all its sub accounts. The rows are added to as
+    journal entries are posted, by accounting.balance.service
+    """
+    account = models.ForeignKey(Account, related_name='balances', on_delete=models.CASCADE)
+    period = models.DateField(db_index=True)
+    debit = models.DecimalField(decimal_places=2, max_digits=15, default=0)
+    credit = models.DecimalField(decimal_places=2, max_digits=15, default=0)
+    total_debit = models.DecimalField(decimal_places=2, max_digits=15, default=0)
+    total_credit = models.DecimalField(decimal_places=2, max_digits=15, default=0)
+
+    class Meta:
+        unique_together = ('account', 'period')
+
+
 # Not yet created in database 
 # class Invoice(models.Model):
 #     tax_id = models.TextField(null=True)
@@ -4,9 +4,11 @@ import logging
 from datetime import date
 from decimal import Decimal
 
+from django.db import transaction
 from rest_framework import serializers
 
 from accounting.models import Account, Transaction, Journal, JournalEntry
+from accounting.balance import service as balance_service
 from accounting.journal_entry import service as je_service
 from accounting.transaction import service as tr_service
 from hr.models import Employee
@@ -155,13 +157,17 @@ class JournalEntrySerializer(serializers.ModelSerializer):
         
         date = validated_data.get('date', None)
 
-        instance = je_service.create(journal=validated_data['journal'],
-                                     description=validated_data['description'],
-                                     date=date)
+        with transaction.atomic():
+            instance = je_service.create(journal=validated_data['journal'],
+                                         description=validated_data['description'],
+                                         date=date)
 
-        tr_serializer = TransactionSerializer(data=transactions_data, many=True, context={'journal_entry': instance})
-        if tr_serializer.is_valid(raise_exception=True):
-            tr_serializer.save()
+            tr_serializer = TransactionSerializer(data=transactions_data, many=True, context={'journal_entry': instance})
+            if tr_serializer.is_valid(raise_exception=True):
+                transactions = tr_serializer.save()
+
+            # Add the transactions to the running balances of the accounts
+            balance_service.post(transactions)
                                             
         return instance
 
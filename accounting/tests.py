@@ -14,8 +14,9 @@ from django.test import TestCase
 from rest_framework.test import APITestCase
 from rest_framework.exceptions import ValidationError
 
-from accounting.models import Journal, JournalEntry, Transaction, Account
+from accounting.models import Journal, JournalEntry, Transaction, Account, AccountBalance
 from accounting.serializers import JournalEntrySerializer
+from accounting.balance import service as balance_service
 from administrator.models import Company
 
 
@@ -130,4 +131,70 @@ class JournalEntryTest(APITestCase):
         self.assertEqual(Transaction.objects.all().count(), 0)
 
 
-        
\ No newline at end of file
+        
+
+
+class AccountBalanceTest(TestCase):
+
+    def setUp(self):
+        """
+        Set up a receivable account with a sub account for a customer
+        """
+        self.company = Company.objects.create(name="Turkey Group Co., Ltd.")
+        self.journal = Journal.objects.create(name='Revenue', company=self.company)
+
+        self.receivable = Account.objects.create(name='Accounts Receivable (A/R)', type='Current Assets',
+                                                 company=self.company)
+        self.customer = Account.objects.create(name='Account Receivable: Acme', type='Current Assets',
+                                               company=self.company, parent=self.receivable)
+        self.revenue = Account.objects.create(name='Sales', type='Income', company=self.company)
+
+    def _post(self, amount):
+        data = {'description': u'Invoice 1',
+                'journal': {'id': self.journal.id},
+                'transactions': [{'account': {'id': self.customer.id},
+                                  'debit': amount,
+                                  'credit': None,
+                                  'description': u'Invoice 1'},
+                                 {'account': {'id': self.revenue.id},
+                                  'debit': None,
+                                  'credit': amount,
+                                  'description': u'Invoice 1'}]}
+
+        serializer = JournalEntrySerializer(data=data)
+        if serializer.is_valid(raise_exception=True):
+            serializer.save()
+
+    def _balances(self):
+        accounts = balance_service.annotate(Account.objects.filter(company=self.company))
+        return {account.id: account.balance for account in accounts}
+
+    def test_post(self):
+        """
+        Test that posting journal entries adds to the balances of the accounts and their parents
+        """
+        self._post(Decimal('100.00'))
+        self._post(Decimal('50.00'))
+
+        self.assertEqual(AccountBalance.objects.count(), 3)
+
+        balances = self._balances()
+        self.assertEqual(balances[self.customer.id], Decimal('150.00'))
+        self.assertEqual(balances[self.receivable.id], Decimal('150.00'))
+        self.assertEqual(balances[self.revenue.id], Decimal('150.00'))
+
+        # The parent has no transactions of its own
+        trial_balance = {a.id: a.debit_sum for a in balance_service.trial_balance(self.company)}
+        self.assertEqual(trial_balance[self.receivable.id], Decimal('0'))
+        self.assertEqual(trial_balance[self.customer.id], Decimal('150.00'))
+
+    def test_rebuild(self):
+        """
+        Test that the rebuilt balances match the posted balances
+        """
+        self._post(Decimal('100.00'))
+        balances = self._balances()
+
+        AccountBalance.objects.all().delete()
+        self.assertEqual(balance_service.rebuild(self.company), 3)
+        self.assertEqual(self._balances(), balances)
@@ -4,7 +4,7 @@ import logging
 import time
 
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Sum
+from django.db.models import Q, Sum, Prefetch
 from django.conf import settings
 from rest_framework import viewsets
 from rest_framework import generics
@@ -13,6 +13,9 @@ from rest_framework import authentication, permissions
 
 from accounting.models import Account, Transaction
 from accounting.serializers import AccountSerializer
+from accounting.balance import service as balance_service
+from utilities.pagination import KeysetPagination
+from utilities import search
 
 
 logger = logging.getLogger(__name__)
@@ -27,9 +30,15 @@ class AccountMixin(object):
         company = user.company
         logger.info(company)
         qs = Account.objects.filter(company=company).order_by('type', 'type_detail')
-        qs = qs.annotate(debit_sum=Sum('transactions__debit'), credit_sum=Sum('transactions__credit'))
+        qs = balance_service.annotate(qs)
 
         return qs 
+
+    def _sub_accounts(self, lookup='sub_accounts'):
+        """
+        Prefetches the sub accounts with their balances
+        """
+        return Prefetch(lookup, queryset=balance_service.annotate(Account.objects.order_by('id')))
         
     def handle_exception(self, exc):
         """
@@ -44,7 +53,8 @@ class AccountMixin(object):
     
     
 class AccountList(AccountMixin, generics.ListCreateAPIView):
-        
+    pagination_class = KeysetPagination
+
     def filter_queryset(self, queryset):
         """
         Override 'get_queryset' method in order to customize filter
@@ -54,42 +64,18 @@ class AccountList(AccountMixin, generics.ListCreateAPIView):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(name__icontains=query) |
-                                       Q(name_th__icontains=query) |
-                                       Q(type__icontains=query) |
-                                       Q(id__icontains=query))
-
-        offset = int(self.request.query_params.get('offset', 0))
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        if offset and limit:
-            queryset = queryset[offset - 1:limit + (offset - 1)]
-        elif not offset and limit:
-            queryset = queryset[:limit]
-        else:
-            queryset = queryset[0:50]
+            queryset = search.search(queryset, query)
 
         queryset = queryset.select_related('parent',
                                            'company')
 
-        queryset = queryset.prefetch_related('sub_accounts', 
+        queryset = queryset.prefetch_related(self._sub_accounts(),
                                              'sub_accounts__parent',
                                              'sub_accounts__company',
-                                             'transactions',
-                                             'sub_accounts__transactions',
-                                             'sub_accounts__sub_accounts')
+                                             self._sub_accounts('sub_accounts__sub_accounts'))
             
         return queryset
-        
-    def get_paginate_by(self):
-        """
-        
-        """
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        if limit == 0:
-            return self.queryset.count()
-        else:
-            return limit
-            
+
 
 class AccountDetail(AccountMixin, generics.RetrieveUpdateDestroyAPIView):
     def filter_queryset(self, queryset):
@@ -99,7 +85,7 @@ class AccountDetail(AccountMixin, generics.RetrieveUpdateDestroyAPIView):
         queryset = queryset.select_related('parent',
                                            'company')
 
-        queryset = queryset.prefetch_related('sub_accounts', 
+        queryset = queryset.prefetch_related(self._sub_accounts(),
                                              'sub_accounts__parent',
                                              'sub_accounts__company',
                                              'sub_accounts__transactions',
@@ -28,6 +28,8 @@ from reportlab.graphics.barcode import code39
 from reportlab.graphics.barcode import code128
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
 
+from media import image_cache
+
 
 logger = logging.getLogger(__name__)
 
@@ -532,7 +534,7 @@ class AcknowledgementPDF(object):
             data.append(['', comments, ''])
         #Get Image url and add image
         if product.image:
-            data.append(['', self.get_image(product.image.generate_url('', '', time=3600), height=100, max_width=290)])
+            data.append(['', self.get_image(product.image, height=100, max_width=290)])
         #Create table
         table = Table(data, colWidths=(80, 300, 60, 40, 65))
         style_data = [('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
@@ -558,7 +560,7 @@ class AcknowledgementPDF(object):
     def _get_fabric_table(self, fabric, string="   Fabric:"):
         fabric_str = string + ' {0}'
         try:
-            fabric_image = self.get_image(fabric.image.generate_url('', '', time=3600), height=30)
+            fabric_image = self.get_image(fabric.image, height=30)
         except AttributeError:
             fabric_image = None
         fabric_table = Table([[fabric_str.format(fabric.description),fabric_image]],
@@ -687,12 +689,16 @@ class AcknowledgementPDF(object):
 
     #helps change the size and maintain ratio
     def get_image(self, path, width=None, height=None, max_width=0, max_height=0):
-        """Retrieves the image via the link and gets the
+        """Retrieves the image from the image cache and gets the
         size from the image. The correct dimensions for
         image are calculated based on the desired with or
         height"""
+        path = image_cache.get_path(path, width=width, height=height, max_width=max_width)
+        if path is None:
+            return None
+
         try:
-            #Read image from link
+            #Read the cached thumbnail
             img = utils.ImageReader(path)
         except:
             return None
@@ -964,7 +970,7 @@ class ConfirmationPDF(object):
             data.append(['', comments, ''])
         #Get Image url and add image
         if product.image:
-            data.append(['', self.get_image(product.image.generate_url('', '', time=3600), height=75, max_width=290)])
+            data.append(['', self.get_image(product.image, height=75, max_width=290)])
         #Create table
         table = Table(data, colWidths=(80, 425, 40))
         style_data = [('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
@@ -987,7 +993,7 @@ class ConfirmationPDF(object):
     def _get_fabric_table(self, fabric, string="   Fabric:"):
         fabric_str = string + ' {0}'
         try:
-            fabric_image = self.get_image(fabric.image.generate_url('', '', time=3600), height=30)
+            fabric_image = self.get_image(fabric.image, height=30)
         except AttributeError:
             fabric_image = None
         fabric_table = Table([[fabric_str.format(fabric.description),fabric_image]],
@@ -1091,12 +1097,16 @@ class ConfirmationPDF(object):
 
     #helps change the size and maintain ratio
     def get_image(self, path, width=None, height=None, max_width=0, max_height=0):
-        """Retrieves the image via the link and gets the
+        """Retrieves the image from the image cache and gets the
         size from the image. The correct dimensions for
         image are calculated based on the desired with or
         height"""
+        path = image_cache.get_path(path, width=width, height=height, max_width=max_width)
+        if path is None:
+            return None
+
         try:
-            #Read image from link
+            #Read the cached thumbnail
             img = utils.ImageReader(path)
         except:
             return None
@@ -1305,7 +1315,7 @@ class ProductionPDF(AcknowledgementPDF):
         #Get Image url and add image
         data.append([''])
         if product.image:
-            data.append(['', self.get_image(product.image.generate_url('', '', time=3600), height=100, max_width=400)])
+            data.append(['', self.get_image(product.image, height=100, max_width=400)])
         #Create table
         table = Table(data, colWidths=(80, 400, 60), splitByRow=True)
         style_data = [('TEXTCOLOR', (0,0), (-1,-1),
@@ -1621,12 +1631,16 @@ class ShippingLabelPDF(object):
         
     #helps change the size and maintain ratio
     def get_image(self, path, width=None, height=None):
-        """Retrieves the image via the link and gets the 
+        """Retrieves the image from the image cache and gets the
         size from the image. The correct dimensions for 
         image are calculated based on the desired with or
         height"""
+        path = image_cache.get_path(path, width=width, height=height)
+        if path is None:
+            return None
+
         try:
-            #Read image from link
+            #Read the cached thumbnail
             img = utils.ImageReader(path)
         except:
             return None
@@ -5,7 +5,6 @@ import dateutil.parser
 import math
 import logging
 from decimal import *
-import httplib2
 
 from pytz import timezone
 from datetime import datetime
@@ -17,7 +16,6 @@ from boto.s3.key import Key
 import boto.ses
 #from oauth2client.contrib.django_orm import Storage
 from oauth2client.contrib import gce
-from apiclient import discovery
 
 from contacts.models import Customer
 from products.models import Product, Upholstery
@@ -25,8 +23,13 @@ from projects.models import Project, Room, Phase
 from supplies.models import Fabric
 from acknowledgements.PDF import AcknowledgementPDF, ConfirmationPDF, ProductionPDF, ShippingLabelPDF, QualityControlPDF
 from media.models import Log, S3Object
-from administrator.models import CredentialsModel, Log as BaseLog
+from media import render_cache
+from administrator.models import Log as BaseLog
+from administrator import tasks as calendar_tasks
+from administrator.stats import StatusStats
 from trcloud.models import TRSalesOrder, TRContact
+from trcloud import tasks as trcloud_tasks
+from utilities import search
 
 
 logger = logging.getLogger(__name__)
@@ -49,6 +52,7 @@ class Acknowledgement(models.Model):
     deleted = models.BooleanField(default=False)
     
     calendar_event_id = models.TextField(null=True)
+    search_document = models.TextField(null=True, blank=True, editable=False)
 
     # Business Related Attributes
     document_number = models.IntegerField(default=0)
@@ -107,7 +111,15 @@ class Acknowledgement(models.Model):
 
     # None Database attributes
     current_user = None 
-    calendar_service = None
+    calendar_name = 'deliveries'
+
+    # Documents rendered for every order as (name, pdf class, key format, attribute).
+    # Documents without an attribute are added to the order's files
+    document_bucket = "document.dellarobbiathailand.com"
+    documents = (('acknowledgement', AcknowledgementPDF, "acknowledgement/{0}/Acknowledgement-{0}.pdf", 'acknowledgement_pdf'),
+                 ('production', ProductionPDF, "acknowledgement/{0}/Production-{0}.pdf", 'production_pdf'),
+                 ('label', ShippingLabelPDF, "acknowledgement/{0}/Label-{0}.pdf", 'label_pdf'),
+                 ('quality_control', QualityControlPDF, "acknowledgment/{0}/Quality_Control-{0}.pdf", None))
 
     @property
     def delivery_date(self):
@@ -127,7 +139,15 @@ class Acknowledgement(models.Model):
 
     @property
     def balance(self):
-        return self.grand_total - sum([inv.grand_total for inv in self.invoices.all()])
+        """
+        Uses the 'invoice_total' annotation when the queryset has it
+        """
+        try:
+            invoice_total = self.invoice_total
+        except AttributeError:
+            invoice_total = sum([inv.grand_total for inv in self.invoices.all()])
+
+        return self.grand_total - invoice_total
         
     @classmethod
     def create(cls, user, **kwargs):
@@ -141,11 +161,8 @@ class Acknowledgement(models.Model):
 
         # Get Customer and create in TRCloud if necessary
         acknowledgement.customer = Customer.objects.get(id=kwargs['customer']['id'])
-        try:
-            if not acknowledgement.customer.trcloud_id == 0:
-                acknowledgement.customer.create_in_trcloud()
-        except Exception as e:
-            logger.warn(e)
+        if not acknowledgement.customer.trcloud_id:
+            trcloud_tasks.queue_sync(acknowledgement.customer, 'create')
 
         acknowledgement.employee = user
 
@@ -199,8 +216,30 @@ class Acknowledgement(models.Model):
 
             self.document_number = last_id
 
+        saved_values = status_stats.get_saved_values(self)
+        created = self.pk is None
+
+        self.search_document = search.document(self.get_search_values())
+
         super(Acknowledgement, self).save(*args, **kwargs)
 
+        status_stats.record_save(self, saved_values)
+
+        if created:
+            # The id is only part of the document once it has been assigned
+            self.search_document = search.document(self.get_search_values())
+            Acknowledgement.objects.filter(pk=self.pk).update(search_document=self.search_document)
+
+    def get_search_values(self):
+        customer = self.customer if self.customer_id else None
+
+        return [self.id,
+                self.document_number,
+                self.po_id,
+                self.customer_name,
+                customer.name if customer else None,
+                customer.name_th if customer else None]
+
     def delete(self):
         """
         Overrides the standard delete method.
@@ -326,35 +365,18 @@ class Acknowledgement(models.Model):
             raise TypeError("Missing Delivery Date")
     
     def create_and_upload_pdfs(self, delete_original=True):
-        ack_filename, production_filename, label_filename, qc_filename = self.create_pdfs()
-        ack_key = "acknowledgement/{0}/Acknowledgement-{0}.pdf".format(self.document_number)
-        #confirmation_key = "acknowledgement/{0}/Confirmation-{0}.pdf".format(self.document_number)
-        production_key = "acknowledgement/{0}/Production-{0}.pdf".format(self.document_number)
-        label_key = "acknowledgement/{0}/Label-{0}.pdf".format(self.document_number)
-        bucket = "document.dellarobbiathailand.com"
-        ack_pdf = S3Object.create(ack_filename, ack_key, bucket, delete_original=delete_original)
-        #confirmation_pdf = S3Object.create(confirmation_filename, confirmation_key, bucket, delete_original=delete_original)
-        prod_pdf = S3Object.create(production_filename, production_key, bucket, delete_original=delete_original)
-        label_pdf = S3Object.create(label_filename, label_key, bucket, delete_original=delete_original)
-
-        # Create QC key and upload and add to files
-        try:
-            qc_key = "acknowledgment/{0}/Quality_Control-{0}.pdf".format(self.document_number)
-            qc_pdf = S3Object.create(qc_filename, qc_key, bucket, delete_original=delete_original)
-
-            # Add qc file to the
-            File.objects.create(file=qc_pdf, acknowledgement=self)
-        except Exception as e:
-            logger.warn(e)
+        products = self.items.all().order_by('id')
 
-        # Save references for files
-        self.label_pdf = label_pdf
-        self.acknowledgement_pdf = ack_pdf
-        #self.confirmation_pdf = confirmation_pdf
-        self.production_pdf = prod_pdf
+        for document, pdf_class, key_format, attr in self.documents:
+            # The QC document is optional and must not stop the other uploads
+            if attr is None:
+                try:
+                    self.create_and_upload_pdf(document, products=products, delete_original=delete_original)
+                except Exception as e:
+                    logger.warn(e)
+            else:
+                self.create_and_upload_pdf(document, products=products, delete_original=delete_original)
 
-        
-        
         self.save()
         
     def create_pdfs(self):
@@ -366,29 +388,119 @@ class Acknowledgement(models.Model):
         """
         products = self.items.all().order_by('id')
 
-        # Initialize pdfs
-        ack_pdf = AcknowledgementPDF(customer=self.customer, ack=self, products=products)
-        confirmation_pdf = ConfirmationPDF(customer=self.customer, ack=self, products=products)
-        production_pdf = ProductionPDF(customer=self.customer, ack=self, products=products)
-        label_pdf = ShippingLabelPDF(customer=self.customer, ack=self, products=products)
-
         # Create pdfs
-        ack_filename = ack_pdf.create()
-        #confirmation_filename = confirmation_pdf.create()
-        production_filename = production_pdf.create()
-        
-        label_filename = label_pdf.create()
+        ack_filename = self.create_pdf('acknowledgement', products=products)
+        production_filename = self.create_pdf('production', products=products)
+        label_filename = self.create_pdf('label', products=products)
 
         # Initialize and create PDF section
         try:
-            qc_pdf = QualityControlPDF(customer=self.customer, ack=self, products=products)
-            qc_filename = qc_pdf.create()
+            qc_filename = self.create_pdf('quality_control', products=products)
         except Exception as e:
             logger.warn(e)
             qc_filename = ""
 
         return ack_filename, production_filename, label_filename, qc_filename
 
+    def create_pdf(self, document, products=None):
+        """Creates a single PDF and returns the filename
+
+        The document must be one of the names listed in 
+        'documents'
+        """
+        pdf_class = self._get_document(document)[1]
+
+        if products is None:
+            products = self.items.all().order_by('id')
+
+        pdf = pdf_class(customer=self.customer, ack=self, products=products)
+
+        return pdf.create()
+
+    def create_and_upload_pdf(self, document, products=None, delete_original=True):
+        """Creates, uploads and attaches a single PDF
+
+        The PDF is only rendered again if the printable data 
+        has changed since the last upload
+        """
+        key = self._get_document(document)[2].format(self.document_number)
+
+        if products is None:
+            products = self.items.all().order_by('id')
+
+        pdf = render_cache.get_or_render(u"acknowledgement.{0}".format(document),
+                                         self.get_printable_data(products),
+                                         lambda: self.create_pdf(document, products=products),
+                                         key,
+                                         self.document_bucket,
+                                         delete_original=delete_original)
+
+        self.attach_pdf(document, pdf)
+
+        return pdf
+
+    def attach_pdf(self, document, pdf):
+        """Attaches an uploaded PDF to the acknowledgement
+
+        Documents with a reference attribute are stored on that 
+        attribute, the rest are added to the acknowledgement's files
+        """
+        attr = self._get_document(document)[3]
+
+        if attr:
+            setattr(self, attr, pdf)
+
+            # Only update the single column so that documents uploaded 
+            # by parallel workers do not overwrite each other
+            Acknowledgement.objects.filter(pk=self.pk).update(**{attr: pdf})
+        else:
+            File.objects.get_or_create(file=pdf, acknowledgement=self)
+
+    def get_printable_data(self, products=None):
+        """Returns the data printed on the acknowledgement PDFs
+
+        Changes that are not printed, such as the status, 
+        are excluded so that they do not require a new render
+        """
+        if products is None:
+            products = self.items.all().order_by('id')
+
+        excluded_fields = ('last_modified', 'status', 'calendar_event_id', 'trcloud_id', 
+                           'trcloud_document_number', 'acknowledgement_pdf_id', 'confirmation_pdf_id',
+                           'production_pdf_id', 'label_pdf_id', 'original_acknowledgement_pdf_id')
+        item_excluded_fields = ('last_modified', 'status', 'trcloud_id', 'image_id', 'fabric_id')
+
+        items = []
+        for item in products:
+            item_data = render_cache.model_data(item, exclude=item_excluded_fields)
+            item_data['image'] = render_cache.file_data(item.image)
+            item_data['fabric'] = self._get_printable_fabric(item.fabric)
+            item_data['pillows'] = [[p.type, p.quantity, p.fabric_quantity, self._get_printable_fabric(p.fabric)]
+                                    for p in item.pillows.all()]
+            item_data['components'] = [[c.id, c.description, c.quantity] for c in item.components.all()]
+            items.append(item_data)
+
+        return {'acknowledgement': render_cache.model_data(self, exclude=excluded_fields),
+                'customer': render_cache.contact_data(self.customer),
+                'project': self.project.codename if self.project else None,
+                'room': self.room.description if self.room else None,
+                'phase': self.phase.description if self.phase else None,
+                'employee': u"{0}".format(self.employee) if self.employee_id else None,
+                'items': items}
+
+    def _get_printable_fabric(self, fabric):
+        if fabric is None:
+            return None
+
+        return [fabric.id, fabric.description, render_cache.file_data(fabric.image)]
+
+    def _get_document(self, document):
+        for doc in self.documents:
+            if doc[0] == document:
+                return doc
+
+        raise ValueError(u"{0} is not a valid document".format(document))
+
     def create_and_upload_checklist(self):
         """
         Creates a shipping Label pdf and uploads to S3 service
@@ -689,76 +801,18 @@ class Acknowledgement(models.Model):
                         recipients,
                         format='html')
     
-    def _get_calendar_service(self, user):
-        if self.calendar_service:
-            self.calendar_service
-        else:
-            
-            storage = Storage(CredentialsModel, 'id', user, 'credential')
-            credentials = storage.get()
-        
-            http = credentials.authorize(httplib2.Http())
-            self.calendar_service = discovery.build('calendar', 'v3', http=http)
-            
-        return self.calendar_service
-        
-    def _get_calendar(self, user):
-        service = self._get_calendar_service(user)
-        response = service.calendarList().list().execute()
-        
-        calendar_summaries = [cal['summary'].lower() for cal in response['items']]
-    
-        # Check if user does not already has account payables
-        if 'deliveries' not in calendar_summaries:
-            # Get calendar
-            cal_id = 'dellarobbiathailand.com_vl7drjcuulloicm0qlupgsr4ko@group.calendar.google.com'
-            calendar = service.calendars().get(calendarId=cal_id).execute()
-     
-            # Add calendar to user's calendarList
-            service.calendarList().insert(body={
-                'id': calendar['id']
-            }).execute()
-            
-        else:
-            # Get calendar is already in calendarList
-            for cal in response['items']:
-                if cal['summary'].lower() == 'deliveries':
-                    calendar = cal
-            
-        return calendar
-        
     def create_calendar_event(self, user):
-        """Create a calendar event for the expected delivery date
+        """Queue the creation of the calendar event for the expected delivery date
         
         """
-        service = self._get_calendar_service(user)
-        calendar = self._get_calendar(user)
-        
-        response = service.events().insert(calendarId=calendar['id'], 
-                                           body=self._get_event_body()).execute()
-        self.calendar_event_id = response['id']
-        self.save()
+        return calendar_tasks.queue_calendar_event(self, user)
         
     def update_calendar_event(self, user=None):
-        """Create a calendar event for the expected delivery date
+        """Queue an update of the calendar event for the expected delivery date
         
         """
-        if user is None:
-            user = self.current_user or self.employee
-        
-        if self.calendar_event_id:
-            
-            service = self._get_calendar_service(user)
-            calendar = self._get_calendar(user)
+        return calendar_tasks.queue_calendar_event(self, user)
         
-            resp = service.events().update(calendarId=calendar['id'], 
-                                           eventId=self.calendar_event_id, 
-                                           body=self._get_event_body()).execute()
-                                          
-        else:
-            
-            self.create_calendar_event(user)
-                                                                       
     def _get_event_body(self):
         evt = {
             'summary': "Ack {0}".format(self.document_number),
@@ -810,10 +864,47 @@ class Acknowledgement(models.Model):
         return u"Acknowledgement #{0}".format(self.document_number)
         
 
+# Order counts and totals per status for the dashboard
+status_stats = StatusStats(Acknowledgement, buckets=(('acknowledged', 'acknowledged'),
+                                                     ('in_production', 'in production'),
+                                                     ('ready_to_ship', 'ready to ship'),
+                                                     ('shipped', 'shipped'),
+                                                     ('invoiced', 'invoiced'),
+                                                     ('paid', 'paid'),
+                                                     ('deposit_received', 'deposit received')))
+        
+
 class File(models.Model):
     acknowledgement = models.ForeignKey(Acknowledgement, on_delete=models.CASCADE)
     file = models.ForeignKey(S3Object, related_name='acknowledgement_files', on_delete=models.CASCADE)
-    
+
+
+class DocumentJob(models.Model):
+    """Status of a PDF rendered in the background for an acknowledgement"""
+    PENDING = 'pending'
+    RENDERING = 'rendering'
+    UPLOADED = 'uploaded'
+    FAILED = 'failed'
+
+    acknowledgement = models.ForeignKey(Acknowledgement, related_name='document_jobs', on_delete=models.CASCADE)
+    document = models.TextField()
+    status = models.TextField(default=PENDING)
+    message = models.TextField(null=True, blank=True)
+    file = models.ForeignKey(S3Object, null=True, related_name='+', on_delete=models.SET_NULL)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('acknowledgement', 'document')
+
+    def set_status(self, status, message=None, file=None):
+        self.status = status
+        self.message = message
+
+        if file is not None:
+            self.file = file
+
+        self.save()
+
     
 class Item(models.Model):
     trcloud_id = models.IntegerField(null=True, blank=True)
@@ -13,7 +13,7 @@ from django.utils import timezone as tz
 
 from administrator.models import User
 from administrator.serializers import UserFieldSerializer, LogSerializer, LogFieldSerializer, CompanyDefault, BaseLogSerializer
-from acknowledgements.models import Acknowledgement, Item, Pillow, Component, File, Log as AckLog
+from acknowledgements.models import Acknowledgement, Item, Pillow, Component, File, DocumentJob, Log as AckLog
 from contacts.serializers import CustomerOrderFieldSerializer, CustomerSerializer
 from supplies.serializers import FabricSerializer
 from products.serializers import ProductSerializer
@@ -25,6 +25,7 @@ from supplies.models import Fabric, Log
 from projects.models import Project, Phase, Room
 from media.models import S3Object
 from acknowledgements import service as ack_service
+from acknowledgements import tasks as ack_tasks
 
 
 logger = logging.getLogger(__name__)
@@ -359,6 +360,15 @@ class FileSerializer(serializers.ModelSerializer):
 
 
 
+class DocumentJobSerializer(serializers.ModelSerializer):
+    file = S3ObjectFieldSerializer(read_only=True)
+
+    class Meta:
+        model = DocumentJob
+        fields = ('document', 'status', 'message', 'file', 'last_modified')
+        read_only_fields = ('document', 'status', 'message', 'file', 'last_modified')
+
+
 class AcknowledgementSerializer(serializers.ModelSerializer):
     item_queryset = Item.objects.exclude(deleted=True)
 
@@ -385,13 +395,14 @@ class AcknowledgementSerializer(serializers.ModelSerializer):
     items = ItemSerializer(item_queryset, many=True)
     files = S3ObjectFieldSerializer(many=True, allow_null=True, required=False)
     logs = LogFieldSerializer(many=True, read_only=True)
+    documents = DocumentJobSerializer(source='document_jobs', many=True, read_only=True)
     
     # Method Fields
     invoices = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Acknowledgement
-        read_only_fields = ('total', 'subtotal', 'time_created', 'logs', 'balance')
+        read_only_fields = ('total', 'subtotal', 'time_created', 'logs', 'balance', 'documents')
         exclude = ('acknowledgement_pdf', 'production_pdf', 'original_acknowledgement_pdf', 'label_pdf', 'trcloud_id',
                    'trcloud_document_number')
         depth = 3
@@ -460,12 +471,9 @@ class AcknowledgementSerializer(serializers.ModelSerializer):
 
         instance.calculate_totals()
 
-        instance.create_and_upload_pdfs()
-        
-        # Add pdfs to files list
-        filenames = ['acknowledgement_pdf', 'production_pdf', 'label_pdf']
-        for filename in filenames:
-            self._add_file(getattr(instance, filename))
+        # Render the pdfs in the background. The pdfs are added 
+        # to the files list once uploaded
+        ack_tasks.queue_pdfs(instance, add_files=True)
            
         # Add files
         for file in files:
@@ -525,17 +533,7 @@ class AcknowledgementSerializer(serializers.ModelSerializer):
         # Store old total and calculate new total
         instance.calculate_totals()
 
-        try:
-            instance.create_and_upload_pdfs()
-        except IOError as e:
-
-        
-            tb = traceback.format_exc()
-            logger.error(tb)
-            
-            message = u"Unable to update PDF for acknowledgement {0} because:\n{1}"
-            message = message.format(instance.id, e)
-            self._log(message, instance)
+        ack_tasks.queue_pdfs(instance)
 
         try:
             instance.update_calendar_event()
@@ -636,6 +634,39 @@ class AcknowledgementSerializer(serializers.ModelSerializer):
 
 
 
+class AcknowledgementSummarySerializer(serializers.ModelSerializer):
+    """
+    Compact read only form of an acknowledgement for the order list
+
+    The queryset must be annotated with ack_service.annotate_invoice_total.
+    The 'fields' in the context limit the fields that are returned
+    """
+    customer = serializers.SerializerMethodField()
+    project = ProjectFieldSerializer(read_only=True)
+    delivery_date = serializers.DateTimeField(read_only=True, default_timezone=timezone('Asia/Bangkok'))
+    invoice_total = serializers.DecimalField(read_only=True, decimal_places=2, max_digits=15)
+    balance = serializers.DecimalField(read_only=True, decimal_places=2, max_digits=15)
+
+    class Meta:
+        model = Acknowledgement
+        fields = ('id', 'document_number', 'customer', 'customer_name', 'project', 'status', 'remarks',
+                  'time_created', 'delivery_date', 'last_modified', 'vat', 'total', 'grand_total',
+                  'invoice_total', 'balance')
+        read_only_fields = fields
+
+    def __init__(self, *args, **kwargs):
+        super(AcknowledgementSummarySerializer, self).__init__(*args, **kwargs)
+
+        fields = self.context.get('fields')
+        if fields:
+            for name in set(self.fields.keys()) - set(fields):
+                self.fields.pop(name)
+
+    def get_customer(self, instance):
+        return {'id': instance.customer_id,
+                'name': instance.customer.name}
+
+
 """
 Field Serializers
 """
@@ -2,7 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from decimal import Decimal
 
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone as tz
 from rest_framework import serializers
 
@@ -46,6 +49,24 @@ def log(message, acknowledgement, request):
         serializer.save()
 
 
+def annotate_invoice_total(queryset):
+    """
+    Annotates the total of the invoices of each acknowledgement as
+    'invoice_total', which Acknowledgement.balance uses instead of
+    querying the invoices
+    """
+    Invoice = Acknowledgement._meta.get_field('invoices').related_model
+    totals = Invoice.objects.filter(acknowledgement=OuterRef('pk')) \
+                            .order_by() \
+                            .values('acknowledgement') \
+                            .annotate(total=Sum('grand_total')) \
+                            .values('total')
+
+    return queryset.annotate(invoice_total=Coalesce(Subquery(totals, output_field=DecimalField()),
+                                                    Value(Decimal('0')),
+                                                    output_field=DecimalField(max_digits=15, decimal_places=2)))
+
+
 """
 Acknowledgement Item Section
 """
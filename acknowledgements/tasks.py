@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background rendering of the acknowledgement PDFs
+
+Each document is rendered and uploaded by its own worker so that
+saving an order does not wait on ReportLab or S3. The progress of
+every document is kept in a DocumentJob that clients can poll.
+"""
+from __future__ import absolute_import
+
+import logging
+import traceback
+
+from celery import shared_task, group
+from django.db import transaction
+
+from acknowledgements.models import Acknowledgement, DocumentJob, File, Log as AckLog
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_pdfs(acknowledgement, documents=None, add_files=False):
+    """
+    Marks the documents as pending and renders them in parallel workers
+    once the current transaction commits
+
+    Returns the DocumentJobs for the queued documents
+    """
+    if documents is None:
+        documents = [doc[0] for doc in acknowledgement.documents]
+
+    jobs = []
+    for document in documents:
+        job, created = DocumentJob.objects.get_or_create(acknowledgement=acknowledgement,
+                                                         document=document)
+        if not created:
+            job.set_status(DocumentJob.PENDING)
+
+        jobs.append(job)
+
+    tasks = group(render_pdf.s(acknowledgement.id, document, add_files) for document in documents)
+
+    # Workers must be able to see the saved order and items
+    transaction.on_commit(lambda: tasks.apply_async())
+
+    return jobs
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=10)
+def render_pdf(self, ack_id, document, add_file=False):
+    """
+    Renders, uploads and attaches a single acknowledgement PDF
+    """
+    ack = Acknowledgement.objects.select_related('customer', 'project', 'room', 'phase').get(pk=ack_id)
+    job = DocumentJob.objects.get(acknowledgement=ack, document=document)
+
+    job.set_status(DocumentJob.RENDERING)
+
+    try:
+        pdf = ack.create_and_upload_pdf(document)
+    except Exception as e:
+        logger.error(traceback.format_exc())
+
+        if self.request.retries < self.max_retries:
+            job.set_status(DocumentJob.PENDING, message=u"{0}".format(e))
+            raise self.retry(exc=e)
+
+        job.set_status(DocumentJob.FAILED, message=u"{0}".format(e))
+
+        message = u"Unable to create {0} PDF for Sales Order #{1} because: {2}"
+        message = message.format(document, ack.document_number, e)
+        AckLog.create(message=message,
+                      acknowledgement=ack,
+                      user=ack.employee,
+                      company=ack.company,
+                      type="SALES ORDER PDF ERROR")
+        return job.status
+
+    # Documents without a reference attribute are already added to the files
+    if add_file and ack._get_document(document)[3]:
+        File.objects.get_or_create(acknowledgement=ack, file=pdf)
+
+        message = u"Added '{0}' to Sales Order #{1} files"
+        message = message.format(pdf.filename, ack.document_number)
+        AckLog.create(message=message,
+                      acknowledgement=ack,
+                      user=ack.employee,
+                      company=ack.company,
+                      type="SALES ORDER")
+
+    job.set_status(DocumentJob.UPLOADED, file=pdf)
+
+    return job.status
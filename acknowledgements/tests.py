@@ -19,12 +19,16 @@ from django.core.urlresolvers import reverse
 from django.contrib.auth.models import Permission, Group, ContentType
 from rest_framework.test import APIRequestFactory, APITestCase, APIClient
 
-from administrator.models import User
-from acknowledgements.models import Acknowledgement, Item, Pillow, Log as AckLog
+from administrator.models import User, StatusSummary
+from administrator.metrics import QueryBudgetMixin
+from administrator import stats as admin_stats
+from acknowledgements.models import Acknowledgement, Item, Pillow, DocumentJob, Log as AckLog
 from supplies.models import Fabric, Reservation, Log
 from contacts.models import Customer, Address, Supplier
 from products.models import Product
 from media.models import S3Object
+from media import render_cache
+from acknowledgements import tasks as ack_tasks
 from projects.models import Project, Phase, Room
 
 
@@ -1137,7 +1141,7 @@ class xAcknowledgementResourceTest(APITestCase):
   
   
 
-class AcknowledgementResourceTest(APITestCase):
+class AcknowledgementResourceTest(QueryBudgetMixin, APITestCase):
     """"
     This tests the api acknowledgements:
     
@@ -1304,14 +1308,34 @@ class AcknowledgementResourceTest(APITestCase):
         Tests getting the list of acknowledgements
         """
         #Get and verify the resp
-        resp = self.client.get(self.base_url)
+        with self.assertMaxQueries(25):
+            resp = self.client.get(self.base_url)
         self.assertEqual(resp.status_code, 200, msg=resp)
         logger.debug(resp)
         #Verify the data sent
-        quotations = resp.data
+        quotations = resp.data['results']
         self.assertIsNotNone(quotations)
         self.assertEqual(len(quotations), 1)
         self.assertEqual(len(quotations[0]['items']), 2)
+
+    def test_get_summary_list(self):
+        """
+        Tests getting the compact list of acknowledgements
+        """
+        with self.assertMaxQueries(8):
+            resp = self.client.get(self.base_url, {'view': 'summary'})
+        self.assertEqual(resp.status_code, 200, msg=resp)
+
+        ack = resp.data['results'][0]
+        self.assertNotIn('items', ack)
+        self.assertEqual(ack['customer']['id'], 1)
+        self.assertEqual(Decimal(ack['invoice_total']), Decimal('0'))
+        self.assertEqual(Decimal(ack['balance']), Decimal(ack['grand_total']))
+
+        # Only the requested fields are returned
+        resp = self.client.get(self.base_url, {'fields': 'id,balance'})
+        self.assertEqual(resp.status_code, 200, msg=resp)
+        self.assertEqual(set(resp.data['results'][0].keys()), set(['id', 'balance']))
     
     def test_get(self):
         """
@@ -2082,6 +2106,199 @@ class AcknowledgementResourceTest(APITestCase):
         ack = Acknowledgement.objects.all()[0]
         self.assertEqual(ack.lead_time, '6 Weeks')
         
+    def test_get_documents(self):
+        """
+        Tests getting the status of the acknowledgement pdfs
+        """
+        DocumentJob.objects.create(acknowledgement=self.ack, document='acknowledgement')
+        DocumentJob.objects.create(acknowledgement=self.ack, document='production',
+                                   status=DocumentJob.FAILED, message='test')
+
+        resp = self.client.get('{0}{1}/documents/'.format(self.base_url, self.ack.id))
+        self.assertEqual(resp.status_code, 200, msg=resp)
+
+        jobs = json.loads(resp.content)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0]['document'], 'acknowledgement')
+        self.assertEqual(jobs[0]['status'], 'pending')
+        self.assertEqual(jobs[1]['status'], 'failed')
+        self.assertEqual(jobs[1]['message'], 'test')
+
+    def test_get_documents_of_unknown_acknowledgement(self):
+        """
+        Tests that the documents of a missing acknowledgement are not found
+        """
+        resp = self.client.get('{0}{1}/documents/'.format(self.base_url, 9999))
+        self.assertEqual(resp.status_code, 404)
+
+    def _patch_render(self, results):
+        """
+        Replaces the rendering and upload of the pdfs. Each call returns
+        the next result, or raises it if it is an exception
+        """
+        calls = []
+
+        def create_and_upload_pdf(ack, document, *args, **kwargs):
+            result = results[min(len(calls), len(results) - 1)]
+            calls.append(document)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        original = Acknowledgement.create_and_upload_pdf
+        Acknowledgement.create_and_upload_pdf = create_and_upload_pdf
+        self.addCleanup(setattr, Acknowledgement, 'create_and_upload_pdf', original)
+
+        return calls
+
+    def test_queue_pdfs(self):
+        """
+        Tests that queued documents are marked as pending
+        """
+        DocumentJob.objects.create(acknowledgement=self.ack, document='production', status=DocumentJob.FAILED)
+
+        jobs = ack_tasks.queue_pdfs(self.ack, documents=['acknowledgement', 'production'])
+
+        self.assertEqual([job.document for job in jobs], ['acknowledgement', 'production'])
+        self.assertEqual(DocumentJob.objects.filter(acknowledgement=self.ack, status=DocumentJob.PENDING).count(), 2)
+
+    def test_render_pdf(self):
+        """
+        Tests that a rendered pdf is attached to its job
+        """
+        calls = self._patch_render([self.file1])
+        DocumentJob.objects.create(acknowledgement=self.ack, document='acknowledgement')
+
+        ack_tasks.render_pdf.apply(args=(self.ack.id, 'acknowledgement'))
+
+        job = DocumentJob.objects.get(acknowledgement=self.ack, document='acknowledgement')
+        self.assertEqual(calls, ['acknowledgement'])
+        self.assertEqual(job.status, DocumentJob.UPLOADED)
+        self.assertEqual(job.file, self.file1)
+        self.assertIsNone(job.message)
+
+    def test_render_pdf_retry(self):
+        """
+        Tests that a failed render is tried again
+        """
+        calls = self._patch_render([IOError('S3 is down'), self.file1])
+        DocumentJob.objects.create(acknowledgement=self.ack, document='production')
+
+        ack_tasks.render_pdf.apply(args=(self.ack.id, 'production'))
+
+        job = DocumentJob.objects.get(acknowledgement=self.ack, document='production')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(job.status, DocumentJob.UPLOADED)
+        self.assertEqual(job.file, self.file1)
+
+    def test_render_pdf_failed(self):
+        """
+        Tests that a render that fails every retry is marked as failed
+        and logged
+        """
+        calls = self._patch_render([IOError('S3 is down')])
+        DocumentJob.objects.create(acknowledgement=self.ack, document='production')
+
+        ack_tasks.render_pdf.apply(args=(self.ack.id, 'production'))
+
+        job = DocumentJob.objects.get(acknowledgement=self.ack, document='production')
+        self.assertEqual(len(calls), ack_tasks.render_pdf.max_retries + 1)
+        self.assertEqual(job.status, DocumentJob.FAILED)
+        self.assertEqual(job.message, 'S3 is down')
+        self.assertIsNone(job.file)
+        self.assertEqual(AckLog.objects.filter(acknowledgement=self.ack, type="SALES ORDER PDF ERROR").count(), 1)
+
+    def test_printable_data_fingerprint(self):
+        """
+        Tests that only printed changes change the pdf fingerprint
+        """
+        key = 'acknowledgement/test.pdf'
+        fingerprint = render_cache.fingerprint('acknowledgement', key, self.ack.get_printable_data())
+
+        self.ack.status = 'ready to ship'
+        self.assertEqual(render_cache.fingerprint('acknowledgement', key, self.ack.get_printable_data()),
+                         fingerprint)
+
+        self.ack.remarks = 'Deliver before noon'
+        self.assertNotEqual(render_cache.fingerprint('acknowledgement', key, self.ack.get_printable_data()),
+                            fingerprint)
+
+    def test_stats(self):
+        """
+        Tests the order statistics follow status and total changes
+        """
+        resp = self.client.get('/api/v1/acknowledgement/stats/')
+        self.assertEqual(resp.status_code, 200, msg=resp)
+        stats = json.loads(resp.content)
+        self.assertEqual(stats['acknowledged']['count'], 1)
+        self.assertEqual(stats['shipped']['count'], 0)
+        self.assertEqual(stats['total']['count'], 1)
+
+        self.ack.status = 'Shipped'
+        self.ack.save()
+
+        stats = json.loads(self.client.get('/api/v1/acknowledgement/stats/').content)
+        self.assertEqual(stats['acknowledged']['count'], 0)
+        self.assertEqual(stats['shipped']['count'], 1)
+        self.assertEqual(Decimal(stats['shipped']['amount']), self.ack.total)
+
+        self.ack.status = 'cancelled'
+        self.ack.save()
+
+        stats = json.loads(self.client.get('/api/v1/acknowledgement/stats/').content)
+        self.assertEqual(stats['shipped']['count'], 0)
+        self.assertEqual(stats['total']['count'], 0)
+
+    def test_stats_after_update_and_delete(self):
+        """
+        Tests that deletes are removed from the statistics and that a
+        rebuild picks up queryset updates
+        """
+        stats = json.loads(self.client.get('/api/v1/acknowledgement/stats/').content)
+        self.assertEqual(stats['acknowledged']['count'], 1)
+
+        Acknowledgement.objects.filter(pk=self.ack.pk).update(status='Shipped')
+        admin_stats.rebuild_all()
+
+        stats = json.loads(self.client.get('/api/v1/acknowledgement/stats/').content)
+        self.assertEqual(stats['acknowledged']['count'], 0)
+        self.assertEqual(stats['shipped']['count'], 1)
+
+        AckLog.objects.filter(acknowledgement=self.ack).delete()
+        Acknowledgement.objects.filter(pk=self.ack.pk).delete()
+
+        stats = json.loads(self.client.get('/api/v1/acknowledgement/stats/').content)
+        self.assertEqual(stats['shipped']['count'], 0)
+        self.assertEqual(stats['total']['count'], 0)
+
+    def test_stats_for_concurrent_new_status(self):
+        """
+        Tests that a status summary created by another save at the same
+        time is added to instead of failing the save
+        """
+        self.client.get('/api/v1/acknowledgement/stats/')
+        create = StatusSummary.objects.create
+
+        def create_concurrently(**kwargs):
+            # Another save creates the summary first
+            create(document=kwargs['document'], status=kwargs['status'], count=1, amount=0)
+            return create(**kwargs)
+
+        StatusSummary.objects.create = create_concurrently
+        self.addCleanup(delattr, StatusSummary.objects, 'create')
+
+        self.ack.status = 'In Production'
+        self.ack.save()
+
+        summary = StatusSummary.objects.get(document='acknowledgements.acknowledgement', status='in production')
+        self.assertEqual(summary.count, 2)
+
+    def test_invalid_document(self):
+        """
+        Tests that only the listed documents can be created
+        """
+        self.assertRaises(ValueError, self.ack.create_pdf, 'invoice')
+
     #@unittest.skip('ok')    
     def test_delete(self):
         """
@@ -13,17 +13,25 @@ from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 from django.db import transaction, connection
 from django.db.models import Q
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 
-from acknowledgements.models import Acknowledgement, Item, Pillow
-from acknowledgements.serializers import AcknowledgementSerializer, ItemSerializer
+from acknowledgements.models import Acknowledgement, Item, Pillow, DocumentJob
+from acknowledgements.models import status_stats as ack_status_stats
+from acknowledgements.serializers import AcknowledgementSerializer, AcknowledgementSummarySerializer
+from acknowledgements.serializers import ItemSerializer, DocumentJobSerializer
+from acknowledgements import service as ack_service
+from acknowledgements import tasks as ack_tasks
 from contacts.serializers import CustomerSerializer
 from contacts.models import Customer
 from projects.models import Project, Room
 from utilities.http import save_upload
+from utilities import export
+from utilities.pagination import KeysetPagination
+from utilities import search
 from media.models import S3Object
 from media.serializers import S3ObjectSerializer
 
@@ -32,53 +40,7 @@ logger = logging.getLogger(__name__)
 
 
 def acknowledgement_stats(request):
-    cursor = connection.cursor()
-    query = """
-    SELECT (SELECT COUNT(id) 
-            FROM acknowledgements_acknowledgement where lower(status) = 'acknowledged'),
-           (SELECT SUM(total) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'acknowledged'),
-           (SELECT COUNT(id) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'in production'),
-           (SELECT SUM(total) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'in production'),
-           (SELECT COUNT(id) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'ready to ship'),
-           (SELECT SUM(total) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'ready to ship'),
-           (SELECT COUNT(id) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'shipped'),
-           (SELECT SUM(total) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'shipped'),
-           (SELECT COUNT(id) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'invoiced'),
-           (SELECT SUM(total) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'invoiced'),
-           (SELECT COUNT(id) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'paid'),
-           (SELECT SUM(total) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'paid'),
-           (SELECT COUNT(id) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'deposit received'),
-           (SELECT SUM(total) 
-                       FROM acknowledgements_acknowledgement where lower(status) = 'deposit received'),
-           COUNT(id),
-           SUM(total)
-    FROM acknowledgements_acknowledgement AS a
-    WHERE lower(status) != 'cancelled';
-    """
-    
-    cursor.execute(query)
-    row = cursor.fetchone()
-    
-    data = {'acknowledged': {'count': row[0], 'amount': str(row[1])},
-            'in_production': {'count':row[2], 'amount': str(row[3])},
-            'ready_to_ship': {'count': row[4], 'amount': str(row[5])},
-            'shipped': {'count':row[6], 'amount': str(row[7])},
-            'invoiced': {'count': row[8], 'amount': str(row[9])},
-            'paid': {'count': row[10], 'amount': str(row[11])},
-            'deposit_received': {'count': row[12], 'amount': str(row[13])},
-            'total': {'count': row[-2], 'amount': str(row[-1])}}
+    data = ack_status_stats.get()
             
     response = HttpResponse(json.dumps(data),
                             content_type="application/json")
@@ -166,39 +128,54 @@ def acknowledgement_file(request, ack_id=None):
         return response
     
 
-def acknowledgement_download(request):
-    
-    # Get the start and ending date to filter
-    start_date = dateutil.parser.parse(request.GET.get('start'))
-    end_date = dateutil.parser.parse(request.GET.get('end'))
-    logger.warn(start_date)
-    logger.warn(end_date)
-    
-    # Get the Acknowledgements
-    acknowledgements = Acknowledgement.objects.filter(time_created__gte=start_date, 
-                                          time_created__lte=end_date)
-    
-    # Create the respones and write headers 
-    filename = 'Acknowledgements_{0}_{1}'.format(start_date.strftime('%Y-%m-%d'),
-                                                 end_date.strftime('%Y-%m-%d'))       
-    response = HttpResponse(content_type="text/csv")
-    response['Content-Disposition'] = 'attachment; filename="{0}.csv"'.format(filename)
-    
-    # Write BOM to make UTF-8     
-    response.write("\xEF\xBB\xBF")
+@login_required
+def acknowledgement_documents(request, ack_id=None):
+    """
+    Returns the status of the acknowledgement's PDFs
 
-    # Write to file
-    writer = csv.writer(response, encoding='cp874')
-    writer.writerow(['id', 'date', 'customer', 'vat', 'total'])
-    
-    for acknowledgement in acknowledgements:
-        writer.writerow([acknowledgement.id,
-                         acknowledgement.time_created,
-                         u'{0}'.format(acknowledgement.customer.name),
-                         '{0}'.format(acknowledgement.vat),
-                         '{0}'.format(acknowledgement.total)])
-                         
+    A POST will render the failed documents again
+    """
+    ack = get_object_or_404(Acknowledgement, pk=ack_id)
+
+    if request.method.lower() == "post":
+        documents = ack.document_jobs.filter(status=DocumentJob.FAILED).values_list('document', flat=True)
+        ack_tasks.queue_pdfs(ack, documents=list(documents))
+
+    jobs = ack.document_jobs.all().select_related('file').order_by('id')
+    serializer = DocumentJobSerializer(jobs, many=True)
+    response = HttpResponse(JSONRenderer().render(serializer.data),
+                            content_type="application/json")
+    response.status_code = 200
     return response
+
+
+ACKNOWLEDGEMENT_COLUMNS = (('id', 'id', lambda d: d.id),
+                           ('date', 'date', lambda d: d.time_created),
+                           ('customer', 'customer', lambda d: d.customer.name if d.customer else None),
+                           ('vat', 'vat', lambda d: d.vat),
+                           ('total', 'total', lambda d: d.total),
+                           ('subtotal', 'subtotal', lambda d: d.subtotal),
+                           ('vat_amount', 'vat amount', lambda d: d.vat_amount),
+                           ('grand_total', 'grand total', lambda d: d.grand_total),
+                           ('status', 'status', lambda d: d.status))
+
+
+def acknowledgement_download(request):
+    """
+    Streams the acknowledgements created between 'start' and 'end' as a csv file
+    """
+    start_date, end_date = export.parse_date_range(request)
+
+    acknowledgements = Acknowledgement.objects.select_related('customer')
+    if start_date:
+        acknowledgements = acknowledgements.filter(time_created__gte=start_date)
+    if end_date:
+        acknowledgements = acknowledgements.filter(time_created__lt=end_date)
+
+    filename = 'Acknowledgements_{0}_{1}'.format(request.GET.get('start', '')[:10], request.GET.get('end', '')[:10])
+
+    return export.stream(request, acknowledgements.order_by('id'), ACKNOWLEDGEMENT_COLUMNS, filename,
+                         default=('id', 'date', 'customer', 'vat', 'total'))
     
     
 class AcknowledgementMixin(object):
@@ -309,6 +286,11 @@ class AcknowledgementMixin(object):
 
         
 class AcknowledgementList(AcknowledgementMixin, generics.ListCreateAPIView):
+    """
+    '?view=summary' or '?fields=id,customer,balance' lists the compact
+    summary of each acknowledgement instead of the full nested form
+    """
+    pagination_class = KeysetPagination
     
     def post(self, request, *args, **kwargs):
         """
@@ -320,6 +302,38 @@ class AcknowledgementList(AcknowledgementMixin, generics.ListCreateAPIView):
         request = self._condense_pillows(request)
 
         return super(AcknowledgementList, self).post(request, *args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        """
+        Sign the urls of all the files on the page together
+        before they are serialized
+        """
+        page = super(AcknowledgementList, self).paginate_queryset(queryset)
+
+        if page is not None and not self._is_summary():
+            files = []
+            for ack in page:
+                files += [f for f in ack.files.all()]
+                files += [item.image for item in ack.items.all()]
+                files += [job.file for job in ack.document_jobs.all()]
+
+            S3Object.generate_urls(files)
+
+        return page
+
+    def get_serializer_class(self):
+        if self._is_summary():
+            return AcknowledgementSummarySerializer
+
+        return super(AcknowledgementList, self).get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super(AcknowledgementList, self).get_serializer_context()
+
+        fields = self.request.query_params.get('fields', '')
+        context['fields'] = [name.strip() for name in fields.split(',') if name.strip()]
+
+        return context
          
     def get_queryset(self):
         """
@@ -334,8 +348,7 @@ class AcknowledgementList(AcknowledgementMixin, generics.ListCreateAPIView):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(customer__name__icontains=query) | 
-                                       Q(pk__icontains=query)).distinct('id')
+            queryset = search.search(queryset, query)
                         
         #Filter by project
         project_id = self.request.query_params.get('project_id', None)
@@ -353,18 +366,12 @@ class AcknowledgementList(AcknowledgementMixin, generics.ListCreateAPIView):
             queryset = queryset.filter(Q(customer__name__icontains="decoroom") |
                                        Q(customer__id=420) |
                                        Q(customer__id=257))
+
+        queryset = ack_service.annotate_invoice_total(queryset)
+
+        if self._is_summary():
+            return queryset.select_related('customer', 'project')
             
-        offset = self.request.query_params.get('offset', None)
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        
-        if offset != None and limit:
-            queryset = queryset[int(offset):limit + int(offset)]
-        elif offset is None and limit:
-            queryset = queryset[0:limit]
-        else:
-            queryset = queryset[0:50]
-        
-        
         queryset = queryset.select_related('customer', 
                                             'project', 
                                             'room',
@@ -386,19 +393,17 @@ class AcknowledgementList(AcknowledgementMixin, generics.ListCreateAPIView):
                                              'items__components',
                                              'items__pillows',
                                              'files',
+                                             'document_jobs',
+                                             'document_jobs__file',
                                              'invoices')
         
         return queryset
-        
-    def get_paginate_by(self):
-        """
-        
-        """
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        if limit == 0:
-            return self.queryset.count()
-        else:
-            return limit    
+
+    def _is_summary(self):
+        params = self.request.query_params
+
+        return self.request.method == 'GET' and (params.get('view') == 'summary' or bool(params.get('fields')))
+
 
 class AcknowledgementDetail(AcknowledgementMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Acknowledgement.objects.all()
@@ -442,6 +447,8 @@ class AcknowledgementDetail(AcknowledgementMixin, generics.RetrieveUpdateDestroy
                                              'items__components',
                                              'items__pillows',
                                              'files', 
+                                             'document_jobs',
+                                             'document_jobs__file',
                                              'invoices')
         
         return queryset
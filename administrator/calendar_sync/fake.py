@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+In memory stand in for the Google Calendar api
+
+Only the parts of the api used by calendar_sync.service are provided.
+The executed requests are recorded in 'requests' and the events are
+kept in 'events' by event id.
+
+    service.set_service(user, FakeService())
+"""
+import itertools
+
+import httplib2
+from apiclient.errors import HttpError
+
+
+class Request(object):
+
+    def __init__(self, service, method, function):
+        self.service = service
+        self.method = method
+        self.function = function
+
+    def execute(self, http=None):
+        self.service.requests.append(self.method)
+
+        return self.function()
+
+
+class Batch(object):
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request, callback or self.callback, request_id))
+
+    def execute(self, http=None):
+        if not self.requests:
+            return
+
+        self.service.batches += 1
+
+        for request, callback, request_id in self.requests:
+            try:
+                response, exception = request.execute(), None
+            except HttpError as e:
+                response, exception = None, e
+
+            if callback:
+                callback(request_id, response, exception)
+
+
+class Resource(object):
+
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class FakeService(object):
+
+    def __init__(self, calendars=('Deliveries', 'Receivables', 'Invoices', 'Receipts')):
+        self.calendars = [{'id': u"{0}@calendar".format(summary.lower()), 'summary': summary}
+                          for summary in calendars]
+        self.events = {}
+        self.requests = []
+        self.batches = 0
+
+        self._ids = itertools.count(1)
+
+    def calendarList(self):
+        return Resource(list=lambda: Request(self, 'calendarList.list',
+                                             lambda: {'items': list(self.calendars)}),
+                        insert=lambda body: Request(self, 'calendarList.insert',
+                                                    lambda: self._add_calendar(body['id'])))
+
+    def calendars(self):
+        return Resource(get=lambda calendarId: Request(self, 'calendars.get',
+                                                       lambda: {'id': calendarId, 'summary': calendarId}))
+
+    def events(self):
+        return Resource(insert=lambda calendarId, body: Request(self, 'events.insert',
+                                                                lambda: self._insert(calendarId, body)),
+                        update=lambda calendarId, eventId, body: Request(self, 'events.update',
+                                                                         lambda: self._update(calendarId, eventId, body)))
+
+    def new_batch_http_request(self, callback=None):
+        return Batch(self, callback=callback)
+
+    def _add_calendar(self, calendar_id):
+        calendar = {'id': calendar_id, 'summary': calendar_id}
+        self.calendars.append(calendar)
+
+        return calendar
+
+    def _insert(self, calendar_id, body):
+        event_id = u"event{0}".format(next(self._ids))
+        self.events[event_id] = dict(body, id=event_id, calendarId=calendar_id)
+
+        return self.events[event_id]
+
+    def _update(self, calendar_id, event_id, body):
+        if event_id not in self.events:
+            raise HttpError(httplib2.Response({'status': 404}), b'Not Found')
+
+        self.events[event_id] = dict(body, id=event_id, calendarId=calendar_id)
+
+        return self.events[event_id]
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Google Calendar events of documents
+
+Building a calendar service fetches the api's discovery document and
+finding a calendar lists the user's calendars, which used to add
+seconds to every save. A service is now built once per credential and
+each calendar is looked up once per user, and both are kept for the
+life of the process.
+
+The events are sent through the batch endpoint of the api, up to 50 in
+one request. A document provides its event with _get_event_body(), the
+summary of its calendar with 'calendar_name' and stores the id of its
+event in 'calendar_event_id'.
+
+With the GOOGLE_CALENDAR_FAKE setting the api is replaced by an in
+memory FakeService, e.g. for tests.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import httplib2
+from apiclient import discovery
+from django.conf import settings
+
+from administrator.models import CredentialsModel, Storage
+from administrator.calendar_sync.fake import FakeService
+
+
+logger = logging.getLogger(__name__)
+
+# Calendar added to the user's calendars if it does not have the document's calendar
+shared_calendar_id = 'dellarobbiathailand.com_vl7drjcuulloicm0qlupgsr4ko@group.calendar.google.com'
+
+batch_size = 50
+service_timeout = 3600
+
+_services = {}
+_calendars = {}
+_lock = threading.Lock()
+_fake = FakeService()
+
+
+def get_service(user):
+    """
+    Returns the calendar service for the user's credentials. Services are
+    rebuilt after an hour so that new credentials are used
+    """
+    if getattr(settings, 'GOOGLE_CALENDAR_FAKE', False):
+        return _services.get(user.pk, (_fake, None))[0]
+
+    now = time.time()
+    cached = _services.get(user.pk)
+
+    if cached is None or now - cached[1] > service_timeout:
+        with _lock:
+            cached = _services.get(user.pk)
+
+            if cached is None or now - cached[1] > service_timeout:
+                credentials = Storage(CredentialsModel, 'id', user, 'credential').get()
+                if credentials is None:
+                    raise ValueError(u"{0} has no Google credentials".format(user.username))
+
+                http = credentials.authorize(httplib2.Http())
+                cached = (discovery.build('calendar', 'v3', http=http), now)
+                _services[user.pk] = cached
+
+    return cached[0]
+
+
+def set_service(user, service):
+    """
+    Sets the service used for the user, e.g. a FakeService
+    """
+    with _lock:
+        _services[user.pk] = (service, time.time())
+        for key in [key for key in _calendars if key[0] == user.pk]:
+            del _calendars[key]
+
+
+def clear():
+    with _lock:
+        _services.clear()
+        _calendars.clear()
+
+
+def get_calendar_id(service, user, name):
+    """
+    Returns the id of the user's calendar with the summary 'name'
+    """
+    key = (user.pk, name.lower())
+
+    if key not in _calendars:
+        _calendars[key] = _find_calendar(service, name.lower())
+
+    return _calendars[key]
+
+
+def send(changes):
+    """
+    Creates or updates the events of the (change, document) pairs in
+    batches per user
+
+    Returns the error of every change that could not be sent by change id
+    """
+    errors = {}
+    by_user = defaultdict(list)
+
+    for change, document in changes:
+        by_user[change.user_id].append((change, document))
+
+    for user_id, pairs in by_user.items():
+        user = pairs[0][0].user
+
+        try:
+            if user is None:
+                raise ValueError(u"No user to send the event as")
+
+            service = get_service(user)
+        except Exception as e:
+            errors.update({change.pk: e for change, document in pairs})
+            continue
+
+        for index in xrange(0, len(pairs), batch_size):
+            errors.update(_send_batch(service, user, pairs[index:index + batch_size]))
+
+    return errors
+
+
+def _send_batch(service, user, pairs):
+    errors = {}
+    event_ids = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors[int(request_id)] = exception
+        elif response:
+            event_ids[int(request_id)] = response.get('id')
+
+    batch = service.new_batch_http_request(callback=callback)
+
+    for change, document in pairs:
+        try:
+            calendar_id = get_calendar_id(service, user, document.calendar_name)
+            body = document._get_event_body()
+        except Exception as e:
+            errors[change.pk] = e
+            continue
+
+        if document.calendar_event_id:
+            request = service.events().update(calendarId=calendar_id,
+                                              eventId=document.calendar_event_id,
+                                              body=body)
+        else:
+            request = service.events().insert(calendarId=calendar_id, body=body)
+
+        batch.add(request, request_id=str(change.pk))
+
+    # A failed request fails every change of the batch that has no result
+    # yet, so that they are tried again instead of aborting the other batches
+    try:
+        batch.execute()
+    except Exception as e:
+        logger.warn(u"Unable to send the calendar events of {0}: {1}".format(user.username, e))
+        for change, document in pairs:
+            if change.pk not in event_ids and change.pk not in errors:
+                errors[change.pk] = e
+
+    for change, document in pairs:
+        model = type(document)
+        event_id = event_ids.get(change.pk)
+
+        # The ids of new events are stored without saving the document
+        if event_id and event_id != document.calendar_event_id:
+            model.objects.filter(pk=document.pk).update(calendar_event_id=event_id)
+            document.calendar_event_id = event_id
+
+        # Events that were deleted from the calendar are created again
+        status = getattr(getattr(errors.get(change.pk), 'resp', None), 'status', None)
+        if document.calendar_event_id and status in (404, 410):
+            model.objects.filter(pk=document.pk).update(calendar_event_id=None)
+            document.calendar_event_id = None
+
+    return errors
+
+
+def _find_calendar(service, name):
+    response = service.calendarList().list().execute()
+
+    for calendar in response.get('items', []):
+        if calendar['summary'].lower() == name:
+            return calendar['id']
+
+    # Add the shared calendar to the user's calendars
+    calendar = service.calendars().get(calendarId=shared_calendar_id).execute()
+    service.calendarList().insert(body={'id': calendar['id']}).execute()
+
+    return calendar['id']
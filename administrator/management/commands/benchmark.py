@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generates synthetic data in a test database and times the core flows
+
+    python manage.py benchmark --settings=EmployeeCenter.test-settings
+    python manage.py benchmark --scale 0.01 --repeat 3
+    python manage.py benchmark --flow acknowledgement_list --flow supply_list --compare benchmarks/results/20190101-120000.json
+
+With --keepdb the data of the first run is kept and reused by the next
+runs, whatever their --scale. The rows created by the flows are kept as
+well, so the volumes of every run are recorded in its results and
+differences are shown by --compare.
+"""
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks import flows, generators, runner
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Times the core business flows against generated data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, dest='scale', default=1.0,
+                            help="Multiplies the volume of generated data")
+        parser.add_argument('--flow', action='append', dest='flows', default=[],
+                            choices=list(flows.FLOWS.keys()),
+                            help="Flow to run. All flows that do not need network access run by default")
+        parser.add_argument('--network', action='store_true', dest='network', default=False,
+                            help="Also run the flows that need network access")
+        parser.add_argument('--repeat', type=int, dest='repeat', default=5,
+                            help="Number of timed runs of every flow")
+        parser.add_argument('--output', dest='output', default=None,
+                            help="Directory to save the results in")
+        parser.add_argument('--compare', dest='compare', default=None,
+                            help="Results of an earlier run to compare with")
+        parser.add_argument('--keepdb', action='store_true', dest='keepdb', default=False,
+                            help="Keep the benchmark database and reuse its data in the next run")
+
+    def handle(self, *args, **options):
+        previous = runner.load(options['compare']) if options['compare'] else None
+        verbosity = options['verbosity']
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=options['keepdb'])
+
+        try:
+            data = generators.load() if options['keepdb'] else None
+
+            if data is None:
+                self.stdout.write(u"Generating data at scale {0}".format(options['scale']))
+                data = generators.generate(scale=options['scale'])
+            else:
+                self.stdout.write(u"Reusing the data kept from an earlier run")
+
+            results = runner.run(data, names=options['flows'], repeat=options['repeat'],
+                                 network=options['network'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=options['keepdb'])
+
+        path = runner.save(results, options['output'])
+
+        for name, result in results['flows'].items():
+            if 'error' in result:
+                self.stdout.write(u"{0:<32} failed: {1}".format(name, result['error']))
+            else:
+                self.stdout.write(u"{0:<32} {1:>9.4f}s median {2:>9.4f}s max {3:>6} queries".format(
+                    name, result['median'], result['max'], result['queries']))
+
+        if previous:
+            self.stdout.write(u"\nCompared with {0}".format(options['compare']))
+            for name, (before, after) in runner.compare_volumes(results, previous).items():
+                self.stdout.write(u"The volume of {0} changed from {1} to {2}".format(name, before, after))
+            for name, change in runner.compare(results, previous).items():
+                self.stdout.write(u"{0:<32} {1:>+8.1f}% {2:>6} -> {3} queries".format(
+                    name, change['change'], change['previous_queries'], change['queries']))
+
+        self.stdout.write(u"\nSaved the results to {0}".format(path))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reports the sampled query counts and latency of the endpoints
+
+    python manage.py endpoint_metrics
+    python manage.py endpoint_metrics --days 1 --sort time --endpoint acknowledgements
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from administrator import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Reports the average queries, timings and sizes of the endpoints"
+
+    columns = (('count', 'Requests'),
+               ('errors', 'Errors'),
+               ('queries', 'Queries'),
+               ('max_queries', 'Max'),
+               ('db_time', 'DB ms'),
+               ('view_time', 'View ms'),
+               ('render_time', 'Render ms'),
+               ('time', 'Total ms'),
+               ('max_time', 'Max ms'),
+               ('size', 'Bytes'))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, dest='days', default=7,
+                            help="Number of days to report")
+        parser.add_argument('--endpoint', dest='endpoint', default=None,
+                            help="Only report the endpoints that contain this text")
+        parser.add_argument('--sort', dest='sort', default='queries',
+                            choices=[column[0] for column in self.columns],
+                            help="Column to sort the endpoints by")
+        parser.add_argument('--limit', type=int, dest='limit', default=None,
+                            help="Number of endpoints to report")
+
+    def handle(self, *args, **options):
+        rows = metrics.report(days=options['days'], endpoint=options['endpoint'], sort=options['sort'])
+        rows = rows[:options['limit']] if options['limit'] else rows
+
+        if not rows:
+            self.stdout.write(u"No requests have been sampled")
+            return
+
+        width = max(len(u"{0} {1}".format(row['method'], row['endpoint'])) for row in rows)
+
+        self.stdout.write(u"{0:<{1}}".format(u"Endpoint", width) +
+                          u"".join(u"{0:>11}".format(header) for name, header in self.columns))
+
+        for row in rows:
+            self.stdout.write(u"{0:<{1}}".format(u"{0} {1}".format(row['method'], row['endpoint']), width) +
+                              u"".join(u"{0:>11}".format(row[name]) for name, header in self.columns))
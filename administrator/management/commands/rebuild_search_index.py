@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Creates the trigram indexes of the search documents and sets the
+documents of all existing rows
+
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --skip-documents
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from accounting.models import Account
+from acknowledgements.models import Acknowledgement
+from contacts.models import Contact, Customer
+from supplies.models import Supply
+from utilities import search
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Creates the search indexes and rebuilds the search documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-documents', action='store_true', dest='skip_documents', default=False,
+                            help="Only create the indexes")
+
+    def handle(self, *args, **options):
+        for model in (Acknowledgement, Contact, Supply, Account):
+            index = search.create_index(model)
+            self.stdout.write(u"Created index {0}".format(index))
+
+        if options['skip_documents']:
+            return
+
+        querysets = [Acknowledgement.objects.select_related('customer'),
+                     Contact.objects.all(),
+                     # Customers also have a first and last name
+                     Customer.objects.all(),
+                     Supply.objects.select_related('fabric').prefetch_related('products__supplier'),
+                     Account.objects.all()]
+
+        for queryset in querysets:
+            count = search.refresh(queryset)
+            self.stdout.write(u"Updated {0} {1} search documents".format(count, queryset.model.__name__))
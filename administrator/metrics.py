@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Query counts and latency of the endpoints
+
+MetricsMiddleware samples a share of the requests and records, for the
+view that handled each one, the number of SQL queries, the time spent in
+the database, in the view and rendering the response, and the size of
+the response. The samples are added up in a daily EndpointMetric row per
+endpoint.
+
+    MIDDLEWARE = [..., 'administrator.metrics.MetricsMiddleware']
+
+    METRICS = {
+        'SAMPLE_RATE': 0.1
+    }
+
+Queries are counted with Django's debug cursor, which is only turned on
+for the sampled requests. The averages are reported by the metrics
+endpoint and by 'python manage.py endpoint_metrics'.
+
+Tests keep the queries of an endpoint within a budget with
+QueryBudgetMixin:
+
+    with self.assertMaxQueries(10):
+        self.client.get('/api/v1/acknowledgement/?view=summary')
+"""
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction, DatabaseError, IntegrityError
+from django.db.models import F, Max, Sum, Value, FloatField, IntegerField, BigIntegerField
+from django.db.models.functions import Greatest
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+
+from administrator.models import EndpointMetric
+
+
+logger = logging.getLogger(__name__)
+
+default_sample_rate = 0.1
+
+
+def get_sample_rate():
+    return float(getattr(settings, 'METRICS', {}).get('SAMPLE_RATE', default_sample_rate))
+
+
+def get_endpoint(view_func):
+    """
+    Returns the dotted path of the view class or function
+    """
+    view = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None) or view_func
+
+    return u"{0}.{1}".format(view.__module__, getattr(view, '__name__', type(view).__name__))
+
+
+class Sample(object):
+    """
+    Measurements of a single request
+    """
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.start = time.time()
+        self.view_end = None
+        self.render_end = None
+
+        self._connections = []
+        for connection in connections.all():
+            self._connections.append((connection, connection.force_debug_cursor, len(connection.queries_log)))
+            connection.force_debug_cursor = True
+
+    def rendered(self, response):
+        self.render_end = time.time()
+
+    def finish(self, response):
+        end = time.time()
+
+        self.queries = 0
+        self.db_time = 0.0
+
+        for connection, force_debug_cursor, start in self._connections:
+            queries = list(connection.queries_log)[start:]
+            self.queries += len(queries)
+            self.db_time += sum(float(query['time']) for query in queries)
+            connection.force_debug_cursor = force_debug_cursor
+
+        self.time = end - self.start
+        self.view_time = (self.view_end or end) - self.start
+        self.render_time = self.render_end - self.view_end if self.render_end and self.view_end else 0.0
+        self.status = response.status_code
+        self.size = 0 if response.streaming else len(response.content)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if random.random() < get_sample_rate():
+            request._metrics_sample = Sample(get_endpoint(view_func), request.method)
+
+    def process_template_response(self, request, response):
+        """
+        DRF responses are rendered after the view has returned
+        """
+        sample = getattr(request, '_metrics_sample', None)
+
+        if sample is not None:
+            sample.view_end = time.time()
+            response.add_post_render_callback(sample.rendered)
+
+        return response
+
+    def process_response(self, request, response):
+        sample = getattr(request, '_metrics_sample', None)
+
+        if sample is not None:
+            del request._metrics_sample
+            sample.finish(response)
+            record(sample)
+
+        return response
+
+
+def record(sample):
+    """
+    Adds the sample to the endpoint's row for today
+    """
+    lookup = {'endpoint': sample.endpoint,
+              'method': sample.method,
+              'date': timezone.localdate()}
+    error = 1 if sample.status >= 500 else 0
+
+    changes = {'count': F('count') + 1,
+               'errors': F('errors') + error,
+               'queries': F('queries') + sample.queries,
+               'max_queries': Greatest('max_queries', Value(sample.queries), output_field=IntegerField()),
+               'db_time': F('db_time') + sample.db_time,
+               'view_time': F('view_time') + sample.view_time,
+               'render_time': F('render_time') + sample.render_time,
+               'time': F('time') + sample.time,
+               'max_time': Greatest('max_time', Value(sample.time), output_field=FloatField()),
+               'size': F('size') + sample.size,
+               'max_size': Greatest('max_size', Value(sample.size), output_field=BigIntegerField())}
+
+    try:
+        with transaction.atomic():
+            updated = EndpointMetric.objects.filter(**lookup).update(**changes)
+
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        EndpointMetric.objects.create(count=1, errors=error, queries=sample.queries,
+                                                      max_queries=sample.queries, db_time=sample.db_time,
+                                                      view_time=sample.view_time, render_time=sample.render_time,
+                                                      time=sample.time, max_time=sample.time,
+                                                      size=sample.size, max_size=sample.size, **lookup)
+                except IntegrityError:
+                    EndpointMetric.objects.filter(**lookup).update(**changes)
+    except DatabaseError as e:
+        logger.warn(u"Unable to record the metrics of {0}: {1}".format(sample.endpoint, e))
+
+
+def report(days=7, endpoint=None, sort='queries'):
+    """
+    Returns the averages of every endpoint over the last days, with the
+    times in milliseconds and the sizes in bytes
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = EndpointMetric.objects.filter(date__gte=since)
+
+    if endpoint:
+        rows = rows.filter(endpoint__icontains=endpoint)
+
+    rows = rows.values('endpoint', 'method') \
+               .annotate(count=Sum('count'), errors=Sum('errors'), queries=Sum('queries'),
+                         max_queries=Max('max_queries'), db_time=Sum('db_time'), view_time=Sum('view_time'),
+                         render_time=Sum('render_time'), time=Sum('time'), max_time=Max('max_time'),
+                         size=Sum('size'), max_size=Max('max_size')) \
+               .order_by()
+
+    results = []
+    for row in rows:
+        count = float(row['count'] or 1)
+
+        results.append(OrderedDict([('endpoint', row['endpoint']),
+                                    ('method', row['method']),
+                                    ('count', row['count']),
+                                    ('errors', row['errors']),
+                                    ('queries', round(row['queries'] / count, 1)),
+                                    ('max_queries', row['max_queries']),
+                                    ('db_time', round(row['db_time'] * 1000 / count, 1)),
+                                    ('view_time', round(row['view_time'] * 1000 / count, 1)),
+                                    ('render_time', round(row['render_time'] * 1000 / count, 1)),
+                                    ('time', round(row['time'] * 1000 / count, 1)),
+                                    ('max_time', round(row['max_time'] * 1000, 1)),
+                                    ('size', int(row['size'] / count)),
+                                    ('max_size', row['max_size'])]))
+
+    results.sort(key=lambda result: result.get(sort, 0), reverse=True)
+
+    return results
+
+
+class QueryBudgetMixin(object):
+    """
+    Test case mixin to keep the queries of an endpoint within a budget
+    """
+    @contextmanager
+    def assertMaxQueries(self, maximum, using='default'):
+        context = CaptureQueriesContext(connections[using])
+
+        with context:
+            yield context
+
+        if len(context) > maximum:
+            queries = u"\n".join(u"{0}. {1}".format(index, query['sql'])
+                                 for index, query in enumerate(context.captured_queries, 1))
+            self.fail(u"{0} queries were executed, the budget is {1}:\n{2}".format(len(context), maximum, queries))
@@ -10,6 +10,7 @@ from time import time
 from django.db import models
 from django.contrib.auth.models import User as AuthUser, UserManager, AbstractUser
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.encoding import smart_bytes, smart_text
 from oauth2client.client import Storage as BaseStorage
 #from oauth2client.contrib.django_orm import FlowField
@@ -234,6 +235,77 @@ class Log(models.Model):
                              related_name='UserLogs')
     
     
+class StatusSummary(models.Model):
+    """
+    Running count and total of a document type per status
+    """
+    document = models.TextField()
+    status = models.TextField()
+    count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('document', 'status')
+
+
+class EndpointMetric(models.Model):
+    """
+    Sampled query counts, timings and response sizes of an endpoint per
+    day, recorded by administrator.metrics.MetricsMiddleware
+    """
+    endpoint = models.TextField()
+    method = models.TextField()
+    date = models.DateField()
+    count = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    queries = models.IntegerField(default=0)
+    max_queries = models.IntegerField(default=0)
+    db_time = models.FloatField(default=0)
+    view_time = models.FloatField(default=0)
+    render_time = models.FloatField(default=0)
+    time = models.FloatField(default=0)
+    max_time = models.FloatField(default=0)
+    size = models.BigIntegerField(default=0)
+    max_size = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('endpoint', 'method', 'date')
+
+
+class CalendarSync(models.Model):
+    """
+    Pending change to the Google Calendar event of a document
+
+    Changes to a document while it waits are coalesced into one row. The
+    event is built from the document when the change is sent by
+    administrator.tasks.sync_calendar_events.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    app_label = models.TextField()
+    model_name = models.TextField()
+    object_id = models.IntegerField()
+    user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL, related_name='+')
+    status = models.TextField(default=PENDING)
+    attempts = models.IntegerField(default=0)
+    message = models.TextField(null=True, blank=True)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = (('status', 'next_attempt'),)
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.message = message
+        self.save()
+
+    
 class CredentialsModel(models.Model):
     id = models.ForeignKey(User, primary_key=True, on_delete=models.CASCADE)
     credential = CredentialsField()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Status statistics for orders
+
+The count and total of every status is kept in a StatusSummary
+that is updated whenever a document's status or total changes and
+whenever a document is deleted. The summary is built with a single
+grouped query the first time it is needed, and the formatted statistics
+are cached for a short time.
+
+Changes made with queryset.update() or directly in the database are not
+seen by the summary, so every summary is rebuilt nightly by
+administrator.tasks.rebuild_status_summaries.
+"""
+import logging
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete
+from django.db.models.functions import Lower
+
+from administrator.models import StatusSummary
+
+
+logger = logging.getLogger(__name__)
+
+# Every StatusStats, so that all summaries can be rebuilt at once
+registry = []
+
+
+class StatusStats(object):
+    cache_timeout = 30
+
+    def __init__(self, model, buckets, amount_field='total', excluded_statuses=('cancelled',)):
+        """
+        'buckets' is a list of (name, status) pairs that are reported
+        along with the total of all statuses that are not excluded
+        """
+        self.model = model
+        self.buckets = buckets
+        self.amount_field = amount_field
+        self.excluded_statuses = excluded_statuses
+
+        registry.append(self)
+
+        # Deletes by queryset do not call the model's delete()
+        post_delete.connect(self._record_delete, sender=model, weak=False,
+                            dispatch_uid=u"status-stats:{0}".format(model._meta.label_lower))
+
+    @property
+    def document(self):
+        return self.model._meta.label_lower
+
+    @property
+    def cache_key(self):
+        return u"status-stats:{0}".format(self.document)
+
+    def get(self):
+        """
+        Returns the count and amount per bucket
+        """
+        data = cache.get(self.cache_key)
+
+        if data is None:
+            summaries = StatusSummary.objects.filter(document=self.document)
+
+            if not summaries.exists():
+                self.rebuild()
+
+            data = self._format(summaries.values_list('status', 'count', 'amount'))
+            cache.set(self.cache_key, data, self.cache_timeout)
+
+        return data
+
+    def rebuild(self):
+        """
+        Rebuilds the summary from the documents in one grouped query
+        """
+        rows = self.model.objects.annotate(status_lower=Lower('status'))
+        rows = rows.values('status_lower').annotate(count=Count('id'), amount=Sum(self.amount_field))
+        rows = rows.order_by()
+
+        with transaction.atomic():
+            StatusSummary.objects.filter(document=self.document).delete()
+            StatusSummary.objects.bulk_create([StatusSummary(document=self.document,
+                                                             status=row['status_lower'] or '',
+                                                             count=row['count'],
+                                                             amount=row['amount'] or 0)
+                                               for row in rows])
+
+        cache.delete(self.cache_key)
+
+    def get_saved_values(self, instance):
+        """
+        Returns the status and amount currently saved for the instance
+        """
+        if instance.pk is None:
+            return None
+
+        return self.model.objects.filter(pk=instance.pk).values_list('status', self.amount_field).first()
+
+    def record_save(self, instance, old_values=None):
+        """
+        Moves the instance from its old status and amount to the new ones
+        """
+        new_values = (instance.status, getattr(instance, self.amount_field))
+
+        old_values = self._normalize(old_values)
+        new_values = self._normalize(new_values)
+
+        if old_values == new_values:
+            return
+
+        # The summary is built from scratch the first time it is requested
+        if not StatusSummary.objects.filter(document=self.document).exists():
+            return
+
+        with transaction.atomic():
+            if old_values:
+                self._apply(old_values[0], -1, -old_values[1])
+
+            self._apply(new_values[0], 1, new_values[1])
+
+        cache.delete(self.cache_key)
+
+    def record_delete(self, instance):
+        """
+        Removes the instance from the summary
+        """
+        values = self._normalize((instance.status, getattr(instance, self.amount_field)))
+
+        if not StatusSummary.objects.filter(document=self.document).exists():
+            return
+
+        self._apply(values[0], -1, -values[1])
+
+        cache.delete(self.cache_key)
+
+    def _record_delete(self, sender, instance, **kwargs):
+        self.record_delete(instance)
+
+    def _apply(self, status, count, amount):
+        """
+        Adds to the summary of the status. The first documents of a new
+        status can be saved at the same time, so a summary that was
+        created by another transaction is updated instead
+        """
+        summaries = StatusSummary.objects.filter(document=self.document, status=status)
+        changes = {'count': F('count') + count, 'amount': F('amount') + amount}
+
+        if not summaries.update(**changes):
+            try:
+                with transaction.atomic():
+                    StatusSummary.objects.create(document=self.document, status=status, count=count, amount=amount)
+            except IntegrityError:
+                summaries.update(**changes)
+
+    def _normalize(self, values):
+        if values is None:
+            return None
+
+        status, amount = values
+
+        return ((status or '').lower(), Decimal(str(amount or 0)))
+
+    def _format(self, summaries):
+        totals = {}
+        for status, count, amount in summaries:
+            totals[status] = (count, amount)
+
+        data = {}
+        for name, status in self.buckets:
+            count, amount = totals.get(status, (0, Decimal('0')))
+            data[name] = {'count': count, 'amount': str(amount)}
+
+        included = [totals[status] for status in totals if status not in self.excluded_statuses]
+        data['total'] = {'count': sum(t[0] for t in included),
+                         'amount': str(sum((t[1] for t in included), Decimal('0')))}
+
+        return data
+
+
+def rebuild_all():
+    """
+    Rebuilds the summaries of every document
+    """
+    for stats in registry:
+        stats.rebuild()
+
+    return len(registry)
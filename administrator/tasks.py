@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background tasks for the administrator application
+
+Changes to the calendar events of documents are queued while the
+document is saved and sent in batches by a worker once the transaction
+has committed. The queue is also drained every minute, which picks up
+changes that are due to be tried again.
+
+    tasks.queue_calendar_event(acknowledgement, user)
+"""
+from __future__ import absolute_import
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from celery import shared_task
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from administrator import stats
+from administrator.models import CalendarSync
+from administrator.calendar_sync import service as calendar_service
+
+
+logger = logging.getLogger(__name__)
+
+max_attempts = 6
+retry_delay = 60
+stale_after = timedelta(minutes=10)
+
+
+def queue_calendar_event(document, user=None):
+    """
+    Queues the creation or update of the document's calendar event. A
+    document is only queued once while its change is pending
+    """
+    user = user or document.current_user or document.employee
+
+    change, created = CalendarSync.objects.get_or_create(app_label=document._meta.app_label,
+                                                         model_name=document._meta.model_name,
+                                                         object_id=document.pk,
+                                                         status=CalendarSync.PENDING,
+                                                         defaults={'user': user})
+
+    # A new change is sent straight away, even if the last attempt failed
+    if not created:
+        change.user = user or change.user
+        change.next_attempt = timezone.now()
+        CalendarSync.objects.filter(pk=change.pk).update(user=change.user, next_attempt=change.next_attempt)
+
+    # The worker must be able to see the saved document
+    transaction.on_commit(lambda: sync_calendar_events.delay())
+
+    return change
+
+
+@shared_task
+def sync_calendar_events(size=calendar_service.batch_size):
+    """
+    Sends the changes that are due in batches until none are left and
+    returns the number of changes sent
+    """
+    count = 0
+
+    while True:
+        changes = claim_calendar_changes(size)
+        if not changes:
+            break
+
+        send_calendar_changes(changes)
+        count += len(changes)
+
+    return count
+
+
+@shared_task
+def rebuild_status_summaries():
+    """
+    Rebuilds the order and purchase order status summaries, which do not
+    see changes made by queryset updates
+    """
+    return stats.rebuild_all()
+
+
+def claim_calendar_changes(size=calendar_service.batch_size):
+    """
+    Marks a batch of due changes as running and returns them
+
+    A change waits while an earlier change of the same document is
+    running, so that it is sent with the event id that the earlier
+    change stores instead of creating a second event
+    """
+    now = timezone.now()
+
+    running = CalendarSync.objects.filter(app_label=OuterRef('app_label'),
+                                          model_name=OuterRef('model_name'),
+                                          object_id=OuterRef('object_id'),
+                                          status=CalendarSync.RUNNING,
+                                          last_modified__gte=now - stale_after)
+
+    with transaction.atomic():
+        changes = CalendarSync.objects.filter(Q(status=CalendarSync.PENDING, next_attempt__lte=now) |
+                                              Q(status=CalendarSync.RUNNING, last_modified__lt=now - stale_after)) \
+                                      .annotate(waiting=Exists(running)) \
+                                      .filter(waiting=False) \
+                                      .order_by('next_attempt', 'id')
+
+        if connection.features.has_select_for_update_skip_locked:
+            changes = changes.select_for_update(skip_locked=True)
+
+        ids = list(changes.values_list('id', flat=True)[:size])
+        CalendarSync.objects.filter(pk__in=ids).update(status=CalendarSync.RUNNING, last_modified=now)
+
+    return list(CalendarSync.objects.filter(pk__in=ids).select_related('user').order_by('next_attempt', 'id'))
+
+
+def send_calendar_changes(changes):
+    """
+    Sends the changes and records the result of each
+    """
+    documents = {}
+    by_model = defaultdict(list)
+
+    for change in changes:
+        by_model[(change.app_label, change.model_name)].append(change.object_id)
+
+    for (app_label, model_name), ids in by_model.items():
+        model = apps.get_model(app_label, model_name)
+        for pk, document in model.objects.in_bulk(ids).items():
+            documents[(app_label, model_name, pk)] = document
+
+    pairs = []
+    errors = {}
+
+    for change in changes:
+        document = documents.get((change.app_label, change.model_name, change.object_id))
+        if document is None:
+            errors[change.pk] = u"{0} {1} does not exist".format(change.model_name, change.object_id)
+        else:
+            pairs.append((change, document))
+
+    errors.update(calendar_service.send(pairs))
+
+    CalendarSync.objects.filter(pk__in=[change.pk for change in changes if change.pk not in errors]) \
+                        .update(status=CalendarSync.DONE, message=None, last_modified=timezone.now())
+
+    for change in changes:
+        if change.pk in errors:
+            _retry(change, errors[change.pk])
+
+
+def _retry(change, error):
+    logger.warn(u"Unable to sync the calendar event of {0} {1}: {2}".format(change.model_name,
+                                                                           change.object_id,
+                                                                           error))
+    change.attempts += 1
+
+    if change.attempts >= max_attempts:
+        change.set_status(CalendarSync.FAILED, message=u"{0}".format(error))
+    else:
+        change.next_attempt = timezone.now() + timedelta(seconds=retry_delay * (2 ** (change.attempts - 1)))
+        change.set_status(CalendarSync.PENDING, message=u"{0}".format(error))
@@ -5,13 +5,24 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 import unittest
+from datetime import timedelta
 import logging
+import socket
 
 from django.contrib.auth.models import User, Permission, Group, ContentType
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.utils import timezone
 from tastypie.test import ResourceTestCase
 from rest_framework.test import APITestCase
 
 from auth.models import Employee, S3Object
+from administrator import metrics, tasks
+from administrator.calendar_sync import service as calendar_service
+from administrator.calendar_sync.fake import FakeService
+from administrator.models import CalendarSync, Company, EndpointMetric, Log, User as AdminUser
+from contacts.models import Customer
+from invoices.models import Invoice
 
 
 logger = logging.getLogger(__name__)
@@ -251,3 +262,208 @@ class GroupResourceTest(ResourceTestCase):
         self.assertEqual(len(group['permissions']), 1)
         self.assertEqual(group['permissions'][0]['name'], Permission.objects.get(pk=1).name)
         
+
+
+class LogPaginationTest(APITestCase):
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Test Company')
+        self.user = AdminUser.objects.create_user('logs', 'logs@yahoo.com', 'test', company=self.company)
+        self.client.force_authenticate(self.user)
+
+        # Three logs in the same millisecond
+        timestamp = timezone.now().replace(microsecond=1300)
+        self.logs = []
+        for i in xrange(3):
+            log = Log.objects.create(type='TEST', message='Log {0}'.format(i), company=self.company, user=self.user)
+            Log.objects.filter(pk=log.pk).update(timestamp=timestamp - timedelta(microseconds=100 * i))
+            self.logs.append(log)
+
+    def test_cursor_keeps_microseconds(self):
+        """
+        Test that rows in the same millisecond as the last row of a page are on the next page
+        """
+        resp = self.client.get('/api/v1/administrator/log/?limit=2')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([log['id'] for log in resp.data['results']], [self.logs[0].id, self.logs[1].id])
+
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([log['id'] for log in resp.data['results']], [self.logs[2].id])
+
+
+class CalendarSyncTest(TestCase):
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Test Company')
+        self.user = AdminUser.objects.create_user('calendar', 'calendar@yahoo.com', 'test', company=self.company)
+        self.customer = Customer.objects.create(name='Test Customer')
+        self.invoices = [Invoice.objects.create(customer=self.customer, employee=self.user, company=self.company,
+                                                _due_date=timezone.now())
+                         for i in range(3)]
+
+        self.service = FakeService()
+        calendar_service.set_service(self.user, self.service)
+
+    def tearDown(self):
+        calendar_service.clear()
+
+    def test_coalesce_changes(self):
+        """
+        Test that a document is only queued once while its change is pending
+        """
+        self.invoices[0].create_calendar_event(self.user)
+        self.invoices[0].update_calendar_event()
+
+        self.assertEqual(CalendarSync.objects.filter(object_id=self.invoices[0].id).count(), 1)
+
+    def test_send_events_in_one_batch(self):
+        """
+        Test that the events are sent in a single batch and the calendar is
+        only looked up once
+        """
+        for invoice in self.invoices:
+            invoice.create_calendar_event(self.user)
+
+        self.assertEqual(tasks.sync_calendar_events(), 3)
+        self.assertEqual(self.service.batches, 1)
+        self.assertEqual(self.service.requests.count('calendarList.list'), 1)
+        self.assertEqual(self.service.requests.count('events.insert'), 3)
+        self.assertEqual(CalendarSync.objects.filter(status=CalendarSync.DONE).count(), 3)
+
+        invoice = Invoice.objects.get(pk=self.invoices[0].pk)
+        self.assertEqual(self.service.events[invoice.calendar_event_id]['calendarId'], 'invoices@calendar')
+
+        # Updates use the stored event
+        invoice.update_calendar_event(self.user)
+        tasks.sync_calendar_events()
+
+        self.assertEqual(self.service.requests.count('calendarList.list'), 1)
+        self.assertEqual(self.service.requests.count('events.update'), 1)
+
+    def test_recreate_deleted_event(self):
+        """
+        Test that an event deleted from the calendar is created again
+        """
+        Invoice.objects.filter(pk=self.invoices[0].pk).update(calendar_event_id='deleted')
+        invoice = Invoice.objects.get(pk=self.invoices[0].pk)
+
+        change = invoice.update_calendar_event(self.user)
+        tasks.sync_calendar_events()
+
+        change.refresh_from_db()
+        self.assertEqual(change.status, CalendarSync.PENDING)
+        self.assertEqual(change.attempts, 1)
+        self.assertIsNone(Invoice.objects.get(pk=invoice.pk).calendar_event_id)
+
+        invoice.update_calendar_event(self.user)
+        tasks.sync_calendar_events()
+
+        change.refresh_from_db()
+        self.assertEqual(change.status, CalendarSync.DONE)
+        self.assertIn(Invoice.objects.get(pk=invoice.pk).calendar_event_id, self.service.events)
+
+    def test_change_while_running(self):
+        """
+        Test that a change queued while the document's first change is
+        running waits for its event id instead of creating a second event
+        """
+        first = self.invoices[0].create_calendar_event(self.user)
+        self.assertEqual(tasks.claim_calendar_changes(), [first])
+
+        second = self.invoices[0].update_calendar_event(self.user)
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(tasks.claim_calendar_changes(), [])
+
+        tasks.send_calendar_changes([first])
+        tasks.sync_calendar_events()
+
+        second.refresh_from_db()
+        self.assertEqual(second.status, CalendarSync.DONE)
+        self.assertEqual(self.service.requests.count('events.insert'), 1)
+        self.assertEqual(self.service.requests.count('events.update'), 1)
+
+    def test_failed_batch(self):
+        """
+        Test that a batch that can not be sent fails its changes without
+        stopping the batches of other users
+        """
+        def execute(http=None):
+            raise socket.error('Connection reset')
+
+        batch = self.service.new_batch_http_request()
+        batch.execute = execute
+        self.service.new_batch_http_request = lambda callback=None: batch
+
+        other = AdminUser.objects.create_user('other', 'other@yahoo.com', 'test', company=self.company)
+        other_service = FakeService()
+        calendar_service.set_service(other, other_service)
+
+        change = self.invoices[0].create_calendar_event(self.user)
+        other_change = self.invoices[1].create_calendar_event(other)
+        tasks.sync_calendar_events()
+
+        change.refresh_from_db()
+        self.assertEqual(change.status, CalendarSync.PENDING)
+        self.assertEqual(change.attempts, 1)
+        self.assertGreater(change.next_attempt, timezone.now())
+
+        other_change.refresh_from_db()
+        self.assertEqual(other_change.status, CalendarSync.DONE)
+        self.assertEqual(other_service.requests.count('events.insert'), 1)
+
+
+def customer_view(request):
+    list(Customer.objects.all())
+    list(Customer.objects.all())
+
+    return HttpResponse('customers')
+
+
+class MetricsTest(metrics.QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = metrics.MetricsMiddleware()
+        Customer.objects.create(name='Test Customer')
+
+    def _request(self):
+        request = self.factory.get('/api/v1/customer/')
+        self.middleware.process_view(request, customer_view, (), {})
+
+        return self.middleware.process_response(request, customer_view(request))
+
+    @override_settings(METRICS={'SAMPLE_RATE': 1})
+    def test_record_sampled_requests(self):
+        """
+        Test that the queries and size of sampled requests are added up
+        """
+        self._request()
+        self._request()
+
+        metric = EndpointMetric.objects.get(endpoint='administrator.tests.customer_view', method='GET')
+        self.assertEqual(metric.count, 2)
+        self.assertEqual(metric.queries, 4)
+        self.assertEqual(metric.max_queries, 2)
+        self.assertEqual(metric.size, len('customers') * 2)
+
+        row = metrics.report(days=1)[0]
+        self.assertEqual(row['endpoint'], 'administrator.tests.customer_view')
+        self.assertEqual(row['queries'], 2)
+
+    @override_settings(METRICS={'SAMPLE_RATE': 0})
+    def test_skip_unsampled_requests(self):
+        self._request()
+
+        self.assertEqual(EndpointMetric.objects.count(), 0)
+
+    def test_query_budget(self):
+        """
+        Test that exceeding a query budget fails the test
+        """
+        with self.assertMaxQueries(2):
+            customer_view(None)
+
+        with self.assertRaises(AssertionError):
+            with self.assertMaxQueries(1):
+                customer_view(None)
@@ -3,7 +3,7 @@ import logging
 
 import boto
 from django.contrib.auth.models import Permission, Group
-from django.http import HttpResponseRedirect, HttpResponse, HttpResponseBadRequest
+from django.http import HttpResponseRedirect, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate
 from django.conf import settings
@@ -15,11 +15,33 @@ import boto.ses
 from administrator.models import User
 from administrator.serializers import UserSerializer, GroupSerializer, PermissionSerializer, LogSerializer, LabelSerializer
 from administrator.models import Log, Label
+from administrator import metrics as admin_metrics
+from utilities.pagination import KeysetPagination
 
 
 logger = logging.getLogger(__name__)
 
 
+@login_required
+def metrics(request):
+    """
+    Returns the averages of the sampled requests of every endpoint
+    """
+    if not request.user.is_superuser:
+        return HttpResponseForbidden()
+
+    try:
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        return HttpResponseBadRequest("'days' must be a number")
+
+    data = admin_metrics.report(days=days,
+                                endpoint=request.GET.get('endpoint'),
+                                sort=request.GET.get('sort', 'queries'))
+
+    return HttpResponse(json.dumps(data), content_type="application/json")
+
+
 def public_email(request):
     if request.method.lower() == 'post':
         data = request.POST
@@ -187,6 +209,8 @@ class LogMixin(object):
 
 
 class LogList(LogMixin, generics.ListAPIView):
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-timestamp', 'id')
     
     def get_queryset(self):
         """
@@ -198,14 +222,6 @@ class LogList(LogMixin, generics.ListAPIView):
 
         if user_id:
             queryset = queryset.filter(user_id=user_id)
-        
-        offset = self.request.query_params.get('offset', None)
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        
-        if offset != None and limit:
-            queryset = queryset[int(offset):limit + int(offset)]
-        else:
-            queryset = queryset[0:50]
 
         queryset = queryset.select_related('user')
         
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the core business flows
+
+The generators create realistic volumes of customers, acknowledgements,
+supplies, purchase orders and attendances, and the flows time the
+requests and jobs that are run against them. Runs are saved as JSON so
+that they can be compared over time.
+
+    python manage.py benchmark --settings=EmployeeCenter.test-settings
+    python manage.py benchmark --scale 0.1 --flow acknowledgement_list --compare benchmarks/results/last.json
+
+The benchmarks run in a separate test database. Run them with the test
+settings so that background tasks run in process, files are kept on the
+local disk and calendar events go to the fake calendar.
+"""
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+The flows that are timed
+
+Each flow is a function of the generated data and an authenticated api
+client. Flows that change data only change rows of their own, so that
+every run of a flow does the same amount of work.
+"""
+import logging
+import os
+import random
+import shutil
+import tempfile
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from administrator.models import User
+from benchmarks import generators
+from hr import attendance_import
+from hr.models import Payroll
+from po.models import PurchaseOrder, Item as POItem
+from po.serializers import PurchaseOrderSerializer
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_client(data):
+    client = APIClient()
+    client.force_authenticate(user=User.objects.get(pk=data['user_id']))
+
+    return client
+
+
+def _get(client, url, params=None):
+    response = client.get(url, params or {})
+    if response.status_code != 200:
+        raise AssertionError(u"GET {0} returned {1}".format(url, response.status_code))
+
+    # Streaming responses are read so that the whole response is timed
+    return response.content if not response.streaming else b''.join(response.streaming_content)
+
+
+def acknowledgement_create(data, client):
+    """
+    Creates an acknowledgement with its pdfs through the api
+    """
+    items = [{'product': {'id': product_id},
+              'description': u"Benchmark item {0}".format(product_id),
+              'quantity': random.randint(1, 5),
+              'unit_price': random.randint(1000, 100000),
+              'pillows': [{'type': 'back'}, {'type': 'back'}, {'type': 'accent'}]}
+             for product_id in random.sample(data['product_ids'], min(4, len(data['product_ids'])))]
+
+    response = client.post('/api/v1/acknowledgement/',
+                           {'customer': {'id': random.choice(data['customer_ids'])},
+                            'delivery_date': (timezone.now() + timedelta(days=30)).isoformat(),
+                            'vat': 7,
+                            'remarks': 'Benchmark',
+                            'items': items},
+                           format='json')
+
+    if response.status_code != 201:
+        raise AssertionError(u"Creating an acknowledgement returned {0}".format(response.status_code))
+
+
+def acknowledgement_list(data, client):
+    _get(client, '/api/v1/acknowledgement/', {'limit': 50})
+
+
+def acknowledgement_summary_list(data, client):
+    _get(client, '/api/v1/acknowledgement/', {'limit': 50, 'view': 'summary'})
+
+
+def acknowledgement_search(data, client):
+    _get(client, '/api/v1/acknowledgement/', {'limit': 50, 'q': 'co', 'view': 'summary'})
+
+
+def customer_list(data, client):
+    _get(client, '/api/v1/customer/', {'limit': 50})
+
+
+def supply_list(data, client):
+    _get(client, '/api/v1/supply/', {'limit': 50})
+
+
+def purchase_order_list(data, client):
+    _get(client, '/api/v1/purchase-order/', {'limit': 50})
+
+
+def purchase_order_receive(data, client):
+    """
+    Receives a copy of an ordered purchase order, which adds the
+    quantities of its items to the supplies
+    """
+    order = PurchaseOrder.objects.get(pk=random.choice(data['purchase_order_ids']))
+    items = list(order.items.all())
+
+    order.pk = None
+    order.status = 'ORDERED'
+    order.save()
+
+    for item in items:
+        item.pk = None
+        item.purchase_order = order
+        item.status = 'Ordered'
+    POItem.objects.bulk_create(items)
+
+    serializer = PurchaseOrderSerializer(order, context={'request': None})
+    serializer.receive_order(order, {'items': []})
+
+
+def attendance_upload(data, client):
+    """
+    Imports a clock machine file with a day of clock ins and outs of
+    every employee. Every run imports a new day, so that every run
+    creates the attendances instead of updating those of the last run
+    """
+    data['attendance_uploads'] = data.get('attendance_uploads', 0) + 1
+    day = data['attendance_end'] + timedelta(days=data['attendance_uploads'])
+    attendance_import.import_attendance(generators.clock_machine_lines(data['employee_ids'], day))
+
+
+def payroll(data, client):
+    """
+    Calculates the pay records of the last two weeks of attendances
+    """
+    record = Payroll(start_date=data['attendance_end'] - timedelta(days=13), end_date=data['attendance_end'])
+    record.save()
+    record.calculate_pay_records()
+
+
+def pricelist(data, client):
+    """
+    Creates the pricelist from the products and schematics in the
+    database, which are downloaded from S3
+    """
+    from products.pricelist import PricelistPDF
+
+    directory = tempfile.mkdtemp()
+    try:
+        PricelistPDF().create(os.path.join(directory, 'Pricelist.pdf'))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# name: (flow, needs network access)
+FLOWS = OrderedDict([('acknowledgement_create', (acknowledgement_create, False)),
+                     ('acknowledgement_list', (acknowledgement_list, False)),
+                     ('acknowledgement_summary_list', (acknowledgement_summary_list, False)),
+                     ('acknowledgement_search', (acknowledgement_search, False)),
+                     ('customer_list', (customer_list, False)),
+                     ('supply_list', (supply_list, False)),
+                     ('purchase_order_list', (purchase_order_list, False)),
+                     ('purchase_order_receive', (purchase_order_receive, False)),
+                     ('attendance_upload', (attendance_upload, False)),
+                     ('payroll', (payroll, False)),
+                     ('pricelist', (pricelist, True))])
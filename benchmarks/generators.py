@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Synthetic data for the benchmarks
+
+The rows are inserted with bulk_create in batches. Customers and
+suppliers inherit from Contact, which bulk_create does not support, so
+their own tables are filled with a single insert per batch once the
+contacts exist.
+
+The volumes are multiplied by 'scale', e.g. 0.01 for a quick run.
+
+A database kept from an earlier run already holds the data, and load()
+returns its ids instead of generating it again.
+"""
+import logging
+import random
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from faker import Faker
+
+from acknowledgements.models import Acknowledgement, Item as AckItem, Pillow
+from administrator.models import Company, User
+from contacts.models import Contact, Customer, Supplier
+from hr.models import Attendance, Employee, Shift
+from po.models import PurchaseOrder, Item as POItem
+from products.models import Product
+from supplies.models import Supply, Product as SupplierProduct, Log as SupplyLog
+
+
+logger = logging.getLogger(__name__)
+
+batch_size = 1000
+
+VOLUMES = {'customers': 20000,
+           'suppliers': 500,
+           'products': 2000,
+           'acknowledgements': 10000,
+           'items_per_acknowledgement': 4,
+           'supplies': 5000,
+           'logs_per_supply': 20,
+           'purchase_orders': 5000,
+           'items_per_purchase_order': 5,
+           'employees': 400,
+           'attendance_days': 60}
+
+PILLOW_TYPES = ('back', 'accent', 'lumbar', 'corner')
+
+
+def get_volumes(scale=1.0):
+    volumes = {}
+    for name, volume in VOLUMES.items():
+        # The number of children per row does not change with the scale
+        volumes[name] = volume if '_per_' in name or name.endswith('_days') else max(1, int(volume * scale))
+
+    return volumes
+
+
+def generate(scale=1.0, seed=1234):
+    """
+    Creates the data and returns the ids of the rows the flows use
+    """
+    random.seed(seed)
+    faker = Faker()
+    faker.seed(seed)
+
+    volumes = get_volumes(scale)
+    data = {}
+
+    with transaction.atomic():
+        company = Company.objects.create(name='Benchmark Company')
+        user = User.objects.create_superuser('benchmark', '', 'benchmark', company=company)
+        data['company_id'] = company.id
+        data['user_id'] = user.id
+
+        data['customer_ids'] = create_contacts(Customer, faker, volumes['customers'],
+                                               {'type': 'Retail', 'first_name': None, 'last_name': None},
+                                               is_customer=True)
+        data['supplier_ids'] = create_contacts(Supplier, faker, volumes['suppliers'], {}, is_supplier=True)
+        data['product_ids'] = create_products(faker, volumes['products'])
+        data['supply_ids'] = create_supplies(faker, volumes['supplies'], data['supplier_ids'])
+        create_supply_logs(faker, data['supply_ids'], volumes['logs_per_supply'])
+        data['acknowledgement_ids'] = create_acknowledgements(faker, volumes['acknowledgements'],
+                                                              volumes['items_per_acknowledgement'],
+                                                              data['customer_ids'], data['product_ids'],
+                                                              company, user)
+        data['purchase_order_ids'] = create_purchase_orders(faker, volumes['purchase_orders'],
+                                                            volumes['items_per_purchase_order'],
+                                                            data['supplier_ids'], data['supply_ids'], user)
+        data['employee_ids'] = create_employees(faker, volumes['employees'])
+        data['attendance_start'], data['attendance_end'] = create_attendances(data['employee_ids'],
+                                                                              volumes['attendance_days'])
+
+    data['volumes'] = volumes
+
+    return data
+
+
+def load():
+    """
+    Returns the ids of the rows the flows use from data generated by an
+    earlier run, or None if the database does not have any
+    """
+    user = User.objects.filter(username='benchmark').first()
+    if user is None:
+        return None
+
+    def ids(model):
+        return list(model.objects.order_by('id').values_list('id', flat=True))
+
+    data = {'company_id': user.company_id,
+            'user_id': user.id,
+            'customer_ids': ids(Customer),
+            'supplier_ids': ids(Supplier),
+            'product_ids': ids(Product),
+            'supply_ids': ids(Supply),
+            'acknowledgement_ids': ids(Acknowledgement),
+            'purchase_order_ids': ids(PurchaseOrder),
+            'employee_ids': ids(Employee)}
+
+    days = Attendance.objects.aggregate(start=Min('date'), end=Max('date'))
+    data['attendance_start'], data['attendance_end'] = days['start'], days['end']
+
+    volumes = {name: volume for name, volume in VOLUMES.items() if '_per_' in name}
+    volumes.update({'customers': len(data['customer_ids']),
+                    'suppliers': len(data['supplier_ids']),
+                    'products': len(data['product_ids']),
+                    'supplies': len(data['supply_ids']),
+                    'acknowledgements': len(data['acknowledgement_ids']),
+                    'purchase_orders': len(data['purchase_order_ids']),
+                    'employees': len(data['employee_ids'])})
+    volumes['attendance_days'] = (days['end'] - days['start']).days + 1 if days['end'] else 0
+    data['volumes'] = volumes
+
+    return data
+
+
+def create_contacts(model, faker, count, fields, **flags):
+    """
+    Creates contacts of a model that inherits from Contact and returns
+    their ids
+    """
+    ids = []
+    columns = ['contact_ptr_id'] + list(fields.keys())
+    sql = u"INSERT INTO {0} ({1}) VALUES ({2})".format(
+        connection.ops.quote_name(model._meta.db_table),
+        u", ".join(connection.ops.quote_name(column) for column in columns),
+        u", ".join(['%s'] * len(columns)))
+
+    for start in xrange(0, count, batch_size):
+        contacts = [Contact(name=faker.company(), telephone=faker.phone_number(), email=faker.email(),
+                            address=faker.address(), **flags)
+                    for i in xrange(min(batch_size, count - start))]
+        contacts = _bulk_create(Contact, contacts)
+
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [[contact.pk] + list(fields.values()) for contact in contacts])
+
+        ids += [contact.pk for contact in contacts]
+
+    logger.info(u"Created {0} {1}".format(count, model._meta.verbose_name_plural))
+
+    return ids
+
+
+def create_products(faker, count):
+    products = [Product(description=u"{0} {1}".format(faker.word().title(), random.choice(['Sofa', 'Chair', 'Table', 'Bed'])),
+                        type='upholstery',
+                        price=Decimal(random.randint(5000, 150000)),
+                        width=random.randint(400, 3000),
+                        depth=random.randint(400, 1200),
+                        height=random.randint(300, 1000))
+                for i in xrange(count)]
+
+    return [product.pk for product in _bulk_create(Product, products)]
+
+
+def create_supplies(faker, count, supplier_ids):
+    supplies = [Supply(description=u"{0} {1}".format(faker.color_name(), faker.word()),
+                       type=random.choice(['wood', 'screw', 'foam', 'glue', 'packaging']),
+                       units=random.choice(['pc', 'kg', 'm', 'mm']),
+                       quantity_th=random.randint(0, 5000))
+                for i in xrange(count)]
+    supplies = _bulk_create(Supply, supplies)
+
+    SupplierProduct.objects.bulk_create([SupplierProduct(supply_id=supply.pk,
+                                                         supplier_id=supplier_id,
+                                                         cost=Decimal(random.randint(1, 5000)),
+                                                         lead_time=random.randint(1, 30))
+                                         for supply in supplies
+                                         for supplier_id in random.sample(supplier_ids, min(2, len(supplier_ids)))],
+                                        batch_size=batch_size)
+
+    return [supply.pk for supply in supplies]
+
+
+def create_supply_logs(faker, supply_ids, per_supply):
+    logs = (SupplyLog(supply_id=supply_id,
+                      action=random.choice(['ADD', 'SUBTRACT', 'SUBTRACT', 'RESERVE']),
+                      quantity=Decimal(random.randint(1, 50)),
+                      message=faker.sentence())
+            for supply_id in supply_ids
+            for i in xrange(per_supply))
+
+    SupplyLog.objects.bulk_create(logs, batch_size=batch_size)
+
+
+def create_acknowledgements(faker, count, items_per_acknowledgement, customer_ids, product_ids, company, user):
+    today = timezone.now()
+    ids = []
+
+    for start in xrange(0, count, batch_size):
+        acknowledgements = []
+        for i in xrange(min(batch_size, count - start)):
+            total = Decimal(random.randint(10000, 500000))
+            acknowledgements.append(Acknowledgement(customer_id=random.choice(customer_ids),
+                                                    customer_name=faker.company(),
+                                                    company=company,
+                                                    employee=user,
+                                                    document_number=start + i + 1,
+                                                    status=random.choice(['acknowledged', 'in production',
+                                                                          'ready to ship', 'shipped', 'invoiced']),
+                                                    _delivery_date=today + timedelta(days=random.randint(-365, 90)),
+                                                    remarks=faker.sentence(),
+                                                    vat=7,
+                                                    subtotal=total,
+                                                    total=total,
+                                                    grand_total=total * Decimal('1.07')))
+        acknowledgements = _bulk_create(Acknowledgement, acknowledgements)
+
+        items = [AckItem(acknowledgement_id=acknowledgement.pk,
+                         product_id=random.choice(product_ids),
+                         description=faker.catch_phrase(),
+                         quantity=Decimal(random.randint(1, 10)),
+                         unit_price=Decimal(random.randint(1000, 100000)),
+                         total=Decimal(random.randint(1000, 500000)))
+                 for acknowledgement in acknowledgements
+                 for j in xrange(items_per_acknowledgement)]
+        items = _bulk_create(AckItem, items)
+
+        Pillow.objects.bulk_create([Pillow(item_id=item.pk, type=random.choice(PILLOW_TYPES),
+                                           quantity=random.randint(1, 4))
+                                    for item in items if random.random() < 0.5],
+                                   batch_size=batch_size)
+
+        ids += [acknowledgement.pk for acknowledgement in acknowledgements]
+
+    logger.info(u"Created {0} acknowledgements".format(count))
+
+    return ids
+
+
+def create_purchase_orders(faker, count, items_per_purchase_order, supplier_ids, supply_ids, user):
+    ids = []
+
+    for start in xrange(0, count, batch_size):
+        orders = [PurchaseOrder(supplier_id=random.choice(supplier_ids),
+                                employee=user,
+                                status=random.choice(['AWAITING APPROVAL', 'ORDERED', 'RECEIVED', 'PAID']),
+                                comments=faker.sentence())
+                  for i in xrange(min(batch_size, count - start))]
+        orders = _bulk_create(PurchaseOrder, orders)
+
+        POItem.objects.bulk_create([POItem(purchase_order_id=order.pk,
+                                           supply_id=random.choice(supply_ids),
+                                           description=faker.word(),
+                                           quantity=Decimal(random.randint(1, 100)),
+                                           unit_cost=Decimal(random.randint(1, 5000)))
+                                    for order in orders
+                                    for j in xrange(items_per_purchase_order)],
+                                   batch_size=batch_size)
+
+        ids += [order.pk for order in orders]
+
+    logger.info(u"Created {0} purchase orders".format(count))
+
+    return ids
+
+
+def create_employees(faker, count):
+    shift = Shift.objects.create(start_time=time(8, 0), end_time=time(17, 0))
+    employees = [Employee(name=faker.name(),
+                          department=random.choice(['upholstery', 'carpentry', 'painting', 'office']),
+                          wage=Decimal(random.randint(300, 800)),
+                          pay_period=random.choice(['daily', 'daily', 'daily', 'monthly']),
+                          card_id=str(10000 + i),
+                          shift=shift)
+                 for i in xrange(count)]
+
+    return [employee.pk for employee in _bulk_create(Employee, employees)]
+
+
+def create_attendances(employee_ids, days):
+    """
+    Creates an attendance for every employee on every day but Sunday and
+    returns the first and last day
+    """
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    tz = timezone.get_current_timezone()
+
+    attendances = []
+    for offset in xrange(days):
+        day = start + timedelta(days=offset)
+        if day.weekday() == 6:
+            continue
+
+        for employee_id in employee_ids:
+            clock_in = tz.localize(datetime.combine(day, time(7, random.randint(30, 59))))
+            clock_out = tz.localize(datetime.combine(day, time(random.choice([17, 18, 19]), random.randint(0, 59))))
+            attendances.append(Attendance(employee_id=employee_id, date=day,
+                                          _start_time=clock_in, _end_time=clock_out))
+
+    Attendance.objects.bulk_create(attendances, batch_size=batch_size)
+
+    return start, end
+
+
+def clock_machine_lines(employee_ids, day):
+    """
+    Returns the lines of a clock machine file with the clock in and out
+    of every employee on the day
+    """
+    lines = ["No\tMchn\tEnNo\tName\tMode\tIOMd\tDateTime"]
+    cards = Employee.objects.filter(pk__in=employee_ids).values_list('card_id', flat=True)
+
+    for index, card_id in enumerate(cards):
+        for hour in (7, 17):
+            stamp = datetime.combine(day, time(hour, random.randint(0, 59)))
+            lines.append(u"{0}\t1\t{1}\t\t0\t0\t{2}".format(index, card_id, stamp.strftime('%Y/%m/%d %H:%M')))
+
+    return lines
+
+
+def _bulk_create(model, objects):
+    """
+    Inserts the objects and sets their primary keys. Only PostgreSQL
+    returns the keys of bulk inserts, so on other databases the newest
+    keys are read back
+    """
+    objects = model.objects.bulk_create(objects, batch_size=batch_size)
+
+    if objects and objects[0].pk is None:
+        pks = list(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objects)])
+        for obj, pk in zip(objects, reversed(pks)):
+            obj.pk = pk
+
+    return objects
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Times the flows and saves the results as JSON
+
+Every flow is run once to warm up and then 'repeat' times. The time and
+the number of queries of every run are recorded.
+"""
+import json
+import logging
+import os
+import platform
+import time
+from collections import OrderedDict
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from benchmarks import flows as benchmark_flows
+
+
+logger = logging.getLogger(__name__)
+
+default_directory = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def run(data, names=None, repeat=5, network=False):
+    """
+    Runs the flows and returns the results
+    """
+    if names:
+        unknown = set(names) - set(benchmark_flows.FLOWS)
+        if unknown:
+            raise ValueError(u"Unknown flows: {0}".format(u", ".join(sorted(unknown))))
+    else:
+        names = [name for name, (flow, needs_network) in benchmark_flows.FLOWS.items()
+                 if network or not needs_network]
+
+    client = benchmark_flows.get_client(data)
+    results = OrderedDict()
+
+    for name in names:
+        flow = benchmark_flows.FLOWS[name][0]
+        logger.info(u"Running {0}".format(name))
+
+        try:
+            flow(data, client)
+
+            times = []
+            queries = []
+            for i in xrange(repeat):
+                context = CaptureQueriesContext(connection)
+                start = time.time()
+                with context:
+                    flow(data, client)
+                times.append(time.time() - start)
+                queries.append(len(context))
+
+        except Exception as e:
+            logger.error(u"{0} failed: {1}".format(name, e))
+            results[name] = OrderedDict([('error', u"{0}".format(e))])
+            continue
+
+        results[name] = summarize(times, queries)
+
+    return OrderedDict([('started', timezone.now().isoformat()),
+                        ('database', connection.vendor),
+                        ('python', platform.python_version()),
+                        ('volumes', data.get('volumes', {})),
+                        ('repeat', repeat),
+                        ('flows', results)])
+
+
+def summarize(times, queries):
+    times = sorted(times)
+    middle = len(times) // 2
+    median = times[middle] if len(times) % 2 else (times[middle - 1] + times[middle]) / 2
+
+    return OrderedDict([('runs', len(times)),
+                        ('min', round(times[0], 4)),
+                        ('median', round(median, 4)),
+                        ('mean', round(sum(times) / len(times), 4)),
+                        ('max', round(times[-1], 4)),
+                        ('queries', max(queries))])
+
+
+def save(results, directory=None):
+    """
+    Saves the results in a file named after the time of the run and
+    returns the path
+    """
+    directory = directory or default_directory
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    path = os.path.join(directory, u"{0}.json".format(timezone.now().strftime('%Y%m%d-%H%M%S')))
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    return path
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def compare(results, previous):
+    """
+    Returns the change in median time and queries of every flow that is
+    in both runs
+    """
+    changes = OrderedDict()
+
+    for name, result in results['flows'].items():
+        before = previous.get('flows', {}).get(name)
+        if not before or 'median' not in before or 'median' not in result:
+            continue
+
+        change = (result['median'] - before['median']) / before['median'] * 100 if before['median'] else 0
+        changes[name] = OrderedDict([('median', result['median']),
+                                     ('previous_median', before['median']),
+                                     ('change', round(change, 1)),
+                                     ('queries', result['queries']),
+                                     ('previous_queries', before['queries'])])
+
+    return changes
+
+
+def compare_volumes(results, previous):
+    """
+    Returns the (previous, current) volumes that differ between the runs,
+    e.g. because a kept database grew with the rows created by the flows
+    """
+    volumes = results.get('volumes', {})
+    before = previous.get('volumes', {})
+
+    return OrderedDict((name, (before.get(name), volumes.get(name)))
+                       for name in sorted(set(volumes) | set(before))
+                       if before.get(name) != volumes.get(name))
@@ -15,6 +15,7 @@ from accounting.models import Account
 from trcloud.models import TRContact
 from media.models import S3Object
 from accounting.account import service as acc_service
+from utilities import search
 
 
 pp = pprint.PrettyPrinter(width=1, indent=4)
@@ -49,6 +50,7 @@ class Contact(models.Model):
     contact_service = None
     website = models.TextField(null=True, blank=True)
     google_contact_id = models.TextField(null=True, blank=True)
+    search_document = models.TextField(null=True, blank=True, editable=False)
 
     # Accounting
     account_receivable = models.ForeignKey(Account, on_delete=models.PROTECT, null=True, related_name='receivable_contact')
@@ -68,8 +70,32 @@ class Contact(models.Model):
             
         return self.contact_service
 
+    _saved_names = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Contact, cls).from_db(db, field_names, values)
+        instance._saved_names = (instance.__dict__.get('name'), instance.__dict__.get('name_th'))
+
+        return instance
+
+    def get_search_values(self):
+        return [self.name,
+                self.name_th,
+                getattr(self, 'first_name', None),
+                getattr(self, 'last_name', None),
+                self.email,
+                self.telephone,
+                self.notes]
+
+    @property
+    def name_changed(self):
+        return self._saved_names is not None and self._saved_names != (self.name, self.name_th)
+
     def save(self, *args, **kwargs):
 
+        self.search_document = search.document(self.get_search_values())
+
         if self.account_payable is None:
             try:
                 self.account_payable = acc_service.create_account_payable(self.company, self)
@@ -83,6 +109,8 @@ class Contact(models.Model):
                 pass
 
         super(Contact, self).save(*args, **kwargs)
+
+        self._saved_names = (self.name, self.name_th)
         
     def sync_google_contacts(self, user):
         # Make the service availabel via the self.contact_service attribute
@@ -211,9 +239,30 @@ class Customer(Contact):
     #class Meta:
         #ordering = ['name']
 
+    def save(self, *args, **kwargs):
+        """
+        The customer's name is part of the search document of its orders
+        """
+        name_changed = self.name_changed
+
+        super(Customer, self).save(*args, **kwargs)
+
+        if name_changed:
+            search.refresh(self.acknowledgements.select_related('customer'))
+
 
 class Supplier(Contact):
-    pass
+
+    def save(self, *args, **kwargs):
+        """
+        The supplier's name is part of the search document of its supplies
+        """
+        name_changed = self.name_changed
+
+        super(Supplier, self).save(*args, **kwargs)
+
+        if name_changed:
+            search.refresh(self.supplies.select_related('fabric').prefetch_related('products__supplier'))
 
 class SupplierContact(models.Model):
     name = models.TextField()
@@ -10,6 +10,8 @@ import logging
 from django.test import TestCase
 from administrator.models import User
 from rest_framework.test import APITestCase
+
+from administrator.metrics import QueryBudgetMixin
 from contacts.models import Address, Customer, Supplier, SupplierContact
 
 
@@ -43,7 +45,7 @@ supplier_data['contacts'] = base_supplier_contact
 del supplier_data['first_name']
 del supplier_data['last_name']
 
-class CustomerResourceTest(APITestCase):
+class CustomerResourceTest(QueryBudgetMixin, APITestCase):
     
     def setUp(self):
         super(CustomerResourceTest, self).setUp()
@@ -70,11 +72,12 @@ class CustomerResourceTest(APITestCase):
         Test GET of list 
         """
         #Retrieve and validate GET response
-        resp = self.client.get('/api/v1/customer/', format='json')
+        with self.assertMaxQueries(12):
+            resp = self.client.get('/api/v1/customer/', format='json')
         self.assertEqual(resp.status_code, 200)
         
         #test deserialized response
-        resp_obj = resp.data
+        resp_obj = resp.data['results']
         self.assertEqual(len(resp_obj), 1)
         customer = resp_obj[0]
         self.assertEqual(customer["name"], 'Charlie Brown')
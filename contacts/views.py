@@ -20,6 +20,8 @@ from acknowledgements.models import Acknowledgement as A
 from estimates.models import Estimate as Quotation
 from po.models import PurchaseOrder as PO
 from utilities.http import save_upload
+from utilities.pagination import KeysetPagination
+from utilities import search
 from media.models import S3Object
 from media.serializers import S3ObjectSerializer
 
@@ -136,10 +138,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(name__icontains=query) |
-                                       Q(email__icontains=query) |
-                                       Q(telephone__icontains=query) |
-                                       Q(notes__icontains=query))
+            queryset = search.search(queryset, query)
                                       
         offset = int(self.request.query_params.get('offset', 0))
         limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
@@ -181,7 +180,8 @@ class CustomerMixin(object):
     
     
 class CustomerList(CustomerMixin, generics.ListCreateAPIView):
-        
+    pagination_class = KeysetPagination
+
 
     def filter_queryset(self, queryset):
         """
@@ -210,19 +210,7 @@ class CustomerList(CustomerMixin, generics.ListCreateAPIView):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(name__icontains=query) |
-                                       Q(email__icontains=query) |
-                                       Q(telephone__icontains=query) |
-                                       Q(notes__icontains=query))
-
-        offset = int(self.request.query_params.get('offset', 0))
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        if offset and limit:
-            queryset = queryset[offset - 1:limit + (offset - 1)]
-        elif not offset and limit:
-            queryset = queryset[:limit]
-        else:
-            queryset = queryset[0:50]
+            queryset = search.search(queryset, query)
 
         open_orders_qs = A.objects.filter(time_created__gte=dt)
         open_orders_qs = open_orders_qs.exclude(status__in=["paid", u'invoiced', u'cancelled'])
@@ -244,17 +232,7 @@ class CustomerList(CustomerMixin, generics.ListCreateAPIView):
 
 
         return queryset
-        
-    def get_paginate_by(self):
-        """
-        
-        """
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        if limit == 0:
-            return self.queryset.count()
-        else:
-            return limit
-            
+
 
 class CustomerDetail(CustomerMixin, generics.RetrieveUpdateDestroyAPIView):
 
@@ -332,10 +310,7 @@ class SupplierList(SupplierMixin, generics.ListCreateAPIView):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(name__icontains=query) |
-                                       Q(email__icontains=query) |
-                                       Q(telephone__icontains=query) |
-                                       Q(notes__icontains=query))
+            queryset = search.search(queryset, query)
 
         offset = int(self.request.query_params.get('offset', 0))
         limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
@@ -381,10 +356,7 @@ class SupplierViewSet(viewsets.ModelViewSet):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(name__icontains=query) |
-                                       Q(email__icontains=query) |
-                                       Q(telephone__icontains=query) |
-                                       Q(notes__icontains=query))
+            queryset = search.search(queryset, query)
         
         offset = int(self.request.query_params.get('offset', 0))
         limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
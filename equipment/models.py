@@ -10,3 +10,4 @@ class Equipment(models.Model):
     cost = models.DecimalField(max_digits=12, decimal_places=2, null=True)
     employee = models.ForeignKey(Employee, null=True, related_name="equipments")
     image = models.ForeignKey(S3Object, null=True)
+    last_modified = models.DateTimeField(auto_now=True, null=True)
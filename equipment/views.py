@@ -9,6 +9,7 @@ from rest_framework import status
 from equipment.models import Equipment
 from equipment.serializers import EquipmentSerializer
 from media.stickers import StickerPage, Sticker
+from media import labels
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +23,15 @@ def sticker(request, pk=None):
     pdf.create(response)
     
     return response
+
+
+@login_required
+def stickers(request):
+    """
+    Prints the stickers of many pieces of equipment on sheets in one
+    document
+    """
+    return labels.stream(request, Equipment.objects.all(), labels.equipment_label, 'Equipment-Stickers')
     
     
 class EquipmentMixin(object):
@@ -19,6 +19,7 @@ from projects.models import Project
 from supplies.models import Fabric
 from estimates.PDF import EstimatePDF
 from media.models import Log, S3Object
+from media import render_cache
 from acknowledgements.models import Acknowledgement
 from deals.models import Event, Deal
 from administrator.models import Log as BaseLog, Company
@@ -141,11 +142,16 @@ class Estimate(models.Model):
         return deal
 
     def create_and_upload_pdf(self, delete_original=True):
-        ack_filename = self.create_pdf()
         ack_key = "estimate/{0}/Quotation-{0}.pdf".format(self.id)
-        
         bucket = "document.dellarobbiathailand.com"
-        ack_pdf = S3Object.create(ack_filename, ack_key, bucket, delete_original=delete_original)
+
+        # Only render again if the printable data has changed
+        ack_pdf = render_cache.get_or_render('estimate',
+                                             self.get_printable_data(),
+                                             self.create_pdf,
+                                             ack_key,
+                                             bucket,
+                                             delete_original=delete_original)
         
         self.pdf = ack_pdf
 
@@ -164,6 +170,29 @@ class Estimate(models.Model):
         
         return estimate_filename
 
+    def get_printable_data(self):
+        """Returns the data printed on the estimate PDF"""
+        items = []
+        for item in self.items.exclude(deleted=True).order_by('description', 'id'):
+            item_data = render_cache.model_data(item, exclude=('last_modified', 'status', 'image_id', 'fabric_id'))
+            item_data['image'] = render_cache.file_data(item.image)
+            item_data['fabric'] = self._get_printable_fabric(item.fabric)
+            item_data['pillows'] = [[p.type, p.quantity, self._get_printable_fabric(p.fabric)]
+                                    for p in item.pillows.all()]
+            items.append(item_data)
+
+        return {'estimate': render_cache.model_data(self, exclude=('last_modified', 'status', 'pdf_id')),
+                'customer': render_cache.contact_data(self.customer),
+                'project': self.project.codename if self.project else None,
+                'employee': u"{0}".format(self.employee) if self.employee_id else None,
+                'items': items}
+
+    def _get_printable_fabric(self, fabric):
+        if fabric is None:
+            return None
+
+        return [fabric.id, fabric.description, render_cache.file_data(fabric.image)]
+
     def calculate_totals(self, items=None):
         #Define items if not already defined
         if not items:
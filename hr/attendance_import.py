@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Bulk import of the clock machine attendance file
+
+The file is read row by row. The active employees are loaded once,
+timestamps that already exist are skipped with a single lookup and the
+new timestamps and attendances are written in batches, with one
+attendance per employee and day.
+"""
+import logging
+
+from dateutil import parser
+from django.db import transaction
+from django.db.models import Case, When, F, Value, DateTimeField
+from pytz import timezone
+
+from hr.models import Employee, Timestamp, Attendance, AttendanceUpload
+
+
+logger = logging.getLogger(__name__)
+
+tz = timezone('Asia/Bangkok')
+batch_size = 500
+progress_interval = 5000
+
+
+def parse_timestamps(lines, header=True):
+    """
+    Yields the card id and localized time of every row in the clock
+    machine file. The card id is the third column and the time is the
+    last column of each tab separated row
+    """
+    for index, line in enumerate(lines):
+        if header and index == 0:
+            continue
+
+        row = line.rstrip('\r\n').split('\t')
+        if len(row) < 3:
+            continue
+
+        try:
+            timestamp = tz.localize(parser.parse(row[-1]))
+        except (ValueError, OverflowError):
+            logger.warn(u"Unable to read the time on line {0}: {1}".format(index + 1, row[-1]))
+            continue
+
+        yield row[2].strip(), timestamp
+
+
+def get_employees_by_card_id():
+    """
+    Returns the active employees by card id and the card ids that are
+    shared by more than one active employee
+    """
+    employees = {}
+    duplicates = set()
+
+    queryset = Employee.objects.filter(status='active', card_id__isnull=False).select_related('shift')
+    for employee in queryset:
+        if employee.card_id in employees:
+            duplicates.add(employee.card_id)
+
+        employees[employee.card_id] = employee
+
+    for card_id in duplicates:
+        del employees[card_id]
+
+    return employees, duplicates
+
+
+def import_attendance(lines, upload=None):
+    """
+    Creates the timestamps and attendances for the rows of a clock
+    machine file and records the results in an AttendanceUpload
+    """
+    if upload is None:
+        upload = AttendanceUpload.objects.create()
+
+    upload.set_status(AttendanceUpload.PROCESSING)
+
+    employees, duplicate_card_ids = get_employees_by_card_id()
+
+    stamps = set()
+    missing = set()
+    duplicates = set()
+
+    for card_id, timestamp in parse_timestamps(lines):
+        upload.rows += 1
+
+        if upload.rows % progress_interval == 0:
+            AttendanceUpload.objects.filter(pk=upload.pk).update(rows=upload.rows)
+
+        if card_id in duplicate_card_ids:
+            duplicates.add(card_id)
+        elif card_id not in employees:
+            missing.add(card_id)
+        else:
+            stamps.add((employees[card_id].id, timestamp))
+
+    employees = {employee.id: employee for employee in employees.values()}
+
+    with transaction.atomic():
+        upload.timestamps_created = create_timestamps(stamps)
+        upload.attendances_created, upload.attendances_updated = update_attendances(stamps, employees)
+
+    upload.missing_employees = missing
+    upload.duplicate_employees = duplicates
+    upload.set_status(AttendanceUpload.COMPLETED)
+
+    logger.info(u"Imported {0} rows: {1} timestamps, {2} new and {3} updated attendances".format(
+        upload.rows, upload.timestamps_created, upload.attendances_created, upload.attendances_updated))
+
+    return upload
+
+
+def create_timestamps(stamps):
+    """
+    Creates the (employee id, time) pairs that do not have a Timestamp yet
+
+    Returns the number of timestamps created
+    """
+    if not stamps:
+        return 0
+
+    times = [timestamp for employee_id, timestamp in stamps]
+
+    existing = Timestamp.objects.filter(employee_id__in=set(employee_id for employee_id, timestamp in stamps),
+                                        datetime__range=(min(times), max(times)))
+    existing = set(existing.values_list('employee_id', 'datetime'))
+
+    timestamps = [Timestamp(employee_id=employee_id, datetime=timestamp)
+                  for employee_id, timestamp in sorted(stamps)
+                  if (employee_id, timestamp) not in existing]
+
+    Timestamp.objects.bulk_create(timestamps, batch_size=batch_size)
+
+    return len(timestamps)
+
+
+def get_times_by_day(stamps, employees):
+    """
+    Returns the start and end time of each (employee id, date)
+
+    Times within 4 hours of the start of the employee's shift are
+    clock-ins and the earliest one is used. Later times are clock-outs
+    and the latest one is used.
+    """
+    days = {}
+
+    for employee_id, timestamp in stamps:
+        employee = employees[employee_id]
+        timestamp = timestamp.astimezone(tz)
+        key = (employee_id, timestamp.date())
+        start_time, end_time = days.get(key, (None, None))
+
+        if timestamp.hour < _get_clock_in_cutoff(employee):
+            start_time = min(start_time or timestamp, timestamp)
+        else:
+            end_time = max(end_time or timestamp, timestamp)
+
+        days[key] = (start_time, end_time)
+
+    return days
+
+
+def update_attendances(stamps, employees):
+    """
+    Creates or updates one attendance per employee and day
+
+    Returns the number of attendances created and updated
+    """
+    days = get_times_by_day(stamps, employees)
+
+    if not days:
+        return 0, 0
+
+    dates = [day for employee_id, day in days]
+
+    existing = {}
+    queryset = Attendance.objects.filter(employee_id__in=set(employee_id for employee_id, day in days),
+                                         date__range=(min(dates), max(dates)))
+    for pk, employee_id, day in queryset.order_by('-id').values_list('id', 'employee_id', 'date'):
+        # The oldest attendance is kept if there are duplicates
+        existing[(employee_id, day)] = pk
+
+    new_attendances = []
+    updates = []
+
+    for key in sorted(days):
+        employee_id, day = key
+        start_time, end_time = days[key]
+
+        if key in existing:
+            updates.append((existing[key], start_time, end_time))
+        else:
+            employee = employees[employee_id]
+            attendance = Attendance(employee=employee,
+                                    date=day,
+                                    shift=employee.shift,
+                                    pay_rate=employee.wage)
+            if start_time:
+                attendance.start_time = start_time
+            if end_time:
+                attendance.end_time = end_time
+
+            new_attendances.append(attendance)
+
+    Attendance.objects.bulk_create(new_attendances, batch_size=batch_size)
+
+    for index in xrange(0, len(updates), batch_size):
+        _update_times(updates[index:index + batch_size])
+
+    return len(new_attendances), len(updates)
+
+
+def _update_times(updates):
+    """
+    Sets the start and end times of a batch of attendances in one query
+    """
+    values = {}
+
+    start_times = [When(pk=pk, then=Value(start_time)) for pk, start_time, end_time in updates if start_time]
+    if start_times:
+        values['_start_time'] = Case(*start_times, default=F('_start_time'), output_field=DateTimeField())
+
+    end_times = [When(pk=pk, then=Value(end_time)) for pk, start_time, end_time in updates if end_time]
+    if end_times:
+        values['_end_time'] = Case(*end_times, default=F('_end_time'), output_field=DateTimeField())
+
+    Attendance.objects.filter(pk__in=[update[0] for update in updates]).update(**values)
+
+
+def _get_clock_in_cutoff(employee):
+    try:
+        return employee.shift.start_time.hour + 4
+    except AttributeError:
+        return 12
@@ -2,6 +2,7 @@
 """
 Models to be use in the HR application
 """
+import json
 import logging
 from decimal import Decimal
 from datetime import date, datetime, time, timedelta
@@ -10,13 +11,15 @@ from math import floor
 from threading import Thread
 import traceback
 from time import sleep
+from collections import defaultdict
 
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import Sum, Case, When, Value
 from administrator.models import User
 from pytz import timezone
 
 from media.models import S3Object
+from media import render_cache
 from hr.PDF import PayrollPDF
 
 
@@ -84,6 +87,49 @@ class Timestamp(models.Model):
             logger.warn(e)
             return None
     
+
+class AttendanceUpload(models.Model):
+    """Progress and results of a clock machine file import"""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    file = models.ForeignKey(S3Object, null=True, related_name='+', on_delete=models.SET_NULL)
+    status = models.TextField(default=PENDING)
+    message = models.TextField(null=True, blank=True)
+    rows = models.IntegerField(default=0)
+    timestamps_created = models.IntegerField(default=0)
+    attendances_created = models.IntegerField(default=0)
+    attendances_updated = models.IntegerField(default=0)
+    _missing_employees = models.TextField(default='[]', db_column='missing_employees')
+    _duplicate_employees = models.TextField(default='[]', db_column='duplicate_employees')
+    time_created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    @property
+    def missing_employees(self):
+        """Card IDs in the file without an active employee"""
+        return json.loads(self._missing_employees)
+
+    @missing_employees.setter
+    def missing_employees(self, value):
+        self._missing_employees = json.dumps(sorted(value))
+
+    @property
+    def duplicate_employees(self):
+        """Card IDs in the file shared by more than one active employee"""
+        return json.loads(self._duplicate_employees)
+
+    @duplicate_employees.setter
+    def duplicate_employees(self, value):
+        self._duplicate_employees = json.dumps(sorted(value))
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.message = message
+        self.save()
+
     
 class Attendance(models.Model):
     
@@ -465,62 +511,172 @@ class PayrollManager(models.Manager):
                           end_date=end_date)
         payroll.save()
         
-        # Create a function that will run in threads to speed up
-        # the calculation process
-        def calculate_payrecords(employees, payroll, start_date, end_date):
-            for employee in employees:
-                record = PayRecord.objects.create(employee,
-                                                  start_date=start_date,
-                                                  end_date=end_date,
-                                                  payroll=payroll)
-                                                  
-        employees = Employee.objects.filter(attendances__date__gte=start_date).distinct()
-        employees = employees.order_by('-nationality', 'id')
-        index = employees.count()
-        threads = []
-        
-        # Make for threads 
-        """"
-        for i in xrange(0, 2):
-            i1 = i * math.floor(index / 2)
-            i2 = (i + 1) * math.floor(index / 2)
-            t = Thread(target=calculate_payrecords, args=(employees[i1:i2],
-                                                          payroll,
-                                                          start_date,
-                                                          end_date))
-            threads.append(t)
-            t.start()
-                                                                 
-        # Wait for all the threads to finish before continuing       
-        while len([t for t in threads if t.isAlive()]) > 0:
-            sleep(10)   
-        else:
-            payroll.create_documents()
-            return payroll
-        """
-        
-        calculate_payrecords(employees, payroll, start_date, end_date)
-        
+        payroll.calculate_pay_records()
         payroll.create_documents()
+        payroll.set_status(Payroll.COMPLETED)
+
         return payroll
         
         
 class Payroll(models.Model):
+    PENDING = 'pending'
+    CALCULATING = 'calculating'
+    CALCULATED = 'calculated'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
     start_date = models.DateField(null=False)
     end_date = models.DateField(null=False)
+    status = models.TextField(default=PENDING)
+    message = models.TextField(null=True, blank=True)
+    pdf = models.ForeignKey(S3Object, null=True, related_name='+', on_delete=models.SET_NULL)
     
     objects = PayrollManager()
-    
+
+    # Attendance fields set by Attendance.calculate_net_wage
+    wage_fields = ('regular_pay', 'overtime_pay', 'lunch_pay', 'gross_wage', 'net_wage',
+                   'reimbursement', 'incentive_pay', 'remarks')
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.message = message
+        Payroll.objects.filter(pk=self.pk).update(status=status, message=message)
+
+    def get_employees(self):
+        employees = Employee.objects.filter(attendances__date__gte=self.start_date).distinct()
+        employees = employees.order_by('-nationality', 'id')
+
+        return employees.select_related('shift')
+
+    def calculate_pay_records(self):
+        """Calculate and save the pay records for all employees
+        
+        The attendances of the pay period are loaded in one query, and the
+        recalculated attendances and the new pay records are saved in batches:
+        
+        - 1. Calculate the wages of every attendance in the period
+        - 2. Save the attendance wages
+        - 3. Sum the monthly regular pay of the daily employees for 
+             the social security
+        - 4. Calculate the pay records and insert them together
+        """
+        self.set_status(self.CALCULATING)
+
+        employees = list(self.get_employees())
+        attendances = self._get_attendances_by_employee(employees)
+
+        with transaction.atomic():
+            for employee in employees:
+                for attendance in attendances[employee.id]:
+                    attendance.calculate_net_wage()
+
+            self._save_attendance_wages([a for employee in employees for a in attendances[employee.id]])
+
+            monthly_regular_pay = self._get_monthly_regular_pay(employees)
+
+            records = []
+            for employee in employees:
+                logger.debug(u"Creating Pay Record for {0}: {1}".format(employee.id, employee.name))
+
+                record = PayRecord(employee=employee, start_date=self.start_date,
+                                   end_date=self.end_date, payroll=self)
+                record.queryset = attendances[employee.id]
+                record.monthly_regular_pay = monthly_regular_pay.get(employee.id, 0)
+                record.calculate_net_wage(save_attendances=False)
+                records.append(record)
+
+            PayRecord.objects.bulk_create(records, batch_size=500)
+
+        self.set_status(self.CALCULATED)
+
+        return records
+
     def create_documents(self):
         """Create all the corresponding documents for this payroll
         """
-        
-        self.pdf = PayrollPDF(payroll=self, 
-                         start_date=self.start_date, 
+        pdf = PayrollPDF(payroll=self,
+                         start_date=self.start_date,
                          end_date=self.end_date)
-        self.pdf.create()
+        pdf.create()
         
-        return self.pdf
+        return pdf
+
+    def create_and_upload_pdf(self, delete_original=True):
+        """Create the payroll pdf and upload it to S3
+
+        The upload is reused if the pay records and attendances have
+        not changed since the pdf was last created
+        """
+        def render():
+            pdf = PayrollPDF(payroll=self,
+                             start_date=self.start_date,
+                             end_date=self.end_date)
+            pdf.create()
+            return pdf.filename
+
+        key = 'payroll/Payroll_{0}-{1}.pdf'.format(self.start_date, self.end_date)
+        pdf = render_cache.get_or_render(u"payroll", self.get_printable_data(), render,
+                                         key=key,
+                                         bucket='document.dellarobbiathailand.com',
+                                         delete_original=delete_original)
+
+        Payroll.objects.filter(pk=self.pk).update(pdf=pdf)
+        self.pdf = pdf
+
+        return pdf
+
+    def get_printable_data(self):
+        """Return the data that is printed on the payroll pdf"""
+        records = self.pay_records.select_related('employee').order_by('id')
+        employees = [record.employee for record in records]
+        attendances = self._get_attendances_by_employee(employees)
+
+        return {'payroll': render_cache.model_data(self, exclude=('status', 'message', 'pdf_id')),
+                'records': [{'record': render_cache.model_data(record),
+                             'employee': render_cache.model_data(record.employee),
+                             'attendances': [render_cache.model_data(a) for a in attendances[record.employee_id]]}
+                            for record in records]}
+
+    def _get_attendances_by_employee(self, employees):
+        attendances = defaultdict(list)
+
+        queryset = Attendance.objects.filter(employee__in=employees,
+                                             date__gte=self.start_date,
+                                             date__lte=self.end_date)
+        queryset = queryset.select_related('shift').order_by('date', 'id')
+
+        employees = {employee.id: employee for employee in employees}
+        for attendance in queryset:
+            attendance.employee = employees[attendance.employee_id]
+            attendances[attendance.employee_id].append(attendance)
+
+        return attendances
+
+    def _save_attendance_wages(self, attendances, batch_size=200):
+        """Save the calculated wages of the attendances in batches"""
+        for index in xrange(0, len(attendances), batch_size):
+            batch = attendances[index:index + batch_size]
+            values = {}
+            for field in self.wage_fields:
+                output_field = Attendance._meta.get_field(field)
+                values[field] = Case(*[When(pk=a.pk, then=Value(getattr(a, field), output_field=output_field))
+                                       for a in batch],
+                                     output_field=output_field)
+
+            Attendance.objects.filter(pk__in=[a.pk for a in batch]).update(**values)
+
+    def _get_monthly_regular_pay(self, employees):
+        """Return the regular pay of each daily employee for the social security month"""
+        if self.end_date.day < 25:
+            return {}
+
+        start_date, end_date = PayRecord.get_social_security_period(self.end_date)
+        ids = [e.id for e in employees if e.pay_period.lower() == 'daily']
+
+        rows = Attendance.objects.filter(employee_id__in=ids, date__gte=start_date, date__lte=end_date)
+        rows = rows.values('employee_id').annotate(regular_pay_sum=Sum('regular_pay')).order_by()
+
+        return {row['employee_id']: row['regular_pay_sum'] for row in rows}
     
     
 class PayRecordManager(models.Manager):
@@ -580,9 +736,7 @@ class PayRecord(models.Model):
             self.gross_wage = self.employee.wage / Decimal('2')
             
             # Calculate Sunday wages
-            attendances = self.employee.attendances
-            attendances = attendances.filter(date__gte=self.start_date,
-                                             date__lte=self.end_date)
+            attendances = self._get_employee_attendances()
             sundays_worked = [a for a in attendances if a.is_sunday == True]
             sunday_wage = len(sundays_worked) * ((self.employee.wage / 30) * 2)
             self.gross_wage += sunday_wage
@@ -592,16 +746,17 @@ class PayRecord(models.Model):
             # Calculate the wage of an employee in cambodia
             if self.employee.location.lower() == 'cambodia':
                 dates = []
+                attendances = {a.date: a for a in self._get_employee_attendances()}
                 c_date = self.start_date
                 while c_date != self.end_date + timedelta(days=1):
                     # Check if there were any days worked in thailand
-                    try:
-                        a = Attendance.objects.get(date=c_date, employee=self.employee)
+                    if c_date in attendances:
+                        a = attendances[c_date]
                         a.calculate_net_wage()
                         gross_wage += a.gross_wage
                     
                     # Add gross wage for days worked in cambodia
-                    except Attendance.DoesNotExist:
+                    else:
                         if c_date.weekday() != 6:
                             a = Attendance.objects.create(date=c_date,
                                                           employee=self.employee,
@@ -619,7 +774,7 @@ class PayRecord(models.Model):
                             a.calculate_net_wage()
                             a.save()
                             gross_wage += a.gross_wage
-                            
+                            attendances[c_date] = a
                             
                     # Add regular times to total
                     self.regular_hours += a.regular_time or 0
@@ -631,6 +786,9 @@ class PayRecord(models.Model):
                 logger.debug("Gross wage for employee in cambodia {0} to {1}: {2}".format(self.start_date,
                                                                                           self.end_date,
                                                                                           gross_wage))
+
+                # Include the days created for cambodia in the net wage
+                self.queryset = [attendances[d] for d in sorted(attendances)]
                 
             else:
                 attendances = self._get_employee_attendances()
@@ -649,7 +807,7 @@ class PayRecord(models.Model):
 
         return self.gross_wage
         
-    def calculate_net_wage(self):
+    def calculate_net_wage(self, save_attendances=True):
         """Calculate the total net wage
         
         This method will calculate the total net wage for the pay period through
@@ -680,7 +838,8 @@ class PayRecord(models.Model):
         attendances = self._get_employee_attendances()
         for attendance in attendances:
             attendance.calculate_net_wage()
-            attendance.save()
+            if save_attendances:
+                attendance.save()
             
             # Calculate regular pay for use in calculating
             # social security later
@@ -722,12 +881,7 @@ class PayRecord(models.Model):
             
             if self.employee.pay_period.lower() == 'daily':
                 
-                start_date = date(self.end_date.year,
-                                  self.end_date.month - 1, 
-                                  26)
-                end_date = date(self.end_date.year,
-                                self.end_date.month,
-                                25)
+                start_date, end_date = self.get_social_security_period(self.end_date)
                                 
                 if self.employee.location.lower() == 'cambodia':
                     monthly_wage = 0
@@ -752,9 +906,13 @@ class PayRecord(models.Model):
                 else:
                     
                     
-                    queryset = self.employee.attendances.filter(date__gte=start_date,
-                                                                date__lte=end_date)
-                    regular_pay_sum = queryset.aggregate(Sum('regular_pay'))['regular_pay__sum']
+                    # The payroll sums the monthly pay for all employees at once
+                    if hasattr(self, 'monthly_regular_pay'):
+                        regular_pay_sum = self.monthly_regular_pay
+                    else:
+                        queryset = self.employee.attendances.filter(date__gte=start_date,
+                                                                    date__lte=end_date)
+                        regular_pay_sum = queryset.aggregate(Sum('regular_pay'))['regular_pay__sum']
                 
                     logger.debug('Total monthly pay for daily employee: {0}'.format(regular_pay_sum))
                 
@@ -805,6 +963,16 @@ class PayRecord(models.Model):
                                         
         return self.net_wage
     
+    @staticmethod
+    def get_social_security_period(end_date):
+        """Return the 26th of the previous month to the 25th of the month 
+        of the end date, which is the period the social security is based on
+        """
+        month_start = date(end_date.year, end_date.month, 1)
+        previous_month = month_start - timedelta(days=1)
+
+        return date(previous_month.year, previous_month.month, 26), date(end_date.year, end_date.month, 25)
+        
     def add_reimbursement(self, amount, note):
         """Adds a reimbursement for the pay record
         
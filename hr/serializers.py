@@ -6,8 +6,10 @@ from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from pytz import timezone
 
-from hr.models import Employee, Attendance, Shift, PayRecord, Payroll
+from hr.models import Employee, Attendance, Shift, PayRecord, Payroll, AttendanceUpload
 from media.models import S3Object
+from media.serializers import S3ObjectSerializer
+from hr import tasks as hr_tasks
 
 
 logger = logging.getLogger(__name__)
@@ -272,17 +274,25 @@ class EmployeeFieldSerializer(serializers.ModelSerializer):
 
         
 class PayrollSerializer(serializers.ModelSerializer):
+    pdf = S3ObjectSerializer(read_only=True)
     
     class Meta:
         model = Payroll
-        fields = ('start_date', 'end_date')
+        fields = ('id', 'start_date', 'end_date', 'status', 'message', 'pdf')
+        read_only_fields = ('status', 'message')
         
     def create(self, validated_data):
-        
+        """
+        Create the payroll and calculate the pay records and pdf
+        in the background
+        """
         start_date = validated_data.pop('start_date')
         end_date = validated_data.pop('end_date')
         
-        instance = Payroll.objects.create(start_date, end_date)
+        instance = Payroll(start_date=start_date, end_date=end_date)
+        instance.save()
+
+        hr_tasks.queue_payroll(instance)
         
         return instance
     
@@ -291,4 +301,14 @@ class PayrollSerializer(serializers.ModelSerializer):
     
     
     
-        
\ No newline at end of file
+        
+
+class AttendanceUploadSerializer(serializers.ModelSerializer):
+    missing_employees = serializers.ListField(read_only=True)
+    duplicate_employees = serializers.ListField(read_only=True)
+
+    class Meta:
+        model = AttendanceUpload
+        fields = ('id', 'status', 'message', 'rows', 'timestamps_created', 'attendances_created',
+                  'attendances_updated', 'missing_employees', 'duplicate_employees', 'time_created',
+                  'last_modified')
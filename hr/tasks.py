@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background tasks for the HR application
+
+The uploaded attendance files are kept in S3 so that any worker can
+import them. The progress and results are recorded in the
+AttendanceUpload and a report of unknown card ids is emailed to HR
+once the import completes.
+
+Payrolls are calculated in one task and the pdf is created in a second
+task, so that the pdf can be created again without recalculating.
+"""
+from __future__ import absolute_import
+
+import logging
+import os
+import tempfile
+import traceback
+
+import boto.ses
+from celery import shared_task, chain
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from hr import attendance_import
+from hr.models import AttendanceUpload, Payroll
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_upload(upload):
+    """
+    Imports the upload in a worker once the current transaction commits
+    """
+    transaction.on_commit(lambda: import_upload.delay(upload.id))
+
+    return upload
+
+
+@shared_task
+def import_upload(upload_id):
+    upload = AttendanceUpload.objects.select_related('file').get(pk=upload_id)
+
+    filename = os.path.join(tempfile.gettempdir(), u"attendance-{0}.txt".format(upload.id))
+
+    try:
+        upload.file.download(filename)
+
+        with open(filename, 'rb') as lines:
+            attendance_import.import_attendance(lines, upload)
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        upload.set_status(AttendanceUpload.FAILED, message=u"{0}".format(e))
+        return upload.status
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    email_report(upload)
+
+    return upload.status
+
+
+def email_report(upload):
+    logger.debug("Emailing Attendance Upload Report")
+
+    heading = """Attendance Upload Report"""
+    header_cell_style = """
+                        border-right:1px solid #595959;
+                        border-bottom:1px solid #595959;
+                        border-top:1px solid #595959;
+                        padding:1em;
+                        text-align:center;
+                        """
+    message = render_to_string("attendance_upload_email.html",
+                               {'heading': heading,
+                                'header_style': header_cell_style,
+                                'missing_employees': upload.missing_employees,
+                                'duplicate_employees': [{'id': card_id} for card_id in upload.duplicate_employees]})
+
+    e_conn = boto.ses.connect_to_region('us-east-1')
+    e_conn.send_email('noreply@dellarobbiathailand.com',
+                      'Attendance Upload Report',
+                      message,
+                      ["hr@alineagroup.co"],
+                      format='html')
+
+
+def queue_payroll(payroll):
+    """
+    Calculates the pay records and then creates the pdf in a worker
+    once the current transaction commits
+    """
+    tasks = chain(calculate_payroll.si(payroll.id), create_payroll_pdf.si(payroll.id))
+    transaction.on_commit(lambda: tasks.apply_async())
+
+    return payroll
+
+
+@shared_task
+def calculate_payroll(payroll_id):
+    payroll = Payroll.objects.get(pk=payroll_id)
+
+    try:
+        payroll.calculate_pay_records()
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        payroll.set_status(Payroll.FAILED, message=u"{0}".format(e))
+        raise
+
+    return payroll.status
+
+
+@shared_task
+def create_payroll_pdf(payroll_id):
+    """
+    Creates the payroll pdf. It is only rendered again if the pay
+    records have changed since it was last created
+    """
+    payroll = Payroll.objects.get(pk=payroll_id)
+
+    try:
+        payroll.create_and_upload_pdf()
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        payroll.set_status(Payroll.FAILED, message=u"{0}".format(e))
+        raise
+
+    payroll.set_status(Payroll.COMPLETED)
+
+    return payroll.status
@@ -10,7 +10,8 @@ from django.test import TestCase
 from pytz import timezone
 from rest_framework.test import APITestCase, APIClient
 
-from hr.models import Employee, Attendance, Shift, Payroll, PayRecord
+from hr.models import Employee, Attendance, Shift, Payroll, PayRecord, Timestamp, AttendanceUpload
+from hr import attendance_import
 
 
 logger = logging.getLogger(__name__)
@@ -287,6 +288,86 @@ class AttendanceTest(APITestCase):
         self.assertEqual(self.sunday_attendance.gross_wage, Decimal('1100') + (ot_rate * Decimal('6')))
         
 
+class AttendanceImportTest(APITestCase):
+    """
+    Testing class for importing the clock machine file
+    """
+    def setUp(self):
+        super(AttendanceImportTest, self).setUp()
+
+        self.shift = Shift(start_time=time(8, 0),
+                           end_time=time(17, 0))
+        self.shift.save()
+
+        self.employee = Employee(shift=self.shift,
+                                 card_id='1001',
+                                 name='test2',
+                                 department='painting',
+                                 wage=Decimal('550'))
+        self.employee.save()
+
+        # Existing attendance that should be updated instead of duplicated
+        self.attendance = Attendance(date=date(2018, 3, 2),
+                                     employee=self.employee,
+                                     shift=self.shift)
+        self.attendance.save()
+
+        self.lines = ["No\tTMNo\tEnNo\tName\tDateTime\r\n",
+                      "1\t1\t1001\ttest2\t2018-03-01 07:55:00\r\n",
+                      "2\t1\t1001\ttest2\t2018-03-01 07:57:00\r\n",
+                      "3\t1\t1001\ttest2\t2018-03-01 17:05:00\r\n",
+                      "4\t1\t1001\ttest2\t2018-03-02 07:50:00\r\n",
+                      "5\t1\t1001\ttest2\t2018-03-02 17:30:00\r\n",
+                      "6\t1\t9999\tunknown\t2018-03-02 08:00:00\r\n"]
+
+    def test_import(self):
+        """
+        Test that timestamps and one attendance per day are created
+        """
+        upload = attendance_import.import_attendance(self.lines)
+
+        self.assertEqual(upload.status, AttendanceUpload.COMPLETED)
+        self.assertEqual(upload.rows, 6)
+        self.assertEqual(upload.timestamps_created, 5)
+        self.assertEqual(upload.attendances_created, 1)
+        self.assertEqual(upload.attendances_updated, 1)
+        self.assertEqual(upload.missing_employees, ['9999'])
+
+        self.assertEqual(Attendance.objects.filter(employee=self.employee).count(), 2)
+
+        attendance = Attendance.objects.get(employee=self.employee, date=date(2018, 3, 1))
+        self.assertEqual(attendance.start_time.time(), time(7, 55))
+        self.assertEqual(attendance.end_time.time(), time(17, 5))
+
+        attendance = Attendance.objects.get(pk=self.attendance.pk)
+        self.assertEqual(attendance.start_time.time(), time(7, 50))
+        self.assertEqual(attendance.end_time.time(), time(17, 30))
+
+    def test_import_twice(self):
+        """
+        Test that importing the same file again does not duplicate anything
+        """
+        attendance_import.import_attendance(self.lines)
+        upload = attendance_import.import_attendance(self.lines)
+
+        self.assertEqual(upload.timestamps_created, 0)
+        self.assertEqual(upload.attendances_created, 0)
+        self.assertEqual(Timestamp.objects.filter(employee=self.employee).count(), 5)
+        self.assertEqual(Attendance.objects.filter(employee=self.employee).count(), 2)
+
+    def test_get_upload(self):
+        """
+        Test that the status of an upload is returned and that an unknown upload is not found
+        """
+        upload = attendance_import.import_attendance(self.lines)
+
+        resp = self.client.get('/api/v1/employee/attendance/upload/{0}/'.format(upload.id))
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get('/api/v1/employee/attendance/upload/{0}/'.format(upload.id + 1))
+        self.assertEqual(resp.status_code, 404)
+
+
 class PayRecordTest(APITestCase):
     """Test class for Payrecord"""
     
@@ -664,6 +745,33 @@ class PayrollTest(APITestCase):
         
         payroll = Payroll.objects.create(start_date, end_date)
 
+    def test_calculate_pay_records(self):
+        """Test that the batched payroll matches pay records calculated one at a time
+        """
+        start_date = date(2016, 2, 11)
+        end_date = date(2016, 2, 25)
+
+        payroll = Payroll(start_date=start_date, end_date=end_date)
+        payroll.save()
+        payroll.calculate_pay_records()
+
+        self.assertEqual(payroll.status, Payroll.CALCULATED)
+        self.assertEqual(payroll.pay_records.count(), payroll.get_employees().count())
+
+        for record in payroll.pay_records.all():
+            expected = PayRecord.objects.create(record.employee, start_date, end_date)
+            self.assertEqual(record.gross_wage, expected.gross_wage)
+            self.assertEqual(record.social_security_withholding, expected.social_security_withholding)
+            self.assertEqual(record.net_wage, expected.net_wage)
+
+    def test_social_security_period(self):
+        """Test the social security period starts in the previous month
+        """
+        self.assertEqual(PayRecord.get_social_security_period(date(2016, 2, 25)),
+                         (date(2016, 1, 26), date(2016, 2, 25)))
+        self.assertEqual(PayRecord.get_social_security_period(date(2017, 1, 25)),
+                         (date(2016, 12, 26), date(2017, 1, 25)))
+
         
 @unittest.skip("ok")           
 class Employee1Test(APITestCase):
@@ -2,22 +2,25 @@ import logging
 import json
 from dateutil import parser
 import pytz
-from threading import Thread
-from time import sleep
 from datetime import time, datetime
 
 import boto
 from django.template.loader import render_to_string
+from django.db import transaction
 from django.db.models import Q
 from django.http import HttpResponseRedirect, HttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import generics
 from rest_framework import viewsets
+from rest_framework.renderers import JSONRenderer
 from django.conf import settings
 
 from hr.serializers import EmployeeSerializer, AttendanceSerializer, ShiftSerializer, PayrollSerializer
+from hr.serializers import AttendanceUploadSerializer
+from hr import tasks as hr_tasks
 from utilities.http import save_upload
 from auth.models import S3Object
-from hr.models import Employee, Attendance, Timestamp, Shift, Payroll
+from hr.models import Employee, Attendance, Timestamp, Shift, Payroll, AttendanceUpload
 
 
 logger = logging.getLogger(__name__)
@@ -50,163 +53,38 @@ def employee_stats(request):
     
 
 def upload_attendance(request):
-    if request.method == "POST":
-        file = request.FILES.get('file')
-        
-        with open('attendance.txt', 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
-        
-        # Save and format the data into a list
-        lines = open('attendance.txt').readlines()
-        data = [l.replace('\r\n', '').split('\t') for l in lines]
-        
-        assert len(lines) == len(data), "Error reformatting data from attendance.txt"
-
-        # Create master holders
-        timestamps = []
-        error_times = []
-        employees = {}
-        missing_employees = {}
-        duplicate_employees = []
-        timezone = pytz.timezone('Asia/Bangkok')
-        employee_queryset = Employee.objects.filter(status='active').select_related('shift')
-        timestamp_queryset = Timestamp.objects.all().select_related('employee', 'employee__shift')
+    """
+    Saves the clock machine file and imports it in the background
 
-        def create_timestamps(data):
-            """
-            Create Timestamps
+    Returns the AttendanceUpload that can be polled for the progress
+    """
+    if request.method == "POST":
+        filename = save_upload(request, filename="attendance-{0}.txt".format(datetime.now().strftime('%Y%m%d%H%M%S%f')))
+        obj = S3Object.create(filename,
+                              "attendance/{0}".format(filename.split('/')[-1]),
+                              'document.dellarobbiathailand.com')
 
-            This function will loop through the list of data, and 
-            find a timestamp if it exists. If not it will create a new 
-            timestamp
-            """
-            for index, d in enumerate(data):
-                employee = None
-                timestamp = timezone.localize(parser.parse(d[-1]))
-                card_id = d[2]
-                
-                # Find the employee with the corresponding card id
-                try:
-                    # Check if employee is already found and in the dict
-                    if card_id in employees:
-                        employee = employees[card_id]
-                    # Retrieves employee by card id and active status
-                    else:
-                        employee = employee_queryset.get(card_id=card_id)
-                        employees[employee.card_id] = employee
+        with transaction.atomic():
+            upload = AttendanceUpload.objects.create(file=obj)
+            hr_tasks.queue_upload(upload)
 
-                except IndexError as e:
-                    print '\n\n'
-                    missing_employees[card_id] = {'id': d[2], 'timestamp': timestamp, 'card_id': card_id}
-                    logger.debug('No employee for card ID {0} on date: {1}'.format(card_id, timestamp))
-                    print '\n\n'
-                except Employee.DoesNotExist:
-                    missing_employees[card_id] = {'id': d[2], 'timestamp': timestamp, 'card_id': card_id}
-                    logger.debug('No employee for card ID {0} on date: {1}'.format(card_id, timestamp))
-                except Employee.MultipleObjectsReturned as e:
-                    duplicate_employees.append({'id': d[2], 'timestamp': timestamp})
-                    logger.debug("Card ID {0} return model than 1 employee".format(card_id))
-                
-                if employee:
-                    # Try to find an existing time stamp first
-                    try:
-                        timestamps.append(timestamp_queryset.objects.get(employee=employee, datetime=timestamp))
-                    # Creates a timestamp if one is not found
-                    except Timestamp.DoesNotExist as e:
-                        timestamps.append(Timestamp.objects.create(employee=employee,
-                                                                     datetime=timestamp))
-                    # If multiple copies are found, all are deleted and new one is made
-                    except Timestamp.MultipleObjectsReturned as e:
-                        Timestamp.objects.filter(employee=employee, datetime=timestamp).delete()
-                        timestamps.append(Timestamp.objects.create(employee=employee,
-                                                                     datetime=timestamp))
+        response = HttpResponse(JSONRenderer().render(AttendanceUploadSerializer(upload).data),
+                                content_type="application/json")
+        response.status_code = 201
+        return response
 
-                                                                 
-            
-        def create_attendances(timestamps):
-            for t in timestamps:
-                count = Attendance.objects.filter(employee=t.employee, date=t.datetime.date()).count()
-                if count == 0:
-                    attendance = Attendance.objects.create(employee=t.employee, date=t.datetime.date(), 
-                                                           shift=t.employee.shift, pay_rate=t.employee.wage)
-                elif count == 1:
-                    attendance = Attendance.objects.get(employee=t.employee, date=t.datetime.date())
-                elif count > 1:
-                    Attendance.objects.filter(employee=t.employee, date=t.datetime.date()).delete()
-                    attendance = Attendance.objects.create(employee=t.employee, date=t.datetime.date(), 
-                                                           shift=t.employee.shift, pay_rate=t.employee.wage)
-                    
-            
-                if t.time.hour < t.employee.shift.start_time.hour + 4:
-                    attendance.start_time = t.time
-                else:
-                    attendance.end_time = t.time
-                attendance.save()
-                
-                assert attendance.id is not None
-                assert attendance.date is not None
-                assert attendance.employee is not None
-                assert attendance.date.year == 2018
-                #logger.debug("{0}: {1} | {2}".format(attendance.date, attendance.employee.id, attendance.id))
-        
-            
-        def create_timestamps_and_attendances(data):
-            logger.debug("Total timestamps {0}".format(len(data)))
-            data1 = data[1:len(data)/2]
-            data2 = data[len(data)/2:]
 
-            # Check that the timestamps have been divided correctly
-            assert len(data1) + len(data2) == len(data) - 1, "Data quantities do not match"
+def attendance_upload(request, upload_id=None):
+    """
+    Returns the status and results of an attendance upload
+    """
+    upload = get_object_or_404(AttendanceUpload, pk=upload_id)
 
-            thread1 = Thread(target=create_timestamps, args=(data1, ))
-            thread2 = Thread(target=create_timestamps, args=(data2, ))
-        
-            threads = [thread1, thread2]
-        
-            thread1.start()
-            thread2.start()
-        
-            while len([t for t in threads if t.isAlive()]) > 0:
-                sleep(100)
-                
-            create_attendances(timestamps)
-            
-            logger.debug("Emailing Attenance Upload Report")
+    response = HttpResponse(JSONRenderer().render(AttendanceUploadSerializer(upload).data),
+                            content_type="application/json")
+    response.status_code = 200
+    return response
 
-            heading = """Attendance Upload Report"""
-            header_cell_style = """
-                                border-right:1px solid #595959;
-                                border-bottom:1px solid #595959;
-                                border-top:1px solid #595959;
-                                padding:1em;
-                                text-align:center;
-                                """
-            message = render_to_string("attendance_upload_email.html", 
-                                       {'heading': heading,
-                                        'header_style': header_cell_style,
-                                        'missing_employees': missing_employees,
-                                        'duplicate_employees': duplicate_employees})
-    
-            e_conn = boto.ses.connect_to_region('us-east-1')
-            e_conn.send_email('noreply@dellarobbiathailand.com',
-                              'Attendance Upload Report',
-                              message,
-                              ["hr@alineagroup.co"],
-                              format='html')
-            
-            
-            
-        # Primary parallel thread
-        primary_thread = Thread(target=create_timestamps_and_attendances, args=(data, ))
-        primary_thread.start()
-        
-                
-        response = HttpResponse(json.dumps({'status': 'We will send you an email once the upload has completed.'}),
-                                content_type="application/json")
-        response.status_code = 201
-        return response
-            
         
 def employee_image(request):
     if request.method == "POST":
@@ -5,7 +5,6 @@ import dateutil.parser
 import math
 import logging
 from decimal import *
-import httplib2
 
 from pytz import timezone
 from datetime import datetime
@@ -17,14 +16,15 @@ from boto.s3.key import Key
 import boto.ses
 #from oauth2client.contrib.django_orm import Storage
 from oauth2client.contrib import gce
-from apiclient import discovery
 
 from contacts.models import Customer
 from products.models import Product, Upholstery
 from projects.models import Project, Room, Phase
 from invoices.PDF import InvoicePDF
 from media.models import Log, S3Object
-from administrator.models import CredentialsModel, Log as BaseLog
+from media import render_cache
+from administrator.models import Log as BaseLog
+from administrator import tasks as calendar_tasks
 from trcloud.models import TRSalesOrder, TRContact
 from acknowledgements.models import Acknowledgement, Item as AckItem
 from accounting.models import JournalEntry
@@ -66,7 +66,7 @@ class Invoice(models.Model):
     calendar_event_id = models.TextField(null=True)
     
     current_user = None 
-    calendar_service = None
+    calendar_name = 'invoices'
 
     # VATs
     vat = models.IntegerField(default=0)
@@ -217,11 +217,16 @@ class Invoice(models.Model):
         self.save()
     
     def create_and_upload_pdf(self, delete_original=True):
-        invoice_filename = self.create_pdf()
         invoice_key = "invoice/{0}/Invoice-{0}.pdf".format(self.document_number)
-        
         bucket = "document.dellarobbiathailand.com"
-        invoice_pdf = S3Object.create(invoice_filename, invoice_key, bucket, delete_original=delete_original)
+
+        # Only render again if the printable data has changed
+        invoice_pdf = render_cache.get_or_render('invoice',
+                                                 self.get_printable_data(),
+                                                 self.create_pdf,
+                                                 invoice_key,
+                                                 bucket,
+                                                 delete_original=delete_original)
        
         # Save references for files
         self.pdf = invoice_pdf
@@ -245,6 +250,25 @@ class Invoice(models.Model):
         
         return invoice_filename
         
+    def get_printable_data(self):
+        """Returns the data printed on the invoice PDF"""
+        excluded_fields = ('last_modified', 'status', 'pdf_id', 'trcloud_id', 
+                           'calendar_event_id', 'journal_entry_id')
+
+        items = []
+        for item in self.items.all().order_by('id'):
+            item_data = render_cache.model_data(item, exclude=('last_modified', 'status', 'trcloud_id', 'image_id'))
+            item_data['image'] = render_cache.file_data(item.image)
+            items.append(item_data)
+
+        return {'invoice': render_cache.model_data(self, exclude=excluded_fields),
+                'customer': render_cache.contact_data(self.customer),
+                'project': self.project.codename if self.project else None,
+                'room': self.room.description if self.room else None,
+                'phase': self.phase.description if self.phase else None,
+                'employee': u"{0}".format(self.employee) if self.employee_id else None,
+                'items': items}
+
     def calculate_totals(self, items=None):
         #Define items if not already defined
         if not items:
@@ -444,76 +468,18 @@ class Invoice(models.Model):
         return tr_so
 
     
-    def _get_calendar_service(self, user):
-        if self.calendar_service:
-            self.calendar_service
-        else:
-            
-            storage = Storage(CredentialsModel, 'id', user, 'credential')
-            credentials = storage.get()
-        
-            http = credentials.authorize(httplib2.Http())
-            self.calendar_service = discovery.build('calendar', 'v3', http=http)
-            
-        return self.calendar_service
-        
-    def _get_calendar(self, user):
-        service = self._get_calendar_service(user)
-        response = service.calendarList().list().execute()
-        
-        calendar_summaries = [cal['summary'].lower() for cal in response['items']]
-    
-        # Check if user does not already has account payables
-        if 'invoices' not in calendar_summaries:
-            # Get calendar
-            cal_id = 'dellarobbiathailand.com_vl7drjcuulloicm0qlupgsr4ko@group.calendar.google.com'
-            calendar = service.calendars().get(calendarId=cal_id).execute()
-     
-            # Add calendar to user's calendarList
-            service.calendarList().insert(body={
-                'id': calendar['id']
-            }).execute()
-            
-        else:
-            # Get calendar is already in calendarList
-            for cal in response['items']:
-                if cal['summary'].lower() == 'invoices':
-                    calendar = cal
-            
-        return calendar
-        
     def create_calendar_event(self, user):
-        """Create a calendar event for the expected delivery date
+        """Queue the creation of the calendar event for the due date
         
         """
-        service = self._get_calendar_service(user)
-        calendar = self._get_calendar(user)
-        
-        response = service.events().insert(calendarId=calendar['id'], 
-                                           body=self._get_event_body()).execute()
-        self.calendar_event_id = response['id']
-        self.save()
+        return calendar_tasks.queue_calendar_event(self, user)
         
     def update_calendar_event(self, user=None):
-        """Create a calendar event for the expected delivery date
+        """Queue an update of the calendar event for the due date
         
         """
-        if user is None:
-            user = self.current_user or self.employee
-        
-        if self.calendar_event_id:
-            
-            service = self._get_calendar_service(user)
-            calendar = self._get_calendar(user)
+        return calendar_tasks.queue_calendar_event(self, user)
         
-            resp = service.events().update(calendarId=calendar['id'], 
-                                           eventId=self.calendar_event_id, 
-                                           body=self._get_event_body()).execute()
-                                          
-        else:
-            
-            self.create_calendar_event(user)
-                                                                       
     def _get_event_body(self):
         evt = {
             'summary': "Ack {0}".format(self.id),
@@ -24,6 +24,7 @@ from contacts.serializers import CustomerSerializer
 from contacts.models import Customer
 from projects.models import Project, Room
 from utilities.http import save_upload
+from utilities import export
 from media.models import S3Object
 from media.serializers import S3ObjectSerializer
 
@@ -166,39 +167,33 @@ def invoice_file(request, ack_id=None):
         return response
     
 
+INVOICE_COLUMNS = (('id', 'id', lambda d: d.id),
+                   ('date', 'date', lambda d: d.time_created),
+                   ('customer', 'customer', lambda d: d.customer.name if d.customer else None),
+                   ('vat', 'vat', lambda d: d.vat),
+                   ('total', 'total', lambda d: d.total),
+                   ('subtotal', 'subtotal', lambda d: d.subtotal),
+                   ('vat_amount', 'vat amount', lambda d: d.vat_amount),
+                   ('grand_total', 'grand total', lambda d: d.grand_total),
+                   ('status', 'status', lambda d: d.status))
+
+
 def invoice_download(request):
-    
-    # Get the start and ending date to filter
-    start_date = dateutil.parser.parse(request.GET.get('start'))
-    end_date = dateutil.parser.parse(request.GET.get('end'))
-    logger.warn(start_date)
-    logger.warn(end_date)
-    
-    # Get the Invoices
-    invoices = Invoice.objects.filter(time_created__gte=start_date, 
-                                          time_created__lte=end_date)
-    
-    # Create the respones and write headers 
-    filename = 'Invoices_{0}_{1}'.format(start_date.strftime('%Y-%m-%d'),
-                                                 end_date.strftime('%Y-%m-%d'))       
-    response = HttpResponse(content_type="text/csv")
-    response['Content-Disposition'] = 'attachment; filename="{0}.csv"'.format(filename)
-    
-    # Write BOM to make UTF-8     
-    response.write("\xEF\xBB\xBF")
+    """
+    Streams the invoices created between 'start' and 'end' as a csv file
+    """
+    start_date, end_date = export.parse_date_range(request)
 
-    # Write to file
-    writer = csv.writer(response, encoding='cp874')
-    writer.writerow(['id', 'date', 'customer', 'vat', 'total'])
-    
-    for invoice in invoices:
-        writer.writerow([invoice.id,
-                         invoice.time_created,
-                         u'{0}'.format(invoice.customer.name),
-                         '{0}'.format(invoice.vat),
-                         '{0}'.format(invoice.total)])
-                         
-    return response
+    invoices = Invoice.objects.select_related('customer')
+    if start_date:
+        invoices = invoices.filter(time_created__gte=start_date)
+    if end_date:
+        invoices = invoices.filter(time_created__lt=end_date)
+
+    filename = 'Invoices_{0}_{1}'.format(request.GET.get('start', '')[:10], request.GET.get('end', '')[:10])
+
+    return export.stream(request, invoices.order_by('id'), INVOICE_COLUMNS, filename,
+                         default=('id', 'date', 'customer', 'vat', 'total'))
     
     
 class InvoiceMixin(object):
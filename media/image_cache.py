@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On disk cache of the images printed on the documents
+
+The PDFs print product and fabric photos at a fixed height or width.
+Instead of downloading the full size photo for every item of every
+render, the original is downloaded once and a thumbnail is stored for
+each size that is printed. S3Objects are cached by bucket, key and
+version so a new upload is downloaded again.
+
+The cache is configured with the IMAGE_CACHE setting:
+
+    IMAGE_CACHE = {
+        'LOCATION': '/var/cache/employee/images',
+        'MAX_SIZE': 1024 * 1024 * 1024
+    }
+
+The least recently used files are deleted once the cache is larger
+than MAX_SIZE.
+
+Files that are not resized, like the SVG schematics of the pricelist,
+are cached as they are with get_file().
+"""
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import urllib2
+import urlparse
+import uuid
+from threading import Lock
+
+from django.conf import settings
+from PIL import Image as PILImage
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache(object):
+
+    def __init__(self, location=None, max_size=512 * 1024 * 1024, scale=3, timeout=30):
+        """
+        'scale' is the number of pixels stored per point of the printed
+        size. 3 pixels per point is 216 dpi
+        """
+        self.location = os.path.abspath(location or os.path.join(tempfile.gettempdir(), 'image-cache'))
+        self.max_size = max_size
+        self.scale = scale
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+        self._size = None
+        self._lock = Lock()
+
+    def get_path(self, source, width=None, height=None, max_width=0):
+        """
+        Returns the filename of a thumbnail of the image, or None if the
+        image can not be read
+
+        'source' is an S3Object, a url or a filename. The thumbnail fits
+        the given width, or the given height and max width
+        """
+        if not source:
+            return None
+
+        directory = os.path.join(self.location, self._source_key(source))
+        size_name = u"w{0}-h{1}-m{2}".format(int(width or 0), int(height or 0), int(max_width or 0))
+        path = os.path.join(directory, size_name)
+
+        if os.path.exists(path):
+            self._touch(path)
+            self.hits += 1
+            return path
+
+        self.misses += 1
+
+        try:
+            original = self._get_original(source, directory)
+            self._write(path, lambda filename: self._resize(original, filename, width, height, max_width))
+        except Exception as e:
+            logger.warn(u"Unable to cache image {0}: {1}".format(source, e))
+            return None
+
+        self._prune(keep=path)
+
+        return path
+
+    def get_file(self, source):
+        """
+        Returns the filename of an unmodified copy of the source, or None
+        if it can not be downloaded
+        """
+        if not source:
+            return None
+
+        directory = os.path.join(self.location, self._source_key(source))
+
+        if os.path.exists(os.path.join(directory, 'original')):
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        try:
+            path = self._get_original(source, directory)
+        except Exception as e:
+            logger.warn(u"Unable to cache file {0}: {1}".format(source, e))
+            return None
+
+        self._prune(keep=path)
+
+        return path
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.location, ignore_errors=True)
+            self._size = None
+            self.hits = 0
+            self.misses = 0
+
+    def _source_key(self, source):
+        """
+        S3Objects are identified by their version. Urls are identified
+        without the query string, which changes every time a url is signed
+        """
+        if hasattr(source, 'key') and hasattr(source, 'bucket'):
+            identity = u"s3:{0}/{1}:{2}".format(source.bucket, source.key, source.version_id or '')
+        elif os.path.exists(source):
+            identity = u"file:{0}:{1}".format(os.path.abspath(source), os.path.getmtime(source))
+        else:
+            parts = urlparse.urlsplit(source)
+            identity = u"url:{0}://{1}{2}".format(parts.scheme, parts.netloc, parts.path)
+
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _get_original(self, source, directory):
+        path = os.path.join(directory, 'original')
+
+        if os.path.exists(path):
+            self._touch(path)
+        elif hasattr(source, 'download'):
+            self._write(path, source.download)
+        elif os.path.exists(source):
+            return source
+        else:
+            self._write(path, lambda filename: self._fetch(source, filename))
+
+        return path
+
+    def _fetch(self, url, filename):
+        response = urllib2.urlopen(url, timeout=self.timeout)
+        try:
+            with open(filename, 'wb') as f:
+                shutil.copyfileobj(response, f)
+        finally:
+            response.close()
+
+    def _resize(self, original, filename, width, height, max_width):
+        """
+        Saves a copy of the original that is no larger than the printed
+        size. Images with transparency are kept as png, the rest are
+        saved as jpeg
+        """
+        img = PILImage.open(original)
+
+        if width and not height:
+            box = (width * self.scale, img.size[1])
+        elif height:
+            box = ((max_width or img.size[0]) * self.scale, height * self.scale)
+        else:
+            box = img.size
+
+        img.thumbnail((int(box[0]) or 1, int(box[1]) or 1), PILImage.ANTIALIAS)
+
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img.save(filename, 'PNG', optimize=True)
+        else:
+            img.convert('RGB').save(filename, 'JPEG', quality=90, optimize=True)
+
+    def _write(self, path, write):
+        """
+        Writes the file to a temporary name first so that other processes
+        never read a partially written file
+        """
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        tmp_path = os.path.join(directory, u".{0}".format(uuid.uuid4().hex))
+        try:
+            write(tmp_path)
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+
+    def _touch(self, path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _files(self):
+        files = []
+        for root, dirs, filenames in os.walk(self.location):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        return files
+
+    def _prune(self, keep=None):
+        """
+        Deletes the least recently used files until the cache is smaller
+        than its max size. The 'keep' file is about to be read and is not
+        deleted
+        """
+        with self._lock:
+            if self._size is not None and self._size <= self.max_size:
+                return
+
+            files = self._files()
+            self._size = sum(size for mtime, size, path in files)
+
+            for mtime, size, path in sorted(files):
+                if self._size <= self.max_size:
+                    break
+
+                if path == keep:
+                    continue
+
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+
+                self._size -= size
+
+
+_image_cache = None
+_image_cache_lock = Lock()
+
+
+def get_image_cache():
+    """
+    Returns the image cache set in IMAGE_CACHE
+    """
+    global _image_cache
+
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                config = getattr(settings, 'IMAGE_CACHE', {})
+                _image_cache = ImageCache(location=config.get('LOCATION'),
+                                          max_size=config.get('MAX_SIZE', 512 * 1024 * 1024))
+
+    return _image_cache
+
+
+def set_image_cache(cache):
+    global _image_cache
+
+    _image_cache = cache
+
+
+def get_path(source, width=None, height=None, max_width=0):
+    return get_image_cache().get_path(source, width=width, height=height, max_width=max_width)
+
+
+def get_file(source):
+    return get_image_cache().get_file(source)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch printing of barcode stickers
+
+Stickers for many supplies, fabrics or equipment are printed onto
+sheets in a single document, instead of one request and one document
+per sticker. The rows are selected with query parameters:
+
+    ?ids=12,15,100-250      the ids and id ranges to print
+    ?since=2019-03-01       the rows changed since the date
+    ?copies=2               the number of stickers of each row
+
+    return labels.stream(request, Supply.objects.all(), labels.supply_label, 'Supply-Stickers')
+
+The document is written to a temporary file, which is kept in memory
+until it becomes large, and streamed to the client.
+"""
+import logging
+import tempfile
+
+import dateutil.parser
+from django.db.models import Q
+from django.http import FileResponse, HttpResponseBadRequest, HttpResponseNotFound
+from django.utils import timezone
+
+from media.stickers import StickerPage
+from utilities import export
+
+
+logger = logging.getLogger(__name__)
+
+max_stickers = 10000
+spool_size = 10 * 1024 * 1024
+
+
+def supply_label(supply):
+    return (u"DRS-{0}".format(supply.id), supply.description or u"")
+
+
+def fabric_label(fabric):
+    return (u"DRS-{0}".format(fabric.id),
+            u"{0} {1} ({2})".format(fabric.pattern, fabric.color, fabric.grade or 'NA'))
+
+
+def equipment_label(equipment):
+    return (u"DRE-{0}".format(equipment.id),
+            u"{0} ({1})".format(equipment.description, (equipment.brand or "").capitalize()))
+
+
+def parse_ids(value):
+    """
+    Returns a filter of the ids and id ranges, e.g. '12,15,100-250'
+    """
+    query = Q()
+
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+
+        if '-' in part:
+            start, end = [int(i) for i in part.split('-', 1)]
+            query |= Q(pk__gte=min(start, end), pk__lte=max(start, end))
+        else:
+            query |= Q(pk=int(part))
+
+    return query
+
+
+def filter_queryset(request, queryset, date_field='last_modified'):
+    """
+    Filters the queryset by the 'ids' and 'since' query parameters.
+    Raises ValueError if a parameter can not be read
+    """
+    ids = request.GET.get('ids')
+    if ids:
+        queryset = queryset.filter(parse_ids(ids))
+
+    since = request.GET.get('since')
+    if since:
+        date = dateutil.parser.parse(since)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+
+        queryset = queryset.filter(**{date_field + '__gte': date})
+
+    return queryset
+
+
+def get_codes(queryset, label, copies=1, limit=None):
+    """
+    Returns the code and description of the stickers of every row,
+    reading the rows in chunks
+    """
+    codes = []
+
+    for obj in export.iterate(queryset):
+        codes.extend([label(obj)] * copies)
+
+        if limit is not None and len(codes) > limit:
+            break
+
+    return codes
+
+
+def render(codes, output):
+    """
+    Writes the stickers onto sheets in one document
+    """
+    StickerPage(codes=codes).create(output)
+
+
+def stream(request, queryset, label, name, date_field='last_modified'):
+    """
+    Returns a response that streams the stickers of the rows selected by
+    the request
+    """
+    try:
+        queryset = filter_queryset(request, queryset, date_field=date_field)
+        copies = int(request.GET.get('copies', 1))
+    except (ValueError, OverflowError) as e:
+        return HttpResponseBadRequest(u"Unable to read the parameters: {0}".format(e))
+
+    if not 0 < copies <= 100:
+        return HttpResponseBadRequest("'copies' must be between 1 and 100")
+
+    codes = get_codes(queryset, label, copies=copies, limit=max_stickers)
+
+    if not codes:
+        return HttpResponseNotFound("No stickers to print")
+    elif len(codes) > max_stickers:
+        return HttpResponseBadRequest(u"More than {0} stickers requested".format(max_stickers))
+
+    output = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    render(codes, output)
+    output.seek(0)
+
+    logger.info(u"Printed {0} stickers".format(len(codes)))
+
+    response = FileResponse(output, content_type='application/pdf')
+    response['Content-Disposition'] = 'filename="{0}.pdf"'.format(name)
+
+    return response
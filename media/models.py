@@ -10,13 +10,13 @@ from django.db import models
 from django.contrib import admin
 from administrator.models import User, CredentialsModel, OAuth2TokenFromCredentials, Storage
 from django.conf import settings
-from boto.s3.connection import S3Connection, Location
-from boto.s3.key import Key
-import boto
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 from httplib2 import Http
 
+from media.storage import get_storage
+from media.url_cache import url_cache, sign as sign_urls
+
 
 logger = logging.getLogger(__name__)
 
@@ -35,15 +35,8 @@ class S3Object(models.Model):
     bucket = models.TextField()
     key = models.TextField() 
     _size = models.IntegerField(db_column='size', max_length=30, null=True, default=None) 
-    _bucket_obj = {}
-    _conn_obj = boto.s3.connect_to_region('ap-southeast-1')
     migrate_re = re.compile(r'(?:acknowledgement|estimate|purchase_order)\/(\d+)\/(?:Acknowledgement|Estimate|PO|Quality_Control|Label|Production|Quotation)\-\1(?:\-\S+)*.pdf')
     migrate_sub_re = re.compile(r'(acknowledgement|acknowledgment|estimate|purchase_order)\/(Acknowledgement|Estimate|PO|Quality_Control|Label|Production|Quotation)\-(\d+)((?:\-\S+)*.pdf)')
-    
-    def __init__(self, *args, **kwargs):
-        super(S3Object, self).__init__(*args, **kwargs)
-
-        self._key_obj = None
 
     @classmethod
     def create(cls, filename, key, bucket, access_key='', secret='', delete_original=True, encrypt_key=False, upload=True):
@@ -97,18 +90,10 @@ class S3Object(models.Model):
         return {'id': self.id,
                 'url': self.generate_url(),
                 'last_modified': self.last_modified}
-    @property
-    def _conn(self):
-        if self._conn_obj is None:
-            self._conn_obj = self._get_connection()
-        
-        return self._conn_obj
-    @property
-    def bucket_obj(self):
-        if self.bucket not in self._bucket_obj:
-            self._bucket_obj[self.bucket] = self._get_bucket()
 
-        return self._bucket_obj[self.bucket]
+    @property
+    def storage(self):
+        return get_storage()
 
     @property
     def key_name(self):
@@ -118,25 +103,8 @@ class S3Object(models.Model):
     def key_name(self, value):
         self.key = value
 
-    @property
-    def key_obj(self):
-
-        if self._key_obj is None:
-            self._key_obj = self.bucket_obj.get_key(self.key_name,
-                                                    version_id=self.version_id)
-            
-
-            #if self._size is None or self.version_id is None or self.last_modified is None:
-            #    t = Thread(target=self._update_from_key_obj, args=(self.key_name, self.bucket_obj))
-            #    t.start()
-
-        return self._key_obj
-
     @property
     def size(self):
-        # if self._size is None:
-        #     t = Thread(target=self._update_from_key_obj)
-        #     t.start()
         return self._size or 0
 
     @property
@@ -150,26 +118,22 @@ class S3Object(models.Model):
             new_key = new_key.replace('acknowledgment', 'acknowledgement')
             assert self.migrate_re.search(new_key), new_key
 
-            old_key_obj = self.key_obj
-            
-            new_key_obj = old_key_obj.copy(self.bucket,
-                                           new_key)
+            old_key = self.key
+            old_version_id = self.version_id
 
-            assert new_key_obj.exists()
-            assert new_key_obj.key == new_key
-            assert new_key_obj.bucket.name == self.bucket
+            self.storage.copy(self.bucket, old_key, new_key, version_id=old_version_id)
+            stat = self.storage.stat(self.bucket, new_key)
+            assert stat is not None, new_key
 
             self.key = new_key
-            self.version_id = new_key_obj.version_id
-            self._size = new_key_obj.size
-            self._key_obj = new_key_obj
+            self.version_id = stat['version_id']
+            self._size = stat['size']
             self.save()
 
-            assert not self.migrate_re.search(old_key_obj.key)
-            old_key_obj.delete()
-            assert self.bucket_obj.get_key(old_key_obj.key, version_id=old_key_obj.version_id) is None
+            self.storage.delete(self.bucket, old_key, version_id=old_version_id)
+            assert not self.storage.exists(self.bucket, old_key, version_id=old_version_id)
 
-            logger.info(u"Migrated from key {0} to {1}".format(old_key_obj.key, self.key))
+            logger.info(u"Migrated from key {0} to {1}".format(old_key, self.key))
             
         else: 
             logger.info(u"Already migrated to {0}".format(self.key))
@@ -185,20 +149,25 @@ class S3Object(models.Model):
         if filename is None:
             filename = self.key_name.split('/')[-1]
 
-        self.key_obj.get_contents_to_filename(filename)
-       
-        return filename
+        return self.storage.download(self.bucket, self.key_name, filename, version_id=self.version_id)
 
     def generate_url(self, key=None, secret=None, time=86400, force_http=False):
         """
         Generates a url for the object
         """
-        return self._conn.generate_url(time,
-                                 'GET',
-                                 bucket=self.bucket,
-                                 key=self.key_name,
+        return url_cache.get_url(self.bucket,
+                                 self.key_name,
+                                 version_id=self.version_id,
+                                 expires_in=time,
                                  force_http=force_http)
 
+    @classmethod
+    def generate_urls(cls, objects, time=86400, force_http=False):
+        """
+        Generates the urls for many objects at once and returns them by id
+        """
+        return sign_urls(objects, time=time, force_http=force_http)
+
     def dict(self):
         """
         Return the objects attributes
@@ -219,73 +188,49 @@ class S3Object(models.Model):
 
     def delete(self, **kwargs):
         try:
-            bucket = self.bucket_obj
-            bucket.delete_key(self.key, version_id=self.version_id)
+            self.storage.delete(self.bucket, self.key, version_id=self.version_id)
         except Exception as e:
             logger.warn(e)
             
         super(S3Object, self).delete(**kwargs)
 
-    def _get_connection(self, key, secret):
-        """
-        Returns the S3 Connection of the object
-        """
-        if self._conn_obj is None:
-            self._conn_obj = boto.s3.connect_to_region('ap-southeast-1')
-        return self._conn_obj
-
-    def _get_bucket(self):
-        """
-        Returns the S3 Bucket of the object
-        """
-        if self.bucket:
-            bucket = self._conn.get_bucket(self.bucket, True)
-            bucket.configure_versioning(True)
-            return bucket
-        else:
-            raise AttributeError("Missing bucket name.")
-
-    def _get_key(self):
-        """
-        Returns the S3 Key of the object
-        """
-        bucket = self.bucket_obj
-        return bucket.get_key(self.key, version_id=self.version_id)
-
     def _upload(self, filename, delete_original=True, encrypt_key=False):
         """
-        Uploads the file to the to our S3 service
-
-        Requies the filename, the file type. if an Appendix is provided
-        then the file is appended with that before the filetype.
+        Uploads the file to the to our storage service
         """
-        bucket = self.bucket_obj
-        k = Key(bucket)
-        k.key = self.key_name
-        k.set_contents_from_filename(filename, encrypt_key=encrypt_key)
-        k.set_acl('private')
+        data = self.storage.upload(self.bucket, self.key_name, filename, encrypt_key=encrypt_key)
 
-        self.version_id = k.version_id
-        if k.last_modified:
-            self.last_modified = parser.parse(k.last_modified)
+        self.version_id = data['version_id']
+        self._size = data['size']
+        if data['last_modified']:
+            self.last_modified = data['last_modified']
 
         if delete_original:
             os.remove(filename)
 
     def _update_from_key_obj(self):
         
-        bucket_obj = self.bucket_obj
-
-        key_obj = bucket_obj.get_key(self.key_name, 
-                                     version_id=self.version_id)
-        self._size = key_obj.size
-        self.version_id = key_obj.version_id
-        self.last_modified = parser.parse(key_obj.last_modified)
+        data = self.storage.stat(self.bucket, self.key_name, version_id=self.version_id)
 
+        self._size = data['size']
+        self.version_id = data['version_id']
+        self.last_modified = data['last_modified']
 
         self.save()
 
 
+class RenderedDocument(models.Model):
+    """
+    An uploaded PDF keyed by a hash of the data printed on it
+    """
+    document = models.TextField()
+    fingerprint = models.CharField(max_length=64, unique=True)
+    file = models.ForeignKey(S3Object, related_name='+', on_delete=models.CASCADE)
+    hits = models.IntegerField(default=0)
+    time_created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(auto_now=True)
+
+
 class Employee(models.Model):
     user = models.OneToOneField(User)
     telephone = models.TextField(null=True)
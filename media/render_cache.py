@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Render cache for the document PDFs
+
+A document is only rendered and uploaded when the data printed on it
+changes. The data is reduced to a fingerprint and the uploaded
+S3Object of the last render with the same fingerprint is reused.
+
+Each render is uploaded under its own key, the document key with the
+fingerprint as the last folder, e.g.
+
+    acknowledgement/12/<fingerprint>/Acknowledgement-12.pdf
+
+so that a reused S3Object still holds the bytes it was rendered with
+after the data has changed and changed back. Renders that have not been
+used for 'max_age' are pruned by prune(), which also deletes the files
+that no document refers to anymore.
+"""
+import hashlib
+import json
+import logging
+import posixpath
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from media.models import S3Object, RenderedDocument
+
+
+logger = logging.getLogger(__name__)
+
+max_age = timedelta(days=90)
+batch_size = 500
+
+
+def model_data(instance, exclude=('last_modified',)):
+    """
+    Returns the concrete field values of a model instance as a dictionary
+    """
+    if instance is None:
+        return None
+
+    return {f.attname: getattr(instance, f.attname) for f in instance._meta.concrete_fields
+            if f.attname not in exclude}
+
+
+def file_data(s3_obj):
+    """
+    Returns the values that identify the content of an S3Object
+    """
+    if s3_obj is None:
+        return None
+
+    return [s3_obj.bucket, s3_obj.key, s3_obj.version_id]
+
+
+def contact_data(contact):
+    """
+    Returns the printable values of a customer or supplier and its addresses
+    """
+    if contact is None:
+        return None
+
+    data = model_data(contact, exclude=('last_modified', 'trcloud_id', 'google_contact_id', 'notes'))
+    data['addresses'] = [model_data(address) for address in contact.addresses.all()]
+
+    return data
+
+
+def fingerprint(document, key, data):
+    """
+    Returns a stable hash of the document, its key and the printable data
+    """
+    content = json.dumps([document, key, data],
+                         sort_keys=True,
+                         default=lambda obj: u"{0}".format(obj))
+
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_key(key, fp):
+    """
+    Returns the key a render with the fingerprint is uploaded under
+    """
+    folder, filename = posixpath.split(key)
+
+    return posixpath.join(folder, fp, filename)
+
+
+def get_or_render(document, data, render, key, bucket, delete_original=True):
+    """
+    Returns the S3Object for the document
+
+    'render' is called to create the pdf and must return the filename.
+    It is only called if no pdf has been uploaded for the same data
+    """
+    fp = fingerprint(document, key, data)
+
+    try:
+        rendered = RenderedDocument.objects.select_related('file').get(fingerprint=fp)
+    except RenderedDocument.DoesNotExist:
+        logger.info(u"Render cache miss for {0}".format(key))
+
+        filename = render()
+        s3_obj = S3Object.create(filename, get_key(key, fp), bucket, delete_original=delete_original)
+
+        try:
+            with transaction.atomic():
+                RenderedDocument.objects.create(document=document, fingerprint=fp, file=s3_obj)
+        except IntegrityError:
+            # Another worker rendered the same data at the same time. Both
+            # uploads are under the same key, so the file is only deleted
+            # if it is a version of its own
+            logger.info(u"Render of {0} was already cached".format(key))
+            _delete(s3_obj)
+
+            return RenderedDocument.objects.select_related('file').get(fingerprint=fp).file
+
+        return s3_obj
+
+    logger.info(u"Render cache hit for {0}".format(key))
+
+    RenderedDocument.objects.filter(pk=rendered.pk).update(hits=F('hits') + 1,
+                                                           last_used=timezone.now())
+
+    return rendered.file
+
+
+def prune(age=None):
+    """
+    Removes the renders that have not been used for 'age' and deletes
+    their files unless a document still refers to them. Returns the
+    number of removed renders
+    """
+    cutoff = timezone.now() - (age or max_age)
+    count = 0
+
+    while True:
+        rows = list(RenderedDocument.objects.filter(last_used__lt=cutoff)
+                                            .values_list('id', 'file_id')[:batch_size])
+        if not rows:
+            break
+
+        RenderedDocument.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        count += len(rows)
+
+        file_ids = set(row[1] for row in rows)
+        unused = file_ids - _get_referenced(file_ids)
+
+        for s3_obj in S3Object.objects.filter(pk__in=unused):
+            _delete(s3_obj)
+
+    logger.info(u"Pruned {0} renders".format(count))
+
+    return count
+
+
+def stats(document=None):
+    """
+    Returns the hits and misses of the render cache per document
+
+    Every miss uploads a new file, so the misses are the number of
+    cached files
+    """
+    queryset = RenderedDocument.objects.all()
+
+    if document:
+        queryset = queryset.filter(document=document)
+
+    rows = queryset.values('document').annotate(misses=Count('id'), hits=Sum('hits'))
+
+    return {row['document']: {'hits': row['hits'] or 0, 'misses': row['misses']} for row in rows}
+
+
+def _get_referenced(file_ids):
+    """
+    Returns the ids of the S3Objects that another model refers to
+    """
+    referenced = set()
+
+    for relation in S3Object._meta.get_fields(include_hidden=True):
+        if not (relation.auto_created and not relation.concrete) or relation.related_model is RenderedDocument:
+            continue
+
+        name = relation.field.name
+        referenced.update(relation.related_model._base_manager.filter(**{name + '__in': file_ids})
+                                                              .values_list(name, flat=True))
+
+    return referenced
+
+
+def _delete(s3_obj):
+    """
+    Deletes the S3Object and its stored file. Renders from before the
+    keys had the fingerprint share a key, so an unversioned file is kept
+    while another S3Object is stored under the same key
+    """
+    shared = S3Object.objects.filter(bucket=s3_obj.bucket, key=s3_obj.key).exclude(pk=s3_obj.pk).exists()
+
+    if s3_obj.version_id or not shared:
+        s3_obj.delete()
+    else:
+        S3Object.objects.filter(pk=s3_obj.pk).delete()
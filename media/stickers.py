@@ -2,9 +2,15 @@
 # -*- coding: utf-8 -*-
 """
 PDF pages for stickers
+
+Barcodes are encoded once per code and size and reused, and the styles
+of the sticker cells are created once, so that a sheet of many stickers
+only creates the tables and descriptions of each sticker.
 """
 import logging
+from collections import OrderedDict
 from decimal import Decimal
+from threading import Lock
 from pytz import timezone
 
 from django.conf import settings
@@ -22,12 +28,39 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.graphics.barcode import createBarcodeDrawing
 from reportlab.graphics.barcode import code128
 
+from media import image_cache
+
 
 logger = logging.getLogger(__name__)
 
 pdfmetrics.registerFont(TTFont('Tahoma', settings.FONT_ROOT + 'Tahoma.ttf'))
 pdfmetrics.registerFont(TTFont('Garuda', settings.FONT_ROOT + 'Garuda.ttf'))
 
+barcode_cache_size = 2048
+
+_barcodes = OrderedDict()
+_barcodes_lock = Lock()
+
+
+def get_barcode(code, bar_height, bar_width):
+    """
+    Returns the Code128 barcode of the code. A barcode is drawn the same
+    way wherever it is placed, so the most recently used barcodes are
+    kept and reused
+    """
+    key = (code, bar_height, bar_width)
+
+    with _barcodes_lock:
+        barcode = _barcodes.pop(key, None)
+        if barcode is None:
+            barcode = code128.Code128(code, barHeight=bar_height, barWidth=bar_width)
+
+        _barcodes[key] = barcode
+        while len(_barcodes) > barcode_cache_size:
+            _barcodes.popitem(last=False)
+
+    return barcode
+
 
 class StickerDocTemplate(BaseDocTemplate):
     def __init__(self, filename, page_size=A4, **kwargs):
@@ -132,7 +165,7 @@ class Sticker(object):
         """
         Creates a single sticker page.
         """
-        barcode = code128.Code128(self.code, barHeight=self.barcode_height, barWidth=self.barcode_width)
+        barcode = get_barcode(self.code, self.barcode_height, self.barcode_width)
         data = [[barcode], [self._format_description(self.description)]]
         table = Table(data, colWidths=self.sticker_width, rowHeights=(self.sticker_height / 2) - 1 * mm)
         style = TableStyle([('FONTSIZE', (0, 0), (-1, -1), 12),
@@ -307,12 +340,16 @@ class FabricSticker(object):
         return Paragraph(description, style)
 
     def get_image(self, path, width=None, height=None, max_width=0, max_height=0):
-        """Retrieves the image via the link and gets the
+        """Retrieves the image from the image cache and gets the
         size from the image. The correct dimensions for
         image are calculated based on the desired with or
         height"""
+        path = image_cache.get_path(path, width=width, height=height, max_width=max_width)
+        if path is None:
+            return None
+
         try:
-            #Read image from link
+            #Read the cached thumbnail
             img = utils.ImageReader(path)
         except:
             return None
@@ -415,6 +452,34 @@ class StickerPage(object):
     barcode_width = 0.35 * mm
     vertical_spacing = 0 * mm
     horizontal_spacing = 0 * mm
+    rows = 8
+    columns = 3
+
+    # Shared by all the stickers
+    page_style = TableStyle([('FONTSIZE', (0, 0), (-1, -1), 12),
+                             ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                             ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+                             ('TOPPADDING', (0, 0), (-1, -1), 1),
+                             ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+                             #('GRID', (0, 0), (-1, -1), 1, colors.CMYKColor(black=60)),
+                             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                             ('ALIGN', (0, 0), (-1, -1), 'CENTER')])
+    cell_style = TableStyle([('FONTSIZE', (0, 0), (-1, -1), 3 * mm),
+                             ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                             ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+                             ('TOPPADDING', (0, 0), (-1, 0), 1 * mm),
+                             ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+                             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                             ('VALIGN', (0, -1), (-1, -1), 'MIDDLE')])
+    description_style = ParagraphStyle(name='Normal',
+                                       fontName='Garuda',
+                                       leading=12,
+                                       wordWrap='CJK',
+                                       allowWidows=1,
+                                       alignment=1,
+                                       allowOrphans=1,
+                                       fontSize=10,
+                                       textColor=colors.CMYKColor(black=60))
 
     def __init__(self, code=None, description=None, codes=None, copy=None, *args, **kwargs):
         """
@@ -430,30 +495,35 @@ class StickerPage(object):
 
     def create(self, response=None):
         """
-        Main method to create a sticker page
+        Main method to create the sticker pages. Codes that do not fit
+        on one page continue on the next
         """
         logger.debug(self.code)
         logger.debug(response)
         if response is None:
             response = '{0}.pdf'.format(self.code)
 
+        codes = self._get_codes()
+        per_page = self.rows * self.columns
+
         doc = StickerDocTemplate(response)
-        stories = [self._create_sticker_page()]
+        stories = [self._create_sticker_page(codes[index:index + per_page])
+                   for index in xrange(0, len(codes), per_page)]
         doc.build(stories)
 
         return "{0}.pdf".format(self.code)
 
-    def _create_sticker_page(self):
+    def _create_sticker_page(self, codes=None):
         """
         Creates a single sticker page.
         """
-        codes = self._get_codes()
+        codes = codes if codes is not None else self._get_codes()
         code_index = 0
 
         data = []
-        for i in range(15):
+        for i in range(self.rows * 2 - 1):
             row = []
-            for h in range(5):
+            for h in range(self.columns * 2 - 1):
                 if h % 2 == 0 and i % 2 == 0:
                     # Add code and description to sticker. If out of code add empty space
                     try:
@@ -467,17 +537,9 @@ class StickerPage(object):
             data.append(row)
 
         table = Table(data,
-                      colWidths=tuple([self.sticker_width if i % 2 == 0 else self.horizontal_spacing for i in range(5) ]),
-                      rowHeights=tuple([self.sticker_height if i % 2 == 0 else self.vertical_spacing for i in range(15)]))
-        style = TableStyle([('FONTSIZE', (0, 0), (-1, -1), 12),
-                            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                            ('TOPPADDING', (0, 0), (-1, -1), 1),
-                            ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
-                            #('GRID', (0, 0), (-1, -1), 1, colors.CMYKColor(black=60)),
-                            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                            ('ALIGN', (0, 0), (-1, -1), 'CENTER')])
-        table.setStyle(style)
+                      colWidths=tuple([self.sticker_width if i % 2 == 0 else self.horizontal_spacing for i in range(self.columns * 2 - 1)]),
+                      rowHeights=tuple([self.sticker_height if i % 2 == 0 else self.vertical_spacing for i in range(self.rows * 2 - 1)]))
+        table.setStyle(self.page_style)
 
         return table
 
@@ -489,19 +551,12 @@ class StickerPage(object):
             code, description = code
         else:
             code, description = code, code
-        barcode = code128.Code128(code, barHeight=self.barcode_height, barWidth=self.barcode_width)
+        barcode = get_barcode(code, self.barcode_height, self.barcode_width)
         data = [[barcode],
                 [self._format_description(description)]]
 
         table = Table(data, colWidths=(50 * mm), rowHeights=(self.barcode_height - 1, 8 * mm))
-        style = TableStyle([('FONTSIZE', (0, 0), (-1, -1), 3 * mm),
-                            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                            ('TOPPADDING', (0, 0), (-1, 0), 1 * mm),
-                            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                            ('VALIGN', (0, -1), (-1, -1), 'MIDDLE')])
-        table.setStyle(style)
+        table.setStyle(self.cell_style)
         return table
 
     def _get_codes(self):
@@ -515,9 +570,10 @@ class StickerPage(object):
         #Sets the codes use
         if self.codes and isinstance(self.codes, list):
             codes = self.codes
-        elif self.code and isinstance(self.code, str):
+        elif self.code and isinstance(self.code, basestring):
+            # A single code fills one page
             codes = [(self.code, self.description) if self.description else
-                     self.code for i in range(self.copy or 30)]
+                     self.code for i in range(self.copy or self.rows * self.columns)]
         else:
             raise ValueError('Expecting some codes here')
 
@@ -528,14 +584,4 @@ class StickerPage(object):
         Formats the description into a paragraph
         with the paragraph style
         """
-        style = ParagraphStyle(name='Normal',
-                               fontName='Garuda',
-                               leading=12,
-                               wordWrap='CJK',
-                               allowWidows=1,
-                               alignment=1,
-                               allowOrphans=1,
-                               fontSize=10,
-                               textColor=colors.CMYKColor(black=60))
-
-        return Paragraph(description, style)
+        return Paragraph(description or u'', self.description_style)
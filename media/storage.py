@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Storage backends for S3Objects
+
+The backend is chosen with the MEDIA_STORAGE setting:
+
+    MEDIA_STORAGE = {
+        'BACKEND': 'media.storage.S3Storage',
+        'OPTIONS': {'region': 'ap-southeast-1'}
+    }
+
+S3Storage also works with S3 compatible services such as MinIO by
+passing 'host', 'port' and 'is_secure' in the options. LocalStorage
+keeps the files on disk so that documents can be created and tested
+without AWS.
+"""
+import contextlib
+import errno
+import logging
+import os
+import shutil
+import socket
+import time
+import urllib
+import uuid
+from datetime import datetime
+from httplib import HTTPException
+from Queue import LifoQueue, Empty, Full
+from threading import Lock
+
+import boto
+import boto.s3
+from boto.exception import BotoServerError, S3ResponseError
+from boto.s3.connection import OrdinaryCallingFormat
+from boto.s3.key import Key
+from dateutil import parser
+from django.conf import settings
+from django.utils.module_loading import import_string
+from pytz import utc
+
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend(object):
+    """
+    Interface for the storage of S3Object files
+
+    Methods that write a file return a dictionary with the 'version_id',
+    'last_modified' and 'size' of the stored file.
+    """
+
+    def upload(self, bucket, key, filename, encrypt_key=False):
+        raise NotImplementedError
+
+    def download(self, bucket, key, filename, version_id=None):
+        raise NotImplementedError
+
+    def copy(self, bucket, key, new_key, version_id=None):
+        raise NotImplementedError
+
+    def delete(self, bucket, key, version_id=None):
+        raise NotImplementedError
+
+    def stat(self, bucket, key, version_id=None):
+        """
+        Returns the 'version_id', 'last_modified' and 'size' of the file,
+        or None if it does not exist
+        """
+        raise NotImplementedError
+
+    def generate_url(self, bucket, key, expires_in=86400, force_http=False, version_id=None):
+        raise NotImplementedError
+
+    def generate_urls(self, keys, expires_in=86400, force_http=False):
+        """
+        Returns the urls for a list of (bucket, key, version_id) tuples
+        """
+        return [self.generate_url(bucket, key, expires_in=expires_in, force_http=force_http, version_id=version_id)
+                for bucket, key, version_id in keys]
+
+    def exists(self, bucket, key, version_id=None):
+        return self.stat(bucket, key, version_id=version_id) is not None
+
+
+class S3Storage(StorageBackend):
+    """
+    Amazon S3 or S3 compatible storage
+
+    Boto connections are not thread safe, so each call borrows a
+    connection from a pool and returns it when done. Failed requests
+    are retried and large files are uploaded in parts.
+    """
+    retry_exceptions = (socket.error, HTTPException, BotoServerError)
+
+    def __init__(self, region='ap-southeast-1', host=None, port=None, is_secure=True,
+                 pool_size=10, retries=3, retry_delay=0.5,
+                 multipart_threshold=16 * 1024 * 1024, multipart_chunk_size=8 * 1024 * 1024,
+                 versioning=True, **connection_kwargs):
+        self.region = region
+        self.host = host
+        self.port = port
+        self.is_secure = is_secure
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunk_size = multipart_chunk_size
+        self.versioning = versioning
+        self.connection_kwargs = connection_kwargs
+
+        self._pool = LifoQueue(maxsize=pool_size)
+        self._versioned_buckets = set()
+        self._lock = Lock()
+
+    def upload(self, bucket, key, filename, encrypt_key=False):
+        self._configure_versioning(bucket)
+
+        if os.path.getsize(filename) > self.multipart_threshold:
+            return self._retry(self._upload_multipart, bucket, key, filename, encrypt_key)
+
+        return self._retry(self._upload, bucket, key, filename, encrypt_key)
+
+    def download(self, bucket, key, filename, version_id=None):
+        def download(conn):
+            key_obj = self._get_bucket(conn, bucket).get_key(key, version_id=version_id)
+            if key_obj is None:
+                raise IOError(errno.ENOENT, u"{0}/{1} does not exist".format(bucket, key))
+
+            key_obj.get_contents_to_filename(filename, version_id=version_id)
+
+            return filename
+
+        return self._retry(download)
+
+    def copy(self, bucket, key, new_key, version_id=None):
+        def copy(conn):
+            new_key_obj = self._get_bucket(conn, bucket).copy_key(new_key, bucket, key,
+                                                                  src_version_id=version_id)
+            return self._key_data(new_key_obj)
+
+        return self._retry(copy)
+
+    def delete(self, bucket, key, version_id=None):
+        def delete(conn):
+            self._get_bucket(conn, bucket).delete_key(key, version_id=version_id)
+
+        return self._retry(delete)
+
+    def stat(self, bucket, key, version_id=None):
+        def stat(conn):
+            key_obj = self._get_bucket(conn, bucket).get_key(key, version_id=version_id)
+            return self._key_data(key_obj) if key_obj is not None else None
+
+        return self._retry(stat)
+
+    def generate_url(self, bucket, key, expires_in=86400, force_http=False, version_id=None):
+        """
+        Signs a url for the key. Signing is done locally and does not
+        make a request to S3
+        """
+        with self._connection() as conn:
+            return conn.generate_url(expires_in,
+                                     'GET',
+                                     bucket=bucket,
+                                     key=key,
+                                     version_id=version_id,
+                                     force_http=force_http)
+
+    def generate_urls(self, keys, expires_in=86400, force_http=False):
+        """
+        Signs the urls for a list of (bucket, key, version_id) tuples with
+        one connection
+        """
+        with self._connection() as conn:
+            return [conn.generate_url(expires_in, 'GET', bucket=bucket, key=key, version_id=version_id,
+                                      force_http=force_http)
+                    for bucket, key, version_id in keys]
+
+    def _upload(self, conn, bucket, key, filename, encrypt_key):
+        key_obj = Key(self._get_bucket(conn, bucket))
+        key_obj.key = key
+        key_obj.set_contents_from_filename(filename, encrypt_key=encrypt_key, policy='private')
+
+        return self._key_data(key_obj, size=os.path.getsize(filename))
+
+    def _upload_multipart(self, conn, bucket, key, filename, encrypt_key):
+        bucket_obj = self._get_bucket(conn, bucket)
+        size = os.path.getsize(filename)
+
+        upload = bucket_obj.initiate_multipart_upload(key, encrypt_key=encrypt_key, policy='private')
+
+        try:
+            with open(filename, 'rb') as fp:
+                for index, offset in enumerate(xrange(0, size, self.multipart_chunk_size)):
+                    fp.seek(offset)
+                    upload.upload_part_from_file(fp, index + 1, size=min(self.multipart_chunk_size, size - offset))
+
+            completed = upload.complete_upload()
+        except Exception:
+            upload.cancel_upload()
+            raise
+
+        return {'version_id': completed.version_id,
+                'last_modified': None,
+                'size': size}
+
+    def _retry(self, func, *args):
+        """
+        Calls func with a pooled connection and retries server and
+        network errors with an increasing delay
+        """
+        for attempt in xrange(self.retries):
+            try:
+                with self._connection() as conn:
+                    return func(conn, *args)
+            except self.retry_exceptions as e:
+                if isinstance(e, S3ResponseError) and e.status < 500:
+                    raise
+
+                if attempt + 1 >= self.retries:
+                    raise
+
+                logger.warn(u"Retrying storage request after error: {0}".format(e))
+                time.sleep(self.retry_delay * (2 ** attempt))
+
+    @contextlib.contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            conn = self._connect()
+
+        try:
+            yield conn
+        except self.retry_exceptions:
+            # The connection may be in a bad state so it is not reused
+            raise
+        except Exception:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except Full:
+            pass
+
+    def _connect(self):
+        if self.host:
+            return boto.connect_s3(host=self.host,
+                                   port=self.port,
+                                   is_secure=self.is_secure,
+                                   calling_format=OrdinaryCallingFormat(),
+                                   **self.connection_kwargs)
+
+        return boto.s3.connect_to_region(self.region, **self.connection_kwargs)
+
+    def _get_bucket(self, conn, bucket):
+        return conn.get_bucket(bucket, validate=False)
+
+    def _configure_versioning(self, bucket):
+        """
+        Turns on versioning the first time a bucket is written to
+        """
+        if not self.versioning or bucket in self._versioned_buckets:
+            return
+
+        def configure(conn):
+            conn.get_bucket(bucket, validate=True).configure_versioning(True)
+
+        self._retry(configure)
+
+        with self._lock:
+            self._versioned_buckets.add(bucket)
+
+    def _key_data(self, key_obj, size=None):
+        last_modified = getattr(key_obj, 'last_modified', None)
+
+        return {'version_id': key_obj.version_id,
+                'last_modified': parser.parse(last_modified) if last_modified else None,
+                'size': size if size is not None else key_obj.size}
+
+
+class LocalStorage(StorageBackend):
+    """
+    Stores the files on the local disk
+
+    Files are kept at <location>/<bucket>/<key> and every version is
+    kept under <location>/<bucket>/.versions/<key>/<version_id>
+    """
+
+    def __init__(self, location=None, base_url=None):
+        self.location = os.path.abspath(location or os.path.join(settings.MEDIA_ROOT, 'storage'))
+        self.base_url = base_url
+
+    def upload(self, bucket, key, filename, encrypt_key=False):
+        version_id = uuid.uuid4().hex
+
+        self._copy_file(filename, self._version_path(bucket, key, version_id))
+        self._copy_file(filename, self._path(bucket, key))
+
+        with open(self._version_path(bucket, key, '.latest'), 'w') as latest:
+            latest.write(version_id)
+
+        return self.stat(bucket, key, version_id=version_id)
+
+    def download(self, bucket, key, filename, version_id=None):
+        path = self._existing_path(bucket, key, version_id)
+        if path is None:
+            raise IOError(errno.ENOENT, u"{0}/{1} does not exist".format(bucket, key))
+
+        shutil.copyfile(path, filename)
+
+        return filename
+
+    def copy(self, bucket, key, new_key, version_id=None):
+        path = self._existing_path(bucket, key, version_id)
+        if path is None:
+            raise IOError(errno.ENOENT, u"{0}/{1} does not exist".format(bucket, key))
+
+        return self.upload(bucket, new_key, path)
+
+    def delete(self, bucket, key, version_id=None):
+        paths = [self._version_path(bucket, key, version_id)] if version_id else []
+        if version_id is None or self._current_version(bucket, key) == version_id:
+            paths.append(self._path(bucket, key))
+
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def stat(self, bucket, key, version_id=None):
+        path = self._existing_path(bucket, key, version_id)
+        if path is None:
+            return None
+
+        return {'version_id': version_id or self._current_version(bucket, key),
+                'last_modified': datetime.fromtimestamp(os.path.getmtime(path), utc),
+                'size': os.path.getsize(path)}
+
+    def generate_url(self, bucket, key, expires_in=86400, force_http=False, version_id=None):
+        if self.base_url:
+            url = u"{0}/{1}/{2}".format(self.base_url.rstrip('/'), bucket, urllib.quote(key.encode('utf-8')))
+
+            return u"{0}?versionId={1}".format(url, urllib.quote(version_id)) if version_id else url
+
+        path = self._version_path(bucket, key, version_id) if version_id else self._path(bucket, key)
+
+        return u"file://{0}".format(urllib.pathname2url(path.encode('utf-8')))
+
+    def _path(self, bucket, key):
+        return os.path.join(self.location, bucket, *key.split('/'))
+
+    def _version_path(self, bucket, key, version_id):
+        return os.path.join(self.location, bucket, '.versions', *(key.split('/') + [version_id]))
+
+    def _current_version(self, bucket, key):
+        """
+        Returns the newest version of the key
+        """
+        try:
+            with open(self._version_path(bucket, key, '.latest')) as latest:
+                return latest.read().strip()
+        except IOError:
+            return None
+
+    def _existing_path(self, bucket, key, version_id=None):
+        path = self._version_path(bucket, key, version_id) if version_id else self._path(bucket, key)
+
+        return path if os.path.exists(path) else None
+
+    def _copy_file(self, src, dest):
+        directory = os.path.dirname(dest)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        shutil.copyfile(src, dest)
+
+
+_storage = None
+_storage_lock = Lock()
+
+
+def get_storage():
+    """
+    Returns the storage backend set in MEDIA_STORAGE
+    """
+    global _storage
+
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                config = getattr(settings, 'MEDIA_STORAGE', {})
+                backend = import_string(config.get('BACKEND', 'media.storage.S3Storage'))
+                _storage = backend(**config.get('OPTIONS', {}))
+
+    return _storage
+
+
+def set_storage(storage):
+    """
+    Replaces the storage backend, e.g. to use a LocalStorage for a benchmark
+    """
+    global _storage
+
+    _storage = storage
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background tasks for the media application
+"""
+from __future__ import absolute_import
+
+import logging
+
+from celery import shared_task
+
+from media import render_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def prune_render_cache():
+    """
+    Removes the cached renders that have not been used recently
+    """
+    return render_cache.prune()
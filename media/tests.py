@@ -0,0 +1,316 @@
+"""
+Testing File for the media application
+"""
+import logging
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from PIL import Image
+
+from media import render_cache
+from media.image_cache import ImageCache
+from media.models import S3Object, RenderedDocument
+from media.storage import LocalStorage, get_storage, set_storage
+from media.url_cache import URLCache
+from supplies.models import Supply
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStorageTest(TestCase):
+    """
+    Testing class for storing S3Objects on the local disk
+    """
+    def setUp(self):
+        super(LocalStorageTest, self).setUp()
+
+        self.location = tempfile.mkdtemp()
+        self.original_storage = get_storage()
+        set_storage(LocalStorage(location=self.location))
+
+        self.filename = os.path.join(self.location, 'test.pdf')
+        self._write(self.filename, 'version 1')
+
+    def tearDown(self):
+        set_storage(self.original_storage)
+        shutil.rmtree(self.location)
+
+        super(LocalStorageTest, self).tearDown()
+
+    def _write(self, filename, content):
+        with open(filename, 'w') as f:
+            f.write(content)
+
+    def _read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_create(self):
+        """
+        Test that the file is uploaded and the version is recorded
+        """
+        obj = S3Object.create(self.filename, 'acknowledgement/1/test.pdf', 'test-bucket')
+
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertIsNotNone(obj.version_id)
+        self.assertEqual(obj.size, len('version 1'))
+        self.assertTrue(obj.generate_url().startswith('file://'))
+
+        downloaded = obj.download(os.path.join(self.location, 'downloaded.pdf'))
+        self.assertEqual(self._read(downloaded), 'version 1')
+
+    def test_versions(self):
+        """
+        Test that an older version can still be downloaded after the key is overwritten
+        """
+        obj1 = S3Object.create(self.filename, 'acknowledgement/1/test.pdf', 'test-bucket')
+
+        self._write(self.filename, 'version 2')
+        obj2 = S3Object.create(self.filename, 'acknowledgement/1/test.pdf', 'test-bucket')
+
+        self.assertNotEqual(obj1.version_id, obj2.version_id)
+        self.assertEqual(self._read(obj1.download(os.path.join(self.location, '1.pdf'))), 'version 1')
+        self.assertEqual(self._read(obj2.download(os.path.join(self.location, '2.pdf'))), 'version 2')
+
+    def test_delete(self):
+        """
+        Test that deleting the object deletes the stored file
+        """
+        obj = S3Object.create(self.filename, 'acknowledgement/1/test.pdf', 'test-bucket')
+        obj.delete()
+
+        self.assertFalse(get_storage().exists('test-bucket', 'acknowledgement/1/test.pdf'))
+
+
+class RenderCacheTest(TestCase):
+    """
+    Testing class for reusing rendered documents
+    """
+    def setUp(self):
+        super(RenderCacheTest, self).setUp()
+
+        self.location = tempfile.mkdtemp()
+        self.original_storage = get_storage()
+        set_storage(LocalStorage(location=self.location))
+
+        self.key = 'acknowledgement/1/Acknowledgement-1.pdf'
+        self.renders = 0
+
+    def tearDown(self):
+        set_storage(self.original_storage)
+        shutil.rmtree(self.location)
+
+        super(RenderCacheTest, self).tearDown()
+
+    def _get_or_render(self, data):
+        def render():
+            self.renders += 1
+            filename = os.path.join(self.location, 'Acknowledgement-1.pdf')
+            with open(filename, 'w') as f:
+                f.write(data)
+            return filename
+
+        return render_cache.get_or_render('acknowledgement', data, render, self.key, 'test-bucket')
+
+    def _read(self, s3_obj):
+        with open(s3_obj.download(os.path.join(self.location, 'downloaded.pdf'))) as f:
+            return f.read()
+
+    def test_get_or_render(self):
+        """
+        Test that a reused render still has its own content after the data changed and changed back
+        """
+        obj_a = self._get_or_render('A')
+        obj_b = self._get_or_render('B')
+
+        self.assertEqual(self._get_or_render('A'), obj_a)
+        self.assertEqual(self.renders, 2)
+        self.assertNotEqual(obj_a.key, obj_b.key)
+        self.assertEqual(obj_a.filename, 'Acknowledgement-1.pdf')
+        self.assertEqual(self._read(obj_a), 'A')
+        self.assertEqual(self._read(obj_b), 'B')
+
+    def test_get_or_render_concurrently(self):
+        """
+        Test that the render of another worker is returned if it was cached first
+        """
+        fp = render_cache.fingerprint('acknowledgement', self.key, 'A')
+        other = S3Object.objects.create(key=render_cache.get_key(self.key, fp), bucket='test-bucket')
+
+        def render():
+            RenderedDocument.objects.create(document='acknowledgement', fingerprint=fp, file=other)
+            filename = os.path.join(self.location, 'Acknowledgement-1.pdf')
+            with open(filename, 'w') as f:
+                f.write('A')
+            return filename
+
+        obj = render_cache.get_or_render('acknowledgement', 'A', render, self.key, 'test-bucket')
+
+        self.assertEqual(obj, other)
+        self.assertEqual(S3Object.objects.count(), 1)
+
+    def test_prune(self):
+        """
+        Test that unused renders are removed and unreferenced files deleted
+        """
+        obj_a = self._get_or_render('A')
+        obj_b = self._get_or_render('B')
+        Supply.objects.create(description='Test', image=obj_b)
+
+        RenderedDocument.objects.update(last_used=timezone.now() - render_cache.max_age - timedelta(days=1))
+
+        self.assertEqual(render_cache.prune(), 2)
+        self.assertEqual(RenderedDocument.objects.count(), 0)
+        self.assertFalse(S3Object.objects.filter(pk=obj_a.pk).exists())
+        self.assertFalse(get_storage().exists('test-bucket', obj_a.key))
+        self.assertTrue(S3Object.objects.filter(pk=obj_b.pk).exists())
+
+
+class URLCacheTest(TestCase):
+    """
+    Testing class for the signed url cache
+    """
+    def setUp(self):
+        super(URLCacheTest, self).setUp()
+
+        self.location = tempfile.mkdtemp()
+        self.original_storage = get_storage()
+        set_storage(LocalStorage(location=self.location))
+
+        self.cache = URLCache(max_size=2)
+
+    def tearDown(self):
+        set_storage(self.original_storage)
+        shutil.rmtree(self.location)
+
+        super(URLCacheTest, self).tearDown()
+
+    def test_get_url(self):
+        """
+        Test that a url is reused until a new version is uploaded
+        """
+        url = self.cache.get_url('test-bucket', 'supply/image/1.jpg', version_id='1')
+        self.assertEqual(self.cache.get_url('test-bucket', 'supply/image/1.jpg', version_id='1'), url)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+        self.cache.get_url('test-bucket', 'supply/image/1.jpg', version_id='2')
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_get_url_of_version(self):
+        """
+        Test that the url of an older version is signed for that version
+        """
+        filename = os.path.join(self.location, 'test.pdf')
+        for content in ('version 1', 'version 2'):
+            with open(filename, 'w') as f:
+                f.write(content)
+            obj = S3Object.create(filename, 'acknowledgement/1/test.pdf', 'test-bucket')
+
+        old = S3Object.objects.exclude(pk=obj.pk).get(key='acknowledgement/1/test.pdf')
+        urls = self.cache.get_urls([('test-bucket', old.key, old.version_id),
+                                    ('test-bucket', obj.key, obj.version_id)])
+
+        self.assertNotEqual(urls[('test-bucket', old.key, old.version_id)],
+                            urls[('test-bucket', obj.key, obj.version_id)])
+        self.assertIn(old.version_id, urls[('test-bucket', old.key, old.version_id)])
+
+    def test_get_url_longer_than_cached(self):
+        """
+        Test that a url is signed again if it expires before the requested time
+        """
+        self.cache.get_url('test-bucket', 'supply/image/1.jpg', expires_in=60)
+        self.cache.get_url('test-bucket', 'supply/image/1.jpg', expires_in=86400)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_get_urls(self):
+        """
+        Test that many urls are signed at once and the oldest are evicted
+        """
+        keys = [('test-bucket', 'supply/image/{0}.jpg'.format(i), None) for i in xrange(3)]
+        urls = self.cache.get_urls(keys)
+
+        self.assertEqual(len(urls), 3)
+        self.assertEqual(self.cache.misses, 3)
+
+        self.cache.get_urls(keys[1:])
+        self.assertEqual(self.cache.hits, 2)
+
+
+class ImageCacheTest(TestCase):
+    """
+    Testing class for the cache of scaled images printed on the pdfs
+    """
+    def setUp(self):
+        super(ImageCacheTest, self).setUp()
+
+        self.location = tempfile.mkdtemp()
+        self.original_storage = get_storage()
+        set_storage(LocalStorage(location=os.path.join(self.location, 'storage')))
+
+        self.cache = ImageCache(location=os.path.join(self.location, 'cache'))
+
+        filename = os.path.join(self.location, 'photo.jpg')
+        Image.new('RGB', (2000, 1000), (255, 0, 0)).save(filename, 'JPEG')
+        self.image = S3Object.create(filename, 'product/image/1.jpg', 'test-bucket')
+
+    def tearDown(self):
+        set_storage(self.original_storage)
+        shutil.rmtree(self.location)
+
+        super(ImageCacheTest, self).tearDown()
+
+    def test_get_path(self):
+        """
+        Test that the image is scaled to the printed size and reused
+        """
+        path = self.cache.get_path(self.image, height=100, max_width=290)
+
+        self.assertEqual(Image.open(path).size, (200 * 3, 100 * 3))
+        self.assertEqual(self.cache.get_path(self.image, height=100, max_width=290), path)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_new_version(self):
+        """
+        Test that a new upload of the key is not read from the cache
+        """
+        path = self.cache.get_path(self.image, height=30)
+
+        filename = os.path.join(self.location, 'photo.jpg')
+        Image.new('RGB', (1000, 1000), (0, 255, 0)).save(filename, 'JPEG')
+        image = S3Object.create(filename, 'product/image/1.jpg', 'test-bucket')
+
+        self.assertNotEqual(self.cache.get_path(image, height=30), path)
+        self.assertEqual(Image.open(self.cache.get_path(image, height=30)).size, (90, 90))
+
+    def test_max_size(self):
+        """
+        Test that the least recently used files are deleted, except for
+        the thumbnail that was just created
+        """
+        self.cache.max_size = 1
+        path = self.cache.get_path(self.image, width=100)
+
+        self.assertEqual([f[2] for f in self.cache._files()], [path])
+
+    def test_get_file(self):
+        """
+        Test that files are cached without being resized
+        """
+        path = self.cache.get_file(self.image)
+
+        self.assertEqual(Image.open(path).size, (2000, 1000))
+        self.assertEqual(self.cache.get_file(self.image), path)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_missing_image(self):
+        """
+        Test that an image that can not be read returns None
+        """
+        self.assertIsNone(self.cache.get_path(os.path.join(self.location, 'missing.jpg'), width=100))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cache of signed urls for S3Objects
+
+Urls are signed for a little longer than requested and reused until
+less than the requested time is left, so the same file is not signed
+again for every serializer field and pdf row. Urls are cached per
+(bucket, key, version_id) so a new upload gets a new url.
+"""
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from media.storage import get_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class URLCache(object):
+
+    def __init__(self, max_size=20000, refresh_window=3600):
+        """
+        'refresh_window' is the number of seconds a url is signed for
+        beyond the requested time, which is how long it can be reused
+        """
+        self.max_size = max_size
+        self.refresh_window = refresh_window
+        self.hits = 0
+        self.misses = 0
+
+        self._urls = OrderedDict()
+        self._lock = Lock()
+
+    def get_url(self, bucket, key, version_id=None, expires_in=86400, force_http=False):
+        return self.get_urls([(bucket, key, version_id)], expires_in=expires_in,
+                             force_http=force_http)[(bucket, key, version_id)]
+
+    def get_urls(self, keys, expires_in=86400, force_http=False):
+        """
+        Returns a dictionary of signed urls for (bucket, key, version_id)
+        tuples. The keys that are not cached are signed together
+        """
+        now = time.time()
+        urls = {}
+        missing = []
+
+        with self._lock:
+            for item in keys:
+                cached = self._urls.get(self._cache_key(item, force_http))
+
+                if cached and cached[1] - now >= expires_in:
+                    urls[item] = cached[0]
+                    self.hits += 1
+                else:
+                    missing.append(item)
+
+        if not missing:
+            return urls
+
+        lifetime = expires_in + self.refresh_window
+        signed = get_storage().generate_urls(missing, expires_in=lifetime, force_http=force_http)
+
+        with self._lock:
+            for item, url in zip(missing, signed):
+                urls[item] = url
+                self._set(self._cache_key(item, force_http), (url, now + lifetime))
+                self.misses += 1
+
+        return urls
+
+    def clear(self):
+        with self._lock:
+            self._urls.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _set(self, cache_key, value):
+        self._urls.pop(cache_key, None)
+        self._urls[cache_key] = value
+
+        while len(self._urls) > self.max_size:
+            self._urls.popitem(last=False)
+
+    def _cache_key(self, item, force_http):
+        bucket, key, version_id = item
+        return (bucket, key, version_id, force_http)
+
+
+url_cache = URLCache()
+
+
+def sign(objects, time=86400, force_http=False):
+    """
+    Signs the urls of many S3Objects at once and returns them by object id
+
+    The urls are cached, so later calls to generate_url for the same
+    objects do not sign them again
+    """
+    objects = [obj for obj in objects if obj is not None]
+    urls = url_cache.get_urls(set((obj.bucket, obj.key, obj.version_id) for obj in objects),
+                              expires_in=time,
+                              force_http=force_http)
+
+    return {obj.id: urls[(obj.bucket, obj.key, obj.version_id)] for obj in objects}
@@ -6,7 +6,6 @@ import datetime
 import logging
 import math
 from decimal import Decimal, ROUND_HALF_UP
-import httplib2
 import hashlib
 import random
 import string
@@ -17,15 +16,16 @@ from django.template.loader import render_to_string
 from django.db import models
 from administrator.models import User, Storage
 #from oauth2client.contrib.django_orm import Storage
-from apiclient import discovery
 
 from administrator.models import Log as BaseLog
 from supplies.models import Supply, Log, Product
 from contacts.models import Supplier
 from media.models import S3Object
+from media import render_cache
 from po.PDF import PurchaseOrderPDF, InventoryPurchaseOrderPDF
 from projects.models import Project, Room, Phase
-from administrator.models import CredentialsModel
+from administrator import tasks as calendar_tasks
+from administrator.stats import StatusStats
 from acknowledgements.models import Acknowledgement
 
 
@@ -93,7 +93,7 @@ class PurchaseOrder(models.Model):
     #balance_confirmed = models.TextField(null=True, default=None)
     
     current_user = None 
-    calendar_service = None
+    calendar_name = 'receivables'
 
     acknowledgement = models.ForeignKey(Acknowledgement, null=True)
 
@@ -111,6 +111,13 @@ class PurchaseOrder(models.Model):
     @approval_token.setter
     def approval_token(self, value):
         self.approval_pass = value
+
+    def save(self, *args, **kwargs):
+        saved_values = status_stats.get_saved_values(self)
+
+        super(PurchaseOrder, self).save(*args, **kwargs)
+
+        status_stats.record_save(self, saved_values)
     
     def calculate_total(self):
         """
@@ -170,53 +177,84 @@ class PurchaseOrder(models.Model):
     def create_and_upload_pdf(self):
         """
         Creates a pdf and uploads it to the S3 service
+
+        The pdfs are only rendered again if the printable 
+        data has changed
         """
+        items = self.items.all().order_by('id')
+        for item in items:
+            item.supply.supplier = self.supplier
+
+        data = self.get_printable_data(items)
 
-        filename, filename2 = self.create_pdf()
         key = "purchase_order/{0}/PO-{0}.pdf".format(self.id)
-        self.pdf = S3Object.create(filename,
-                                   key,
-                                   'document.dellarobbiathailand.com')
+        self.pdf = render_cache.get_or_render('purchase_order',
+                                              data,
+                                              lambda: self._create_pdf(PurchaseOrderPDF, items),
+                                              key,
+                                              'document.dellarobbiathailand.com')
         
         auto_key = "purchase_order/{0}/PO-{0}-auto.pdf".format(self.id)
-        self.auto_print_pdf = S3Object.create(filename2,
-                                              auto_key,
-                                              'document.dellarobbiathailand.com')
+        self.auto_print_pdf = render_cache.get_or_render('purchase_order.auto_print',
+                                                         data,
+                                                         lambda: self._create_pdf(InventoryPurchaseOrderPDF, items),
+                                                         auto_key,
+                                                         'document.dellarobbiathailand.com')
         
         self.save()
+
+    def get_printable_data(self, items=None):
+        """
+        Returns the data printed on the purchase order pdfs
+        """
+        if items is None:
+            items = self.items.all().order_by('id')
+
+        excluded_fields = ('last_modified', 'status', 'pdf_id', 'auto_print_pdf_id', 'paid_date',
+                           'approved_by_id', 'approved_at', 'approval_key', 'approval_salt',
+                           'approval_pass', 'deposit_document_id', 'balance_document_id',
+                           'calendar_event_id')
+
+        item_data = []
+        for item in items:
+            data = render_cache.model_data(item, exclude=('status',))
+            data['supply'] = render_cache.model_data(item.supply, exclude=('last_modified', 'quantity', 'image_id'))
+
+            # The original cost is only printed for discounted items
+            if item.discount > 0:
+                data['cost'] = item.supply.cost
+
+            item_data.append(data)
+
+        return {'purchase_order': render_cache.model_data(self, exclude=excluded_fields),
+                'supplier': render_cache.contact_data(self.supplier),
+                'contacts': [render_cache.model_data(c, exclude=('last_modified',)) for c in self.supplier.contacts.all()],
+                'project': self.project.codename if self.project else None,
+                'room': self.room.description if self.room else None,
+                'phase': self.phase.description if self.phase else None,
+                'employee': u"{0}".format(self.employee) if self.employee_id else None,
+                'items': item_data}
+
+    def _create_pdf(self, pdf_class, items):
+        pdf = pdf_class(po=self, items=items,
+                        supplier=self.supplier,
+                        revision=self.revision,
+                        revision_date=self.order_date)
+
+        return pdf.create()
     
     def create_calendar_event(self, user):
-        """Create a calendar event for the expected delivery date
+        """Queue the creation of the calendar event for the expected receive date
         
         """
-        service = self._get_calendar_service(user)
-        calendar = self._get_calendar(user)
-        
-        response = service.events().insert(calendarId=calendar['id'], 
-                                           body=self._get_event_body()).execute()
-        self.calendar_event_id = response['id']
-        self.save()
+        return calendar_tasks.queue_calendar_event(self, user)
         
     def update_calendar_event(self, user=None):
-        """Create a calendar event for the expected delivery date
+        """Queue an update of the calendar event for the expected receive date
         
         """
-        if user is None:
-            user = self.current_user or self.employee
+        return calendar_tasks.queue_calendar_event(self, user)
         
-        if self.calendar_event_id:
-            
-            service = self._get_calendar_service(user)
-            calendar = self._get_calendar(user)
-        
-            resp = service.events().update(calendarId=calendar['id'], 
-                                           eventId=self.calendar_event_id, 
-                                           body=self._get_event_body()).execute()
-                                          
-        else:
-            
-            self.create_calendar_event(user)
-         
     def create_approval_key(self):
         key = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(6))
         return key
@@ -562,45 +600,6 @@ class PurchaseOrder(models.Model):
         
         return self.grand_total
         
-    def _get_calendar_service(self, user):
-        if self.calendar_service:
-            self.calendar_service
-        else:
-            
-            storage = Storage(CredentialsModel, 'id', user, 'credential')
-            credentials = storage.get()
-        
-            http = credentials.authorize(httplib2.Http())
-            self.calendar_service = discovery.build('calendar', 'v3', http=http)
-            
-        return self.calendar_service
-        
-    def _get_calendar(self, user):
-        service = self._get_calendar_service(user)
-        response = service.calendarList().list().execute()
-        
-        calendar_summaries = [cal['summary'].lower() for cal in response['items']]
-    
-        # Check if user does not already has account payables
-        if 'receivables' not in calendar_summaries:
-            # Get calendar
-            cal_id = 'dellarobbiathailand.com_vl7drjcuulloicm0qlupgsr4ko@group.calendar.google.com'
-            calendar = service.calendars().get(calendarId=cal_id).execute()
-     
-            # Add calendar to user's calendarList
-            service.calendarList().insert(body={
-                'id': calendar['id']
-            }).execute()
-            
-        else:
-            # Get calendar is already in calendarList
-            for cal in response['items']:
-                if cal['summary'].lower() == 'receivables':
-                    calendar = cal
-            
-        return calendar
-        
-                                                                  
     def _get_event_body(self):
         evt = {
             'summary': "Purchase Order {0}".format(self.id),
@@ -649,6 +648,12 @@ class PurchaseOrder(models.Model):
         return description
 
    
+# Purchase order counts and totals per status for the dashboard
+status_stats = StatusStats(PurchaseOrder, buckets=(('processed', 'processed'),
+                                                   ('received', 'received'),
+                                                   ('paid', 'paid')))
+
+
 class Item(models.Model):
     
     purchase_order = models.ForeignKey(PurchaseOrder, related_name='items')
@@ -5,6 +5,7 @@ from decimal import Decimal
 from datetime import datetime
 from pytz import timezone
 
+from django.db import transaction
 from django.template.loader import render_to_string
 from rest_framework import serializers
 import boto.ses
@@ -12,7 +13,8 @@ import boto.ses
 from administrator.models import User
 from administrator.serializers import LogFieldSerializer
 from contacts.models import Supplier
-from supplies.models import Supply, Product, Log
+from supplies.models import Supply, Product, Log, StockMovement
+from supplies import stock
 from po.models import PurchaseOrder, Item, Log as POLog, File
 from projects.models import Project, Room, Phase
 from projects.serializers import RoomFieldSerializer, PhaseFieldSerializer, ProjectFieldSerializer
@@ -185,17 +187,13 @@ class ItemSerializer(serializers.ModelSerializer):
         if new_status != instance.status and instance.status.lower() in ["awaiting approval", "ordered"]:
             instance.status = new_status
             instance.save()
-            old_quantity = instance.supply.quantity
 
-            #Fix for if adding decimal and supply together
-            try:
-                instance.supply.quantity += float(str(instance.quantity))
-            except TypeError:
-                instance.supply.quantity += Decimal(str(instance.quantity))
+            with transaction.atomic():
+                movement = stock.move(instance.supply, instance.quantity, 'RECEIVE',
+                                      reference=u"purchase-order-item:{0}".format(instance.id))
+                self._log_quantity_change(instance.supply, movement.balance - movement.quantity, movement.balance)
 
-            new_quantity = instance.supply.quantity
-            instance.supply.save()
-            self._log_quantity_change(instance.supply, old_quantity, new_quantity)
+            instance.supply.refresh_from_db()
 
         if instance.unit_cost != instance.supply.cost:
             self._change_supply_cost(instance.supply, instance.unit_cost, units)
@@ -564,14 +562,38 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
         """
         Will received the order and then process the items and the corresponding supplies.
         The quantities for the supplies will automatically increase based on the supplies received
+
+        The quantities of all the items are added to the supplies at once
         """
-        for item in instance.items.all():
-            item.status = "RECEIVED"
-            self._apply_new_quantity(item, instance)
+        items = list(instance.items.select_related('supply'))
+        products = self._get_products(items, instance)
+
+        logs = []
+        movements = []
+        for item in items:
+            product = products[item.supply_id]
+
+            #Calculate the quantity to add to current supply qty
+            qty_to_add = Decimal(str(item.quantity)) * product.quantity_per_purchasing_unit
 
-            item.supply.save()
-            item.save()
-            self._log_receiving_item(item)
+            log = Log(supply=item.supply,
+                      supplier=instance.supplier,
+                      action="ADD",
+                      quantity=item.quantity,
+                      message=u"Received {0:.0f}{1} of {2} from {3}".format(item.quantity,
+                                                                       product.purchasing_units,
+                                                                       item.supply.description,
+                                                                       instance.supplier.name))
+            logs.append(log)
+            movements.append(StockMovement(supply_id=item.supply_id,
+                                           quantity=qty_to_add,
+                                           reason='RECEIVE',
+                                           reference=u"purchase-order-item:{0}".format(item.id)))
+
+        with transaction.atomic():
+            stock.apply(movements)
+            Log.objects.bulk_create(logs)
+            instance.items.filter(pk__in=[item.id for item in items]).update(status="RECEIVED")
 
         if instance.status.lower() != 'paid':
             instance.status = "RECEIVED"
@@ -585,45 +607,28 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
 
         return instance
 
-
-    def _apply_new_quantity(self, item, po):
-        # Retrieve product responding to this item and supplier
-        try:
-            product = Product.objects.get(supply=item.supply,
-                                          supplier=po.supplier)
-        except Product.MultipleObjectsReturned as e:
-            logger.warn(e)
-            products = Product.objects.filter(supply=item.supply, supplier=po.supplier)
-            product = products.order_by('id')[0]
-        except Product.DoesNotExist as e:
-            msg = u"There is no product for supply {0}: {1} and supplier {2}: {3}\n\n{4}"
-            msg = msg.format(item.supply.id,
-                             item.supply.description,
-                             po.supplier.id,
-                             po.supplier.name,
-                             e)
-            try:           
-                product = Product.objects.create(supply=item.supply, 
-                                             supplier=po.supplier,
-                                             cost=item.unit_cost)
-            except TypeError as e:
-                product = Product.objects.create(supply=item.supply, 
-                                             supplier=po.supplier,
-                                             cost=item.cost)
-
-        #Calculate the quantity to add to current supply qty
-        try:
-            qty_to_add = Decimal(str(item.quantity)) * product.quantity_per_purchasing_unit
-        except TypeError:
-            qty_to_add = float(str(item.quantity)) * product.quantity_per_purchasing_unit
-
-        #Change the supply's current quantity
-        try:
-            item.supply.quantity += Decimal(str(qty_to_add))
-        except TypeError:
-            item.supply.quantity += float(str(qty_to_add))
-
-        return item
+    def _get_products(self, items, po):
+        """
+        Returns the product of the supplier for each supply of the items,
+        creating the products that do not exist yet
+        """
+        products = {}
+        for product in Product.objects.filter(supply_id__in=[item.supply_id for item in items],
+                                              supplier=po.supplier).order_by('-id'):
+            # The oldest product is used if there is more than one
+            products[product.supply_id] = product
+
+        for item in items:
+            if item.supply_id not in products:
+                logger.warn(u"There is no product for supply {0}: {1} and supplier {2}: {3}".format(item.supply.id,
+                                                                                                     item.supply.description,
+                                                                                                     po.supplier.id,
+                                                                                                     po.supplier.name))
+                products[item.supply_id] = Product.objects.create(supply=item.supply,
+                                                                  supplier=po.supplier,
+                                                                  cost=item.unit_cost)
+
+        return products
 
     def _update_items(self, instance, items_data):
         """
@@ -698,20 +703,6 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
                                                                                               supply.supplier.name))
         log.save()
 
-    def _log_receiving_item(self, item):
-        supply = item.supply
-        supply.supplier = item.purchase_order.supplier
-
-        log = Log(supply=item.supply,
-                  supplier=item.purchase_order.supplier,
-                  action="ADD",
-                  quantity=item.quantity,
-                  message=u"Received {0:.0f}{1} of {2} from {3}".format(item.quantity,
-                                                                   supply.purchasing_units,
-                                                                   supply.description,
-                                                                   item.purchase_order.supplier.name))
-        log.save()
-
     def _log_change(self, prop, old_value, new_value, instance=None, employee=None):
         # Note: Log Changes to specified properties
         if instance is None:
@@ -16,6 +16,7 @@ from django.test import TestCase
 from administrator.models import User
 from django.contrib.auth.models import Permission, ContentType
 from rest_framework.test import APITestCase
+from administrator.metrics import QueryBudgetMixin
 from faker import Faker
 
 from contacts.models import Supplier, Address, SupplierContact
@@ -88,7 +89,7 @@ def create_user(block_permissions=[]):
     return user
 
 
-class PurchaseOrderTest(APITestCase):
+class PurchaseOrderTest(QueryBudgetMixin, APITestCase):
     """
     Tests the Purchase Order
     """
@@ -178,11 +179,12 @@ class PurchaseOrderTest(APITestCase):
         Tests getting a list of po's via GET
         """
         #Validate the response
-        resp = self.client.get('/api/v1/purchase-order/', format='json')
+        with self.assertMaxQueries(20):
+            resp = self.client.get('/api/v1/purchase-order/', format='json')
         self.assertEqual(resp.status_code, 200)
         
         #Validate the returned data
-        resp = resp.data
+        resp = resp.data['results']
         self.assertIsInstance(resp, list)
         self.assertEqual(len(resp), 1)
     
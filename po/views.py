@@ -15,9 +15,11 @@ from django.contrib.auth.decorators import login_required
 
 from po.serializers import PurchaseOrderSerializer
 from po.models import PurchaseOrder
+from po.models import status_stats as po_status_stats
 from supplies.models import Supply, Product
 from projects.models import Project, Room, Phase
 from utilities.http import save_upload
+from utilities.pagination import KeysetPagination
 from media.models import S3Object
 from media.serializers import S3ObjectSerializer
 
@@ -142,33 +144,7 @@ def purchase_order_approval(request):
     
 
 def purchase_order_stats(request):
-    cursor = connection.cursor()
-    query = """
-    SELECT (SELECT COUNT(id)
-    FROM po_purchaseorder where lower(status) = 'processed') AS processed_count,
-    (SELECT SUM(total)
-    FROM po_purchaseorder where lower(status) = 'processed') AS processed_sum,
-    (SELECT COUNT(id)
-    FROM po_purchaseorder where lower(status) = 'received') AS received_count,
-    (SELECT SUM(total)
-    FROM po_purchaseorder where lower(status) = 'received') AS received_sum,
-    (SELECT COUNT(id)
-    FROM po_purchaseorder where lower(status) = 'paid') AS paid_count,
-    (SELECT SUM(total)
-    FROM po_purchaseorder where lower(status) = 'paid') AS paid_sum,
-    COUNT(id) AS total_count,
-    SUM(total) AS total_sum
-    FROM po_purchaseorder
-    WHERE lower(status) != 'cancelled';
-    """
-    
-    cursor.execute(query)
-    row = cursor.fetchone()
-
-    data = {'processed': {'count': row[0], 'amount': str(row[1])},
-            'received': {'count': row[2], 'amount': str(row[3])},
-            'paid': {'count': row[4], 'amount': str(row[5])},
-            'total': {'count': row[6], 'amount': str(row[7])}}
+    data = po_status_stats.get()
     
     response = HttpResponse(json.dumps(data),
                             content_type="application/json")
@@ -193,6 +169,8 @@ class PurchaseOrderMixin(object):
         
         
 class PurchaseOrderList(PurchaseOrderMixin, generics.ListCreateAPIView):
+    pagination_class = KeysetPagination
+
     def get_queryset(self):
         """
         Override 'get_queryset' method in order to customize filter
@@ -221,17 +199,6 @@ class PurchaseOrderList(PurchaseOrderMixin, generics.ListCreateAPIView):
         if last_modified:
             queryset = queryset.filter(last_modified__gte=last_modified)
                                       
-        offset = int(self.request.query_params.get('offset', 0))
-        settings_paginate_by = settings.REST_FRAMEWORK['PAGINATE_BY']
-        limit = self.request.query_params.get('limit', settings_paginate_by)
-        limit = int(limit)
-        
-        if offset and limit:
-            queryset = queryset[offset - 1:limit + (offset - 1)]
-        else:
-            queryset = queryset[0:50]
-            
-
         queryset = queryset.select_related('supplier',
                                            'project',
                                            'room',
@@ -251,16 +218,6 @@ class PurchaseOrderList(PurchaseOrderMixin, generics.ListCreateAPIView):
                                              'project__rooms__files',
                                              'supplier__addresses')
         return queryset
-        
-    def get_paginate_by(self):
-        """
-        
-        """
-        settings_paginate_by = settings.REST_FRAMEWORK['PAGINATE_BY']
-        limit = self.request.query_params.get('limit', settings_paginate_by)
-        limit = int(limit)
-        
-        return self.queryset.count() if limit == 0 else limit
 
 
 class PurchaseOrderDetail(PurchaseOrderMixin,
@@ -4,7 +4,6 @@ import logging
 from decimal import *
 import math
 from StringIO import StringIO
-import urllib
 import PIL
 import io
 
@@ -22,6 +21,7 @@ from reportlab.graphics.barcode import code128
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
 
+from media import image_cache
 from utilities.svglib import svg2rlg
 
 logger = logging.getLogger(__name__)
@@ -126,13 +126,12 @@ class CatalogPDF(object):
                                             alignment=0,
                                             font_size=10)]]
                                    
+        # The schematic is kept in the image cache and converted once
         config = self.model.images.get(key__icontains=".svg")
-        link = config.generate_url()
-        logger.debug(link)
-        urllib.urlretrieve(link, 'temp.svg')
-        drawing = svg2rlg('/Users/Charlie/Sites/employee/backend/temp.svg')
+        path = image_cache.get_file(config)
+        drawing = svg2rlg(path) if path else None
         logger.debug(drawing)
-        data.append([drawing, ''])
+        data.append([drawing or '', ''])
         
         
         logo_url = "https://s3-ap-southeast-1.amazonaws.com/media.dellarobbiathailand.com/logo/DR_logo.png"
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Recalculates and stores the grade prices of the products
+
+    python manage.py reprice_products
+    python manage.py reprice_products --supplier 12
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from products import pricing
+from products.models import Product
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Recalculates the A1-A6 prices of all products in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supplier', type=int, dest='supplier',
+                            help="Only reprice the products that use a supply from this supplier")
+        parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=pricing.batch_size)
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.filter(deleted=False)
+
+        if options.get('supplier'):
+            queryset = queryset.filter(supplies__products__supplier_id=options['supplier']).distinct()
+
+        count, errors = pricing.reprice(queryset, chunk_size=options['chunk_size'])
+
+        for product_id in sorted(errors):
+            self.stderr.write(u"Skipped product {0}: {1}".format(product_id, errors[product_id]))
+
+        self.stdout.write(u"Repriced {0} products, skipped {1}".format(count, len(errors)))
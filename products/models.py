@@ -108,177 +108,44 @@ class Product(models.Model):
         return obj
         
     def get_prices(self):
-        #Calculate supply quantities before calculating cost
-        try:
-            pass#self.calculate_supply_quantities()
-        except AttributeError:
-            pass
-            
-        grades = {'A1': 15, 
-                  'A2': 20, 
-                  'A3': 25,
-                  'A4': 30,
-                  'A5': 35,
-                  'A6': 40}
-        
-        prices = {}
-        
-        # Calculate the direct cost here, so that it doens't have to be recalculated
-        # for each grade
-        if self.prices.all().count() < len(grades):
-            direct_cost = self._calculate_costs_excluding_fabric()
-        
-        for grade in grades:
-            # Retrieve the stored grade, or calculate if no grade is stored
-            try:
-                logger.info("Retrieving price for grade {0}".format(grade))
-                prices[grade] = self.get_price(grade.upper()).price
-            except Price.DoesNotExist:
-                logger.info('Price for grade {0} does not exist'.format(grade))
-                prices[grade] = self.calculate_price(grades[grade], direct_cost=direct_cost)
-
-        return prices
-        
-    def calculate_prices(self, apply_prices=False):
-        #Calculate supply quantities before calculating cost
-        try:
-            pass#self.calculate_supply_quantities()
-        except AttributeError:
-            pass
-            
-        grades = {'A1': 15, 
-                  'A2': 20, 
-                  'A3': 25,
-                  'A4': 30,
-                  'A5': 35,
-                  'A6': 40}
-        
-        prices = {}
-        
-        # Calculate the direct cost here, so that it doens't have to be recalculated
-        # for each grade
-        direct_cost = self._calculate_costs_excluding_fabric()
-        
-        for grade in grades:
-            # Calculate if no grade is stored
-            logger.info("Calculating price for grade {0}".format(grade))
-            prices[grade] = self.calculate_price(grades[grade], direct_cost=direct_cost)
-            
-        if apply_prices:
-            
-            Price.objects.filter(product=self).delete()
-            
-            for grade in prices:
-                
-                Price.objects.create(grade=grade.upper(), product=self, price=prices[grade])
-                    
-                logger.info("{0} price for {1} created at {2}".format(grade, self.description, prices[grade]))
-                
-        return prices
-        
-    def get_price(self, grade):
-        return self.prices.get(grade=grade)
-        
-    def calculate_price(self, grade, direct_cost=None):
         """
-        Calculate the price of the product at the specified grade
+        Returns the stored price of each grade, and calculates the prices
+        of the grades that are not stored
         """
-        logger.debug("\nCalculating prices for grade {0}".format(grade))
-        
-        # Calculate all the costs excluding fabric cost
-        if not direct_cost:
-            direct_cost = self._calculate_costs_excluding_fabric()
-        
-        # Add fabric cost based on quantity of fabric used
-        try:
-            direct_cost += self._calculate_fabric_costs(Supply.objects.get(product=self, description='fabric').quantity, grade)
-        except Supply.DoesNotExist as e:
-            raise ValueError('Missing fabric quantity for {0}'.format(self.description))
+        from products import pricing
 
-        logger.debug("Total direct material cost is {0:.2f}".format(direct_cost))
-        
-        # Calculate the total manufacture cost. Minimum cost to make this product 
-        # without losing money
-        total_manufacture_cost = direct_cost + self._calculate_overhead(direct_cost)
-        
-        logger.debug("Total manufacture cost is {0:.2f}".format(total_manufacture_cost))
-        
-        #Calculate the wholesale for this product
-        wholesale_price = self._calculate_wholesale_price(total_manufacture_cost)
-        
-        retail_price = wholesale_price * Decimal('2')
-        
-        return retail_price
-        
-    def _calculate_fabric_costs(self, quantity, grade):
-        try:
-            cost = Decimal(str(quantity)) * Decimal(str(grade)) * Decimal(str(36))
-        except Exception as e:
-            if not quantity:
-                raise ValueError("Quantity cannot be {0}".format(quantity))
-            
-            if not grade:
-                raise ValueError("Quantity cannot be {0}".format(grade))
-        
-        logger.debug("Fabric cost is {0}".format(cost))
-        
-        return cost
-        
-    def _calculate_costs_excluding_fabric(self):
+        stored = {}
+        for price in self.prices.all().order_by('effective_date', 'id'):
+            stored[price.grade.upper()] = price.price
+
+        if len(stored) < len(pricing.GRADES):
+            calculated = self.calculate_prices()
+        else:
+            calculated = {}
+
+        return {grade: stored[grade] if grade in stored else calculated[grade] for grade in pricing.GRADES}
+
+    def calculate_prices(self, apply_prices=False):
         """
-        Calculate the direct material cost of the product
+        Calculates the price of each grade and optionally replaces the
+        stored prices
         """
-        logger.info('Calculating costs excluding fabric for {0}'.format(self.description))
-        
-        cost = 0
-        
-        for ps in Supply.objects.filter(product=self).exclude(description='fabric').exclude(cost__isnull=True, quantity__isnull=True):
-            if ps.supply and ps.quantity:
-                #Set supplier in order to retrieve cost
-                product = ps.supply.products.all().order_by('cost')[0]
-                ps.supply.supplier = product.supplier
-                
-                if product.supplier.currency.lower() == 'usd':
-                    currency_modifier = 36
-                elif product.supplier.currency.lower() == 'eur':
-                    currency_modifier = 39
-                elif product.supplier.currency.lower() == 'rmb':
-                    currency_modifier = 5.7
-                else:
-                    currency_modifier = 1
-                    
-                #Add the cost of the supply to the total
-                try:
-                    cost += ps.quantity * ((ps.supply.cost * currency_modifier)/ product.quantity_per_purchasing_unit)
-                except Exception as e:
-                    logger.debug(e)
-                    print ps.quantity, ps.description, ps.supply.description
-            else:
-                cost += (ps.cost or 0)
-                
-        logger.debug("Costs excluding fabric are {0:.2f}".format(cost))
-        
-        return cost
-        
-    def _calculate_overhead(self, direct_costs):
-        return direct_costs * (Decimal(str(self._overhead_percent)) / Decimal('100'))
-    
-    def _calculate_wholesale_price(self, tmc):    
-        
-        if re.search('^fc-\s+', self.description):
-            pp = self._profit_percent + 5
-        elif re.search('^ac-\s+', self.description):
-            pp = self._profit_percent + 15
-        else:
-            pp = self._profit_percent
-            
-        divisor = 1 - (pp / Decimal('100')) 
-        
-        price = tmc / divisor
-        
-        logger.debug("Wholesale price is {0:.2f}".format(price))
-        
-        return price
+        from products import pricing
+
+        prices, errors = pricing.calculate_prices([self])
+
+        if self.id in errors:
+            raise ValueError(errors[self.id])
+
+        if apply_prices:
+            pricing.apply_prices(prices)
+
+            logger.info(u"Prices for {0} created: {1}".format(self.description, prices[self.id]))
+
+        return prices[self.id]
+
+    def get_price(self, grade):
+        return self.prices.get(grade=grade)
         
     def _retrieve_price(self, grade):
         try:
@@ -11,13 +11,13 @@ from decimal import *
 import re
 import csv
 import multiprocessing
-from threading import Thread
-from time import sleep
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from operator import itemgetter
 
 from django.conf import settings
 from django.core.exceptions import *
-from django.db.models import Q, Sum
+from django.db.models import Q, Sum, Prefetch
 from reportlab.lib import colors, utils
 from reportlab.lib.units import mm
 from reportlab.platypus import *
@@ -29,9 +29,11 @@ from reportlab.graphics.barcode import code128
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
 from svglib.svglib import svg2rlg
 
-from products.models import Model, Upholstery, Supply as ProductSupply
+from products.models import Model, Upholstery, Image as ModelImage, Supply as ProductSupply
+from products import schematics
 from supplies.models import Fabric
 from contacts.models import Supplier
+from media import image_cache
 
 
 django.setup()
@@ -142,6 +144,8 @@ class PricelistPDF(object):
                    ('ALIGNMENT', (2,0), (2,-1), 'CENTER'),
                    ('PADDING', (0,0), (-1,-1), 0),
                    ('FONTSIZE', (0,0),(-1,-1), 10)]
+    # Number of model pages created at once
+    workers = 8
 
     def __init__(self, *args, **kwargs):
 
@@ -190,8 +194,8 @@ class PricelistPDF(object):
         models_name += [model for model in sorted(models.keys(), key=lambda model: model.model) if "DW-" not in model.model]
 
         # Adding models to the document. 
-        for model in models_name:
-            stories.append(self._create_model_page(model, models[model]))
+        for page in self._create_model_pages(models_name, models):
+            stories.append(page)
             #stories.append(self._create_model_section(model, models[model]))
             stories.append(PageBreak())
 
@@ -205,26 +209,31 @@ class PricelistPDF(object):
         doc.build(stories)
 
     def _prepare_data(self, models):
+        """
+        Returns the upholsteries of each model by configuration. The
+        upholsteries and images of all the models are read at once and
+        the schematics are downloaded to the local cache
+        """
+        upholsteries = Upholstery.objects.exclude(description__icontains="pillow") \
+                                         .select_related('configuration', 'schematic') \
+                                         .distinct('model_id', 'description') \
+                                         .order_by('model_id', 'description')
+        images = ModelImage.objects.order_by('-primary')
+        models = list(models.prefetch_related(Prefetch('upholsteries', queryset=upholsteries),
+                                              Prefetch('images', queryset=images)))
+
+        paths = schematics.download([u.schematic for model in models for u in model.upholsteries.all()])
 
-        data = {}
-        threads = []
+        data = OrderedDict()
         for model in models:
             data[model] = {}
+            self._add_upholstery_data(model, data, paths)
 
-            t = Thread(target=self._add_upholstery_data, args=(model, data))
-            threads.append(t)
-            t.start()
-
-        while len([t for t in threads if t.isAlive()]) > 0:
-            sleep(1)
-
-        else:
-            return data
-
-    def _add_upholstery_data(self, model, data):
+        return data
 
+    def _add_upholstery_data(self, model, data, paths):
 
-        for upholstery in Upholstery.objects.filter(model=model).exclude(description__icontains="pillow").distinct('description').order_by('description'):
+        for upholstery in model.upholsteries.all():
 
             uphol_data = {'id': upholstery.id,
                           'configuration': upholstery.configuration.configuration,
@@ -235,9 +244,9 @@ class PricelistPDF(object):
                           'price': upholstery.price,
                           'export_price': upholstery.export_price}
 
-            try:
-                uphol_data['schematic'] = upholstery.schematic
-            except AttributeError:
+            if upholstery.schematic_id in paths:
+                uphol_data['schematic'] = paths[upholstery.schematic_id]
+            else:
                 logger.warn("Upholstery: {0} is missing schematics".format(upholstery.description))
 
             config_key = upholstery.configuration.configuration.lower()
@@ -247,15 +256,30 @@ class PricelistPDF(object):
             config_key = " ".join([s.capitalize() for s in config_key.split(' ')])
             data[model][config_key] = uphol_data
 
+    def _create_model_pages(self, models, data):
+        """
+        Creates the pages of the models with a pool of threads and returns
+        them in the order of the models
+        """
+        if not models:
+            return []
+
+        pool = ThreadPool(min(self.workers, len(models)))
+        try:
+            return pool.map(lambda model: self._create_model_page(model, data[model]), models)
+        finally:
+            pool.close()
+            pool.join()
+
     def _create_model_page(self, model, products):
         # Initial array and image of product
-        images = model.images.all().order_by('-primary')
+        images = model.images.all()
 
         # Create data array used to create table
         data = [[model.model]]
         # Add Image for this model
         try:
-            data.append([self._get_image(images[0].generate_url(), height=150)])
+            data.append([self._get_image(images[0], height=150)])
         except IndexError as e:
             data.append([''])
             logger.warn("Model {0} is missing an image".format(model.model))
@@ -275,20 +299,14 @@ class PricelistPDF(object):
             price = Decimal(str(math.ceil((price * Decimal('1.3')) / Decimal('10')))) * Decimal('10')
             price = "{0}".format(int(price or 0))
             
-            filename = "temp/{0}.svg".format(product['description'].replace(' ', '_'))
             try:
-                #product['schematic'].download(filename)
-                drawing = svg2rlg(filename)
+                drawing = schematics.get_drawing(product['schematic'])
                 scale = (40 / drawing.height)
                 #drawing.scale(scale, scale)
                 drawing.vAlign = 'TOP'
                 drawing.renderScale = scale
                 data.append([drawing, config, width, depth, height, price])
-            except AttributeError as e:
-                try:
-                    product['schematic'].download(filename)
-                except AttributeError as e:
-                    logger.warn("{0} has no schematics".format(product['description']))
+            except (KeyError, ValueError) as e:
                 logger.warn("Error getting schematics for {0}".format(product['description']))
                 data.append(['', config, width, depth, height, price])
 
@@ -416,13 +434,17 @@ class PricelistPDF(object):
 
     #helps change the size and maintain ratio
     def _get_image(self, path, width=None, height=None, max_width=0, max_height=0):
-        """Retrieves the image via the link and gets the
+        """Retrieves the image from the image cache and gets the
         size from the image. The correct dimensions for
         image are calculated based on the desired with or
         height"""
 
+        path = image_cache.get_path(path, width=width, height=height, max_width=max_width)
+        if path is None:
+            return ''
+
         try:
-            #Read image from link
+            #Read the cached thumbnail
             img = utils.ImageReader(path)
         except Exception as e:
             logger.debug(e)
@@ -11,14 +11,12 @@ from decimal import *
 import re
 import csv
 import multiprocessing
-from threading import Thread
-from time import sleep
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
-from svglib.svglib import svg2rlg
-#if you want to see the box around the image
 from django.conf import settings
 from django.core.exceptions import *
-from django.db.models import Q, Sum
+from django.db.models import Q, Sum, Prefetch
 from reportlab.lib import colors, utils
 from reportlab.lib.units import mm
 from reportlab.platypus import *
@@ -31,10 +29,12 @@ from reportlab.graphics import renderPDF, renderPM
 
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
 
-from products.models import Model, Upholstery, Supply as ProductSupply
+from products.models import Model, Upholstery, Image as ModelImage, Supply as ProductSupply
+from products import schematics
 from supplies.models import Fabric
 from contacts.models import Supplier
 from media.models import S3Object
+from media import image_cache
 
 
 django.setup()
@@ -150,12 +150,12 @@ class PricelistPDF(object):
                    ('ALIGNMENT', (2,0), (2,-1), 'CENTER'),
                    ('PADDING', (0,0), (-1,-1), 0),
                    ('FONTSIZE', (0,0),(-1,-1), 10)]
-    _files_to_delete = []
+    # Number of model sections created at once
+    workers = 8
 
     def __init__(self, export=False, *args, **kwargs):
 
         self.export = export
-        self.fabrics = fabrics
 
     def create(self, filename='Pricelist.pdf'):
         filename = filename if not self.export else "Pricelist_Export.pdf"
@@ -198,12 +198,8 @@ class PricelistPDF(object):
         #models_name = [model for model in sorted(models.keys(), key=lambda model: model.model) if "DW-" in model.model]
         #models_name += [model for model in sorted(models.keys(), key=lambda model: model.model) if "DW-" not in model.model]
 
-        for model in models.keys():
-
-            assert len(models[model]) == model.upholsteries.all().count(), "Only {0} of {1} return from prepare data for model {2}".format(len(models[model]),
-                                                                                                                                       model.upholsteries.all().count(),
-                                                                                                                                       model.model)
-            stories.append(self._create_model_section(model, models[model]))
+        for section in self._create_model_sections(models):
+            stories.append(section)
             stories.append(PageBreak())
 
         for story in stories:
@@ -216,91 +212,57 @@ class PricelistPDF(object):
         doc.build(stories)
 
     def _prepare_data(self, models):
+        """
+        Returns the data of the upholsteries of each model, in the order
+        of the models. The upholsteries and images of all the models are
+        read at once and the schematics are downloaded to the local cache
+        """
+        upholsteries = Upholstery.objects.select_related('configuration', 'schematic').order_by('-width')
+        images = ModelImage.objects.order_by('-primary')
+        models = list(models.prefetch_related(Prefetch('upholsteries', queryset=upholsteries),
+                                              Prefetch('images', queryset=images)))
 
-        data = {}
-        threads = []
+        paths = schematics.download([u.schematic for model in models for u in model.upholsteries.all()])
+
+        data = OrderedDict()
         for model in models:
-            data[model] = []
+            data[model] = [self._get_upholstery_data(upholstery, paths) for upholstery in model.upholsteries.all()]
+            logger.debug("Model {0} has {1} upholsteries.".format(model.model, len(data[model])))
 
-            t = Thread(target=self._add_upholstery_data, args=(model, data))
-            threads.append(t)
-            t.start()
+        return data
 
-        while len([t for t in threads if t.isAlive()]) > 0:
-            sleep(1)
+    def _get_upholstery_data(self, upholstery, paths):
+        uphol_data = {'id': upholstery.id,
+                      'configuration': upholstery.configuration.configuration,
+                      'description': upholstery.description,
+                      'width': upholstery.width,
+                      'depth': upholstery.depth,
+                      'height': upholstery.height,
+                      'price': upholstery.price,
+                      'export_price': upholstery.export_price}
 
-        else:
-            for model in data.keys():
-                msg = "Prepared {0} of {1} for model {2}"
-                assert len(data[model]) == model.upholsteries.all().count(), msg.format(len(data[model]), 
-                                                                                        model.upholsteries.all().count(),
-                                                                                        model.model)
-            return data
-
-    def _add_upholstery_data(self, model, data):
-        for upholstery in model.upholsteries.all().order_by('-width'):
-
-            uphol_data = {'id': upholstery.id,
-                          'configuration': upholstery.configuration.configuration,
-                          'description': upholstery.description,
-                          'width': upholstery.width,
-                          'depth': upholstery.depth,
-                          'height': upholstery.height,
-                          'price': upholstery.price,
-                          'export_price': upholstery.export_price}
-
-            download_switch = True
-            filename = "{0}.svg".format(upholstery.description)
-
-            while download_switch:
-                try:
-                    upholstery.schematic.download(filename)
-                    uphol_data['schematic'] = filename
-                    self._files_to_delete.append(filename)
-                    download_switch = False
-                except AttributeError as e:
-                    download_switch = False
-                except Exception as e:
-                    logger.warn(e)
-                    msg = "Will try to download schemetic for {0} again in 15 seconds"
-                    logger.info(msg.format(upholstery.description))
-                    sleep(5)
+        if upholstery.schematic_id in paths:
+            uphol_data['schematic'] = paths[upholstery.schematic_id]
 
+        return uphol_data
 
-            """
-            if upholstery.supplies.count() > 0:
-                uphol_data = {'id': upholstery.id,
-                              'configuration': upholstery.configuration.configuration,
-                              'description': upholstery.description,
-                              'width': upholstery.width,
-                              'depth': upholstery.depth,
-                              'height': upholstery.height,
-                              'price': upholstery.price,
-                              'export_price': upholstery.export_price}
-                prices = upholstery.get_prices()
-
-                if "DW" in upholstery.model.model:
-                    upholstery.price = prices['A3']
-                    upholstery.save()
-                uphol_data['prices'] = prices
-            else:
-                uphol_data = {'id': upholstery.id,
-                              'configuration': upholstery.configuration.configuration,
-                              'description': upholstery.description,
-                              'width': upholstery.width,
-                              'depth': upholstery.depth,
-                              'height': upholstery.height,
-                              'price': upholstery.price,
-                              'export_price': upholstery.export_price,
-                              'prices': []}
-            """
+    def _create_model_sections(self, models):
+        """
+        Creates the sections of the models with a pool of threads and
+        returns them in the order of the models
 
-            data[model].append(uphol_data)
-        
-        uphol_count = model.upholsteries.all().count()
-        logger.debug("Model {0} has {1} upholsteries.".format(model.model, uphol_count ))
-        assert len(data[model]) == model.upholsteries.all().count()
+        The sections only read the prefetched data, the cached schematics
+        and the image cache, so no queries are made from the threads
+        """
+        if not models:
+            return []
 
+        pool = ThreadPool(min(self.workers, len(models)))
+        try:
+            return pool.map(lambda model: self._create_model_section(model, models[model]), models.keys())
+        finally:
+            pool.close()
+            pool.join()
 
     def _create_model_section(self, model, products):
         """
@@ -310,7 +272,7 @@ class PricelistPDF(object):
         #products = Upholstery.objects.filter(model=model, supplies__id__gt=0).distinct('description').order_by('description')
 
         # Initial array and image of product
-        images = model.images.all().order_by('-primary')
+        images = model.images.all()
 
         try:
             product_description = u"{0} {1}"
@@ -319,7 +281,7 @@ class PricelistPDF(object):
                                         fontname='Raleway',
                                         alignment=TA_LEFT,
                                         font_size=24,
-                                        left_indent=12)],[self._get_image(images[0].generate_url(), height=150)]]
+                                        left_indent=12)],[self._get_image(images[0], height=150)]]
         except (IndexError, AttributeError) as e:
             logger.debug(e)
             product_description = u"{0} {1}"
@@ -332,49 +294,36 @@ class PricelistPDF(object):
 
         #data = [[self._prepare_text(model.model, font_size=24, alignment=TA_LEFT)]]
 
-        assert len(products) == model.upholsteries.all().count(), "Only {0} of {1} products in create model section for model {2}".format(len(products),
-                                                                                                                                          model.upholsteries.all().count(),
-                                                                                                                                          model.model)
         # Var to keep track of number of products priced
         count = 0
         priced_count = 0
 
-        # Get Max row height
+        # Get Max row height. The row height is kept per section so that
+        # sections can be created at the same time
         logger.info(u"{0}".format(model.model))
-        if "PS-905" in model.model:
-            self.max_row_height = 110
-            logger.info("\n\n905\n")
-        try:
-            self.max_row_height = max([self._get_drawing(p['schematic'])[2] for p in products])     
-
-            logger.info([self._get_drawing(p['schematic'])[2] for p in products])
+        max_row_height = 110 if "PS-905" in model.model else self.max_row_height
 
-            if len([p for p in products if 'schematic' in p]) > 0:
-
-                assert self.max_row_height > 40, products
-
-            logger.info("\n\nMax row height for {0} is {1}\n".format(model.model, self.max_row_height))
+        if products and all('schematic' in p for p in products):
+            try:
+                heights = [schematics.get_size(p['schematic'])[1] for p in products]
+                max_row_height = max(heights)
+                logger.info(heights)
 
+                assert max_row_height > 40, products
 
-        except (KeyError, ValueError) as e:
-            logger.debug("No schematics:")
-            logger.debug(model.model)
-            logger.debug(model.name)
-            logger.debug(e)
-            print "\n\n"
+                logger.info("\n\nMax row height for {0} is {1}\n".format(model.model, max_row_height))
+            except ValueError as e:
+                logger.debug(e)
+        else:
+            logger.debug(u"No schematics for {0} {1}".format(model.model, model.name))
 
         # Denotes number of products per line by 
         product_tables = []
         for p in products:
-            p1, w = self._create_product_price_table(p)
+            p1, w = self._create_product_price_table(p, max_row_height)
             product_tables.append((p1, p, w))
 
 
-        assert len(product_tables) == model.upholsteries.all().count(), "Only {0} for {1} product tables for model {2}".format(len(product_tables),
-                                                                                                                             model.upholsteries.all().count(),
-                                                                                                                             model.model)
-
-
         col_widths = 0
         page_width = 550
         section_products = []
@@ -390,7 +339,7 @@ class PricelistPDF(object):
             # and it is not the last product
             elif col_widths + x[2] >= page_width and (index + 1) != len(products): 
                 # Create full section first 
-                section = self._create_section(section_products)
+                section = self._create_section(section_products, max_row_height)
                 data.append([section])
 
                 # Then start next row
@@ -403,7 +352,7 @@ class PricelistPDF(object):
             # and it is the last product
             elif col_widths + x[2] >= page_width and (index + 1) == len(products): 
                 # Create full section first 
-                section = self._create_section(section_products)
+                section = self._create_section(section_products, max_row_height)
                 data.append([section])
                 
 
@@ -414,7 +363,7 @@ class PricelistPDF(object):
                 count = 1
 
                 # Create final row
-                section = self._create_section(section_products)
+                section = self._create_section(section_products, max_row_height)
                 data.append([section])
 
             elif col_widths + x[2] <= page_width and (index + 1) == len(products):
@@ -424,7 +373,7 @@ class PricelistPDF(object):
                 count += 1
 
                 # Create final row
-                section = self._create_section(section_products)
+                section = self._create_section(section_products, max_row_height)
                 data.append([section])
 
             else:
@@ -451,11 +400,8 @@ class PricelistPDF(object):
             data.append([section])
         """
         # Check that all products for this model have been priced
-        assert priced_count == len(products), "Only {0} of {1} price".format(priced_count, len(products))
+        assert priced_count == len(products), "Only {0} of {1} price for model {2}".format(priced_count, len(products), model.model)
 
-        assert priced_count == model.upholsteries.all().count(), "Only added {0} of {1} for model {2}".format(priced_count, 
-                                                                                                              model.upholsteries.all().count(),
-                                                                                                              model.model)
         assert len(data) != 0 
 
         table_style = [('ALIGNMENT', (0,0), (0, 0), 'CENTER'),
@@ -467,12 +413,9 @@ class PricelistPDF(object):
         table = Table(data, colWidths=(550), repeatRows=2)
         table.setStyle(TableStyle(table_style))
 
-        # Reset max row height
-        self.max_row_height = 20
-
         return table
 
-    def _create_section(self, products, row_height=20):
+    def _create_section(self, products, max_row_height=20):
 
         header = []#[self._prepare_text('Grade', font_size=12)]
         col_widths = []
@@ -493,9 +436,8 @@ class PricelistPDF(object):
             col_widths.append(widths)
 
         row_heights = [40, (20 * 4)]
-        self.max_row_height
-        if self.max_row_height > 20:
-            row_heights[1] = row_heights[1] + self.max_row_height
+        if max_row_height > 20:
+            row_heights[1] = row_heights[1] + max_row_height
         
         table = Table([header, data], colWidths=col_widths, rowHeights=row_heights)
         table.setStyle(TableStyle([('GRID', (0, 0), (-1, -1), 1, colors.CMYKColor(black=60)),
@@ -504,7 +446,7 @@ class PricelistPDF(object):
 
         return table
 
-    def _create_product_price_table(self, product):
+    def _create_product_price_table(self, product, max_row_height=20):
         """
         Calculate price list for each product
         """
@@ -520,7 +462,7 @@ class PricelistPDF(object):
             col_width = drawing_width if drawing_width >= 120 else 120
             assert drawing_height > row_height, "Height of {0} shoul be greather a {1}".format(drawing_height, row_height)
             row_height = drawing_height
-        except KeyError as e:
+        except (KeyError, ValueError) as e:
             logger.debug(e)
             
         data.append(["Width:  {0}".format(product['width'])])
@@ -570,14 +512,14 @@ class PricelistPDF(object):
         
 
         if len(data) > 4 :
-            row_heights = (self.max_row_height, 20, 20, 20, 20)
+            row_heights = (max_row_height, 20, 20, 20, 20)
 
         
             table_style.append(('ALIGNMENT', (0, 0), (-1, 0), 'CENTER'))
             table_style.append(('VALIGN', (0, 1), (-1, 1), 'TOP'))
             table_style.append(('LINEBELOW', (0, 0), (-1, 0), 1, colors.CMYKColor(black=60)))
         elif re.compile('(.+)?905(.+)?').search(product['description']):
-            row_heights = (self.max_row_height, 20, 20, 20, 20)
+            row_heights = (max_row_height, 20, 20, 20, 20)
 
         
             table_style.append(('ALIGNMENT', (0, 0), (-1, 0), 'CENTER'))
@@ -614,13 +556,17 @@ class PricelistPDF(object):
 
     #helps change the size and maintain ratio
     def _get_image(self, path, width=None, height=None, max_width=0, max_height=0):
-        """Retrieves the image via the link and gets the
+        """Retrieves the image from the image cache and gets the
         size from the image. The correct dimensions for
         image are calculated based on the desired with or
         height"""
 
+        path = image_cache.get_path(path, width=width, height=height, max_width=max_width)
+        if path is None:
+            return ''
+
         try:
-            #Read image from link
+            #Read the cached thumbnail
             img = utils.ImageReader(path)
         except Exception as e:
             logger.debug(e)
@@ -644,22 +590,21 @@ class PricelistPDF(object):
         return Image(path, width=new_width, height=new_height)
 
     def _get_drawing(self, path, filename=None, width=None, height=None, max_width=None, max_height=None):
-        try:
-            drawing = svg2rlg(path)
-            sx=sy=1
-            drawing.width,drawing.height = drawing.minWidth()*sx, drawing.height*sy
-
-            if max_height: 
-                sy= max_height/drawing.height if  drawing.height > max_height else 1
-                sx = sy
-            elif max_width:
-                sx= max_width/drawing.width if  drawing.width > max_width else 1
-                sy = sx
-        except (AttributeError) as e:
-            logger.debug(e)
-            logger.debug(path)
-            logger.debug(svg2rlg(path))
-        
+        """
+        Returns a copy of the cached drawing of the schematic, scaled to
+        fit the max height or width
+        """
+        drawing = schematics.get_drawing(path)
+        sx=sy=1
+        drawing.width,drawing.height = drawing.minWidth()*sx, drawing.height*sy
+
+        if max_height: 
+            sy= max_height/drawing.height if  drawing.height > max_height else 1
+            sx = sy
+        elif max_width:
+            sx= max_width/drawing.width if  drawing.width > max_width else 1
+            sy = sx
+
         drawing.scale(sx,sy)
         
     
@@ -757,7 +702,7 @@ class FabricPDF(object):
         for fabric in fabrics:
 
             try:
-                data.append([self._get_image(fabric.image.generate_url(), width=100) if fabric.image else '',
+                data.append([self._get_image(fabric.image, width=100) if fabric.image else '',
                              fabric.color.title(),
                              self._calculate_grade(fabric)])
             except ValueError as e:
@@ -832,12 +777,16 @@ class FabricPDF(object):
 
     #helps change the size and maintain ratio
     def _get_image(self, path, width=None, height=None, max_width=0, max_height=0):
-        """Retrieves the image via the link and gets the
+        """Retrieves the image from the image cache and gets the
         size from the image. The correct dimensions for
         image are calculated based on the desired with or
         height"""
+        path = image_cache.get_path(path, width=width, height=height, max_width=max_width)
+        if path is None:
+            return None
+
         try:
-            #Read image from link
+            #Read the cached thumbnail
             img = utils.ImageReader(path)
         except Exception as e:
             logger.debug(e)
@@ -884,18 +833,9 @@ if __name__ == "__main__":
         os.makedirs(directory)
 
     def create_pricelist(filename):
+        # Schematics are kept in the image cache for the next run
         pdf = PricelistPDF()
         pdf.create(filename)
-        regexp = re.compile('(.+)?\.svg$')
-
-        # Delete svg files saved from S3
-        for f in pdf._files_to_delete:
-            if regexp.search(f):
-                os.remove(f)
-            else: 
-                logger.debug("Did not remove {0}".format(f))
-                logger.debug("Result of regexp: {0}".format(regexp.search(f)))
-                logger.debug(regexp.pattern)
 
     def create_fabriclist(filename, fabrics):
         f_pdf = FabricPDF(fabrics=None)
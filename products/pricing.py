@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch price calculation for products
+
+The bill of materials, the cheapest supplier product of every supply
+and the currency rates are loaded for a whole set of products in a few
+queries. The prices of all grades are then calculated for every product
+in one pass over the loaded data, without any further queries.
+
+The currency rates are the number of baht per unit of the supplier's
+currency and can be changed with the CURRENCY_RATES setting.
+"""
+import logging
+import re
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from products.models import Product, Supply as ProductSupply, Price
+from supplies.models import Product as SupplierProduct
+
+
+logger = logging.getLogger(__name__)
+
+GRADES = OrderedDict([('A1', 15),
+                      ('A2', 20),
+                      ('A3', 25),
+                      ('A4', 30),
+                      ('A5', 35),
+                      ('A6', 40)])
+
+CURRENCY_RATES = {'THB': Decimal('1'),
+                  'USD': Decimal('36'),
+                  'EUR': Decimal('39'),
+                  'RMB': Decimal('5.7')}
+
+FABRIC_COST_PER_GRADE = Decimal('36')
+
+batch_size = 500
+
+
+def get_currency_rates():
+    rates = dict(CURRENCY_RATES)
+    rates.update({currency.upper(): Decimal(str(rate))
+                  for currency, rate in getattr(settings, 'CURRENCY_RATES', {}).items()})
+
+    return rates
+
+
+def load_bill_of_materials(product_ids):
+    """
+    Returns the supply rows of the products by product id
+    """
+    rows = defaultdict(list)
+    queryset = ProductSupply.objects.filter(product_id__in=product_ids) \
+                                    .values_list('product_id', 'description', 'supply_id', 'quantity', 'cost') \
+                                    .order_by('id')
+
+    for product_id, description, supply_id, quantity, cost in queryset:
+        rows[product_id].append((description, supply_id, quantity, cost))
+
+    return rows
+
+
+def load_supply_costs(supply_ids, rates=None):
+    """
+    Returns the cost in baht of a single unit of each supply, using the
+    cheapest supplier product of the supply
+    """
+    rates = rates or get_currency_rates()
+    costs = {}
+
+    queryset = SupplierProduct.objects.filter(supply_id__in=supply_ids) \
+                                      .values_list('supply_id', 'cost', 'quantity_per_purchasing_unit',
+                                                   'supplier__currency') \
+                                      .order_by('supply_id', 'cost', 'id')
+
+    for supply_id, cost, quantity_per_unit, currency in queryset:
+        if supply_id in costs:
+            continue
+
+        rate = rates.get((currency or 'THB').upper(), Decimal('1'))
+        costs[supply_id] = (cost * rate) / (quantity_per_unit or Decimal('1'))
+
+    return costs
+
+
+def calculate_prices(products, rates=None):
+    """
+    Calculates the prices of all grades for the products
+
+    Returns a dictionary of the prices by grade for each product id, and
+    a dictionary of the reason each product that could not be priced
+    was skipped
+    """
+    products = list(products)
+    product_ids = [product.id for product in products]
+
+    bill_of_materials = load_bill_of_materials(product_ids)
+    supply_ids = set(row[1] for rows in bill_of_materials.values() for row in rows if row[1])
+    supply_costs = load_supply_costs(supply_ids, rates=rates)
+
+    prices = {}
+    errors = {}
+
+    for product in products:
+        try:
+            direct_cost, fabric_quantity = _calculate_costs(product, bill_of_materials[product.id], supply_costs)
+        except ValueError as e:
+            logger.warn(e)
+            errors[product.id] = u"{0}".format(e)
+            continue
+
+        overhead = Decimal('1') + (Decimal(str(product._overhead_percent)) / Decimal('100'))
+        divisor = Decimal('1') - (_profit_percent(product) / Decimal('100'))
+
+        prices[product.id] = OrderedDict((grade, (direct_cost + fabric_quantity * multiplier * FABRIC_COST_PER_GRADE)
+                                                 * overhead / divisor * Decimal('2'))
+                                         for grade, multiplier in GRADES.items())
+
+    return prices, errors
+
+
+def apply_prices(prices):
+    """
+    Replaces the stored grade prices of the products
+    """
+    with transaction.atomic():
+        Price.objects.filter(product_id__in=prices.keys()).delete()
+        Price.objects.bulk_create([Price(product_id=product_id, grade=grade, price=price)
+                                   for product_id in prices
+                                   for grade, price in prices[product_id].items()],
+                                  batch_size=batch_size)
+
+
+def reprice(queryset=None, chunk_size=batch_size, rates=None):
+    """
+    Calculates and stores the prices of all products in chunks
+
+    Returns the number of products repriced and the reasons the other
+    products were skipped by product id
+    """
+    queryset = queryset if queryset is not None else Product.objects.filter(deleted=False)
+    queryset = queryset.only('id', 'description').order_by('id')
+    rates = rates or get_currency_rates()
+
+    count = 0
+    errors = {}
+    last_id = 0
+
+    while True:
+        products = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not products:
+            break
+
+        prices, chunk_errors = calculate_prices(products, rates=rates)
+        apply_prices(prices)
+
+        count += len(prices)
+        errors.update(chunk_errors)
+        last_id = products[-1].id
+
+        logger.info(u"Repriced {0} products".format(count))
+
+    return count, errors
+
+
+def _calculate_costs(product, rows, supply_costs):
+    """
+    Returns the cost of the materials excluding fabric and the quantity
+    of fabric of a product
+    """
+    cost = Decimal('0')
+    fabric_quantity = None
+
+    for description, supply_id, quantity, supply_cost in rows:
+        if description == 'fabric':
+            if fabric_quantity is None:
+                fabric_quantity = quantity
+        elif supply_id and quantity:
+            try:
+                cost += quantity * supply_costs[supply_id]
+            except KeyError:
+                raise ValueError(u"Supply {0} of {1} has no supplier".format(supply_id, product.description))
+        else:
+            cost += supply_cost or 0
+
+    if not fabric_quantity:
+        raise ValueError(u'Missing fabric quantity for {0}'.format(product.description))
+
+    return cost, fabric_quantity
+
+
+def _profit_percent(product):
+    if re.search('^fc-\s+', product.description):
+        return Decimal(product._profit_percent + 5)
+    elif re.search('^ac-\s+', product.description):
+        return Decimal(product._profit_percent + 15)
+
+    return Decimal(product._profit_percent)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local cache of the upholstery schematics printed on the pricelists
+
+The schematics are SVG files on S3. They are downloaded into the image
+cache, which keeps them between runs by bucket, key and version, so only
+new uploads are downloaded again. Downloads are made by a bounded pool
+of threads instead of one thread per model.
+
+Each file is converted into a Drawing only once per process, by the
+cache of utilities.svglib. Callers get a copy of the converted Drawing,
+which can be resized without changing the cached one:
+
+    paths = schematics.download([u.schematic for u in upholsteries])
+    drawing = schematics.get_drawing(paths[upholstery.schematic_id])
+    width, height = schematics.get_size(paths[upholstery.schematic_id])
+"""
+import logging
+from multiprocessing.pool import ThreadPool
+
+from media import image_cache
+from utilities import svglib
+
+
+logger = logging.getLogger(__name__)
+
+workers = 8
+
+
+def download(schematics, size=None, retries=2):
+    """
+    Downloads the schematics that are not cached yet and returns the
+    local filenames by S3Object id. Failed downloads are tried again
+    'retries' times, after which the schematic is left out
+    """
+    schematics = dict((s.id, s) for s in schematics if s)
+    paths = {}
+
+    for attempt in xrange(retries + 1):
+        missing = [s for schematic_id, s in schematics.items() if schematic_id not in paths]
+        if not missing:
+            break
+
+        pool = ThreadPool(min(size or workers, len(missing)))
+        try:
+            results = pool.map(image_cache.get_file, missing)
+        finally:
+            pool.close()
+            pool.join()
+
+        paths.update((s.id, path) for s, path in zip(missing, results) if path)
+
+    for schematic_id in set(schematics) - set(paths):
+        logger.warn(u"Unable to download schematic {0}".format(schematic_id))
+
+    return paths
+
+
+def get_drawing(path):
+    """
+    Returns a copy of the drawing of the svg file. Drawings are cached
+    by svglib, so each schematic is only converted once
+    """
+    drawing = svglib.svg2rlg(path)
+    if drawing is None:
+        raise ValueError(u"Unable to read the schematic {0}".format(path))
+
+    return drawing
+
+
+def get_size(path):
+    """
+    Returns the width and height the schematic is drawn at
+    """
+    drawing = get_drawing(path)
+
+    return drawing.minWidth(), drawing.height
+
+
+def clear():
+    svglib.clearCache()
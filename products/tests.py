@@ -4,16 +4,28 @@ when you run "manage.py test".
 
 Replace this with more appropriate tests for your application.
 """
+import gzip
+import os
 import random
 import logging
+import shutil
+import tempfile
+from cStringIO import StringIO
+from decimal import Decimal
 
 from django.test import TestCase
 from django.contrib.auth.models import User, Permission
 from django.conf import settings
 from rest_framework.test import APITestCase
 
-from products.models import Product, Model, Configuration, Upholstery, Table, Pillow
+from products.models import Product, Model, Configuration, Upholstery, Table, Pillow, Price, Supply as ProductSupply
+from products import pricing, schematics
+from contacts.models import Supplier
+from supplies.models import Supply, Product as SupplierProduct
 from auth.models import S3Object
+from media.image_cache import ImageCache, get_image_cache, set_image_cache
+from media.storage import LocalStorage, get_storage, set_storage
+from utilities import svglib
 
 base_product = {"width": 1000, 
                 "depth": 500,
@@ -585,4 +597,177 @@ class TableResourceTest(APITestCase):
         #Validate the response
         self.assertEqual(resp.status_code, 204)
     
-    
\ No newline at end of file
+    
+
+
+class PricingTest(TestCase):
+
+    def setUp(self):
+        """
+        Set up a product made from a supply bought in USD and 2 units of fabric
+        """
+        super(PricingTest, self).setUp()
+
+        supplier = Supplier.objects.create(name="Test Supplier", currency="USD")
+        expensive_supplier = Supplier.objects.create(name="Expensive Supplier", currency="USD")
+        supply = Supply.objects.create(description="Foam")
+        SupplierProduct.objects.create(supply=supply, supplier=supplier, cost=10)
+        SupplierProduct.objects.create(supply=supply, supplier=expensive_supplier, cost=20)
+
+        self.product = Product.objects.create(description="Test Sofa", type="upholstery")
+        ProductSupply.objects.create(product=self.product, supply=supply, description="foam", quantity=3)
+        ProductSupply.objects.create(product=self.product, description="labor", cost=100)
+        ProductSupply.objects.create(product=self.product, description="fabric", quantity=2)
+
+        self.unpriced = Product.objects.create(description="No Fabric", type="upholstery")
+
+    def test_calculate_prices(self):
+        """
+        Test that the cheapest supplier and the currency rate are used
+        """
+        prices, errors = pricing.calculate_prices([self.product, self.unpriced])
+
+        # (3 * 10 * 36 + 100 + 2 * 15 * 36) * 1.4 / 0.8 * 2
+        self.assertEqual(prices[self.product.id]['A1'], Decimal('7910'))
+        self.assertEqual(prices[self.product.id].keys(), ['A1', 'A2', 'A3', 'A4', 'A5', 'A6'])
+        self.assertIn(self.unpriced.id, errors)
+
+    def test_reprice(self):
+        """
+        Test that the prices are stored in bulk and replace the old prices
+        """
+        Price.objects.create(product=self.product, grade='A1', price=1)
+
+        count, errors = pricing.reprice(Product.objects.all(), chunk_size=1)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(Price.objects.filter(product=self.product).count(), 6)
+        self.assertEqual(self.product.get_prices()['A1'], Decimal('7910'))
+
+
+class SchematicsTest(TestCase):
+    """
+    Testing class for the schematics cache of the pricelist
+    """
+    svg = """<svg xmlns="http://www.w3.org/2000/svg" width="200" height="100">
+                 <rect x="0" y="0" width="200" height="100" />
+             </svg>"""
+
+    def setUp(self):
+        super(SchematicsTest, self).setUp()
+
+        self.location = tempfile.mkdtemp()
+        self.original_storage = get_storage()
+        self.original_cache = get_image_cache()
+        set_storage(LocalStorage(location=os.path.join(self.location, 'storage')))
+        set_image_cache(ImageCache(location=os.path.join(self.location, 'cache')))
+        schematics.clear()
+
+        filename = os.path.join(self.location, 'sofa.svg')
+        with open(filename, 'w') as f:
+            f.write(self.svg)
+        self.schematic = S3Object.create(filename, 'schematic/sofa.svg', 'test-bucket')
+
+    def tearDown(self):
+        set_storage(self.original_storage)
+        set_image_cache(self.original_cache)
+        schematics.clear()
+        shutil.rmtree(self.location)
+
+        super(SchematicsTest, self).tearDown()
+
+    def test_download(self):
+        """
+        Test that the schematics are only downloaded once
+        """
+        paths = schematics.download([self.schematic, None])
+
+        self.assertEqual(paths.keys(), [self.schematic.id])
+        self.assertEqual(schematics.download([self.schematic]), paths)
+        self.assertEqual(get_image_cache().hits, 1)
+        self.assertEqual(get_image_cache().misses, 1)
+
+    def test_get_drawing(self):
+        """
+        Test that the schematic is parsed once and that scaling a copy
+        does not change the cached drawing
+        """
+        path = schematics.download([self.schematic])[self.schematic.id]
+
+        drawing = schematics.get_drawing(path)
+        drawing.scale(0.5, 0.5)
+
+        self.assertEqual(len(svglib._cache), 1)
+        self.assertEqual(schematics.get_size(path), (200, 100))
+        self.assertNotEqual(schematics.get_drawing(path).transform, drawing.transform)
+        self.assertEqual(len(svglib._cache), 1)
+
+    def test_get_compressed_drawing(self):
+        """
+        Test that compressed schematics are read in memory and share the
+        drawing of the same uncompressed content
+        """
+        filename = os.path.join(self.location, 'sofa.svgz')
+        f = gzip.open(filename, 'wb')
+        f.write(self.svg)
+        f.close()
+
+        path = schematics.download([self.schematic])[self.schematic.id]
+
+        self.assertEqual(schematics.get_size(filename), (200, 100))
+        self.assertEqual(schematics.get_size(path), (200, 100))
+        self.assertEqual(len(svglib._cache), 1)
+        self.assertNotIn('sofa.svg', os.listdir(self.location))
+
+
+class SvgParserTest(TestCase):
+    """
+    Testing class for the path, transform and document parsing of svglib
+    """
+
+    def test_normalise_path_with_exponents(self):
+        self.assertEqual(svglib.normaliseSvgPath("M1e2 -2.5E-1L10 20"),
+                         ['M', [100.0, -0.25], 'L', [10.0, 20.0]])
+
+    def test_normalise_path_with_implicit_commands(self):
+        """
+        Test that repeated arguments repeat their command and that the
+        arguments of a repeated m are lines
+        """
+        self.assertEqual(svglib.normaliseSvgPath("m1,2 3,4 c1 2 3 4 5 6 7 8 9 10 11 12z"),
+                         ['m', [1.0, 2.0], 'l', [3.0, 4.0],
+                          'c', [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], 'c', [7.0, 8.0, 9.0, 10.0, 11.0, 12.0],
+                          'z', []])
+
+    def test_normalise_path_with_horizontal_and_vertical_lines(self):
+        """
+        Test that the values of relative lines are added up and that
+        absolute lines keep their last value
+        """
+        self.assertEqual(svglib.normaliseSvgPath("M 10 20 30 40 h 5 5 v -2 H 1 2 Z"),
+                         ['M', [10.0, 20.0], 'L', [30.0, 40.0], 'h', [10.0], 'v', [-2.0], 'H', [2.0], 'Z', []])
+
+    def test_convert_transform(self):
+        converter = svglib.AttributeConverter()
+
+        self.assertEqual(converter.convertTransform("scale(2) translate(10,20) matrix(1 0 0 1 -5e1 .5) rotate(45)"),
+                         [('scale', 2.0), ('translate', (10.0, 20.0)),
+                          ('matrix', (1.0, 0.0, 0.0, 1.0, -50.0, 0.5)), ('rotate', 45.0)])
+
+    def test_parse_text(self):
+        """
+        Test that the text, tspans and tails of a text element keep
+        their order
+        """
+        root = svglib.parseSvg(StringIO('<svg xmlns="http://www.w3.org/2000/svg">'
+                                        '<text x="0">Hello <tspan>big</tspan> world<tspan>!</tspan></text>'
+                                        '</svg>'))
+        text = root.firstChild
+
+        self.assertEqual(root.nodeName, 'svg')
+        self.assertEqual(text.getAttribute('x'), '0')
+        self.assertEqual([node.nodeName for node in text.childNodes], ['#text', 'tspan', '#text', 'tspan'])
+        self.assertEqual([node.nodeValue or node.firstChild.nodeValue for node in text.childNodes],
+                         ['Hello ', 'big', ' world', '!'])
+        self.assertTrue(all(node.parentNode is text for node in text.childNodes))
@@ -23,10 +23,7 @@ from reportlab.lib.enums import TA_LEFT, TA_CENTER
 
 from hr.models import Employee
 from projects.models import Project, ItemSupply, Part, Room, Phase, Item
-from contacts.models import Supplier
-from po.models import PurchaseOrder as PO
-from acknowledgements.models import Item as AckItem
-from supplies.models import Supply
+from projects.costing import ProjectCosts
 
 
 django.setup()
@@ -63,6 +60,9 @@ class ProjectPDF(object):
         
         if response is None:
             response = 'Project-Summary({0}).pdf'.format(self.project.codename)
+
+        self.costs = ProjectCosts(self.project)
+
         doc = SimpleDocTemplate(response, 
                                 pagesize=A4, 
                                 leftMargin=12, 
@@ -123,16 +123,13 @@ class ProjectPDF(object):
         data.append(["Suppliers:", ''])
         data.append([self._create_supplier_summary(self.project), ''])
         
-        items = AckItem.objects.filter(acknowledgement__project=self.project).count()
+        items = len(self.costs.get_acknowledgement_items())
+        suppliers = self.costs.get_suppliers()
         
         data.append(['Acknowledgements:', items])
-        data.append(['Purchase Orders:', self.project.purchase_orders.all().count()])
-        total_dict = self.project.purchase_orders.aggregate(Sum('grand_total'))
-        total = total_dict['grand_total__sum']
-        try:
-            data.append(['', "{0:,.2f}".format(total)])
-        except Exception:
-            pass
+        data.append(['Purchase Orders:', sum(s['count'] for s in suppliers)])
+        if suppliers:
+            data.append(['', "{0:,.2f}".format(sum(s['total'] or 0 for s in suppliers))])
         
         table = Table(data, colWidths=(200, 000))
         
@@ -141,7 +138,7 @@ class ProjectPDF(object):
     def _create_and_append_room_details_section(self, stories=None):
         
         stories.append(PageBreak())
-        for room in self.project.rooms.all():
+        for room in self.costs.rooms:
                 self._create_and_append_room_details(stories, room)
                 stories.append(PageBreak())
                     
@@ -149,7 +146,7 @@ class ProjectPDF(object):
         
     def _create_and_append_phase_details_section(self, stories=None):
         
-        for phase in self.project.phases.all():
+        for phase in self.costs.phases:
                 self._create_and_append_phase_details(stories, phase)
                 stories.append(PageBreak())
                     
@@ -158,7 +155,7 @@ class ProjectPDF(object):
     def _create_room_overview(self, project):
         data = [['', '']]
         
-        for index, room in enumerate(project.rooms.all()):
+        for index, room in enumerate(self.costs.rooms):
             index += 1
             data.append([index, room.description])
             
@@ -169,7 +166,7 @@ class ProjectPDF(object):
     def _create_phase_summary(self, project):
         data = [['', '']]
         
-        for index, phase in enumerate(project.phases.all()):
+        for index, phase in enumerate(self.costs.phases):
             index += 1
             data.append([index, phase.description])
             
@@ -180,10 +177,8 @@ class ProjectPDF(object):
     def _create_supplier_summary(self, project):
         data = [['', '']]
         
-        for supplier in Supplier.objects.filter(purchaseorder__project=project).distinct():
-            total = PO.objects.filter(project=project, supplier=supplier).aggregate(Sum('grand_total'))
-            total = total['grand_total__sum']
-            data.append([supplier.name, "{0:,.2f}".format(total)])
+        for supplier in self.costs.get_suppliers():
+            data.append([supplier['supplier__name'], "{0:,.2f}".format(supplier['total'] or 0)])
         table = Table(data, colWidths=(200, 200))
         
         return table
@@ -212,26 +207,15 @@ class ProjectPDF(object):
         return stories
     
     def _create_room_supplies_summary(self, room):
-        running_total = 0
         data = [['#', 'Description', 'Qty', 'Unit Cost', 'Total']]
-        supplies = ItemSupply.objects.filter(item__room=room)
-        supplies = supplies.values('supply__description', 'supply').annotate(quantity=Sum('quantity')).order_by('supply')
+        supplies = self.costs.get_supplies(room)
+        running_total = self.costs.get_total(supplies)
         for index, supply in enumerate(supplies):
-            supply_dict = Supply.objects.get(pk=supply['supply']).products.all().values('purchasing_units', 'quantity_per_purchasing_unit').annotate(Max('cost'))[0]
-            unit_cost = supply_dict['cost__max']
-            purchasing_units = supply_dict['purchasing_units']
-            q_per_pu = supply_dict['quantity_per_purchasing_unit']
-            
-            if Supply.objects.get(pk=supply['supply']).units.lower() != purchasing_units.lower():
-                unit_cost = unit_cost / q_per_pu
-                
-            total = unit_cost * Decimal(supply['quantity'])
-            running_total += total
             data.append([index + 1, 
-                         self._prepare_text(supply['supply__description']),
+                         self._prepare_text(supply['description']),
                          "{0:,.2f}".format(supply['quantity']), 
-                         unit_cost, 
-                         "{0:,.2f}".format(total)])
+                         "{0:,.2f}".format(supply['unit_cost']), 
+                         "{0:,.2f}".format(supply['total'])])
                          
         if len(data) == 1:
             data.append(['No Supplies for this Room'])
@@ -269,7 +253,8 @@ class ProjectPDF(object):
                        
         data = [['#', 'Description', 'Qty', 'Unit Cost', 'Total']]
         
-        for index, item in enumerate(room.items.all()):
+        items = self.costs.get_items(room)
+        for index, item in enumerate(items):
             data.append([index + 1, item.description, item.quantity])
             
             data.append(['', self._prepare_text('Parts', bold=True, font='Helvetica')])
@@ -279,24 +264,14 @@ class ProjectPDF(object):
                 
             
             data.append(['', self._prepare_text('Supplies', bold=True, font='Helvetica')])
-            running_total = 0
-            for supply in item.supplies.all():
-                supply_dict = supply.products.all().values('purchasing_units', 'quantity_per_purchasing_unit').annotate(Max('cost'))[0]
-                unit_cost = supply_dict['cost__max']
-                purchasing_units = supply_dict['purchasing_units']
-                q_per_pu = supply_dict['quantity_per_purchasing_unit'] or 0
-                
-                if supply.units.lower() != purchasing_units.lower():
-                    unit_cost = unit_cost / q_per_pu
-                    
-                quantity = ItemSupply.objects.get(supply=supply, item=item).quantity
-                total = unit_cost * Decimal(quantity)
-                running_total += total
+            supplies = self.costs.get_item_supplies(item)
+            running_total = self.costs.get_total(supplies)
+            for supply in supplies:
                 data.append(['', 
-                             supply.description,
-                             "{0:,.2f}".format(quantity),
-                             unit_cost, 
-                             "{0:,.2f}".format(total)])
+                             supply['description'],
+                             "{0:,.2f}".format(supply['quantity']),
+                             "{0:,.2f}".format(supply['unit_cost']), 
+                             "{0:,.2f}".format(supply['total'])])
                 special_styles['indent'].append(len(data) - 1)
                 
                              
@@ -306,9 +281,9 @@ class ProjectPDF(object):
             special_styles['line_above'].append(len(data) - 1)
         
         # Add Items (Loose Furniture) from the acknowledgements
-        init_index = room.items.count()
-        for index, item in enumerate(AckItem.objects.filter(acknowledgement__room=self.project)):
-            data.append([index + init_index + 1, item.description, item.quantity, '', ''])
+        init_index = len(items)
+        for index, item in enumerate(self.costs.get_acknowledgement_items(room=room)):
+            data.append([index + init_index + 1, item['description'], item['quantity'], '', ''])
         
         if len(data) == 1:
             data.append(["No Items for this Room"])
@@ -367,26 +342,15 @@ class ProjectPDF(object):
         return stories
     
     def _create_phase_supplies_summary(self, phase):
-        running_total = 0
         data = [['#', 'Description', 'Qty', 'Unit Cost', 'Total']]
-        supplies = ItemSupply.objects.filter(item__room__project=self.project)
-        supplies = supplies.values('supply__description', 'supply').annotate(quantity=Sum('quantity')).order_by('supply')
+        supplies = self.costs.get_supplies(multiplier=phase.quantity)
+        running_total = self.costs.get_total(supplies)
         for index, supply in enumerate(supplies):
-            supply_dict = Supply.objects.get(pk=supply['supply']).products.all().values('purchasing_units', 'quantity_per_purchasing_unit').annotate(Max('cost'))[0]
-            unit_cost = supply_dict['cost__max']
-            purchasing_units = supply_dict['purchasing_units']
-            q_per_pu = supply_dict['quantity_per_purchasing_unit']
-            
-            if Supply.objects.get(pk=supply['supply']).units.lower() != purchasing_units.lower():
-                unit_cost = unit_cost / q_per_pu
-                
-            total = unit_cost * Decimal(supply['quantity']) * phase.quantity
-            running_total += total
             data.append([index + 1, 
-                         self._prepare_text(supply['supply__description']),
-                         "{0:,.2f}".format(Decimal(supply['quantity']) * phase.quantity), 
-                         unit_cost, 
-                         "{0:,.2f}".format(total)])
+                         self._prepare_text(supply['description']),
+                         "{0:,.2f}".format(supply['quantity']), 
+                         "{0:,.2f}".format(supply['unit_cost']), 
+                         "{0:,.2f}".format(supply['total'])])
                          
         if len(data) == 1:
             data.append(['No Supplies for this Room'])
@@ -424,7 +388,8 @@ class ProjectPDF(object):
                        
         data = [['#', 'Description', 'Qty', 'Unit Cost', 'Total']]
         
-        for index, item in enumerate(Item.objects.filter(room__project=self.project)):
+        items = self.costs.items
+        for index, item in enumerate(items):
             data.append([index + 1, item.description, item.quantity])
             
             data.append(['', self._prepare_text('Parts', bold=True, font='Helvetica')])
@@ -434,24 +399,14 @@ class ProjectPDF(object):
                 
             
             data.append(['', self._prepare_text('Supplies', bold=True, font='Helvetica')])
-            running_total = 0
-            for supply in item.supplies.all():
-                supply_dict = supply.products.all().values('purchasing_units', 'quantity_per_purchasing_unit').annotate(Max('cost'))[0]
-                unit_cost = supply_dict['cost__max']
-                purchasing_units = supply_dict['purchasing_units']
-                q_per_pu = supply_dict['quantity_per_purchasing_unit']
-                
-                if supply.units.lower() != purchasing_units.lower():
-                    unit_cost = unit_cost / q_per_pu
-                    
-                quantity = ItemSupply.objects.get(supply=supply, item=item).quantity * phase.quantity
-                total = unit_cost * Decimal(quantity)
-                running_total += total
+            supplies = self.costs.get_item_supplies(item, multiplier=phase.quantity)
+            running_total = self.costs.get_total(supplies)
+            for supply in supplies:
                 data.append(['', 
-                             self._prepare_text(supply.description, font='Garuda'),
-                             "{0:,.2f}".format(quantity),
-                             unit_cost, 
-                             "{0:,.2f}".format(total)])
+                             self._prepare_text(supply['description'], font='Garuda'),
+                             "{0:,.2f}".format(supply['quantity']),
+                             "{0:,.2f}".format(supply['unit_cost']), 
+                             "{0:,.2f}".format(supply['total'])])
                 special_styles['indent'].append(len(data) - 1)
                 
                              
@@ -461,9 +416,9 @@ class ProjectPDF(object):
             special_styles['line_above'].append(len(data) - 1)
         
         # Add Items (Loose Furniture) from the acknowledgements
-        init_index = Item.objects.filter(room__project=self.project).count()
-        for index, item in enumerate(AckItem.objects.filter(acknowledgement__phase=phase)):
-            data.append([index + init_index + 1, item.description, item.quantity, '', ''])
+        init_index = len(items)
+        for index, item in enumerate(self.costs.get_acknowledgement_items(phase=phase)):
+            data.append([index + init_index + 1, item['description'], item['quantity'], '', ''])
         
         # Create the table
         table = Table(data, colWidths=(20, 350, 30, 70, 90), repeatRows=1)
@@ -521,6 +476,9 @@ class PhasePDF(object):
         
         if response is None:
             response = 'Phase-Summary({0}).pdf'.format(self.phase.description)
+
+        self.costs = ProjectCosts(self.project)
+
         doc = SimpleDocTemplate(response, 
                                 pagesize=A4, 
                                 leftMargin=12, 
@@ -582,37 +540,20 @@ class PhasePDF(object):
         return stories
     
     def _create_phase_supplies_summary(self, phase):
-        running_total = 0
         data = [['#', 'Description', 'Qty']]
         
         if self.user.has_perm('projects.view_project_costs'):
             data[0] += ['Unit Cost', 'Total']
             
-        supplies = ItemSupply.objects.filter(item__room__project=self.project)
-        supplies = supplies.values('supply__description', 'supply').annotate(quantity=Sum('quantity')).order_by('supply')
+        supplies = self.costs.get_supplies(multiplier=phase.quantity)
+        running_total = self.costs.get_total(supplies)
         for index, supply in enumerate(supplies):
-            
-            if self.user.has_perm('projects.view_project_costs'):
-            
-                supply_dict = Supply.objects.get(pk=supply['supply']).products.all().values('purchasing_units', 'quantity_per_purchasing_unit').annotate(Max('cost'))[0]
-                unit_cost = supply_dict['cost__max']
-                purchasing_units = supply_dict['purchasing_units']
-                q_per_pu = supply_dict['quantity_per_purchasing_unit']
-            
-                if Supply.objects.get(pk=supply['supply']).units.lower() != purchasing_units.lower():
-                    unit_cost = unit_cost / q_per_pu
-                
-                total = unit_cost * Decimal(supply['quantity']) * phase.quantity
-                running_total += total
-            
-            
-                
             data.append([index + 1, 
-                         self._prepare_text(supply['supply__description'], font="Garuda"),
-                         "{0:,.2f}".format(Decimal(supply['quantity']) * phase.quantity)])
+                         self._prepare_text(supply['description'], font="Garuda"),
+                         "{0:,.2f}".format(supply['quantity'])])
                          
             if self.user.has_perm('projects.view_project_costs'):
-                data[-1] += [unit_cost,  "{0:,.2f}".format(total)]
+                data[-1] += ["{0:,.2f}".format(supply['unit_cost']),  "{0:,.2f}".format(supply['total'])]
                 
         if len(data) == 1:
             data.append(['No Supplies for this Room'])
@@ -662,7 +603,8 @@ class PhasePDF(object):
             data[0] += ['Unit Cost', 'Total']
         
         # Loop though all items in the project
-        for index, item in enumerate(Item.objects.filter(room__project=self.project)):
+        items = self.costs.items
+        for index, item in enumerate(items):
             data.append([index + 1, item.description, item.quantity])
             
             # Add parts for the current item
@@ -676,9 +618,9 @@ class PhasePDF(object):
                 self._create_and_append_item_supplies(data, special_styles, item)
               
         # Add Items (Loose Furniture) from the acknowledgements
-        init_index = Item.objects.filter(room__project=self.project).count()
-        for index, item in enumerate(AckItem.objects.filter(acknowledgement__phase=self.phase)):
-            data.append([index + init_index + 1, item.description, item.quantity])
+        init_index = len(items)
+        for index, item in enumerate(self.costs.get_acknowledgement_items(phase=self.phase)):
+            data.append([index + init_index + 1, item['description'], item['quantity']])
         
         #Determine column widths based on user permission
         if self.user.has_perm('projects.view_project_costs'):
@@ -716,31 +658,16 @@ class PhasePDF(object):
         
     def _create_and_append_item_supplies(self, data, special_styles, item):
         data.append(['', self._prepare_text('Supplies', bold=True, font='Helvetica')])
-        running_total = 0
-        for supply in item.supplies.all():
-            quantity = ItemSupply.objects.get(supply=supply, item=item).quantity * self.phase.quantity
-            
-            if self.user.has_perm('projects.view_project_costs'):
-                supply_dict = supply.products.all().values('purchasing_units', 'quantity_per_purchasing_unit').annotate(Max('cost'))[0]
-                unit_cost = supply_dict['cost__max']
-                purchasing_units = supply_dict['purchasing_units']
-                q_per_pu = supply_dict['quantity_per_purchasing_unit']
-            
-                if supply.units.lower() != purchasing_units.lower():
-                    unit_cost = unit_cost / q_per_pu
-                    
-                total = unit_cost * Decimal(quantity)
-                running_total += total
-            
-            description = self._prepare_text(supply.description, font='Garuda')
-            logger.debug(description)
-            logger.debug(description.text)
+        supplies = self.costs.get_item_supplies(item, multiplier=self.phase.quantity)
+        running_total = self.costs.get_total(supplies)
+        for supply in supplies:
+            description = self._prepare_text(supply['description'], font='Garuda')
             data.append(['',
                          description,
-                         "{0:,.2f}".format(quantity)])
+                         "{0:,.2f}".format(supply['quantity'])])
                          
             if self.user.has_perm('projects.view_project_costs'):
-                data[-1] += [unit_cost,  "{0:,.2f}".format(total)]
+                data[-1] += ["{0:,.2f}".format(supply['unit_cost']),  "{0:,.2f}".format(supply['total'])]
                 
             special_styles['indent'].append(len(data) - 1)
             
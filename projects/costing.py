@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Costs of the rooms, phases and suppliers of a project
+
+The reports used to look up each supply, its products and its quantity
+row by row, so the number of queries grew with the number of rooms and
+items. ProjectCosts loads the items, parts, item supplies, product costs,
+supplier totals and acknowledgement items of the whole project in a few
+grouped queries the first time they are needed, and the rollups are
+calculated from those rows:
+
+    costs = ProjectCosts(project)
+    for room in costs.rooms:
+        for item in costs.get_items(room):
+            rows = costs.get_item_supplies(item)
+        summary = costs.get_supplies(room)
+
+The unit cost of a supply is the highest cost of its products, divided
+by the quantity per purchasing unit when the supply is counted in other
+units than it is bought in.
+"""
+import logging
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db.models import Q, Sum, Count
+
+from acknowledgements.models import Item as AckItem
+from po.models import PurchaseOrder
+from projects.models import Item, ItemSupply
+from supplies.models import Product
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectCosts(object):
+
+    def __init__(self, project):
+        self.project = project
+
+        self._rooms = None
+        self._phases = None
+        self._items = None
+        self._item_supplies = None
+        self._unit_costs = None
+        self._suppliers = None
+        self._acknowledgement_items = None
+
+    @property
+    def rooms(self):
+        if self._rooms is None:
+            self._rooms = list(self.project.rooms.all())
+
+        return self._rooms
+
+    @property
+    def phases(self):
+        if self._phases is None:
+            self._phases = list(self.project.phases.all())
+
+        return self._phases
+
+    @property
+    def items(self):
+        """
+        The items of every room with their parts
+        """
+        if self._items is None:
+            self._items = list(Item.objects.filter(room__project=self.project)
+                                           .prefetch_related('parts')
+                                           .order_by('room_id', 'id'))
+
+        return self._items
+
+    def get_items(self, room=None):
+        """
+        Returns the items of the room, or of the whole project
+        """
+        if room is None:
+            return self.items
+
+        return [item for item in self.items if item.room_id == room.id]
+
+    def get_item_supplies(self, item, multiplier=1):
+        """
+        Returns the supplies of the item with their quantity, unit cost
+        and total, multiplied by e.g. the number of units of a phase
+        """
+        return [self._cost(row['supply_id'], row['description'], row['quantity'] * multiplier)
+                for row in self._load_item_supplies().get(item.id, [])]
+
+    def get_supplies(self, room=None, multiplier=1):
+        """
+        Returns the total quantity, unit cost and total of each supply
+        used in the room, or in the whole project, ordered by supply
+        """
+        quantities = OrderedDict()
+        descriptions = {}
+
+        rows = []
+        for item_rows in self._load_item_supplies().values():
+            rows.extend(row for row in item_rows if room is None or row['room_id'] == room.id)
+
+        for row in sorted(rows, key=lambda row: row['supply_id']):
+            quantities[row['supply_id']] = quantities.get(row['supply_id'], Decimal('0')) + row['quantity']
+            descriptions[row['supply_id']] = row['description']
+
+        return [self._cost(supply_id, descriptions[supply_id], quantity * multiplier)
+                for supply_id, quantity in quantities.items()]
+
+    def get_total(self, rows):
+        return sum((row['total'] for row in rows), Decimal('0'))
+
+    def get_unit_cost(self, supply_id):
+        return self._load_unit_costs().get(supply_id, Decimal('0'))
+
+    def get_suppliers(self):
+        """
+        Returns the name, number of purchase orders and total of each
+        supplier of the project
+        """
+        if self._suppliers is None:
+            self._suppliers = list(PurchaseOrder.objects.filter(project=self.project)
+                                                        .values('supplier_id', 'supplier__name')
+                                                        .annotate(count=Count('id'), total=Sum('grand_total'))
+                                                        .order_by('supplier__name'))
+
+        return self._suppliers
+
+    def get_acknowledgement_items(self, room=None, phase=None):
+        """
+        Returns the acknowledged items (loose furniture) of the room or
+        phase, or of the whole project
+        """
+        if self._acknowledgement_items is None:
+            query = Q(acknowledgement__project=self.project) | \
+                    Q(acknowledgement__room__project=self.project) | \
+                    Q(acknowledgement__phase__project=self.project)
+
+            self._acknowledgement_items = list(AckItem.objects.filter(query)
+                                                              .values('id', 'description', 'quantity',
+                                                                      'acknowledgement__project_id',
+                                                                      'acknowledgement__room_id',
+                                                                      'acknowledgement__phase_id')
+                                                              .order_by('id'))
+
+        items = self._acknowledgement_items
+        if room is not None:
+            items = [i for i in items if i['acknowledgement__room_id'] == room.id]
+        elif phase is not None:
+            items = [i for i in items if i['acknowledgement__phase_id'] == phase.id]
+        else:
+            items = [i for i in items if i['acknowledgement__project_id'] == self.project.id]
+
+        return items
+
+    def _cost(self, supply_id, description, quantity):
+        unit_cost = self.get_unit_cost(supply_id)
+
+        return {'supply_id': supply_id,
+                'description': description,
+                'quantity': quantity,
+                'unit_cost': unit_cost,
+                'total': unit_cost * quantity}
+
+    def _load_item_supplies(self):
+        """
+        Returns the supply rows of every item of the project by item id
+        """
+        if self._item_supplies is None:
+            self._item_supplies = OrderedDict()
+
+            rows = ItemSupply.objects.filter(item__room__project=self.project) \
+                                     .values('item_id', 'item__room_id', 'supply_id', 'supply__description',
+                                             'supply__units', 'quantity') \
+                                     .order_by('item_id', 'id')
+
+            for row in rows:
+                self._item_supplies.setdefault(row['item_id'], []).append({'room_id': row['item__room_id'],
+                                                                           'supply_id': row['supply_id'],
+                                                                           'description': row['supply__description'],
+                                                                           'units': row['supply__units'],
+                                                                           'quantity': Decimal(row['quantity'] or 0)})
+
+        return self._item_supplies
+
+    def _load_unit_costs(self):
+        """
+        Returns the unit cost of every supply of the project, from the
+        most expensive product of each supply
+        """
+        if self._unit_costs is None:
+            units = {}
+            for item_rows in self._load_item_supplies().values():
+                units.update((row['supply_id'], row['units']) for row in item_rows)
+
+            self._unit_costs = {}
+
+            products = Product.objects.filter(supply_id__in=units.keys()) \
+                                      .values_list('supply_id', 'cost', 'purchasing_units',
+                                                   'quantity_per_purchasing_unit') \
+                                      .order_by('supply_id', '-cost', 'id')
+
+            for supply_id, cost, purchasing_units, quantity_per_unit in products:
+                if supply_id in self._unit_costs:
+                    continue
+
+                unit_cost = cost or Decimal('0')
+                if quantity_per_unit and (units[supply_id] or u'').lower() != (purchasing_units or u'').lower():
+                    unit_cost = unit_cost / quantity_per_unit
+
+                self._unit_costs[supply_id] = unit_cost
+
+        return self._unit_costs
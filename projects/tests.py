@@ -17,11 +17,12 @@ from django.test import TestCase
 from tastypie.test import ResourceTestCase
 from rest_framework.test import APITestCase
 
-from contacts.models import Customer
-from supplies.models import Supply
+from contacts.models import Customer, Supplier
+from supplies.models import Supply, Product as SupplyProduct
 from products.models import Product, Model, Configuration, Upholstery
 from projects.models import Project, Room, Item, ProjectSupply, ItemSupply
 from media.models import S3Object
+from projects.costing import ProjectCosts
 
 
 logger = logging.getLogger(__name__)
@@ -373,15 +374,61 @@ class ItemResourceTestCase(APITestCase):
         
         #Test database resource
         self.assertEqual(self.item.supplies.all().count(), 0)
-        
-        
 
 
+class ProjectCostsTestCase(TestCase):
+
+    def setUp(self):
+        """
+        Set up a project with two rooms that share a supply
+        """
+        self.project = Project.objects.create(codename="Ladawan")
+        self.bedroom = Room.objects.create(project=self.project, description="Bedroom", reference="B-01")
+        self.lounge = Room.objects.create(project=self.project, description="Lounge", reference="L-01")
+
+        supplier = Supplier.objects.create(name="Hafele")
+        self.hinge = Supply.objects.create(description="Hinge", units="pc")
+        self.board = Supply.objects.create(description="Board", units="m")
+        SupplyProduct.objects.create(supply=self.hinge, supplier=supplier, cost=Decimal('10'), purchasing_units='pc')
+        SupplyProduct.objects.create(supply=self.hinge, supplier=supplier, cost=Decimal('12'), purchasing_units='pc')
+        SupplyProduct.objects.create(supply=self.board, supplier=supplier, cost=Decimal('100'),
+                                     purchasing_units='sheet', quantity_per_purchasing_unit=Decimal('4'))
 
+        self.cabinet = Item.objects.create(room=self.bedroom, description="Cabinet")
+        self.shelf = Item.objects.create(room=self.lounge, description="Shelf")
+        ItemSupply.objects.create(item=self.cabinet, supply=self.hinge, quantity=4)
+        ItemSupply.objects.create(item=self.cabinet, supply=self.board, quantity=2)
+        ItemSupply.objects.create(item=self.shelf, supply=self.hinge, quantity=2)
 
+    def test_rollups(self):
+        """
+        Test the costs of the items, rooms and project
+        """
+        costs = ProjectCosts(self.project)
 
+        self.assertEqual(costs.get_unit_cost(self.hinge.id), Decimal('12'))
+        self.assertEqual(costs.get_unit_cost(self.board.id), Decimal('25'))
 
+        cabinet = costs.get_item_supplies(self.cabinet)
+        self.assertEqual([(s['description'], s['total']) for s in cabinet], [("Hinge", 48), ("Board", 50)])
+        self.assertEqual(costs.get_total(cabinet), Decimal('98'))
 
+        lounge = costs.get_supplies(self.lounge)
+        self.assertEqual([(s['supply_id'], s['quantity']) for s in lounge], [(self.hinge.id, 2)])
 
+        project = costs.get_supplies(multiplier=3)
+        self.assertEqual([(s['supply_id'], s['quantity']) for s in project], [(self.hinge.id, 18), (self.board.id, 6)])
+        self.assertEqual(costs.get_total(project), Decimal('366'))
 
+    def test_queries(self):
+        """
+        Test that the number of queries does not grow with the rooms
+        """
+        costs = ProjectCosts(self.project)
 
+        with self.assertNumQueries(5):
+            for room in costs.rooms:
+                for item in costs.get_items(room):
+                    list(item.parts.all())
+                    costs.get_item_supplies(item)
+                costs.get_supplies(room)
@@ -5,7 +5,6 @@ import dateutil.parser
 import math
 import logging
 from decimal import *
-import httplib2
 
 from pytz import timezone
 from datetime import datetime
@@ -17,14 +16,14 @@ from boto.s3.key import Key
 import boto.ses
 #from oauth2client.contrib.django_orm import Storage
 from oauth2client.contrib import gce
-from apiclient import discovery
 
 from contacts.models import Customer
 from products.models import Product, Upholstery
 from projects.models import Project, Room, Phase
 from receipts.PDF import ReceiptPDF
 from media.models import Log, S3Object
-from administrator.models import Company, CredentialsModel, Log as BaseLog
+from administrator.models import Company, Log as BaseLog
+from administrator import tasks as calendar_tasks
 from trcloud.models import TRSalesOrder, TRContact
 from acknowledgements.models import Acknowledgement, Item as AckItem
 from invoices.models import Invoice, Item as InvItem
@@ -55,7 +54,7 @@ class Receipt(models.Model):
     calendar_event_id = models.TextField(null=True)
     
     current_user = None 
-    calendar_service = None
+    calendar_name = 'receipts'
 
     # VATs
     vat = models.IntegerField(default=0)
@@ -288,76 +287,18 @@ class Receipt(models.Model):
         }
 
     
-    def _get_calendar_service(self, user):
-        if self.calendar_service:
-            self.calendar_service
-        else:
-            
-            storage = Storage(CredentialsModel, 'id', user, 'credential')
-            credentials = storage.get()
-        
-            http = credentials.authorize(httplib2.Http())
-            self.calendar_service = discovery.build('calendar', 'v3', http=http)
-            
-        return self.calendar_service
-        
-    def _get_calendar(self, user):
-        service = self._get_calendar_service(user)
-        response = service.calendarList().list().execute()
-        
-        calendar_summaries = [cal['summary'].lower() for cal in response['items']]
-    
-        # Check if user does not already has account payables
-        if 'receipts' not in calendar_summaries:
-            # Get calendar
-            cal_id = 'dellarobbiathailand.com_vl7drjcuulloicm0qlupgsr4ko@group.calendar.google.com'
-            calendar = service.calendars().get(calendarId=cal_id).execute()
-     
-            # Add calendar to user's calendarList
-            service.calendarList().insert(body={
-                'id': calendar['id']
-            }).execute()
-            
-        else:
-            # Get calendar is already in calendarList
-            for cal in response['items']:
-                if cal['summary'].lower() == 'receipts':
-                    calendar = cal
-            
-        return calendar
-        
     def create_calendar_event(self, user):
-        """Create a calendar event for the expected delivery date
+        """Queue the creation of the calendar event for the paid date
         
         """
-        service = self._get_calendar_service(user)
-        calendar = self._get_calendar(user)
-        
-        response = service.events().insert(calendarId=calendar['id'], 
-                                           body=self._get_event_body()).execute()
-        self.calendar_event_id = response['id']
-        self.save()
+        return calendar_tasks.queue_calendar_event(self, user)
         
     def update_calendar_event(self, user=None):
-        """Create a calendar event for the expected delivery date
+        """Queue an update of the calendar event for the paid date
         
         """
-        if user is None:
-            user = self.current_user or self.employee
+        return calendar_tasks.queue_calendar_event(self, user)
         
-        if self.calendar_event_id:
-            
-            service = self._get_calendar_service(user)
-            calendar = self._get_calendar(user)
-        
-            resp = service.events().update(calendarId=calendar['id'], 
-                                           eventId=self.calendar_event_id, 
-                                           body=self._get_event_body()).execute()
-                                          
-        else:
-            
-            self.create_calendar_event(user)
-                                                                       
     def _get_event_body(self):
         evt = {
             'summary': "Ack {0}".format(self.id),
@@ -20,6 +20,7 @@ import boto.ses
 from django.db.models import Avg, Max, Sum
 
 from supplies.models import Supply, Log
+from supplies import replenishment
 
 
 class SupplyEmail(object):
@@ -73,7 +74,7 @@ class SupplyEmail(object):
                               {buying_guide}
                           </div>
                        """.format(log=self._create_log_section(self.logs),
-                                  buying_guide=self._create_buy_section(self.queryset),
+                                  buying_guide=self._create_buy_section(replenishment.shopping_list()),
                                   section_style=self.section_style)
     
     def get_message(self):
@@ -131,12 +132,8 @@ class SupplyEmail(object):
     def _create_buy_section(self, supplies):
         """
         Creates a buying guide for the supplies
-        who's quantities have changed recently
+        that are below their reorder points
         """
-        #Filter to supplies that have reduced quantities down
-        supplies = supplies.filter(log__timestamp__range=[self.start_date, self.end_date], 
-                                   log__action='SUBTRACT')
-        
         table = "<table cellpadding='0' cellspacing='0' style='width:100%;'>"
         table += """<thead>
                         <tr>
@@ -153,45 +150,30 @@ class SupplyEmail(object):
                         <th style="{cell_style}border-left:1px solid #595959;">Description</th>
                         <th style="{cell_style}">Current Quantity</th>
                         <th style="{cell_style}">Average/Day</th>
-                        <th style="{cell_style}">Max/Day</th>
-                        <th style="{cell_style}">Total/Week</th>
+                        <th style="{cell_style}">Reorder Point</th>
+                        <th style="{cell_style}">To Buy</th>
                         </tr>
                     </thead>
                  """.format(heading="Purchasing Guide",
                             cell_style=self.header_cell_style)
         for supply in supplies:
-            stats = self._get_stats(supply)
+            stats = supply.consumption
             table += """<tr>
                             <td style="{cell_style}border-left:1px solid #595959;">{description}</td>
                             <td style="{cell_style}">{quantity}</td>
                             <td style="{cell_style}">{avg_quantity}</td>
-                            <td style="{cell_style}">{max_quantity}</td>
-                            <td style="{cell_style}">{total}</td>
+                            <td style="{cell_style}">{reorder_point}</td>
+                            <td style="{cell_style}">{to_buy}</td>
                         </tr>
                      """.format(description=supply.description,
                                 quantity=supply.quantity,
-                                avg_quantity=ceil(stats['avg']),
-                                max_quantity=stats['max'],
-                                total=stats['sum'],
+                                avg_quantity=ceil(stats.daily_rate),
+                                reorder_point=stats.reorder_point,
+                                to_buy=supply.to_buy,
                                 cell_style=self.cell_style)
         
         table += "</table>"
-        return table         
-        
-    def _get_stats(self, supply):
-        pre_aggregate = supply.log_set.filter(timestamp__range=[self.start_date, self.end_date], action='SUBTRACT')
-        
-        if len(pre_aggregate) == 0:
-            return False
-        
-        max = pre_aggregate.aggregate(Max('quantity'))['quantity__max']
-        sum = pre_aggregate.aggregate(Sum('quantity'))['quantity__sum']
-        print supply.description, max, sum, pre_aggregate
-
-        avg = sum/7
-        return {'sum': sum,
-                'max': max,
-                'avg': avg}
+        return table
             
 if __name__ == "__main__":
     email = SupplyEmail()
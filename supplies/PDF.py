@@ -19,6 +19,7 @@ from reportlab.graphics.barcode import code39
 from reportlab.graphics.barcode import code128
 
 from supplies.models import Supply, Product
+from supplies import replenishment
 
 logger = logging.getLogger(__name__)
 pdfmetrics.registerFont(TTFont('Tahoma', settings.FONT_ROOT + 'Tahoma.ttf'))
@@ -164,10 +165,6 @@ class PropsPDF(object):
 #this.close(SaveOptions.DONOTSAVECHANGES);)>>"""
 
 class SupplyPDF():
-    name_map = {'id': 'id',
-                'description': 'description',
-                'quantity': 'quantity',
-                'to_buy': 'to_buy'}
     supplies = None
     layout_style = [('GRID', (0, 0), (-1,-1), 1, colors.CMYKColor(black=60)),
                     ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
@@ -198,21 +195,7 @@ class SupplyPDF():
     
     def __init__(self, *args, **kwargs):
         self.filename = kwargs['filename']
-        self.supplies = Supply.objects.raw("""WITH weekly_average as (
-                        SELECT s.id as id, sum(sl.quantity) as week_total
-                        FROM supplies_log as sl
-                        INNER JOIN supplies_supply as s
-                        ON s.id = sl.supply_id
-                        GROUP BY s.id, sl.action, date_trunc('week', log_timestamp)
-                        HAVING (date_trunc('week', log_timestamp) > NOW() - interval '4 weeks'
-                        AND sl.action = 'SUBTRACT'))
-                        SELECT s.id, s.description, s.quantity, 
-                        (SELECT round(avg(week_total), 2) FROM weekly_average WHERE id = s.id) as to_buy
-                        FROM supplies_supply as s
-                        WHERE (id in (SELECT id from weekly_average WHERE id = s.id)
-                        OR id in (SELECT supply_id FROM supplies_log))
-                        AND s.quantity < ((SELECT avg(week_total) FROM weekly_average WHERE id = s.id) * 2)
-                        ORDER BY s.description""", translations=self.name_map)
+        self.supplies = replenishment.shopping_list()
 
     def create(self):
         doc = SimpleDocTemplate(self.filename, 
@@ -259,7 +242,7 @@ class SupplyPDF():
     def _create_suppliers_table(self, supply, quantity):
         data = []
         best = ()
-        for index, product in enumerate(Product.objects.filter(supply=supply)):
+        for index, product in enumerate(supply.products.all()):
             unit_cost = self._get_unit_cost(product)
             
             if best == ():
@@ -272,11 +255,15 @@ class SupplyPDF():
                          product.purchasing_units,
                          self._get_total_str(supply, product, quantity)])
         
+        if len(data) == 0:
+            data = [['NA', 'NA', 'NA', 'NA']]
+
         table = Table(data, colWidths=(180, 55, 55, 115))
         
         #Append style for best price
         style = deepcopy(self.details_style)
-        style.append(('FONTNAME', (0,best[1]), (-1,best[1]), 'Helvetica-Bold'))
+        if best:
+            style.append(('FONTNAME', (0,best[1]), (-1,best[1]), 'Helvetica-Bold'))
         table.setStyle(TableStyle(style))
         
         #calculate total
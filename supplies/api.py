@@ -8,6 +8,7 @@ import logging
 import json
 import re
 
+from django.db import transaction
 from django.db.models import Q
 from django.conf.urls import url
 from tastypie import fields
@@ -17,6 +18,8 @@ from tastypie.exceptions import Unauthorized
 from tastypie.constants import ALL, ALL_WITH_RELATIONS
 
 from supplies.models import Supply, Fabric, Product, Log, Reservation
+from supplies import stock
+from supplies import replenishment
 from contacts.models import Supplier
 from supplies.validation import SupplyValidation, FabricValidation
 from utilities.http import save_upload
@@ -113,27 +116,13 @@ class SupplyResource(ModelResource):
         except KeyError as e:
             logger.warn(e)
             
-        #Adds the quantity
-        try:
-            logger.debug("{0} : {1}".format(bundle.obj.quantity, bundle.data['quantity']))
-            logger.debug(bundle.obj.id)
-            logger.debug(bool(Decimal(str(bundle.obj.quantity)) != Decimal(bundle.data['quantity']) and bundle.obj.quantity != None))
-            if Decimal(str(bundle.obj.quantity)) != Decimal(bundle.data['quantity']) and bundle.obj.quantity != None:
-                action = "ADD" if float(bundle.data['quantity']) > bundle.obj.quantity else "SUBTRACT"
-                diff = abs(Decimal(str(bundle.obj.quantity)) - Decimal(bundle.data['quantity']))
-                bundle.obj.quantity = float(bundle.data['quantity'])
-                log = Log(supply=bundle.obj,
-                          action=action,
-                          quantity=diff,
-                          message=u"{0}ed {1}{2} {3} {4}".format(action.capitalize(),
-                                                               diff,
-                                                               bundle.obj.units,
-                                                               "to" if action == "ADD" else "from",
-                                                               bundle.obj.description))
-                log.save()
-                        
-        except KeyError:
-            pass
+        #Adds the quantity. The quantity of an existing supply is changed
+        #by a stock movement in obj_update, so that stock moved while the
+        #supply was being edited is not overwritten
+        if bundle.obj.pk:
+            bundle.obj._save_quantity = False
+        elif 'quantity' in bundle.data:
+            bundle.obj.quantity = float(bundle.data['quantity'])
             
         #Adds the image
         if "image" in bundle.data:
@@ -150,49 +139,6 @@ class SupplyResource(ModelResource):
             except S3Object.DoesNotExist:
                 raise
         
-        """
-        #Change the quantity
-        if "quantity" in bundle.data and bundle.obj.pk:
-            #Equalize the 2 quantities so that
-            #they are easier to work with and compare
-            client_quantity = float(bundle.data['quantity'])
-            server_quantity = float(bundle.obj.quantity)
-            difference = abs(client_quantity - server_quantity)
-
-            #Get the description
-            description = bundle.obj.description
-            purchasing_units = bundle.obj.purchasing_units
-            
-            #Checks if quantity is added
-            if client_quantity > server_quantity:
-                if bundle.request.user.has_perm('supplies.add_quantity'):
-                    bundle.obj.quantity = client_quantity
-                    logger.info("Added {0}{1} to {2} inventory".format(difference,
-                                                                       purchasing_units,
-                                                                       description))
-                else:
-                    bundle.data['quantity'] = server_quantity
-                    bundle.data['quantity'] = server_quantity
-                    warning = "{0} is not authorized to add to the quantity of Fabric {1}".format(bundle.request.user.username,
-                                                                                                  bundle.obj.description)
-                    logger.warn(warning)
-                    #raise Unauthorized("User does not have authorization to add to inventory.")
-                
-            #Checks if quantity was subtracted
-            elif client_quantity < server_quantity:
-                if bundle.request.user.has_perm('supplies.subtract_quantity'):
-                    bundle.obj.quantity = client_quantity
-                    logger.info("Subtracted {0}{1} from {2} inventory".format(difference,
-                                                                       purchasing_units,
-                                                                       description))
-                else:
-                    bundle.data['quantity'] = server_quantity
-                    warning = "{0} is not authorized to subtract from the quantity of Fabric {1}".format(bundle.request.user.username,
-                                                                                                         bundle.obj.description)
-                    logger.warn(warning)
-                    #raise Unauthorized("User does not have authorization to subtract from inventory.")
-        """
-        
         return bundle
     
     def dehydrate(self, bundle):
@@ -226,7 +172,7 @@ class SupplyResource(ModelResource):
                                            'document.dellarobbiathailand.com', 
                                            encrypt_key=True)
                 bundle.obj.sticker = stickers
-                bundle.obj.save()
+                bundle.obj.save(update_fields=['sticker'])
                 
             bundle.data['sticker'] = {'url':bundle.obj.sticker.generate_url()}
         #If getting a list
@@ -312,7 +258,28 @@ class SupplyResource(ModelResource):
             except KeyError:
                 raise
 
-        bundle = super(SupplyResource, self).obj_update(bundle, **kwargs)
+        with transaction.atomic():
+            bundle = super(SupplyResource, self).obj_update(bundle, **kwargs)
+
+            if 'quantity' in bundle.data:
+                obj = bundle.obj
+
+                def create_log(difference):
+                    action = "ADD" if difference > 0 else "SUBTRACT"
+                    log = Log(supply=obj,
+                              action=action,
+                              quantity=abs(difference),
+                              message=u"{0}ed {1}{2} {3} {4}".format(action.capitalize(),
+                                                                   abs(difference),
+                                                                   obj.units,
+                                                                   "to" if action == "ADD" else "from",
+                                                                   obj.description))
+                    log.save()
+                    return log
+
+                stock.adjust(obj, round(float(bundle.data['quantity']), 2), country=obj.country,
+                             create_log=create_log)
+                obj.refresh_from_db(fields=['quantity_th', 'quantity_kh'])
 
         for supplier_data in suppliers:
             supplier = Supplier.objects.get(pk=supplier_data['id'])
@@ -400,18 +367,22 @@ class SupplyResource(ModelResource):
         """
   
         obj = self._meta.queryset.get(pk=kwargs['pk'])
-        if request.GET.has_key('country'):
-            obj.country = request.GET.get('country')
+        country = request.GET.get('country')
         quantity = request.REQUEST.get('quantity')
-        obj.quantity = round(float(obj.quantity) + float(quantity), 2)
-        obj.save()
-        
-        #log the event
-        log = Log(supply=obj,
-                  message="Added {0}{1} of {2}".format(quantity, obj.units, obj.description),
-                  action="ADD",
-                  quantity=quantity)
-        log.save()
+
+        with transaction.atomic():
+            #log the event
+            log = Log(supply=obj,
+                      message="Added {0}{1} of {2}".format(quantity, obj.units, obj.description),
+                      action="ADD",
+                      quantity=quantity)
+            log.save()
+
+            stock.move(obj, round(float(quantity), 2), 'ADD', country=country, log=log)
+
+        obj.refresh_from_db()
+        if country:
+            obj.country = country
         
         #Prepare a dictionary of the resource
         data = {'quantity': obj.quantity}
@@ -434,18 +405,22 @@ class SupplyResource(ModelResource):
         
        
         obj = self._meta.queryset.get(pk=kwargs['pk'])
-        if request.GET.has_key('country'):
-            obj.country = request.GET.get('country')
+        country = request.GET.get('country')
         quantity = request.REQUEST.get('quantity')
-        obj.quantity = round(float(obj.quantity) - float(quantity), 2)
-        obj.save()
-        
-        #log the event
-        log = Log(supply=obj,
-                  message="Subtracted {0}{1} of {2}".format(quantity, obj.units, obj.description),
-                  action="SUBTRACT",
-                  quantity=quantity)
-        log.save()
+
+        with transaction.atomic():
+            #log the event
+            log = Log(supply=obj,
+                      message="Subtracted {0}{1} of {2}".format(quantity, obj.units, obj.description),
+                      action="SUBTRACT",
+                      quantity=quantity)
+            log.save()
+
+            stock.move(obj, -round(float(quantity), 2), 'SUBTRACT', country=country, log=log)
+
+        obj.refresh_from_db()
+        if country:
+            obj.country = country
         
         data = {'quantity': obj.quantity}
         for key in obj.__dict__:
@@ -480,30 +455,10 @@ class SupplyResource(ModelResource):
         """
         Creates a shopping list of items needed
         """
-        name_map = {'id': 'id',
-                    'description': 'description',
-                    'quantity': 'quantity',
-                    'to_buy': 'to_buy'}
-        supplies = Supply.objects.raw("""WITH weekly_average as (
-                        SELECT s.id as id, sum(sl.quantity) as week_total
-                        FROM supplies_log as sl
-                        INNER JOIN supplies_supply as s
-                        ON s.id = sl.supply_id
-                        GROUP BY s.id, sl.action, date_trunc('week', log_timestamp)
-                        HAVING (date_trunc('week', log_timestamp) > NOW() - interval '4 weeks'
-                        AND sl.action = 'SUBTRACT'))
-                        SELECT s.id, s.description, s.quantity, 
-                        (SELECT round(avg(week_total), 2) FROM weekly_average WHERE id = s.id) as to_buy
-                        FROM supplies_supply as s
-                        WHERE (id in (SELECT id from weekly_average WHERE id = s.id)
-                        OR id in (SELECT supply_id FROM supplies_log))
-                        AND s.quantity < (SELECT avg(week_total) FROM weekly_average WHERE id = s.id)
-                        ORDER BY s.description""", translations=name_map)
-                        
-        data = [{'id':s.id, 
+        data = [{'id': s.id,
                  'description': s.description,
-                 'quantity':s.quantity, 
-                 'quantity_to_buy':s.to_buy} for s in supplies]
+                 'quantity': s.quantity,
+                 'quantity_to_buy': s.to_buy} for s in replenishment.shopping_list()]
         return self.create_response(request, data)
         
     def dehydrate_log(self, log):
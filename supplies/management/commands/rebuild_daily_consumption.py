@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Recreates the daily consumption totals and the rolling statistics from
+the supply logs, e.g. when the statistics are first set up or after
+logs have been corrected
+
+    python manage.py rebuild_daily_consumption
+    python manage.py rebuild_daily_consumption --since 2019-01-01
+"""
+import logging
+
+import dateutil.parser
+from django.core.management.base import BaseCommand, CommandError
+
+from supplies import tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily supply consumption from the supply logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', dest='since', default=None,
+                            help="Only rebuild the days from this date")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = dateutil.parser.parse(options['since']).date()
+            except ValueError as e:
+                raise CommandError(u"Unable to read the date {0}: {1}".format(options['since'], e))
+
+        count = tasks.rebuild_daily_consumption(since)
+
+        self.stdout.write(u"Rebuilt {0} daily consumption totals".format(count))
@@ -8,17 +8,20 @@ import logging
 
 from django.conf import settings
 from administrator.models import User
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.core.exceptions import MultipleObjectsReturned
 from django.shortcuts import get_object_or_404
+from django.utils import timezone as tz_utils
 from boto.s3.connection import S3Connection
 from boto.s3.key import Key
-import boto.ses
+from pytz import timezone
 
 from contacts.models import Contact, Supplier
 from hr.models import Employee
 from media.models import S3Object
 from media.stickers import StickerPage
+from utilities import search
 
 
 logger = logging.getLogger(__name__)
@@ -61,9 +64,19 @@ class Supply(models.Model):
     admin_only = models.BooleanField(default=False)
     shelf = models.ForeignKey(Shelf, related_name='fabrics', null=True)
     status = models.TextField(null=True)
+    search_document = models.TextField(null=True, blank=True, editable=False)
     
     _check_quantity = False
 
+    # Set to False to save an existing supply without its quantities,
+    # which are only changed by supplies.stock
+    _save_quantity = True
+
+    # Values of the fields in the search document when the supply was
+    # loaded. The products are refreshed by Product.save
+    search_fields = ('description', 'description_th', 'type', 'pattern', 'color')
+    _saved_search_values = None
+
     class Meta:
         permissions = (('view_supplier', 'Can view the Supplier'),
                        ('view_cost', 'Can view the cost per unit'),
@@ -254,61 +267,90 @@ class Supply(models.Model):
         return self.product
         
     def test_if_critically_low_quantity(self):
-        sql = """
-        WITH weekly_average as (
-            SELECT s.id as id, sum(sl.quantity) as week_total
-            FROM supplies_log as sl
-            INNER JOIN supplies_supply as s
-            ON s.id = sl.supply_id
-            GROUP BY s.id, sl.action, date_trunc('day', log_timestamp)
-            HAVING (date_trunc('day', log_timestamp) > NOW() - interval '4 weeks'
-            AND sl.action = 'SUBTRACT'))
-        SELECT id, description, quantity
-        FROM supplies_supply as s
-        WHERE id in (SELECT id from weekly_average WHERE id = s.id)
-        AND s.quantity < (SELECT avg(week_total) FROM weekly_average WHERE id = s.id)
-        AND {0} = s.id;
+        """
+        Returns True if the quantity is lower than the average daily
+        consumption over the last 4 weeks
         """
         try:
-            s = Supply.objects.raw(sql.format(self.id))[0]
-            return True
-        except IndexError:
+            return self.consumption.is_low(self.quantity)
+        except ConsumptionStats.DoesNotExist:
             return False
-    
-    def email_critically_low_quantity(self):
-        """Emails when a material has become critically low"""
-        conn = boto.ses.connect_to_region('us-east-1')
-        img_src = self.image.generate_url(time=3600) if self.image else "" 
-        body = u"{0} has a critically low stock of {1}{2} as of {3} <br /> <img src='{4}' />"
-        body = body.format(self.description,
-                           self.quantity, 
-                           self.units,
-                           datetime.now().strftime('%B %d, %Y'),
-                           img_src)
-        conn.send_email('no-replay@dellarobbiathailand.com',
-                        '{0} Critically Low'.format(self.description),
-                        body,
-                        'charliep@dellarobbiathailand.com',
-                        format='html')
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Supply, cls).from_db(db, field_names, values)
+        instance._saved_search_values = instance._get_search_fields()
+
+        return instance
+
+    def _get_search_fields(self):
+        # Deferred fields are not loaded
+        return tuple(self.__dict__.get(name) for name in self.search_fields)
+
+    def get_search_values(self):
+        """
+        Returns the description, supplier names and references of the
+        supply, and the pattern and color if it is a fabric
+        """
+        values = [self.description, self.description_th, self.type]
+
+        if isinstance(self, Fabric):
+            fabric = self
+        else:
+            fabric = getattr(self, 'fabric', None) if self.pk else None
+
+        if fabric is not None:
+            values += [fabric.pattern, fabric.color]
+
+        if self.pk:
+            products = self.products.all()
+            if 'products' not in getattr(self, '_prefetched_objects_cache', {}):
+                products = products.select_related('supplier')
+
+            for product in products:
+                values += [product.reference, product.supplier.name, product.supplier.name_th]
+
+        return values
+
+    def get_detail_fields(self):
+        """
+        Returns the names of the fields that are saved when the
+        quantities are left out
+        """
+        return [f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('quantity_th', 'quantity_kh')]
+
     def save(self, *args, **kwargs):
         """
         Custom Save Method
-        
-        Tests if the quantity needs to be check for being 
-        critically low.
+
+        Tests if the quantity needs to be check for being
+        critically low. Supplies that become critically low are
+        included in the next low stock digest
+
+        The search document is only rebuilt for new supplies and when
+        the description, type, pattern or color changed
         """
-        try:
-            if self._check_quantity:
-                if self.test_if_critically_low_quantity():
-                    self.email_critically_low_quantity()
-                self._check_quantity = False
-        except Exception:
-            pass
-            
+        search_values = self._get_search_fields()
+        if self.pk is None or search_values != self._saved_search_values:
+            self.search_document = search.document(self.get_search_values())
+
+        if not self._save_quantity and self.pk and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = self.get_detail_fields()
+
         super(Supply, self).save(*args, **kwargs)
-     
-     
+
+        self._saved_search_values = search_values
+
+        if self._check_quantity:
+            self._check_quantity = False
+
+            try:
+                ConsumptionStats.check(self)
+            except Exception as e:
+                logger.warn(e)
+
+
 class Product(models.Model):
     supplier = models.ForeignKey(Supplier, related_name="products")
     supply = models.ForeignKey(Supply, related_name='products')
@@ -326,6 +368,32 @@ class Product(models.Model):
         logger.debug(self.__dict__)
         logger.debug(self.cost)
 
+    _saved_search_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Product, cls).from_db(db, field_names, values)
+        instance._saved_search_values = (instance.__dict__.get('supplier_id'), instance.__dict__.get('reference'))
+
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        The supplier and reference are part of the supply's search
+        document and the lead time is part of its reorder point
+        """
+        search_values = (self.supplier_id, self.reference)
+
+        super(Product, self).save(*args, **kwargs)
+
+        if search_values != self._saved_search_values:
+            search.refresh(Supply.objects.filter(pk=self.supply_id).select_related('fabric')
+                                         .prefetch_related('products__supplier'))
+            self._saved_search_values = search_values
+
+        from supplies import replenishment
+        replenishment.refresh([self.supply_id])
+
 
 class Location(models.Model):
     """This Location class is used to track and location and in the future
@@ -367,6 +435,15 @@ class Log(models.Model):
     employee = models.ForeignKey(Employee, null=True)
     acknowledgement = models.ForeignKey('acknowledgements.Acknowledgement', null=True)
 
+    _saved_action = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Log, cls).from_db(db, field_names, values)
+        instance._saved_action = instance.action
+
+        return instance
+
     @classmethod
     def create(cls, supply, event, quantity, employee, acknowledgement_id=None, acknowledgement=None):
         supplyObj = cls()
@@ -386,6 +463,182 @@ class Log(models.Model):
 
         supplyObj.save()
 
+    def save(self, *args, **kwargs):
+        """
+        Adds the quantity to the consumption statistics of the supply
+        when the log becomes a subtraction
+        """
+        consumed = self.action == 'SUBTRACT' and self._saved_action != 'SUBTRACT'
+
+        super(Log, self).save(*args, **kwargs)
+
+        if consumed and self.quantity:
+            DailyConsumption.record(self)
+
+        self._saved_action = self.action
+
+
+class DailyConsumption(models.Model):
+    """
+    Total quantity of a supply subtracted on a day. The rows are kept
+    up to date as logs are saved
+    """
+    supply = models.ForeignKey(Supply, related_name='daily_consumption')
+    date = models.DateField(db_index=True)
+    quantity = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    # The days of the totals are the days in the factory
+    time_zone = timezone('Asia/Bangkok')
+
+    class Meta:
+        unique_together = ('supply', 'date')
+
+    @classmethod
+    def get_date(cls, timestamp):
+        return tz_utils.localtime(timestamp, cls.time_zone).date()
+
+    @classmethod
+    def record(cls, log):
+        """
+        Adds the quantity of a log to the day's total and to the
+        rolling totals of the supply
+        """
+        date = cls.get_date(log.timestamp)
+        new_day = False
+
+        with transaction.atomic():
+            updated = cls.objects.filter(supply_id=log.supply_id, date=date).update(quantity=F('quantity') + log.quantity)
+
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(supply_id=log.supply_id, date=date, quantity=log.quantity)
+                    new_day = True
+                except IntegrityError:
+                    cls.objects.filter(supply_id=log.supply_id, date=date).update(quantity=F('quantity') + log.quantity)
+
+            ConsumptionStats.add(log.supply_id, date, log.quantity, new_day)
+
+        from supplies import replenishment
+        replenishment.refresh([log.supply_id])
+
+
+class ConsumptionStats(models.Model):
+    """
+    Rolling consumption of a supply over the last 4 weeks
+
+    The totals are added to as logs are saved and are recalculated from
+    the daily consumption every night, when the oldest day drops out of
+    the window. 'alert_pending' is set when the supply becomes critically
+    low and cleared once it has been included in a digest.
+
+    The reorder point is the stock used during the lead time of the
+    supplier and the days until the shopping list is next reviewed. It is
+    kept up to date by supplies.replenishment.
+    """
+    window = 28
+    review_days = 7
+
+    supply = models.OneToOneField(Supply, related_name='consumption')
+    window_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    window_days = models.IntegerField(default=0)
+    last_consumed = models.DateField(null=True)
+    critically_low = models.BooleanField(default=False)
+    alert_pending = models.BooleanField(default=False)
+    lead_time = models.IntegerField(default=1)
+    reorder_point = models.DecimalField(max_digits=15, decimal_places=2, default=0, db_index=True)
+    order_quantity = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    @property
+    def daily_average(self):
+        """
+        Average consumption of the days the supply was used
+        """
+        if not self.window_days:
+            return Decimal('0')
+
+        return self.window_total / self.window_days
+
+    @property
+    def weekly_average(self):
+        return self.window_total / (self.window / 7)
+
+    @property
+    def daily_rate(self):
+        """
+        Average consumption per calendar day
+        """
+        return self.window_total / self.window
+
+    def quantity_to_buy(self, quantity):
+        """
+        Returns the quantity to buy to last until the order after next
+        arrives
+        """
+        to_buy = self.reorder_point + self.order_quantity - Decimal(str(quantity))
+
+        return max(to_buy, Decimal('0')).quantize(Decimal('0.01'))
+
+    def is_low(self, quantity):
+        return self.window_days > 0 and Decimal(str(quantity)) < self.daily_average
+
+    @classmethod
+    def add(cls, supply_id, date, quantity, new_day=False):
+        updated = cls.objects.filter(supply_id=supply_id).update(window_total=F('window_total') + quantity,
+                                                                 window_days=F('window_days') + (1 if new_day else 0),
+                                                                 last_consumed=date)
+        if not updated:
+            cls.objects.create(supply_id=supply_id,
+                               window_total=quantity,
+                               window_days=1,
+                               last_consumed=date)
+
+    @classmethod
+    def check(cls, supply):
+        """
+        Marks the supply as critically low, or no longer low, from its
+        current quantity. Returns True if the supply is critically low
+        """
+        try:
+            stats = cls.objects.get(supply_id=supply.pk)
+        except cls.DoesNotExist:
+            return False
+
+        low = stats.is_low(supply.quantity)
+        if low != stats.critically_low:
+            cls.objects.filter(pk=stats.pk).update(critically_low=low, alert_pending=low)
+
+        return low
+
+
+class StockMovement(models.Model):
+    """
+    Append only record of a change to the quantity of a supply
+
+    'quantity' is positive for stock that is added and negative for stock
+    that is taken out, and 'balance' is the quantity of the supply after
+    the movement. The quantities of the supplies are only changed by
+    supplies.stock, which adds the movements in the same transaction
+    """
+    supply = models.ForeignKey(Supply, related_name='stock_movements', on_delete=models.PROTECT)
+    country = models.CharField(max_length=2, default='TH')
+    quantity = models.DecimalField(max_digits=15, decimal_places=2)
+    balance = models.DecimalField(max_digits=15, decimal_places=2, null=True)
+    reason = models.TextField()
+    reference = models.TextField(null=True, blank=True)
+    log = models.ForeignKey(Log, null=True, related_name='stock_movements', on_delete=models.SET_NULL)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Stock movements can not be changed")
+
+        super(StockMovement, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Stock movements can not be deleted")
+
 
 class Fabric(Supply):
     pattern = models.TextField()
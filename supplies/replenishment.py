@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Replenishment of supplies
+
+Every supply that has been used in the last 4 weeks has a reorder point
+in its consumption statistics: the stock that will be used during the
+lead time of its cheapest supplier plus the days until the shopping list
+is next reviewed. A supply is on the shopping list once its quantity is
+below the reorder point, and enough is bought to last until the order
+after next would arrive.
+
+The reorder points are refreshed for a supply when its consumption or
+its products change, and for all supplies every night. The shopping
+list, the shopping list pdf and the supply emails all read the stored
+reorder points instead of recalculating the consumption from the logs.
+"""
+import logging
+from decimal import Decimal
+
+from django.db.models import Case, When, Value, F, DecimalField, IntegerField
+
+from supplies.models import Supply, Product, ConsumptionStats
+
+
+logger = logging.getLogger(__name__)
+
+batch_size = 500
+
+
+def load_lead_times(supply_ids=None):
+    """
+    Returns the lead time in days of the cheapest product of each supply
+    """
+    products = Product.objects.all()
+    if supply_ids is not None:
+        products = products.filter(supply_id__in=supply_ids)
+
+    lead_times = {}
+    costs = {}
+    for supply_id, cost, quantity_per_unit, lead_time in products.values_list('supply_id', 'cost',
+                                                                               'quantity_per_purchasing_unit',
+                                                                               'lead_time') \
+                                                                  .order_by('supply_id', 'id'):
+        unit_cost = (cost or Decimal('0')) / (quantity_per_unit or Decimal('1'))
+        if supply_id not in costs or unit_cost < costs[supply_id]:
+            costs[supply_id] = unit_cost
+            lead_times[supply_id] = lead_time or 0
+
+    return lead_times
+
+
+def calculate(window_total, lead_time):
+    """
+    Returns the reorder point and the quantity used between reviews
+    """
+    daily_rate = Decimal(window_total or 0) / ConsumptionStats.window
+    reorder_point = daily_rate * (lead_time + ConsumptionStats.review_days)
+    order_quantity = daily_rate * ConsumptionStats.review_days
+
+    return reorder_point.quantize(Decimal('0.01')), order_quantity.quantize(Decimal('0.01'))
+
+
+def refresh(supply_ids=None):
+    """
+    Sets the lead times and reorder points of the supplies, or of all
+    supplies with consumption statistics. Returns the number of supplies
+    updated
+    """
+    stats = ConsumptionStats.objects.all()
+    if supply_ids is not None:
+        stats = stats.filter(supply_id__in=supply_ids)
+
+    rows = list(stats.values_list('supply_id', 'window_total').order_by('supply_id'))
+    if not rows:
+        return 0
+
+    lead_times = load_lead_times([supply_id for supply_id, total in rows] if supply_ids is not None else None)
+
+    for index in xrange(0, len(rows), batch_size):
+        _update(rows[index:index + batch_size], lead_times)
+
+    return len(rows)
+
+
+def shopping_list():
+    """
+    Returns the supplies whose quantity is below their reorder point with
+    the quantity to buy set as 'to_buy'
+    """
+    supplies = Supply.objects.filter(deleted=False,
+                                     consumption__reorder_point__gt=0,
+                                     quantity_th__lt=F('consumption__reorder_point')) \
+                             .select_related('consumption') \
+                             .prefetch_related('products__supplier') \
+                             .order_by('description')
+
+    supplies = list(supplies)
+    for supply in supplies:
+        supply.to_buy = supply.consumption.quantity_to_buy(supply.quantity)
+
+    return supplies
+
+
+def _update(rows, lead_times):
+    """
+    Sets the lead times and reorder points of a batch of supplies in one
+    query
+    """
+    lead_time_cases = []
+    reorder_point_cases = []
+    order_quantity_cases = []
+
+    for supply_id, window_total in rows:
+        lead_time = lead_times.get(supply_id, 1)
+        reorder_point, order_quantity = calculate(window_total, lead_time)
+
+        lead_time_cases.append(When(supply_id=supply_id, then=Value(lead_time)))
+        reorder_point_cases.append(When(supply_id=supply_id, then=Value(reorder_point)))
+        order_quantity_cases.append(When(supply_id=supply_id, then=Value(order_quantity)))
+
+    ConsumptionStats.objects.filter(supply_id__in=[row[0] for row in rows]) \
+                            .update(lead_time=Case(*lead_time_cases, output_field=IntegerField()),
+                                    reorder_point=Case(*reorder_point_cases, output_field=DecimalField()),
+                                    order_quantity=Case(*order_quantity_cases, output_field=DecimalField()))
@@ -4,10 +4,12 @@ from decimal import Decimal
 from datetime import datetime
 import logging
 
+from django.db import transaction
 from rest_framework import serializers
 
 from contacts.models import Supplier
 from supplies.models import Supply, Product, Fabric, Log
+from supplies import stock
 from hr.models import Employee
 from media.models import S3Object
 from acknowledgements.models import Acknowledgement
@@ -339,8 +341,7 @@ class SupplySerializer(serializers.ModelSerializer):
         # Extract other data that is part of the product info
         
 
-        old_quantity = instance.quantity
-        new_quantity = validated_data.get('quantity', instance.quantity)
+        new_quantity = validated_data.pop('quantity', None)
 
         # Associated data for the logs
         employee = validated_data.pop('employee', None)
@@ -354,11 +355,20 @@ class SupplySerializer(serializers.ModelSerializer):
             if product_serializer.is_valid(raise_exception=True):
                 product_serializer.save()
 
-        instance.save()
+        # The quantity is changed by a stock movement, so that stock moved
+        # while the supply was being edited is not overwritten
+        with transaction.atomic():
+            instance._save_quantity = False
+            instance.save()
+
+            if new_quantity is not None:
+                if Decimal(str(new_quantity)) < 0:
+                    raise ValueError('Quantity cannot be negative')
+
+                create_log = lambda difference: self._log_quantity(instance, difference, employee, acknowledgement)
+                stock.adjust(instance, new_quantity, country=getattr(instance, 'country', None), create_log=create_log)
 
-        assert instance.quantity == new_quantity
-        self._log_quantity(instance, old_quantity, new_quantity, employee, acknowledgement)
-        assert instance.quantity == new_quantity
+        instance.refresh_from_db(fields=['quantity_th', 'quantity_kh'])
 
         return instance
 
@@ -406,41 +416,29 @@ class SupplySerializer(serializers.ModelSerializer):
         else:
             return u''
 
-    def _log_quantity(self, obj, old_quantity, new_quantity, employee=None, acknowledgement=None):
+    def _log_quantity(self, obj, difference, employee=None, acknowledgement=None):
         """
-        Internal method to apply the new quantity to the obj and
-        create a log of the quantity change
+        Internal method to create a log of the quantity change
         """
-        new_quantity = Decimal(str(new_quantity))
-
-        #Type change to ensure that calculations are only between Decimals
-        old_quantity = Decimal(str(old_quantity))
-
-        if new_quantity < 0:
-            raise ValueError('Quantity cannot be negative')
-
-        if new_quantity != old_quantity:
-            if new_quantity > old_quantity:
-                action = 'ADD'
-                diff = new_quantity - old_quantity
-            elif new_quantity < old_quantity:
-                action = 'SUBTRACT'
-                diff = old_quantity - new_quantity
-
-            #Create log to track quantity changes
-            log = Log(supply=obj,
-                      action=action,
-                      quantity=diff,
-                      employee=employee,
-                      acknowledgement=acknowledgement,
-                      message=u"{0}ed {1}{2} {3} {4}".format(action.capitalize(),
-                                                             diff,
-                                                             obj.units,
-                                                             "to" if action == "ADD" else "from",
-                                                             obj.description))
-
-            #Save log
-            log.save()
+        action = 'ADD' if difference > 0 else 'SUBTRACT'
+        diff = abs(difference)
+
+        #Create log to track quantity changes
+        log = Log(supply=obj,
+                  action=action,
+                  quantity=diff,
+                  employee=employee,
+                  acknowledgement=acknowledgement,
+                  message=u"{0}ed {1}{2} {3} {4}".format(action.capitalize(),
+                                                         diff,
+                                                         obj.units,
+                                                         "to" if action == "ADD" else "from",
+                                                         obj.description))
+
+        #Save log
+        log.save()
+
+        return log
 
 
 class SupplyFieldSerializer(serializers.ModelSerializer):
@@ -530,25 +528,21 @@ class LogSerializer(serializers.ModelSerializer):
 
         #Determine if should update or not
         if action.lower() == 'cut':
-            old_qty = instance.supply.quantity
-            try:
-                instance.supply.quantity -= quantity
-            except TypeError:
-                instance.supply.quantity -= float(quantity)
-
-            assert instance.supply.quantity != old_qty, "The quantities are wrong: {0} : {1} : {2}".format(instance.supply.quantity, old_qty, quantity)
-
-            instance.supply.save()
-
-            #Adjust log
-            instance.action = "SUBTRACT"
-            instance.quantity = quantity
-            instance.timestamp = datetime.now()
-            instance.message = "{0}{1} of {2} cut for Ack #{3}".format(instance.quantity,
-                                                                       instance.supply.units,
-                                                                       instance.supply.description,
-                                                                       instance.acknowledgement_id)
-            instance.save()
+            with transaction.atomic():
+                #Adjust log
+                instance.action = "SUBTRACT"
+                instance.quantity = quantity
+                instance.timestamp = datetime.now()
+                instance.message = "{0}{1} of {2} cut for Ack #{3}".format(instance.quantity,
+                                                                           instance.supply.units,
+                                                                           instance.supply.description,
+                                                                           instance.acknowledgement_id)
+                instance.save()
+
+                stock.move(instance.supply, -quantity, 'CUT', log=instance,
+                           reference=u"acknowledgement:{0}".format(instance.acknowledgement_id))
+
+            instance.supply.refresh_from_db()
 
         elif action.lower() == 'cancel':
 
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Changes to the stock of supplies
+
+The quantity of a supply is never read, changed in Python and saved.
+Every change is added to the quantity in the database and recorded as
+an append only StockMovement in the same transaction, so that receiving
+and cutting the same supply at the same time can not overwrite each
+other's changes.
+
+    stock.move(supply, Decimal('-5'), 'SUBTRACT')
+
+A quantity that was counted, e.g. when a supply is edited, is recorded
+with adjust(), which moves the difference to the quantity in the
+database:
+
+    stock.adjust(supply, Decimal('12'))
+
+Many movements, e.g. the items of a purchase order, are applied at once
+with apply(), which locks the supplies, updates all of their quantities
+in one query and bulk creates the movements.
+"""
+import logging
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, When, Value, F, FloatField
+from django.utils import timezone
+
+from supplies.models import Supply, StockMovement, ConsumptionStats
+
+
+logger = logging.getLogger(__name__)
+
+batch_size = 500
+
+
+def get_quantity_field(country=None):
+    """
+    Returns the name of the field holding the quantity in the country
+    """
+    return 'quantity_{0}'.format((country or 'TH').lower())
+
+
+def move(supply, quantity, reason, country=None, reference=None, log=None):
+    """
+    Adds the quantity to the supply and returns the movement. A negative
+    quantity takes stock out
+    """
+    movement = StockMovement(supply_id=getattr(supply, 'pk', supply),
+                             country=(country or 'TH').upper(),
+                             quantity=Decimal(str(quantity)),
+                             reason=reason,
+                             reference=reference,
+                             log=log)
+
+    apply([movement])
+
+    return movement
+
+
+def adjust(supply, quantity, country=None, reference=None, create_log=None):
+    """
+    Sets the quantity of the supply to a counted quantity and returns the
+    movement, or None if the quantity has not changed. 'create_log' is
+    called with the difference and returns the Log of the movement
+    """
+    field = get_quantity_field(country)
+
+    with transaction.atomic():
+        current = Supply.objects.select_for_update() \
+                                .filter(pk=getattr(supply, 'pk', supply)) \
+                                .values_list(field, flat=True) \
+                                .get()
+
+        difference = Decimal(str(quantity)) - Decimal(str(current or 0))
+        if not difference:
+            return None
+
+        log = create_log(difference) if create_log else None
+
+        return move(supply, difference, 'ADJUST', country=country, reference=reference, log=log)
+
+
+def apply(movements):
+    """
+    Adds the quantities of the movements to their supplies and saves the
+    movements. The supplies are locked in order of their ids so that
+    concurrent calls can not deadlock
+    """
+    movements = [m for m in movements if m.quantity]
+    if not movements:
+        return []
+
+    deltas = OrderedDict()
+    for m in movements:
+        m.country = (m.country or 'TH').upper()
+        field = get_quantity_field(m.country)
+        deltas.setdefault(field, {})
+        deltas[field][m.supply_id] = deltas[field].get(m.supply_id, Decimal('0')) + m.quantity
+
+    supply_ids = sorted(set(m.supply_id for m in movements))
+    fields = list(deltas.keys())
+
+    with transaction.atomic():
+        locked = Supply.objects.select_for_update() \
+                               .filter(pk__in=supply_ids) \
+                               .order_by('pk') \
+                               .values_list('pk', *fields)
+        quantities = {row[0]: dict(zip(fields, row[1:])) for row in locked}
+
+        missing = set(supply_ids) - set(quantities)
+        if missing:
+            raise Supply.DoesNotExist(u"Supplies {0} do not exist".format(sorted(missing)))
+
+        changes = {field: F(field) + Case(*[When(pk=supply_id, then=Value(float(delta)))
+                                            for supply_id, delta in deltas[field].items()],
+                                          default=Value(0.0),
+                                          output_field=FloatField())
+                   for field in fields}
+        Supply.objects.filter(pk__in=supply_ids).update(last_modified=timezone.now(), **changes)
+
+        # Each movement records the quantity after it was applied
+        for m in movements:
+            balance = Decimal(str(quantities[m.supply_id][get_quantity_field(m.country)] or 0)) + m.quantity
+            quantities[m.supply_id][get_quantity_field(m.country)] = balance
+            m.balance = balance
+
+        StockMovement.objects.bulk_create(movements, batch_size=batch_size)
+
+    _check_critically_low(set(m.supply_id for m in movements if m.quantity < 0))
+
+    return movements
+
+
+def _check_critically_low(supply_ids):
+    """
+    Checks the supplies that stock was taken out of for being
+    critically low
+    """
+    if not supply_ids:
+        return
+
+    for supply in Supply.objects.filter(pk__in=supply_ids, consumption__isnull=False):
+        try:
+            ConsumptionStats.check(supply)
+        except Exception as e:
+            logger.warn(e)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background tasks for the supplies application
+
+The consumption statistics are added to as supply logs are saved. Every
+night the rolling 4 week totals are recalculated from the daily totals,
+so that days that have left the window are dropped, the reorder points
+are recalculated and all supplies are checked for critically low stock
+at once. Supplies that have become critically low are emailed in a
+single digest instead of one email per supply save.
+"""
+from __future__ import absolute_import
+
+import logging
+from datetime import datetime, timedelta
+
+import boto.ses
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Case, When, Value, Sum, Count, Max, F, DateField, DecimalField, IntegerField, ExpressionWrapper
+from django.db.models.functions import TruncDay
+from pytz import timezone
+
+from media.models import S3Object
+from supplies.models import Log, DailyConsumption, ConsumptionStats
+from supplies import replenishment
+
+
+logger = logging.getLogger(__name__)
+
+tz = timezone('Asia/Bangkok')
+batch_size = 500
+
+
+@shared_task
+def refresh_consumption(today=None):
+    """
+    Recalculates the rolling totals, the reorder points and the
+    critically low supplies
+    """
+    with transaction.atomic():
+        refresh_stats(today)
+        replenishment.refresh()
+        count = update_critically_low()
+
+    return count
+
+
+@shared_task
+def send_low_stock_digest():
+    """
+    Emails the supplies that became critically low since the last digest
+    """
+    stats = list(ConsumptionStats.objects.filter(alert_pending=True)
+                                         .select_related('supply', 'supply__image')
+                                         .order_by('supply__description'))
+    if not stats:
+        return 0
+
+    images = S3Object.generate_urls([s.supply.image for s in stats])
+
+    rows = []
+    for s in stats:
+        supply = s.supply
+        rows.append(u"<tr><td>{0}</td><td>{1}{2}</td><td>{3:.2f}{2}</td><td><img src='{4}' height='75' /></td></tr>".format(
+            supply.description,
+            supply.quantity,
+            supply.units,
+            s.daily_average,
+            images.get(supply.image_id, '')))
+
+    body = u"""<p>The following supplies are critically low as of {0}</p>
+    <table>
+    <tr><th>Supply</th><th>Quantity</th><th>Average daily use</th><th></th></tr>
+    {1}
+    </table>""".format(datetime.now(tz).strftime('%B %d, %Y'), u"".join(rows))
+
+    conn = boto.ses.connect_to_region('us-east-1')
+    conn.send_email('no-replay@dellarobbiathailand.com',
+                    u'{0} Supplies Critically Low'.format(len(stats)),
+                    body,
+                    'charliep@dellarobbiathailand.com',
+                    format='html')
+
+    ConsumptionStats.objects.filter(pk__in=[s.pk for s in stats]).update(alert_pending=False)
+
+    return len(stats)
+
+
+def refresh_stats(today=None):
+    """
+    Sets the rolling totals of every supply from the daily totals of the
+    last 4 weeks
+    """
+    today = today or datetime.now(tz).date()
+    start = today - timedelta(days=ConsumptionStats.window - 1)
+
+    totals = DailyConsumption.objects.filter(date__gte=start, date__lte=today) \
+                                     .values('supply_id') \
+                                     .annotate(total=Sum('quantity'), days=Count('id'), last=Max('date'))
+    totals = {row['supply_id']: row for row in totals}
+
+    ConsumptionStats.objects.exclude(supply_id__in=totals.keys()).update(window_total=0, window_days=0)
+
+    existing = set(ConsumptionStats.objects.filter(supply_id__in=totals.keys()).values_list('supply_id', flat=True))
+
+    ConsumptionStats.objects.bulk_create([ConsumptionStats(supply_id=supply_id,
+                                                           window_total=row['total'],
+                                                           window_days=row['days'],
+                                                           last_consumed=row['last'])
+                                          for supply_id, row in totals.items() if supply_id not in existing],
+                                         batch_size=batch_size)
+
+    rows = [totals[supply_id] for supply_id in sorted(existing)]
+    for index in xrange(0, len(rows), batch_size):
+        _update_totals(rows[index:index + batch_size])
+
+
+def update_critically_low():
+    """
+    Marks every supply whose quantity is below its average daily
+    consumption in one query, and unmarks the supplies that have been
+    restocked. Returns the number of newly critically low supplies
+    """
+    average = ExpressionWrapper(F('window_total') / F('window_days'), output_field=DecimalField())
+    low = ConsumptionStats.objects.filter(window_days__gt=0) \
+                                  .annotate(average=average) \
+                                  .filter(supply__quantity_th__lt=F('average')) \
+                                  .values('id')
+
+    ConsumptionStats.objects.filter(critically_low=True) \
+                            .exclude(pk__in=low) \
+                            .update(critically_low=False, alert_pending=False)
+
+    return ConsumptionStats.objects.filter(critically_low=False, pk__in=low) \
+                                   .update(critically_low=True, alert_pending=True)
+
+
+def rebuild_daily_consumption(since=None):
+    """
+    Recreates the daily totals from the supply logs, e.g. when the
+    statistics are first set up, and returns the number of daily totals.
+    Run with 'python manage.py rebuild_daily_consumption'
+    """
+    logs = Log.objects.filter(action='SUBTRACT', quantity__isnull=False)
+    if since:
+        logs = logs.filter(timestamp__gte=since)
+
+    # Logs are grouped by the day in the same time zone as when they are recorded
+    days = logs.annotate(day=TruncDay('timestamp', tzinfo=DailyConsumption.time_zone)) \
+               .values('supply_id', 'day') \
+               .annotate(total=Sum('quantity')) \
+               .order_by()
+
+    with transaction.atomic():
+        existing = DailyConsumption.objects.all()
+        if since:
+            existing = existing.filter(date__gte=since)
+        existing.delete()
+
+        created = DailyConsumption.objects.bulk_create((DailyConsumption(supply_id=row['supply_id'],
+                                                                         date=DailyConsumption.get_date(row['day']),
+                                                                         quantity=row['total'])
+                                                        for row in days.iterator()),
+                                                       batch_size=batch_size)
+
+        refresh_stats()
+        replenishment.refresh()
+
+    return len(created)
+
+
+def _update_totals(rows):
+    """
+    Sets the rolling totals of a batch of supplies in one query
+    """
+    totals = [When(supply_id=row['supply_id'], then=Value(row['total'])) for row in rows]
+    days = [When(supply_id=row['supply_id'], then=Value(row['days'])) for row in rows]
+    last = [When(supply_id=row['supply_id'], then=Value(row['last'])) for row in rows]
+
+    ConsumptionStats.objects.filter(supply_id__in=[row['supply_id'] for row in rows]) \
+                            .update(window_total=Case(*totals, output_field=DecimalField()),
+                                    window_days=Case(*days, output_field=IntegerField()),
+                                    last_consumed=Case(*last, output_field=DateField()))
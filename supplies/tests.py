@@ -5,17 +5,31 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 import copy
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 import logging
 import random
 import unittest
+from StringIO import StringIO
+
+from pytz import timezone
 
 from administrator.models import User
 from django.contrib.auth.models import Permission, ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 
+from administrator.metrics import QueryBudgetMixin
 from contacts.models import Supplier
-from supplies.models import Supply, Fabric, Foam, Log, Product
+from supplies.models import Supply, Fabric, Foam, Log, Product, DailyConsumption, ConsumptionStats, StockMovement
+from supplies import tasks as supply_tasks
+from supplies import stock
+from supplies import replenishment
+from media import labels
+from utilities import search
 from auth.models import S3Object
 from hr.models import Employee
 
@@ -71,7 +85,7 @@ def create_user(block_permissions=[]):
             user.user_permissions.add(p)
     return user
                 
-class SupplyAPITest(APITestCase):
+class SupplyAPITest(QueryBudgetMixin, APITestCase):
     def setUp(self):
         """
         Set up the view 
@@ -123,14 +137,45 @@ class SupplyAPITest(APITestCase):
         """
         
         #Testing standard GET
-        resp = self.client.get('/api/v1/supply/')
+        with self.assertMaxQueries(10):
+            resp = self.client.get('/api/v1/supply/')
         self.assertEqual(resp.status_code, 200)
         
         #Tests the returned data
         resp_obj = resp.data
         self.assertIn('results', resp_obj)
         self.assertEqual(len(resp_obj['results']), 4)
-    
+
+    def test_get_list_with_cursor(self):
+        """
+        Tests paging through the supplies with the returned cursors
+        """
+        resp = self.client.get('/api/v1/supply/?limit=3')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([s['id'] for s in resp.data['results']],
+                         [self.supply.id, self.supply2.id, self.supply3.id])
+        self.assertIsNone(resp.data['previous'])
+        self.assertIsNotNone(resp.data['next'])
+        self.assertEqual(resp.data['count'], 4)
+
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([s['id'] for s in resp.data['results']], [self.supply4.id])
+        self.assertIsNone(resp.data['next'])
+        self.assertIsNotNone(resp.data['previous'])
+
+        resp = self.client.get(resp.data['previous'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([s['id'] for s in resp.data['results']],
+                         [self.supply.id, self.supply2.id, self.supply3.id])
+
+        # The legacy offset starts at the given row
+        resp = self.client.get('/api/v1/supply/?offset=1&limit=2')
+        self.assertEqual([s['id'] for s in resp.data['results']], [self.supply2.id, self.supply3.id])
+
+        resp = self.client.get('/api/v1/supply/?cursor=invalid')
+        self.assertEqual(resp.status_code, 404)
+
     def test_get(self):
         """
         Tests getting a supply that doesn't have the price 
@@ -476,6 +521,31 @@ class SupplyAPITest(APITestCase):
         obj = resp.data
         self.assertEqual(float(obj['quantity']), float('8'))
         
+    def test_put_records_adjustment(self):
+        """
+        Tests that a changed quantity is recorded as a stock movement from
+        the quantity in the database
+        """
+        supply = Supply.objects.get(pk=1)
+        supply.country = 'TH'
+        stock.move(supply, Decimal('-0.8'), 'SUBTRACT')
+
+        modified_data = base_supply.copy()
+        modified_data['description'] = 'new'
+        modified_data['quantity'] = '10.8'
+
+        resp = self.client.put('/api/v1/supply/1/?country=TH', format='json',
+                               data=modified_data)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Supply.objects.get(pk=1).description, 'new')
+        self.assertEqual(Supply.objects.get(pk=1).quantity, 10.8)
+
+        movement = StockMovement.objects.filter(supply_id=1).order_by('-id')[0]
+        self.assertEqual(movement.reason, 'ADJUST')
+        self.assertEqual(movement.quantity, Decimal('0.8'))
+        self.assertEqual(movement.log.action, 'ADD')
+
     def test_put_to_create_new_product(self):
         """
         Tests adding a new supplier/product to the supply
@@ -860,6 +930,20 @@ class LogTestCase(APITestCase):
         
         fabric = Fabric.objects.get(pk=1)
         self.assertEqual(fabric.quantity, 12)
+
+    def test_download(self):
+        """
+        Test that the logs are streamed as a csv file with the selected columns
+        """
+        resp = self.client.get('/api/v1/supply/log/?columns=id,supply,action&start=2000-01-01')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+
+        lines = ''.join(resp.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], u'ID,Supply,Action Type')
+        self.assertIn(u"{0},Max Col: Grey,RESERVE".format(self.log.id), lines[1:])
+        
         
         
         
@@ -871,4 +955,309 @@ class LogTestCase(APITestCase):
         
         
         
-        
\ No newline at end of file
+
+
+class ConsumptionTestCase(TestCase):
+
+    def setUp(self):
+        """
+        Set up a supply that is used 10 a day
+        """
+        self.supply = Supply.objects.create(description="Glue", units='ml', quantity_th=100)
+
+        for i in xrange(2):
+            Log.objects.create(supply=self.supply, action="SUBTRACT", quantity=5, message="Used 5ml")
+
+    def test_log_updates_consumption(self):
+        """
+        Test that subtracting logs are added to the daily and rolling totals
+        """
+        self.assertEqual(DailyConsumption.objects.get(supply=self.supply).quantity, Decimal('10'))
+
+        stats = ConsumptionStats.objects.get(supply=self.supply)
+        self.assertEqual(stats.window_total, Decimal('10'))
+        self.assertEqual(stats.window_days, 1)
+        self.assertEqual(stats.daily_average, Decimal('10'))
+
+        # Adding stock does not count as consumption
+        Log.objects.create(supply=self.supply, action="ADD", quantity=50, message="Added 50ml")
+        self.assertEqual(ConsumptionStats.objects.get(supply=self.supply).window_total, Decimal('10'))
+
+    def test_reservation_cut(self):
+        """
+        Test that a reservation is only counted once it is cut
+        """
+        log = Log.objects.create(supply=self.supply, action="RESERVE", quantity=3, message="Reserved 3ml")
+        self.assertEqual(ConsumptionStats.objects.get(supply=self.supply).window_total, Decimal('10'))
+
+        log = Log.objects.get(pk=log.pk)
+        log.action = "SUBTRACT"
+        log.save()
+        log.save()
+
+        self.assertEqual(ConsumptionStats.objects.get(supply=self.supply).window_total, Decimal('13'))
+
+    def test_critically_low(self):
+        """
+        Test that a supply below its average daily use is marked for the digest
+        """
+        self.supply.quantity = 50
+        self.supply.save()
+        self.assertFalse(ConsumptionStats.objects.get(supply=self.supply).critically_low)
+
+        self.supply.quantity = 8
+        self.supply.save()
+
+        stats = ConsumptionStats.objects.get(supply=self.supply)
+        self.assertTrue(stats.critically_low)
+        self.assertTrue(stats.alert_pending)
+        self.assertTrue(self.supply.test_if_critically_low_quantity())
+
+    def test_refresh_consumption(self):
+        """
+        Test that days older than 4 weeks leave the rolling totals
+        """
+        DailyConsumption.objects.create(supply=self.supply,
+                                        date=DailyConsumption.objects.get(supply=self.supply).date - timedelta(days=40),
+                                        quantity=100)
+        ConsumptionStats.objects.filter(supply=self.supply).update(window_total=110, window_days=2)
+
+        supply_tasks.refresh_consumption()
+
+        stats = ConsumptionStats.objects.get(supply=self.supply)
+        self.assertEqual(stats.window_total, Decimal('10'))
+        self.assertEqual(stats.window_days, 1)
+
+        # A supply that drops below its average is found without being saved
+        Supply.objects.filter(pk=self.supply.pk).update(quantity_th=5)
+        self.assertEqual(supply_tasks.refresh_consumption(), 1)
+        self.assertTrue(ConsumptionStats.objects.get(supply=self.supply).alert_pending)
+
+    def test_rebuild_daily_consumption(self):
+        """
+        Test that the daily totals are recreated from the logs by the command
+        """
+        DailyConsumption.objects.filter(supply=self.supply).update(quantity=99)
+        out = StringIO()
+
+        call_command('rebuild_daily_consumption', stdout=out)
+
+        self.assertEqual(DailyConsumption.objects.get(supply=self.supply).quantity, Decimal('10'))
+        self.assertEqual(ConsumptionStats.objects.get(supply=self.supply).window_total, Decimal('10'))
+        self.assertIn("Rebuilt 1 daily", out.getvalue())
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_rebuild_daily_consumption_in_bangkok_days(self):
+        """
+        Test that a rebuild puts the logs on the same days as when they are recorded
+        """
+        timestamp = timezone('Asia/Bangkok').localize(datetime(2018, 3, 2, 1, 0))
+        Log.objects.filter(supply=self.supply).update(timestamp=timestamp)
+
+        supply_tasks.rebuild_daily_consumption()
+
+        self.assertEqual(DailyConsumption.objects.get(supply=self.supply).date, date(2018, 3, 2))
+        self.assertEqual(DailyConsumption.get_date(timestamp), date(2018, 3, 2))
+
+
+class ReplenishmentTestCase(TestCase):
+
+    def setUp(self):
+        """
+        Set up a supply that is used 10 a day on average and takes 3 days to arrive
+        """
+        self.supplier = Supplier.objects.create(name="Glue Co")
+        self.supply = Supply.objects.create(description="Glue", units='ml', quantity_th=50)
+        Product.objects.create(supply=self.supply, supplier=self.supplier, cost=100, lead_time=3)
+
+        Log.objects.create(supply=self.supply, action="SUBTRACT", quantity=280, message="Used 280ml")
+
+    def test_reorder_point(self):
+        """
+        Test that the reorder point covers the lead time and the days until the next review
+        """
+        stats = ConsumptionStats.objects.get(supply=self.supply)
+
+        self.assertEqual(stats.lead_time, 3)
+        self.assertEqual(stats.reorder_point, Decimal('100'))
+        self.assertEqual(stats.order_quantity, Decimal('70'))
+
+    def test_shopping_list(self):
+        """
+        Test that supplies below their reorder point are listed with the quantity to buy
+        """
+        supplies = replenishment.shopping_list()
+
+        self.assertEqual([s.id for s in supplies], [self.supply.id])
+        self.assertEqual(supplies[0].to_buy, Decimal('120'))
+
+        Supply.objects.filter(pk=self.supply.pk).update(quantity_th=150)
+        self.assertEqual(replenishment.shopping_list(), [])
+
+    def test_lead_time_change(self):
+        """
+        Test that changing the lead time of the product refreshes the reorder point
+        """
+        product = Product.objects.get(supply=self.supply)
+        product.lead_time = 7
+        product.save()
+
+        self.assertEqual(ConsumptionStats.objects.get(supply=self.supply).reorder_point, Decimal('140'))
+
+
+class StockTestCase(TestCase):
+
+    def setUp(self):
+        """
+        Set up two supplies
+        """
+        self.screw = Supply.objects.create(description="Screw", quantity_th=10)
+        self.board = Supply.objects.create(description="Board", quantity_th=5, quantity_kh=2)
+
+    def test_move(self):
+        """
+        Test that the quantity is changed in the database and the movement is recorded
+        """
+        # A stale copy of the supply does not affect the change
+        stale = Supply.objects.get(pk=self.screw.pk)
+        stock.move(self.screw, Decimal('-4'), 'SUBTRACT')
+        stock.move(stale, Decimal('2.5'), 'ADD')
+
+        self.assertEqual(Supply.objects.get(pk=self.screw.pk).quantity, 8.5)
+        self.assertEqual([m.balance for m in StockMovement.objects.filter(supply=self.screw).order_by('id')],
+                         [Decimal('6'), Decimal('8.5')])
+
+    def test_apply(self):
+        """
+        Test that many movements are applied at once to each supply and country
+        """
+        movements = [StockMovement(supply_id=self.screw.pk, quantity=Decimal('5'), reason='RECEIVE'),
+                     StockMovement(supply_id=self.board.pk, quantity=Decimal('3'), reason='RECEIVE'),
+                     StockMovement(supply_id=self.screw.pk, quantity=Decimal('1'), reason='RECEIVE'),
+                     StockMovement(supply_id=self.board.pk, country='KH', quantity=Decimal('-2'), reason='SUBTRACT')]
+
+        stock.apply(movements)
+
+        board = Supply.objects.get(pk=self.board.pk)
+        self.assertEqual(Supply.objects.get(pk=self.screw.pk).quantity, 16)
+        self.assertEqual(board.quantity_th, 8)
+        self.assertEqual(board.quantity_kh, 0)
+        self.assertEqual([m.balance for m in movements], [Decimal('15'), Decimal('8'), Decimal('16'), Decimal('0')])
+
+    def test_append_only(self):
+        """
+        Test that movements can not be changed or deleted
+        """
+        stock.move(self.screw, Decimal('1'), 'ADD')
+        movement = StockMovement.objects.get(supply=self.screw)
+
+        self.assertRaises(ValueError, movement.save)
+        self.assertRaises(ValueError, movement.delete)
+
+    def test_adjust(self):
+        """
+        Test that a counted quantity is recorded as the difference to the quantity in the database
+        """
+        stale = Supply.objects.get(pk=self.screw.pk)
+        stock.move(self.screw, Decimal('-4'), 'SUBTRACT')
+
+        movement = stock.adjust(stale, Decimal('9'))
+
+        self.assertEqual(movement.reason, 'ADJUST')
+        self.assertEqual(movement.quantity, Decimal('3'))
+        self.assertEqual(Supply.objects.get(pk=self.screw.pk).quantity, 9)
+        self.assertIsNone(stock.adjust(stale, Decimal('9')))
+
+
+class SearchTestCase(TestCase):
+
+    def setUp(self):
+        """
+        Set up a supply with a supplier and a fabric
+        """
+        self.supplier = Supplier.objects.create(name="Acme Timber", name_th=u"\u0e44\u0e21\u0e49")
+        self.supply = Supply.objects.create(description="Oak Board", description_th=u"\u0e44\u0e21\u0e49\u0e42\u0e2d\u0e4a\u0e04")
+        Product.objects.create(supply=self.supply, supplier=self.supplier, reference="REF-9")
+        self.fabric = Fabric.objects.create(description="Max Col: Grey", pattern="Max", color="Grey")
+
+    def _search(self, query, queryset=None):
+        return list(search.search(queryset or Supply.objects.all(), query))
+
+    def test_search(self):
+        """
+        Test that supplies are found by description, supplier, reference and Thai name
+        """
+        supply = Supply.objects.get(pk=self.supply.pk)
+
+        self.assertEqual(self._search("oak"), [supply])
+        self.assertEqual(self._search("acme board"), [supply])
+        self.assertEqual(self._search("ref-9"), [supply])
+        self.assertEqual(self._search(u"\u0e42\u0e2d\u0e4a\u0e04"), [supply])
+        self.assertEqual(self._search("oak grey"), [])
+        self.assertEqual(self._search("grey", Fabric.objects.all()), [Fabric.objects.get(pk=self.fabric.pk)])
+
+    def test_supplier_rename(self):
+        """
+        Test that renaming the supplier updates the search documents of its supplies
+        """
+        supplier = Supplier.objects.get(pk=self.supplier.pk)
+        supplier.name = "Birch Co"
+        supplier.save()
+
+        self.assertEqual(len(self._search("birch")), 1)
+        self.assertEqual(self._search("acme"), [])
+
+    def test_save_without_search_changes(self):
+        """
+        Test that the search document is only rebuilt when the searched fields change
+        """
+        supply = Supply.objects.get(pk=self.supply.pk)
+        supply.notes = "Kiln dried"
+
+        with CaptureQueriesContext(connection) as queries:
+            supply.save()
+        self.assertFalse([q for q in queries.captured_queries if Product._meta.db_table in q['sql']])
+
+        supply.description = "Walnut Board"
+        supply.save()
+        self.assertEqual(self._search("walnut acme"), [supply])
+
+
+class StickerTestCase(APITestCase):
+
+    def setUp(self):
+        """
+        Set up a logged in user and three supplies
+        """
+        User.objects.create_user('test', 'test@yahoo.com', 'test')
+        self.client.login(username='test', password='test')
+
+        self.supplies = [Supply.objects.create(description="Sticker {0}".format(i)) for i in xrange(3)]
+
+    def test_parse_ids(self):
+        """
+        Test that ids and id ranges are selected
+        """
+        ids = [s.pk for s in self.supplies]
+        query = labels.parse_ids("{0}, {1}-{2}".format(ids[0], ids[2], ids[1]))
+
+        self.assertEqual(sorted(Supply.objects.filter(query).values_list('pk', flat=True)), ids)
+
+    def test_print_stickers(self):
+        """
+        Test that the stickers of the selected supplies are printed in one document
+        """
+        ids = [s.pk for s in self.supplies]
+        resp = self.client.get('/api/v1/supply/sticker/?ids={0}-{1}&copies=2'.format(ids[0], ids[-1]))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/pdf')
+        self.assertTrue(b"".join(resp.streaming_content).startswith(b"%PDF"))
+
+    def test_invalid_parameters(self):
+        """
+        Test that unreadable parameters and empty selections are rejected
+        """
+        self.assertEqual(self.client.get('/api/v1/supply/sticker/?ids=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/supply/sticker/?copies=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/supply/sticker/?since=2100-01-01').status_code, 404)
@@ -19,10 +19,13 @@ from contacts.models import Supplier
 from supplies.models import Supply, Fabric, Log, Product
 from supplies.PDF import SupplyPDF
 from utilities.http import save_upload
+from utilities.pagination import KeysetPagination
+from utilities import search
+from utilities import export
 from auth.models import S3Object
 from supplies.serializers import SupplySerializer, FabricSerializer, LogSerializer
 from media.stickers import StickerPage, Sticker, FabricSticker
-from supplies.renderers import SupplyLogCSVRenderer
+from media import labels
 
 
 logger = logging.getLogger(__name__)
@@ -38,6 +41,20 @@ def sticker(request, pk=None):
     return response
    
 
+@login_required
+def stickers(request):
+    """
+    Prints the stickers of many supplies on sheets in one document
+    """
+    return labels.stream(request, Supply.objects.only('id', 'description', 'last_modified'),
+                         labels.supply_label, 'Supply-Stickers')
+
+
+@login_required
+def fabric_stickers(request):
+    return labels.stream(request, Fabric.objects.all(), labels.fabric_label, 'Fabric-Stickers')
+
+
 @login_required
 def fabric_sticker(request, pk=None):
     response = HttpResponse(content_type='application/pdf; charset=utf-8')
@@ -87,11 +104,25 @@ class SupplyMixin(object):
 
 
 class SupplyList(SupplyMixin, generics.ListCreateAPIView):
+    pagination_class = KeysetPagination
     supplier = None
     
     def put(self, request, *args, **kwargs):
         return self.bulk_update(request, *args, **kwargs)
 
+    def paginate_queryset(self, queryset):
+        """
+        Sign the urls of all the images on the page together
+        before they are serialized
+        """
+        page = super(SupplyList, self).paginate_queryset(queryset)
+
+        if page is not None:
+            S3Object.generate_urls([supply.image for supply in page] +
+                                   [supply.sticker for supply in page])
+
+        return page
+
     def get_queryset(self):
         """
         Override 'get_queryset' method in order to customize filter
@@ -101,9 +132,7 @@ class SupplyList(SupplyMixin, generics.ListCreateAPIView):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(products__supplier__name__icontains=query) |
-                                       Q(description__icontains=query) |
-                                       Q(products__reference__icontains=query))
+            queryset = search.search(queryset, query)
 
         #Filter based on supplier
         s_id = self.request.query_params.get('supplier_id', None)
@@ -129,22 +158,10 @@ class SupplyList(SupplyMixin, generics.ListCreateAPIView):
             #queryset = queryset.extra(select={'order_count': sql})
             #queryset = queryset.extra(order_by = ['-order_count'])
     
-        # If supplier is not given
-        else:
-            queryset = queryset.distinct('id')
-            
         #Filter based on product upc code
         upc = self.request.query_params.get('upc', None)
         if upc:
-            queryset = queryset.filter(products__upc=upc)
-
-        offset = int(self.request.query_params.get('offset', 0))
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        
-        if offset and limit:
-            queryset = queryset[offset - 1:limit + (offset - 1)]
-        else:
-            queryset = queryset[0:50]
+            queryset = queryset.filter(products__upc=upc).distinct()
 
         queryset = queryset.select_related('image',
                                            'sticker',
@@ -153,16 +170,6 @@ class SupplyList(SupplyMixin, generics.ListCreateAPIView):
 
         return queryset
 
-    def get_paginate_by(self):
-        """
-
-        """
-        limit = int(self.request.query_params.get('limit', settings.REST_FRAMEWORK['PAGINATE_BY']))
-        if limit == 0:
-            return self.queryset.count()
-        else:
-            return limit
-
     def bulk_update(self, request, *args, **kwargs):
         #partial = kwargs.pop('partial', False)
 
@@ -227,11 +234,7 @@ class FabricList(FabricMixin, SupplyList):
         #Filter based on query
         query = self.request.query_params.get('q', None)
         if query:
-            queryset = queryset.filter(Q(products__supplier__name__icontains=query) |
-                                       Q(description__icontains=query) |
-                                       Q(products__reference__icontains=query) |
-                                       Q(pattern__icontains=query) |
-                                       Q(color__icontains=query)).distinct()
+            queryset = search.search(queryset, query)
 
         #Filter based on supplier
         s_id = self.request.query_params.get('supplier_id', None)
@@ -243,16 +246,6 @@ class FabricList(FabricMixin, SupplyList):
         if upc:
             queryset = queryset.filter(products__upc=upc)
 
-        offset = int(self.request.query_params.get('offset', 0))
-        limit = int(self.request.query_params.get('limit', self.request.query_params.get('page_size', settings.REST_FRAMEWORK['PAGINATE_BY'])))
-
-        if offset == 0 and limit == 0:
-            queryset = queryset
-        elif offset and limit:
-            queryset = queryset[offset:limit + (offset - 1)]
-        else:
-            queryset = queryset[0:50]
-
         queryset = queryset.select_related('image')
         queryset = queryset.prefetch_related('logs', 'logs__employee')
         queryset = queryset.prefetch_related(Prefetch('logs', 
@@ -274,12 +267,31 @@ class FabricViewSet(viewsets.ModelViewSet):
     serializer_class = FabricSerializer
 
 
+LOG_COLUMNS = (('id', 'ID', lambda l: l.id),
+               ('supply_id', 'Supply ID', lambda l: l.supply_id),
+               ('supply', 'Supply', lambda l: l.supply.description),
+               ('employee_id', 'Employee ID', lambda l: l.employee_id),
+               ('employee', 'Employee', lambda l: l.employee.name if l.employee else None),
+               ('acknowledgement', 'Acknowledgement', lambda l: l.acknowledgement_id),
+               ('customer', 'Customer', lambda l: l.acknowledgement.customer.name
+                                                  if l.acknowledgement and l.acknowledgement.customer else None),
+               ('message', 'Message', lambda l: l.message),
+               ('action', 'Action Type', lambda l: l.action),
+               ('quantity', 'Quantity', lambda l: l.quantity),
+               ('cost', 'Cost', lambda l: l.cost),
+               ('timestamp', 'Timestamp', lambda l: l.timestamp))
+
+
 class LogList(generics.ListAPIView):
+    """
+    Streams the supply logs as a csv file
 
-    queryset = Log.objects.all().order_by('-timestamp')
+    Without a 'start' or 'end' only the latest logs are exported
+    """
+    queryset = Log.objects.all().order_by('-id')
     serializer_class = LogSerializer
-    renderer_classes = (SupplyLogCSVRenderer, )
-    
+    renderer_classes = (JSONRenderer, )
+    latest = 100
 
     def get_queryset(self):
         queryset = self.queryset
@@ -295,11 +307,23 @@ class LogList(generics.ListAPIView):
         if action:
             queryset = queryset.filter(action=action)
 
-        queryset = queryset.select_related('supply', 'employee', 'supplier', 'supply__image')
+        start_date, end_date = export.parse_date_range(self.request)
+
+        if start_date:
+            queryset = queryset.filter(timestamp__gte=start_date)
+
+        if end_date:
+            queryset = queryset.filter(timestamp__lt=end_date)
+
+        queryset = queryset.select_related('supply', 'employee', 'acknowledgement__customer')
+
+        return queryset
 
-        queryset = self.queryset.filter(timestamp__gte="2018-01-01")
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        limit = None if ('start' in request.GET or 'end' in request.GET) else self.latest
 
-        return queryset[0:100]
+        return export.stream(request, queryset, LOG_COLUMNS, 'supply-log', encoding='utf-8', limit=limit)
 
 
 class LogDetail(generics.RetrieveUpdateAPIView):
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HTTP client for the TRCloud api
+
+Requests reuse kept alive connections from a pool for each thread,
+always have a timeout and are retried with an exponential backoff.
+Searches and retrievals are retried on any connection error, timeout or
+server error. Creates and edits are only retried if the connection
+could not be made, so that a document is never submitted twice.
+
+The client is configured with the TRCLOUD setting:
+
+    TRCLOUD = {
+        'TIMEOUT': (3.05, 20),
+        'RETRIES': 3,
+        'BACKOFF': 0.5,
+        'POOL_SIZE': 10
+    }
+
+Every request is reported to the listeners added with add_listener(),
+e.g. to record the latency of TRCloud:
+
+    client.get_client().add_listener(lambda url, status, elapsed, attempts, error: ...)
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+
+class TRCloudError(Exception):
+    pass
+
+
+class Client(object):
+
+    headers = {'Content-Type': 'application/x-www-form-urlencoded',
+               'Origin': 'http://localhost'}
+
+    def __init__(self, timeout=(3.05, 20), retries=3, backoff=0.5, pool_size=10):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.listeners = []
+
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """
+        Sessions are not shared between threads
+        """
+        session = getattr(self._local, 'session', None)
+
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            self._local.session = session
+
+        return session
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def post(self, url, data, idempotent=False):
+        """
+        Posts the form data and returns the response
+        """
+        attempt = 0
+
+        while True:
+            attempt += 1
+            start = time.time()
+            status = None
+
+            try:
+                response = self.session.post(url, data=data, timeout=self.timeout)
+                status = response.status_code
+
+                if status >= 500:
+                    raise TRCloudError(u"TRCloud responded with {0}".format(status))
+
+            except (requests.exceptions.RequestException, TRCloudError) as e:
+                self._report(url, status, time.time() - start, attempt, e)
+
+                if attempt > self.retries or not self._can_retry(e, idempotent):
+                    raise
+
+                delay = self.backoff * (2 ** (attempt - 1))
+                logger.warn(u"Retrying {0} in {1}s because {2}".format(url, delay, e))
+                time.sleep(delay)
+                continue
+
+            self._report(url, status, time.time() - start, attempt, None)
+
+            return response
+
+    def _can_retry(self, error, idempotent):
+        """
+        Requests that did not reach TRCloud can always be sent again
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        elif isinstance(error, requests.exceptions.ConnectionError):
+            return idempotent or self._not_sent(error)
+
+        return idempotent
+
+    def _not_sent(self, error):
+        """
+        Returns True if the connection failed before the request was sent
+        """
+        message = u"{0}".format(error).lower()
+
+        return 'failed to establish a new connection' in message or 'name or service not known' in message
+
+    def _report(self, url, status, elapsed, attempt, error):
+        logger.debug(u"TRCloud {0} {1} in {2:.3f}s".format(url, status, elapsed))
+
+        for listener in self.listeners:
+            try:
+                listener(url, status, elapsed, attempt, error)
+            except Exception as e:
+                logger.warn(e)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the client configured in TRCLOUD
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = getattr(settings, 'TRCLOUD', {})
+                _client = Client(timeout=config.get('TIMEOUT', (3.05, 20)),
+                                 retries=config.get('RETRIES', 3),
+                                 backoff=config.get('BACKOFF', 0.5),
+                                 pool_size=config.get('POOL_SIZE', 10))
+
+    return _client
+
+
+def set_client(client):
+    global _client
+
+    _client = client
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 import logging
-import requests
 import json
 import hashlib
 import time
@@ -12,6 +11,10 @@ import pprint
 
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+from trcloud import client
+
 
 pp = pprint.PrettyPrinter(indent=4, width=1)
 logger = logging.getLogger(__name__)
@@ -44,8 +47,6 @@ class BaseTRModelMixin(object):
             "securekey": hashlib.md5(settings.TRCLOUD_ENCRYPT_HEAD +"t" + timestamp).hexdigest(),
             "timestamp": timestamp,
         }
-        
-        logger.debug(predata)
 
 
 
@@ -81,10 +82,12 @@ class BaseTRModelMixin(object):
             raise Exception(message)
 
     @classmethod
-    def _send_request(cls, url, data):
-        headers = {'Content-Type': 'application/x-www-form-urlencoded',
-                   'Origin': 'http://localhost'}
-        response = requests.post(url, data=data, headers=headers)
+    def _send_request(cls, url, data, idempotent=False):
+        """
+        Sends the request through the pooled client. Only idempotent
+        requests are retried after they have reached TRCloud
+        """
+        response = client.get_client().post(url, data, idempotent=idempotent)
        
         data = cls._parse_response(response)
         return data
@@ -95,7 +98,7 @@ class BaseTRModelMixin(object):
         data = {'index': index,
                 'keyword': keyword}
                 
-        response = cls._send_request(url, cls._prepare_body_for_request(data))
+        response = cls._send_request(url, cls._prepare_body_for_request(data), idempotent=True)
         return response
 
     @classmethod
@@ -103,7 +106,7 @@ class BaseTRModelMixin(object):
         
         data = {'id': id}
 
-        response = cls._send_request(url, cls._prepare_body_for_request(data))
+        response = cls._send_request(url, cls._prepare_body_for_request(data), idempotent=True)
         return response
 
     def _create(self, url, data):
@@ -391,4 +394,37 @@ class TRSalesOrder(BaseTRModelMixin):
 
         # Convert to JSON
 
-        # Send the data to TRCloud endpoint for Alinea
\ No newline at end of file
+        # Send the data to TRCloud endpoint for Alinea
+
+
+class SyncJob(models.Model):
+    """
+    Outbox of objects to create or update in TRCloud
+
+    Saving a document adds a job instead of waiting on TRCloud. The jobs
+    are sent in batches by trcloud.tasks.drain_outbox and failed jobs are
+    tried again with an increasing delay.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    app_label = models.TextField()
+    model_name = models.TextField()
+    object_id = models.IntegerField()
+    action = models.TextField()
+    status = models.TextField(default=PENDING)
+    attempts = models.IntegerField(default=0)
+    message = models.TextField(null=True, blank=True)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = (('status', 'next_attempt'),)
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.message = message
+        self.save()
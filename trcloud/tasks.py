@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background synchronisation with TRCloud
+
+Documents are not sent to TRCloud while they are saved. A SyncJob is
+added to the outbox instead, and a worker sends the pending jobs in
+batches once the transaction has committed. The outbox is also drained
+every minute, which picks up jobs that are due to be tried again.
+
+    tasks.queue_sync(acknowledgement.customer, 'create')
+"""
+from __future__ import absolute_import
+
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from trcloud.models import SyncJob
+
+
+logger = logging.getLogger(__name__)
+
+batch_size = 20
+max_attempts = 6
+retry_delay = 60
+stale_after = timedelta(minutes=10)
+
+
+def queue_sync(obj, action='create'):
+    """
+    Adds a job to call '<action>_in_trcloud' on the object. Pending jobs
+    for the same object and action are not added twice
+    """
+    job, created = SyncJob.objects.get_or_create(app_label=obj._meta.app_label,
+                                                 model_name=obj._meta.model_name,
+                                                 object_id=obj.pk,
+                                                 action=action,
+                                                 status=SyncJob.PENDING)
+
+    # The worker must be able to see the saved object
+    transaction.on_commit(lambda: drain_outbox.delay())
+
+    return job
+
+
+@shared_task
+def drain_outbox(size=batch_size):
+    """
+    Sends the jobs that are due in batches until none are left and
+    returns the number of jobs sent
+    """
+    count = 0
+
+    while True:
+        jobs = claim(size)
+        if not jobs:
+            break
+
+        for job in jobs:
+            run(job)
+
+        count += len(jobs)
+
+    return count
+
+
+def claim(size=batch_size):
+    """
+    Marks a batch of due jobs as running and returns them. Jobs that
+    another worker has locked are skipped, and jobs that have been
+    running for too long are claimed again
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        jobs = SyncJob.objects.filter(Q(status=SyncJob.PENDING, next_attempt__lte=now) |
+                                      Q(status=SyncJob.RUNNING, last_modified__lt=now - stale_after)) \
+                              .order_by('next_attempt', 'id')
+
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+
+        jobs = list(jobs[:size])
+        SyncJob.objects.filter(pk__in=[job.pk for job in jobs]).update(status=SyncJob.RUNNING, last_modified=now)
+
+    return jobs
+
+
+def run(job):
+    """
+    Sends a single job. Failed jobs are tried again later with a longer
+    delay each time
+    """
+    job.attempts += 1
+
+    try:
+        model = apps.get_model(job.app_label, job.model_name)
+        obj = model.objects.get(pk=job.object_id)
+        getattr(obj, '{0}_in_trcloud'.format(job.action))()
+    except Exception as e:
+        logger.warn(u"Unable to {0} {1} {2} in TRCloud: {3}".format(job.action, job.model_name, job.object_id, e))
+
+        if job.attempts >= max_attempts:
+            job.set_status(SyncJob.FAILED, message=u"{0}".format(e))
+        else:
+            job.next_attempt = timezone.now() + timedelta(seconds=retry_delay * (2 ** (job.attempts - 1)))
+            job.set_status(SyncJob.PENDING, message=u"{0}".format(e))
+
+        return job.status
+
+    job.set_status(SyncJob.DONE)
+
+    return job.status
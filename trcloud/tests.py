@@ -1,3 +1,118 @@
+# -*- coding: utf-8 -*-
+import requests
 from django.test import TestCase
 
-# Create your tests here.
+from contacts.models import Customer
+from trcloud import client, tasks
+from trcloud.models import SyncJob
+
+
+class Response(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class Session(object):
+    """
+    Session that answers with the queued responses or raises the queued
+    errors
+    """
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, url, data=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+
+        return response
+
+
+class ClientTest(TestCase):
+
+    def setUp(self):
+        self.client_ = client.Client(retries=2, backoff=0)
+        self.reports = []
+        self.client_.add_listener(lambda url, status, elapsed, attempt, error: self.reports.append((status, attempt)))
+
+    def _set_session(self, session):
+        self.client_._local.session = session
+
+        return session
+
+    def test_retry_idempotent_request(self):
+        """
+        Test that searches are sent again after a timeout or server error
+        """
+        session = self._set_session(Session(requests.exceptions.ReadTimeout('timed out'),
+                                            Response(502),
+                                            Response(200)))
+
+        response = self.client_.post('https://trcloud/search', {}, idempotent=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.calls, 3)
+        self.assertEqual(self.reports, [(None, 1), (502, 2), (200, 3)])
+
+    def test_do_not_resend_documents(self):
+        """
+        Test that a create that may have reached TRCloud is not sent again
+        """
+        session = self._set_session(Session(requests.exceptions.ReadTimeout('timed out'), Response(200)))
+
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client_.post('https://trcloud/create', {})
+
+        self.assertEqual(session.calls, 1)
+
+    def test_give_up_after_retries(self):
+        session = self._set_session(Session(Response(500), Response(500), Response(500)))
+
+        with self.assertRaises(client.TRCloudError):
+            self.client_.post('https://trcloud/search', {}, idempotent=True)
+
+        self.assertEqual(session.calls, 3)
+
+
+class SyncJobTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Test Customer')
+
+    def test_queue_sync_once(self):
+        """
+        Test that an object is only queued once while its job is pending
+        """
+        tasks.queue_sync(self.customer, 'create')
+        tasks.queue_sync(self.customer, 'create')
+        tasks.queue_sync(self.customer, 'update')
+
+        self.assertEqual(SyncJob.objects.filter(object_id=self.customer.id, action='create').count(), 1)
+        self.assertEqual(SyncJob.objects.filter(object_id=self.customer.id).count(), 2)
+
+    def test_retry_failed_job(self):
+        """
+        Test that a failed job is scheduled again and eventually failed
+        """
+        job = SyncJob.objects.create(app_label='contacts', model_name='customer',
+                                     object_id=self.customer.id, action='missing')
+
+        self.assertEqual(tasks.drain_outbox(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.next_attempt, job.created)
+
+        # The job is not due again yet
+        self.assertEqual(tasks.drain_outbox(), 0)
+
+        job.attempts = tasks.max_attempts - 1
+        job.save()
+        tasks.run(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.FAILED)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Streaming CSV exports
+
+The rows of an export are read from the database in chunks and each
+line is sent to the client as soon as it is written, so that exporting
+a year of documents neither holds the whole queryset nor the whole file
+in memory, and the download starts straight away.
+
+    columns = (('id', 'id', lambda a: a.id),
+               ('customer', 'customer', lambda a: a.customer.name))
+
+    return export.stream(request, queryset, columns, 'Acknowledgements')
+
+The request can select the columns with '?columns=id,customer' and the
+encoding with '?encoding=utf-8'. The default encoding is cp874 (Thai
+Windows), which is what the accounting software imports. UTF-8 files
+start with a byte order mark so that Excel reads them as UTF-8.
+"""
+import logging
+from datetime import timedelta
+
+import dateutil.parser
+import unicodecsv as csv
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+chunk_size = 2000
+
+ENCODINGS = {'cp874': ('cp874', ''),
+             'utf-8': ('utf-8', '\xEF\xBB\xBF')}
+
+
+class Echo(object):
+    """
+    File like object that returns what is written instead of storing it
+    """
+    def write(self, value):
+        return value
+
+
+def parse_date_range(request):
+    """
+    Returns the 'start' and 'end' of the request as aware datetimes
+
+    An end without a time includes the whole of that day, so that the end
+    is compared with 'less than'
+    """
+    start = request.GET.get('start')
+    end = request.GET.get('end')
+
+    start = _parse_date(start) if start else None
+
+    if end:
+        end_date = _parse_date(end)
+        end = end_date + timedelta(days=1) if len(end.strip()) <= 10 else end_date
+
+    return start, end
+
+
+def select_columns(request, columns, default=None):
+    """
+    Returns the columns named in the 'columns' query parameter in the
+    requested order, or the default columns
+    """
+    names = [name.strip() for name in request.GET.get('columns', '').split(',') if name.strip()]
+    names = names or default
+    if not names:
+        return columns
+
+    by_name = {column[0]: column for column in columns}
+    selected = [by_name[name] for name in names if name in by_name]
+
+    return selected or columns
+
+
+def iterate(queryset, size=None):
+    """
+    Yields the rows of the queryset, reading a chunk at a time by primary
+    key. The queryset is ordered by primary key, descending if it was
+    ordered descending
+    """
+    size = size or chunk_size
+    ordering = queryset.query.order_by or queryset.model._meta.ordering or []
+    descending = bool(ordering) and ordering[0].startswith('-')
+
+    queryset = queryset.order_by('-pk' if descending else 'pk')
+    last_pk = None
+
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__lt=last_pk) if descending else chunk.filter(pk__gt=last_pk)
+
+        rows = list(chunk[:size])
+        if not rows:
+            break
+
+        for row in rows:
+            yield row
+
+        last_pk = rows[-1].pk
+
+
+def rows(queryset, columns, encoding='cp874', limit=None):
+    """
+    Yields the encoded lines of the csv file, starting with the headers
+    """
+    encoding, bom = ENCODINGS.get(encoding, ENCODINGS['cp874'])
+    writer = csv.writer(Echo(), encoding=encoding, errors='replace')
+
+    if bom:
+        yield bom
+
+    yield writer.writerow([column[1] for column in columns])
+
+    for index, obj in enumerate(iterate(queryset, size=min(limit, chunk_size) if limit else None)):
+        if limit is not None and index >= limit:
+            break
+
+        yield writer.writerow([_format(column[2](obj)) for column in columns])
+
+
+def stream(request, queryset, columns, name, default=None, encoding='cp874', limit=None):
+    """
+    Returns a response that streams the queryset as a csv file. 'default'
+    names the columns exported when none are requested
+    """
+    columns = select_columns(request, columns, default=default)
+    encoding = request.GET.get('encoding', encoding).lower()
+
+    response = StreamingHttpResponse(rows(queryset, columns, encoding=encoding, limit=limit),
+                                     content_type="text/csv")
+    response['Content-Disposition'] = 'attachment; filename="{0}.csv"'.format(name)
+
+    return response
+
+
+def _parse_date(value):
+    date = dateutil.parser.parse(value)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+
+    return date
+
+
+def _format(value):
+    if value is None:
+        return u''
+
+    return u"{0}".format(value)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Keyset pagination for the list views
+
+Pages are fetched by filtering on the ordering of the last row that
+was sent instead of by offset, so deep pages are as fast as the first
+page and rows do not shift between pages when new documents are added.
+
+The 'cursor' returned in 'next' and 'previous' is an opaque token. The
+'offset' parameter is still accepted for older clients, and 'count'
+still holds the number of rows of the filtered list.
+"""
+import base64
+import datetime
+import json
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+logger = logging.getLogger(__name__)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds of times, which DjangoJSONEncoder cuts down
+    to milliseconds, so that rows in the same millisecond as the last
+    row of a page are not skipped
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+
+        return super(CursorEncoder, self).default(o)
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    limit_query_params = ('limit', 'page_size')
+    offset_query_param = 'offset'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @property
+    def default_limit(self):
+        return settings.REST_FRAMEWORK.get('PAGINATE_BY', 50)
+
+    @property
+    def max_limit(self):
+        return settings.REST_FRAMEWORK.get('MAX_PAGINATE_BY', 1000)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset, view)
+        self.next_values = None
+        self.previous_values = None
+        self.count = queryset.order_by().count()
+
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request)
+        offset = self.get_offset(request)
+
+        if cursor is not None:
+            reverse, values = cursor
+        elif offset:
+            return self._paginate_offset(queryset, offset)
+        else:
+            reverse, values = False, None
+
+        if reverse:
+            queryset = queryset.order_by(*[_reverse(field) for field in self.ordering])
+            if values is not None:
+                queryset = queryset.filter(_after([_reverse(field) for field in self.ordering], values))
+        elif values is not None:
+            queryset = queryset.filter(_after(self.ordering, values))
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+
+        if reverse:
+            results.reverse()
+
+        if results:
+            first, last = self.get_values(results[0]), self.get_values(results[-1])
+            if reverse:
+                self.previous_values = first if has_more else None
+                self.next_values = last
+            else:
+                self.previous_values = first if values is not None else None
+                self.next_values = last if has_more else None
+        elif values is not None:
+            # Nothing beyond the cursor, so allow the client to step back
+            if reverse:
+                self.next_values = values
+            else:
+                self.previous_values = values
+
+        return results
+
+    def _paginate_offset(self, queryset, offset):
+        results = list(queryset[offset:offset + self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+
+        if results:
+            self.previous_values = self.get_values(results[0])
+            self.next_values = self.get_values(results[-1]) if has_more else None
+
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([('count', self.count),
+                                     ('next', self.get_next_link()),
+                                     ('previous', self.get_previous_link()),
+                                     ('results', data)]))
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+
+        return self.get_link(False, self.next_values)
+
+    def get_previous_link(self):
+        if self.previous_values is None:
+            return None
+
+        return self.get_link(True, self.previous_values)
+
+    def get_link(self, reverse, values):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(reverse, values))
+
+    def get_limit(self, request):
+        """
+        Returns the page size. A limit of 0 or more than the maximum
+        returns the largest page allowed rather than the whole table
+        """
+        limit = self.default_limit
+
+        for param in self.limit_query_params:
+            if param in request.query_params:
+                try:
+                    limit = int(request.query_params[param])
+                except (TypeError, ValueError):
+                    pass
+                break
+
+        if limit <= 0 or limit > self.max_limit:
+            limit = self.max_limit
+
+        return limit
+
+    def get_offset(self, request):
+        try:
+            return max(int(request.query_params.get(self.offset_query_param, 0)), 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def get_ordering(self, queryset, view=None):
+        """
+        Returns the ordering of the view or queryset with the primary key
+        added so that every row has a unique position
+        """
+        ordering = getattr(view, 'cursor_ordering', None)
+        ordering = ordering or queryset.query.order_by or queryset.model._meta.ordering or ('-id',)
+        ordering = list(ordering)
+
+        for field in ordering:
+            assert isinstance(field, basestring), "Keyset ordering only supports field names"
+
+        if not set(['id', '-id', 'pk', '-pk']).intersection(ordering):
+            ordering.append('id')
+
+        return ordering
+
+    def get_values(self, instance):
+        values = []
+        for field in self.ordering:
+            value = instance
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, 'id' if attr == 'pk' else attr, None)
+            values.append(value)
+
+        return values
+
+    def encode_cursor(self, reverse, values):
+        data = json.dumps({'r': 1 if reverse else 0, 'v': values}, cls=CursorEncoder)
+
+        return base64.urlsafe_b64encode(data.encode('utf-8'))
+
+    def decode_cursor(self, request):
+        """
+        Returns a (reverse, values) tuple or None if no cursor was sent
+        """
+        encoded = request.query_params.get(self.cursor_query_param, None)
+        if not encoded:
+            return None
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            reverse, values = bool(data['r']), data['v']
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, values
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else u"-{0}".format(field)
+
+
+def _after(ordering, values):
+    """
+    Returns a filter for the rows that come after 'values' in 'ordering'
+
+    Nulls are sorted last in ascending order and first in descending
+    order, matching PostgreSQL.
+    """
+    query = Q(pk__in=[])
+    equal = Q()
+
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+
+        if value is None:
+            after = Q(**{name + '__isnull': False}) if descending else None
+            same = Q(**{name + '__isnull': True})
+        else:
+            if descending:
+                after = Q(**{name + '__lt': value})
+            else:
+                after = Q(**{name + '__gt': value}) | Q(**{name + '__isnull': True})
+            same = Q(**{name: value})
+
+        if after is not None:
+            query |= equal & after
+
+        equal &= same
+
+    return query
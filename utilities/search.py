@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Search for the list views
+
+Searchable models keep a lower case 'search_document' with the text
+that can be searched, which is set from get_search_values() when the
+model is saved. The documents are indexed with a pg_trgm GIN index, so
+that substring searches, including Thai names that have no spaces, do
+not scan the table. The indexes are created by the
+'rebuild_search_index' management command.
+
+    queryset = search.search(queryset, request.query_params.get('q'))
+
+Every word of the query must be found in the document and the results
+are ranked by trigram similarity to the query on PostgreSQL.
+"""
+import logging
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, When, Value, TextField
+
+
+logger = logging.getLogger(__name__)
+
+batch_size = 500
+field_name = 'search_document'
+rank_name = 'search_rank'
+
+
+def document(values):
+    """
+    Joins the values into a single lower case document
+    """
+    values = [u"{0}".format(value).strip() for value in values if value not in (None, '')]
+
+    return re.sub(r'\s+', u' ', u' '.join(values)).lower()
+
+
+def search(queryset, query, rank=True):
+    """
+    Filters the queryset to the rows that contain every word of the
+    query. The rows are ranked by similarity ahead of the existing
+    ordering of the queryset
+    """
+    query = document([query]) if query else u''
+    if not query:
+        return queryset
+
+    for term in query.split(u' '):
+        queryset = queryset.filter(**{field_name + '__contains': term})
+
+    # Trigram similarity is only available on PostgreSQL
+    if rank and connection.vendor == 'postgresql':
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['-id']
+        queryset = queryset.annotate(**{rank_name: TrigramSimilarity(field_name, query)})
+        queryset = queryset.order_by('-' + rank_name, *ordering)
+
+    return queryset
+
+
+def refresh(queryset):
+    """
+    Sets the search documents of all the rows of the queryset in batches
+    and returns the number of rows updated
+
+    Related rows used by get_search_values() should be prefetched
+    """
+    model = queryset.model
+    count = 0
+    last_pk = None
+
+    queryset = queryset.order_by('pk')
+
+    while True:
+        batch = queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+
+        documents = [When(pk=obj.pk, then=Value(document(obj.get_search_values()))) for obj in batch]
+        model.objects.filter(pk__in=[obj.pk for obj in batch]) \
+                     .update(**{field_name: Case(*documents, output_field=TextField())})
+
+        count += len(batch)
+        last_pk = batch[-1].pk
+
+    return count
+
+
+def create_index(model):
+    """
+    Creates the trigram index of the model's search documents
+    """
+    table = model._meta.get_field(field_name).model._meta.db_table
+    index = u"{0}_search_trgm".format(table)
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(u"CREATE INDEX IF NOT EXISTS {0} ON {1} USING gin ({2} gin_trgm_ops)".format(
+            connection.ops.quote_name(index),
+            connection.ops.quote_name(table),
+            connection.ops.quote_name(field_name)))
+
+    return index
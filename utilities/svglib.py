@@ -13,17 +13,29 @@ The current intended usage is either as module within other projects:
 or from the command-line where right now it is usable as an SVG to PDF
 converting tool named sv2pdf (which should also handle SVG files com-
 pressed with gzip and extension .svgz).
+
+Local changes: files are read with a streaming parser into a light
+tree of nodes instead of a full DOM, paths and transforms are split
+with compiled expressions, .svgz files are decompressed in memory and
+converted drawings are cached by the hash of the file's content.
+svg2rlg() returns a copy of the cached drawing, so the same schematic
+is only converted once for the pricelists and the product PDFs.
 """
 
 import sys
 import os
+import copy
 import glob
+import hashlib
 import types
 import re
 import operator
 import gzip
-import xml.dom.minidom 
 import string
+import threading
+from collections import OrderedDict
+from cStringIO import StringIO
+from xml.etree import cElementTree
 
 from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.graphics.shapes import *
@@ -41,6 +53,23 @@ __date__ = "2010-03-01"
 pt = 1
 LOGMESSAGES = 0
 
+# Number of converted drawings kept in memory
+CACHESIZE = 256
+
+# operator codes mapped to the minimum number of expected arguments
+PATHOPS = {'A':7, 'a':7,
+           'Q':4, 'q':4, 'T':2, 't':2, 'S':4, 's':4,
+           'M':2, 'L':2, 'm':2, 'l':2, 'H':1, 'V':1,
+           'h':1, 'v':1, 'C':6, 'c':6, 'Z':0, 'z':0}
+
+PATHTOKEN = re.compile(r"([AaQqTtSsMmLlHhVvCcZz])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+TRANSFORM = re.compile(r"(\w+)\s*\(([^)]*)\)")
+
+PREDEFINEDCOLORS = frozenset(("aqua black blue fuchsia gray green lime maroon navy "
+                              "olive orange purple red silver teal white yellow "
+                              "lawngreen indianred aquamarine lightgreen brown").split())
+
 
 ### helpers ###
 
@@ -81,43 +110,26 @@ def fixSvgPath(aList):
     were applied or a copy of the same list, otherwise.
     """
 
-    # this could also modify the path to contain an op code
-    # for each coord. tuple of a tuple sequence... 
-
-    hPos, vPos, HPos, VPos, numPos = [], [], [], [], []
-    for i in xrange(len(aList)):
-        hPos.append(aList[i]=='h')
-        vPos.append(aList[i]=='v')
-        HPos.append(aList[i]=='H')
-        VPos.append(aList[i]=='V')
-        numPos.append(type(aList[i])==type(1.0))
-
     fixedList = []
+    n = len(aList)
 
     i = 0
-    while i < len(aList):
-        if hPos[i] + vPos[i] + HPos[i] + VPos[i] == 0:
-            fixedList.append(aList[i])
-        elif hPos[i] == 1 or vPos[i] == 1:
-            fixedList.append(aList[i])
-            sum = 0
-            j = i+1
-            while j < len(aList) and numPos[j] == 1:
-                sum = sum + aList[j]
-                j = j+1
-            fixedList.append(sum)
-            i = j-1
-        elif HPos[i] == 1 or VPos[i] == 1:
-            fixedList.append(aList[i])
-            last = 0
-            j = i+1
-            while j < len(aList) and numPos[j] == 1:
-                last = aList[j]
-                j = j+1
-            fixedList.append(last)
-            i = j-1
+    while i < n:
+        el = aList[i]
+        fixedList.append(el)
         i = i+1
 
+        if el in ('h', 'v', 'H', 'V'):
+            values = []
+            while i < n and type(aList[i]) == float:
+                values.append(aList[i])
+                i = i+1
+
+            if el in ('h', 'v'):
+                fixedList.append(sum(values))
+            else:
+                fixedList.append(values[-1] if values else 0)
+
     return fixedList
 
 
@@ -134,69 +146,141 @@ def normaliseSvgPath(attr):
       -> ['M', [10, 20], 'L', [20, 20], 'L', [30, 40], 'L', [40, 40], 'Z', []]
     """
 
-    # operator codes mapped to the minimum number of expected arguments 
-    ops = {'A':7, 'a':7,
-      'Q':4, 'q':4, 'T':2, 't':2, 'S':4, 's':4, 
-      'M':2, 'L':2, 'm':2, 'l':2, 'H':1, 'V':1,  
-      'h':1, 'v':1, 'C':6, 'c':6, 'Z':0, 'z':0}
-
-    # do some preprocessing
-    opKeys = ops.keys()
-    a = attr
-    a = a.replace(',', ' ')
-    a = string.replace(a, 'e-', 'ee')
-    a = string.replace(a, '-', ' -')
-    a = string.replace(a, 'ee', 'e-')
-    for op in opKeys:
-        a = a.replace(op, " %s " % op)
-    a = a.strip()
-    a = a.split()
-    a = convertToFloats(a)
+    a = [op or float(number) for op, number in PATHTOKEN.findall(attr)]
     a = fixSvgPath(a)
 
     # insert op codes for each argument of an op with multiple arguments
     res = []
+    n = len(a)
     i = 0
-    while i < len(a):
+    while i < n:
         el = a[i]
-        if el in opKeys:
+        if type(el) != float:
             if el in ('z', 'Z'):
                 res.append(el)
                 res.append([])
             else:
-                while i < len(a)-1:
-                    if a[i+1] not in opKeys:
-                        res.append(el)
-                        res.append(a[i+1:i+1+ops[el]])
-                        i = i + ops[el]
-                    else:
-                        break
+                count = PATHOPS[el]
+                while i < n-1 and type(a[i+1]) == float:
+                    res.append(el)
+                    res.append(a[i+1:i+1+count])
+                    i = i + count
         i = i + 1
 
     # fix sequences of M to one M plus a sequence of L operators,
     # same for m and l.
-    for i in xrange(0, len(res), 2):
-        op, nums = res[i:i+2]
-        if i >= 2:
-            if op == 'M' == res[i-2]:
-                res[i] = 'L'
-            elif op == 'm' == res[i-2]:
-                res[i] = 'l'
+    for i in xrange(2, len(res), 2):
+        op = res[i]
+        if op == 'M' == res[i-2]:
+            res[i] = 'L'
+        elif op == 'm' == res[i-2]:
+            res[i] = 'l'
 
     return res
 
 
+### parsing ###
+
+class SvgNode(object):
+    """A light replacement of the DOM nodes used by the renderer.
+
+    Only the parts of the DOM interface that the converters use are
+    provided. Namespaced attributes keep their "{uri}name" keys.
+    """
+
+    __slots__ = ('nodeName', 'nodeType', 'nodeValue', 'attrib', 'parentNode', 'childNodes')
+
+    ELEMENT_NODE = 1
+    TEXT_NODE = 3
+
+    def __init__(self, nodeName, nodeType=1, attrib=None, parentNode=None, nodeValue=None):
+        self.nodeName = nodeName
+        self.nodeType = nodeType
+        self.nodeValue = nodeValue
+        self.attrib = attrib if attrib is not None else {}
+        self.parentNode = parentNode
+        self.childNodes = []
+
+    @property
+    def firstChild(self):
+        return self.childNodes[0] if self.childNodes else None
+
+    def getAttribute(self, name):
+        return self.attrib.get(name, '')
+
+    def getAttributeNS(self, namespace, name):
+        return self.attrib.get("{%s}%s" % (namespace, name), '')
+
+
+def localName(tag):
+    "Remove the namespace from a tag name."
+
+    return tag.rsplit('}', 1)[-1] if tag[:1] == '{' else tag
+
+
+def parseSvg(source):
+    """Parse an SVG document into a tree of SvgNodes.
+
+    The document is read with iterparse and the parsed elements are
+    released as soon as their parent has been read. Returns the root
+    node.
+    """
+
+    stack = []
+    root = None
+
+    for event, elem in cElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            parent = stack[-1][1] if stack else None
+            node = SvgNode(localName(elem.tag), attrib=dict(elem.attrib), parentNode=parent)
+            stack.append((elem, node))
+            if root is None:
+                root = node
+            continue
+
+        elem, node = stack.pop()
+
+        # the text and tails of the children are complete once the
+        # element ends
+        children = []
+        elements = iter(node.childNodes)
+        if elem.text:
+            children.append(SvgNode('#text', SvgNode.TEXT_NODE, parentNode=node, nodeValue=elem.text))
+        for child in elem:
+            children.append(next(elements))
+            if child.tail:
+                children.append(SvgNode('#text', SvgNode.TEXT_NODE, parentNode=node, nodeValue=child.tail))
+            child.clear()
+        node.childNodes = children
+
+        if stack:
+            stack[-1][1].childNodes.append(node)
+        else:
+            elem.clear()
+
+    return root
+
+
 ### attribute converters (from SVG to RLG)
 
 class AttributeConverter:
     "An abstract class to locate and convert attributes in a DOM instance."
 
+    # the same style attributes are repeated on many nodes
+    styles = {}
+
     def parseMultiAttributes(self, line):
         """Try parsing compound attribute string.
 
-        Return a dictionary with single attributes in 'line'.
+        Return a dictionary with single attributes in 'line'. The
+        dictionary is shared and must not be changed.
         """
-    
+
+        newAttrs = self.styles.get(line)
+        if newAttrs is not None:
+            return newAttrs
+
+        key = line
         try:
             line = line.encode("ASCII")
         except:
@@ -212,6 +296,10 @@ class AttributeConverter:
             k, v = [s.strip() for s in (k, v)]
             newAttrs[k] = v
 
+        if len(self.styles) > 10000:
+            self.styles.clear()
+        self.styles[key] = newAttrs
+
         return newAttrs
 
 
@@ -232,8 +320,10 @@ class AttributeConverter:
 
         if attrValue and attrValue != "inherit":
             return attrValue
-        elif svgNode.getAttribute("style"):
-            dict = self.parseMultiAttributes(svgNode.getAttribute("style"))
+
+        style = svgNode.getAttribute("style")
+        if style:
+            dict = self.parseMultiAttributes(style)
             if dict.has_key(name):
                 return dict[name]
         else:
@@ -257,11 +347,9 @@ class AttributeConverter:
                 d = self.parseMultiAttributes(style)
                 dict.update(d)
 
-        attrs = svgNode.attributes
-        for i in xrange(attrs.length):
-            a = attrs.item(i)
-            if a.name != "style":
-                dict[a.name.encode("ASCII")] = a.value
+        for name, value in svgNode.attrib.items():
+            if name != "style":
+                dict[name.encode("ASCII")] = value
 
         return dict
 
@@ -286,26 +374,11 @@ class AttributeConverter:
         except:
             pass
 
-        line = line.strip()
-        ops = line[:]
-        brackets = []
-        indices = []
-        for i in range(len(line)):
-           if line[i] in "()": brackets.append(i)
-        for i in range(0, len(brackets), 2):
-            bi, bj = brackets[i], brackets[i+1]
-            subline = line[bi+1:bj]
-            subline = subline.strip()
-            subline = subline.replace(',', ' ')
-            subline = re.sub("[ ]+", ',', subline)
-            indices.append(eval(subline))
-            ops = ops[:bi] + ' '*(bj-bi+1) + ops[bj+1:]
-        ops = ops.split()
-
-        assert len(ops) == len(indices)
         result = []
-        for i in range(len(ops)):
-            result.append((ops[i], indices[i]))
+        for op, values in TRANSFORM.findall(line):
+            values = tuple(float(v) for v in NUMBER.findall(values))
+            # single values are not tuples, as they were when evaluated
+            result.append((op, values[0] if len(values) == 1 else values))
 
         return result
 
@@ -320,6 +393,12 @@ class Svg2RlgAttributeConverter(AttributeConverter):
         if not text:
             return 0.0
 
+        # most lengths are plain numbers
+        try:
+            return float(text)
+        except ValueError:
+            pass
+
         if text[-1] == '%':
             if LOGMESSAGES:
                 print "Fiddling length unit: %"
@@ -355,10 +434,7 @@ class Svg2RlgAttributeConverter(AttributeConverter):
     def convertColor(self, svgAttr):
         "Convert string to a RL color object."
 
-        # fix it: most likely all "web colors" are allowed
-        predefined = "aqua black blue fuchsia gray green lime maroon navy "
-        predefined = predefined + "olive orange purple red silver teal white yellow "
-        predefined = predefined + "lawngreen indianred aquamarine lightgreen brown"
+        # fix it: most likely all "web colors" are allowed, see PREDEFINEDCOLORS
 
         # This needs also to lookup values like "url(#SomeName)"...    
 
@@ -371,7 +447,7 @@ class Svg2RlgAttributeConverter(AttributeConverter):
         except:
             pass
 
-        if text in predefined.split():
+        if text in PREDEFINEDCOLORS:
             return getattr(colors, text)
         elif text == "currentColor":
             return "currentColor"
@@ -475,7 +551,7 @@ class SvgRenderer:
         self.attrConverter = Svg2RlgAttributeConverter()
         self.shapeConverter = Svg2RlgShapeConverter()
         self.shapeConverter.svgSourceFile = path
-        self.handledShapes = self.shapeConverter.getHandledShapes()
+        self.handledShapes = set(self.shapeConverter.getHandledShapes())
         self.drawing = None
         self.mainGroup = Group()
         self.definitions = {}
@@ -503,7 +579,7 @@ class SvgRenderer:
 
         if name == "svg":
             self.level = self.level + 1
-            n = NodeTracker(node)
+            n = self.track(node)
             drawing = self.renderSvg(n)
             children = n.childNodes
             for child in children:
@@ -514,7 +590,7 @@ class SvgRenderer:
             self.printUnusedAttributes(node, n)
         elif name == "defs":
             self.doesProcessDefinitions = 1
-            n = NodeTracker(node)
+            n = self.track(node)
             self.level = self.level + 1
             parent.add(self.renderG(n))
             self.level = self.level - 1
@@ -522,14 +598,14 @@ class SvgRenderer:
             self.printUnusedAttributes(node, n)
         elif name == 'a':
             self.level = self.level + 1
-            n = NodeTracker(node)
+            n = self.track(node)
             item = self.renderA(n)
             parent.add(item)
             self.level = self.level - 1
             self.printUnusedAttributes(node, n)
         elif name == 'g':
             self.level = self.level + 1
-            n = NodeTracker(node)
+            n = self.track(node)
             display = n.getAttribute("display")
             if display != "none":
                 item = self.renderG(n)
@@ -541,7 +617,7 @@ class SvgRenderer:
             self.printUnusedAttributes(node, n)
         elif name == "symbol":
             self.level = self.level + 1
-            n = NodeTracker(node)
+            n = self.track(node)
             item = self.renderSymbol(n)
             # parent.add(item)
             id = n.getAttribute("id")
@@ -551,7 +627,7 @@ class SvgRenderer:
             self.printUnusedAttributes(node, n)
         elif name in self.handledShapes:
             methodName = "convert"+name[0].upper()+name[1:]
-            n = NodeTracker(node)
+            n = self.track(node)
             shape = getattr(self.shapeConverter, methodName)(n)
             if shape:
                 self.shapeConverter.applyStyleOnShape(shape, n)
@@ -570,7 +646,19 @@ class SvgRenderer:
                 print "Ignoring node: %s" % name
 
 
+    def track(self, node):
+        "Only keep track of the used attributes when they are reported."
+
+        if self.verbose or LOGMESSAGES:
+            return NodeTracker(node)
+
+        return node
+
+
     def printUnusedAttributes(self, node, n):
+        if not (self.verbose or LOGMESSAGES):
+            return
+
         allAttrs = self.attrConverter.getAllAttributes(node).keys()
         unusedAttrs = []
 
@@ -580,7 +668,7 @@ class SvgRenderer:
 
         if self.verbose and unusedAttrs:
             format = "%s-Unused: %s"
-            args = ("  "*(self.level+1), unusedAttrs.join(", "))
+            args = ("  "*(self.level+1), ", ".join(unusedAttrs))
             #if not self.logFile:
             #    print format % args
             #else:
@@ -883,7 +971,7 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
             # moveto, lineto absolute
             if op in ('M', 'L'):
                 xn, yn = nums
-                pts = pts + [xn, yn]
+                pts.extend([xn, yn])
                 if op == 'M': 
                     ops.append(0)
                     lastMoveToOp = (op, xn, yn)
@@ -894,9 +982,9 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
             elif op == 'm':
                 xn, yn = nums
                 if len(pts) >= 2:
-                    pts = pts + [pts[-2]+xn] + [pts[-1]+yn]
+                    pts.extend([pts[-2]+xn, pts[-1]+yn])
                 else:
-                    pts = pts + [xn, yn]
+                    pts.extend([xn, yn])
                 if normPath[-2] in ('z', 'Z') and lastMoveToOp:
                     pts[-2] = xn + lastMoveToOp[-2]
                     pts[-1] = yn + lastMoveToOp[-1]
@@ -906,51 +994,51 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
                 ops.append(0)
             elif op == 'l':
                 xn, yn = nums
-                pts = pts + [pts[-2]+xn] + [pts[-1]+yn]
+                pts.extend([pts[-2]+xn, pts[-1]+yn])
                 ops.append(1)
 
             # horizontal/vertical line absolute
             elif op in ('H', 'V'):
                 k = nums[0]
                 if op == 'H':
-                    pts = pts + [k] + [pts[-1]]
+                    pts.extend([k, pts[-1]])
                 elif op == 'V':
-                    pts = pts + [pts[-2]] + [k]
+                    pts.extend([pts[-2], k])
                 ops.append(1)
 
             # horizontal/vertical line relative
             elif op in ('h', 'v'):
                 k = nums[0]
                 if op == 'h':
-                    pts = pts + [pts[-2]+k] + [pts[-1]]
+                    pts.extend([pts[-2]+k, pts[-1]])
                 elif op == 'v':
-                    pts = pts + [pts[-2]] + [pts[-1]+k]
+                    pts.extend([pts[-2], pts[-1]+k])
                 ops.append(1)
 
             # cubic bezier, absolute
             elif op == 'C':
                 x1, y1, x2, y2, xn, yn = nums
-                pts = pts + [x1, y1, x2, y2, xn, yn]
+                pts.extend([x1, y1, x2, y2, xn, yn])
                 ops.append(2)
             elif op == 'S':
                 x2, y2, xn, yn = nums
                 xp, yp, x0, y0 = pts[-4:]
                 xi, yi = x0+(x0-xp), y0+(y0-yp)
                 # pts = pts + [xcp2, ycp2, x2, y2, xn, yn]
-                pts = pts + [xi, yi, x2, y2, xn, yn]
+                pts.extend([xi, yi, x2, y2, xn, yn])
                 ops.append(2)
 
             # cubic bezier, relative
             elif op == 'c':
                 xp, yp = pts[-2:]
                 x1, y1, x2, y2, xn, yn = nums
-                pts = pts + [xp+x1, yp+y1, xp+x2, yp+y2, xp+xn, yp+yn]
+                pts.extend([xp+x1, yp+y1, xp+x2, yp+y2, xp+xn, yp+yn])
                 ops.append(2)
             elif op == 's':
                 xp, yp, x0, y0 = pts[-4:]
                 xi, yi = x0+(x0-xp), y0+(y0-yp)
                 x2, y2, xn, yn = nums
-                pts = pts + [xi, yi, x0+x2, y0+y2, x0+xn, y0+yn]
+                pts.extend([xi, yi, x0+x2, y0+y2, x0+xn, y0+yn])
                 ops.append(2)
 
             # quadratic bezier, absolute
@@ -960,7 +1048,7 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
                 xcp, ycp = x1, y1
                 (x0,y0), (x1,y1), (x2,y2), (xn,yn) = \
                     convertQuadraticToCubicPath((x0,y0), (x1,y1), (xn,yn))
-                pts = pts + [x1,y1, x2,y2, xn,yn]
+                pts.extend([x1,y1, x2,y2, xn,yn])
                 ops.append(2)
             elif op == 'T':
                 xp, yp, x0, y0 = pts[-4:]
@@ -969,7 +1057,7 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
                 xn, yn = nums
                 (x0,y0), (x1,y1), (x2,y2), (xn,yn) = \
                     convertQuadraticToCubicPath((x0,y0), (xi,yi), (xn,yn))
-                pts = pts + [x1,y1, x2,y2, xn,yn]
+                pts.extend([x1,y1, x2,y2, xn,yn])
                 ops.append(2)
 
             # quadratic bezier, relative
@@ -980,7 +1068,7 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
                 xcp, ycp = x1, y1
                 (x0,y0), (x1,y1), (x2,y2), (xn,yn) = \
                     convertQuadraticToCubicPath((x0,y0), (x1,y1), (xn,yn))
-                pts = pts + [x1,y1, x2,y2, xn,yn]
+                pts.extend([x1,y1, x2,y2, xn,yn])
                 ops.append(2)
             elif op == 't':
                 x0, y0 = pts[-2:]
@@ -990,7 +1078,7 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
                 xcp, ycp = xi, yi
                 (x0,y0), (x1,y1), (x2,y2), (xn,yn) = \
                     convertQuadraticToCubicPath((x0,y0), (xi,yi), (xn,yn))
-                pts = pts + [x1,y1, x2,y2, xn,yn]
+                pts.extend([x1,y1, x2,y2, xn,yn])
                 ops.append(2)
 
             # close path
@@ -1002,7 +1090,7 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
                 if LOGMESSAGES:
                     print "Suspicious path operator:", op
                 if op in ('A', 'a'):
-                    pts = pts + nums[-2:]
+                    pts.extend(nums[-2:])
                     ops.append(1)
                     if LOGMESSAGES:
                         print "(Replaced with straight line)"
@@ -1155,32 +1243,83 @@ class Svg2RlgShapeConverter(SvgShapeConverter):
                 setattr(shape, "fillColor", ac.convertColor(svgAttr))
 
 
+_cache = OrderedDict()
+_cacheLock = threading.Lock()
+
+
+def readSvg(path):
+    "Return the content of an SVG file, decompressing .svgz files in memory."
+
+    f = open(path, 'rb')
+    try:
+        data = f.read()
+    finally:
+        f.close()
+
+    # .svgz files are recognised by their content, so that cached
+    # copies without the extension are read too
+    if data[:2] == '\x1f\x8b':
+        data = gzip.GzipFile(fileobj=StringIO(data)).read()
+
+    return data
+
+
+def copyDrawing(drawing):
+    """Return a copy of a drawing.
+
+    The shapes are shared, so the copy can be scaled, moved and added
+    to, but the shapes in it must not be changed.
+    """
+
+    result = copy.copy(drawing)
+    result.contents = list(drawing.contents)
+
+    return result
+
+
+def clearCache():
+    "Remove all converted drawings from the cache."
+
+    with _cacheLock:
+        _cache.clear()
+
+
 def svg2rlg(path):
-    "Convert an SVG file to an RLG Drawing object."
-    
-    # unzip .svgz file into .svg
-    unzipped = False
-    if os.path.splitext(path)[1].lower() == ".svgz":
-        data = gzip.GzipFile(path, "rb").read()
-        open(path[:-1], 'w').write(data)
-        path = path[:-1]
-        unzipped = True
+    """Convert an SVG file to an RLG Drawing object.
+
+    Drawings are cached by the hash of the file's content and a copy
+    of the cached drawing is returned.
+    """
 
     # load SVG file
     try:
-        doc = xml.dom.minidom.parse(path)
-        svg = doc.documentElement
+        data = readSvg(path)
     except:
         print "Failed to load input file!"
         return
 
-    # convert to a RLG drawing
-    svgRenderer = SvgRenderer(path)
-    svgRenderer.render(svg)
-    drawing = svgRenderer.finish()
+    key = hashlib.sha1(data).hexdigest()
 
-    # remove unzipped .svgz file (.svg)
-    if unzipped:
-        os.remove(path)
-        
-    return drawing
+    with _cacheLock:
+        drawing = _cache.pop(key, None)
+        if drawing is not None:
+            _cache[key] = drawing
+
+    if drawing is None:
+        try:
+            svg = parseSvg(StringIO(data))
+        except:
+            print "Failed to load input file!"
+            return
+
+        # convert to a RLG drawing
+        svgRenderer = SvgRenderer(path)
+        svgRenderer.render(svg)
+        drawing = svgRenderer.finish()
+
+        with _cacheLock:
+            _cache[key] = drawing
+            while len(_cache) > CACHESIZE:
+                _cache.popitem(last=False)
+
+    return copyDrawing(drawing)